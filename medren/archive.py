@@ -0,0 +1,262 @@
+import dataclasses
+import datetime
+import io
+import logging
+import os
+import shutil
+import tarfile
+import zipfile
+from collections.abc import Callable, Iterator
+from pathlib import Path, PurePosixPath
+from typing import BinaryIO
+
+from medren.backend_takeout import TAKEOUT_SIDECAR_SIZE_LIMIT, parse_takeout_json, takeout_sidecar_names
+from medren.backends import backend_support
+from medren.consts import extension_normalized
+from medren.exif_process import ExifClass
+from medren.fusion import FUSE_HEADER_BYTES
+from medren.mover import unlink_quietly
+from medren.report import warn
+
+logger = logging.getLogger(__name__)
+
+# Media inside zip and tar archives (e.g. Google Takeout exports and phone backups) are scanned without extracting
+# them: each member is streamed once, and the backends read its head (or seek in it, for ISO-BMFF).
+# A member is named by the path of the archive followed by the path inside it, e.g. takeout.zip/Photos/IMG_1.jpg,
+# and applying a rename of a member extracts it to its new path, in one pass over the archive.
+
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tgz', '.tar.gz', '.tbz2', '.tar.bz2', '.txz', '.tar.xz')
+STREAM_WINDOW = 4 * 1024 * 1024  # Bytes of a tar member kept behind the read position, for parsers that seek back
+
+MemberMeta = dict[str, ExifClass]  # member name -> metadata
+
+
+def is_archive(path: Path | str) -> bool:
+    return str(path).lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def split_member_path(path: Path | str) -> tuple[Path, str] | None:
+    """
+    Split the path of an archive member.
+
+    Returns:
+        tuple[Path, str] | None: The archive and the member name, None if the path is not inside an archive
+    """
+    path = Path(path)
+    for parent in path.parents:
+        if is_archive(parent) and parent.is_file():
+            return parent, path.relative_to(parent).as_posix()
+    return None
+
+
+class SequentialReader(io.RawIOBase):
+    """
+    A forward only stream (a member of a compressed tar) that can seek back within its head
+    and within a window behind the read position. Seeking forward reads and drops the data.
+
+    Args:
+        raw: The stream
+        size: The size of the stream, for seeks from the end
+        head: Bytes of the start of the stream that are kept
+        window: Bytes kept behind the read position
+    """
+
+    def __init__(self, raw: BinaryIO, size: int | None = None, head: int = FUSE_HEADER_BYTES,
+                 window: int = STREAM_WINDOW):
+        super().__init__()
+        self.raw = raw
+        self.size = size
+        self.head_size = head
+        self.window = window
+        self.head = bytearray()
+        self.buf = bytearray()
+        self.buf_start = 0  # The stream offset of buf[0]
+        self.pos = 0
+        self.eof = False
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.pos
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_CUR:
+            offset += self.pos
+        elif whence == os.SEEK_END:
+            if self.size is None:
+                raise io.UnsupportedOperation('The size of the stream is unknown')
+            offset += self.size
+        if offset < 0:
+            raise ValueError('Negative seek position')
+        self.pos = offset
+        return offset
+
+    def _fill(self, end: int) -> None:
+        while not self.eof and self.buf_start + len(self.buf) < end:
+            chunk = self.raw.read(min(end - self.buf_start - len(self.buf), 1024 * 1024))
+            if not chunk:
+                self.eof = True
+                break
+            if len(self.head) < self.head_size:
+                self.head += chunk[:self.head_size - len(self.head)]
+            self.buf += chunk
+            if len(self.buf) > self.window:
+                drop = len(self.buf) - self.window
+                del self.buf[:drop]
+                self.buf_start += drop
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = (self.size if self.size is not None else 1 << 62) - self.pos
+        start, end = self.pos, self.pos + max(size, 0)
+        self._fill(end)
+        end = min(end, self.buf_start + len(self.buf))
+        if start >= end:
+            return b''
+        if start >= self.buf_start:
+            data = bytes(self.buf[start - self.buf_start:end - self.buf_start])
+        elif end <= len(self.head):
+            data = bytes(self.head[start:end])
+        elif start < len(self.head) and self.buf_start <= len(self.head):
+            data = bytes(self.head[start:] + self.buf[len(self.head) - self.buf_start:end - self.buf_start])
+        else:
+            raise io.UnsupportedOperation(f'Can not seek back to {start} in a stream')
+        self.pos += len(data)
+        return data
+
+    def readinto(self, b) -> int:
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+
+def iter_members(archive: Path | str) -> Iterator[tuple[str, int, float, BinaryIO]]:
+    """
+    Iterate over the files of an archive in storage order.
+
+    Yields:
+        tuple[str, int, float, BinaryIO]: The member name, size, modification time and a seekable file object,
+            which is valid until the next member
+    """
+    if str(archive).lower().endswith('.zip'):
+        with zipfile.ZipFile(archive) as zf:
+            for info in zf.infolist():
+                if info.is_dir():
+                    continue
+                with zf.open(info) as f:
+                    yield info.filename, info.file_size, zip_mtime(info), f
+    else:
+        with tarfile.open(archive, 'r|*') as tf:
+            for info in tf:
+                if not info.isfile():
+                    continue
+                f = tf.extractfile(info)
+                yield info.name, info.size, info.mtime, SequentialReader(f, size=info.size)
+
+
+def zip_mtime(info: zipfile.ZipInfo) -> float:
+    return datetime.datetime(*info.date_time).timestamp()
+
+
+def member_meta(f: BinaryIO, path: PurePosixPath, backends: list[str]) -> ExifClass | None:
+    """Extract the metadata of a member with the backends that can read a file object or its head."""
+    for backend in backends:
+        b = backend_support[backend]
+        if not b.stream_func and not b.buffer_func:
+            continue
+        try:
+            f.seek(0)
+            ex = b.stream_func(f, path, logger) if b.stream_func else b.buffer_func(f.read(FUSE_HEADER_BYTES), path,
+                                                                                     logger)
+            if ex:
+                return ex
+        except Exception as e:
+            logger.debug(f"{backend}: Could not extract datetime from {path}: {e}")
+    return None
+
+
+def scan_archive(archive: Path | str, backends_for: Callable[[str], list[str]]) -> MemberMeta:
+    """
+    Extract the metadata of the media in an archive, in one pass over it.
+
+    Members without metadata, or without a location, take them from their Google Takeout sidecar (if there is one).
+
+    Args:
+        archive: A zip or tar file (possibly compressed)
+        backends_for: The backends to try for a (normalized) extension, in order
+
+    Returns:
+        MemberMeta: The metadata of the members that have a datetime
+    """
+    metas: dict[str, ExifClass | None] = {}
+    sidecars: dict[str, bytes] = {}
+    for name, size, _mtime, f in iter_members(archive):
+        path = PurePosixPath(name)
+        ext = path.suffix.lower()
+        if ext == '.json':
+            if size <= TAKEOUT_SIDECAR_SIZE_LIMIT:
+                sidecars[name] = f.read()
+            continue
+        metas[name] = member_meta(f, path, backends_for(extension_normalized.get(ext, ext)))
+    result = {}
+    for name, ex in metas.items():
+        path = PurePosixPath(name)
+        merged = ex
+        if ex is None or ex.lat is None:
+            sidecar = next((sidecars[str(path.with_name(n))] for n in takeout_sidecar_names(path.name)
+                            if str(path.with_name(n)) in sidecars), None)
+            if sidecar is not None:
+                try:
+                    takeout = parse_takeout_json(sidecar, path)
+                except ValueError as e:
+                    logger.debug(f"Could not parse the Takeout sidecar of {name}: {e}")
+                    takeout = None
+                if takeout is not None and ex is None:
+                    merged = takeout
+                elif takeout is not None and takeout.lat is not None:
+                    merged = dataclasses.replace(ex, lat=takeout.lat, lon=takeout.lon, alt=takeout.alt,
+                                                 backend=f'{ex.backend}+takeout')
+        if merged is None:
+            warn(logger, 'no_datetime', f"No datetime found for {archive}/{name}")
+        else:
+            result[name] = merged
+    return result
+
+
+def extract_members(archive: Path | str, targets: dict[str, Path]) -> dict[str, Path]:
+    """
+    Extract members of an archive to new paths, in one pass over it.
+
+    Args:
+        archive: A zip or tar file
+        targets: The new path of each member to extract, these should not exist
+
+    Returns:
+        dict[str, Path]: The new paths of the extracted members
+    """
+    done = {}
+    for name, _size, mtime, f in iter_members(archive):
+        target = targets.get(name)
+        if target is None or name in done:
+            continue
+        if os.path.lexists(target):
+            logger.warning(f"Skipping {archive}/{name} because {target} exists")
+            continue
+        target.parent.mkdir(parents=True, exist_ok=True)
+        with open(target, 'xb') as out:
+            try:
+                f.seek(0)
+                shutil.copyfileobj(f, out, 1024 * 1024)
+            except BaseException:
+                out.close()
+                unlink_quietly(target)
+                raise
+        os.utime(target, (mtime, mtime))
+        done[name] = target
+        if len(done) == len(targets):
+            break
+    return done
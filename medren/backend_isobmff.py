@@ -0,0 +1,345 @@
+import datetime
+import logging
+import os
+import struct
+from collections.abc import Iterator
+from pathlib import Path
+from typing import BinaryIO
+
+import piexif
+
+from medren.backend_piexif import piexif_dict_to_exif
+from medren.exif_process import ExifClass, ExifStat, clean_make_model
+
+# ISO base media file format (ISO/IEC 14496-12) box walker.
+# HEIC/HEIF keep the Exif block as an item of the top level `meta` box,
+# MP4/MOV keep the creation time in `moov/mvhd` and location/device in `moov/udta` and `moov/meta`.
+# Only box headers are read while walking, payloads are skipped by seeking past them.
+
+MP4_EPOCH = datetime.datetime(1904, 1, 1)
+
+FIRST_BOX_TYPES = (b'ftyp', b'moov', b'wide', b'free', b'skip', b'mdat')
+BOX_HEADER_SIZE = 8  # 32 bit size and type
+LARGE_SIZE = 1  # The box size value of a 64 bit size following the type
+LARGE_SIZE_BYTES = 8
+UUID_SIZE = 16  # The extended type of `uuid` boxes
+FULL_BOX_HEADER_SIZE = 4  # Version and flags of a FullBox
+INFE_TYPED_VERSION = 2  # `infe` versions from 2 have an item type, version 2 has 16 bit item ids
+ILOC_LONG_ID_VERSION = 2  # `iloc` versions from 2 have 32 bit item ids and counts
+EXIF_TIFF_OFFSET_SIZE = 4  # The Exif item starts with the offset of the TIFF header
+TEXT_ATOM_HEADER_SIZE = 4  # Text size and language of a QuickTime text atom
+HEIF_BRANDS = (b'heic', b'heix', b'heim', b'heis', b'hevc', b'hevx', b'mif1', b'msf1', b'avif', b'avis')
+
+APPLE_CREATION_DATE = 'com.apple.quicktime.creationdate'
+APPLE_MAKE = 'com.apple.quicktime.make'
+APPLE_MODEL = 'com.apple.quicktime.model'
+APPLE_LOCATION = 'com.apple.quicktime.location.ISO6709'
+
+
+def read_exact(f: BinaryIO, size: int) -> bytes:
+    data = f.read(size)
+    if len(data) != size:
+        raise EOFError(f"Expected {size} bytes, got {len(data)}")
+    return data
+
+
+def iter_boxes(f: BinaryIO, start: int, end: int | None) -> Iterator[tuple[bytes, int, int]]:
+    """
+    Iterate over the boxes in a byte range without reading their payloads.
+
+    Args:
+        f: A seekable binary file object
+        start: Offset of the first box
+        end: Offset of the end of the range, None for the end of the file
+
+    Yields:
+        tuple[bytes, int, int]: The box type, the payload offset and the box end offset
+    """
+    pos = start
+    while end is None or pos + BOX_HEADER_SIZE <= end:
+        f.seek(pos)
+        header = f.read(BOX_HEADER_SIZE)
+        if len(header) < BOX_HEADER_SIZE:
+            return
+        size, box_type = struct.unpack('>I4s', header)
+        payload = pos + BOX_HEADER_SIZE
+        if size == LARGE_SIZE:
+            size = struct.unpack('>Q', read_exact(f, LARGE_SIZE_BYTES))[0]
+            payload += LARGE_SIZE_BYTES
+        elif size == 0:
+            # the box extends to the end of the range
+            if end is None:
+                end = f.seek(0, os.SEEK_END)
+            size = end - pos
+        if box_type == b'uuid':
+            payload += UUID_SIZE
+        if size < payload - pos:
+            return
+        yield box_type, payload, pos + size
+        pos += size
+
+
+def find_box(f: BinaryIO, start: int, end: int | None, box_type: bytes) -> tuple[int, int] | None:
+    for t, payload, box_end in iter_boxes(f, start, end):
+        if t == box_type:
+            return payload, box_end
+    return None
+
+
+def read_uint(f: BinaryIO, size: int) -> int:
+    if size == 0:
+        return 0
+    return int.from_bytes(read_exact(f, size), 'big')
+
+
+def _meta_children_start(f: BinaryIO, payload: int) -> int:
+    # ISO `meta` is a FullBox (4 bytes of version and flags), QuickTime `meta` is a plain container
+    f.seek(payload)
+    return payload + FULL_BOX_HEADER_SIZE if f.read(FULL_BOX_HEADER_SIZE) == b'\x00\x00\x00\x00' else payload
+
+
+def _parse_iinf(f: BinaryIO, payload: int, end: int) -> dict[int, bytes]:
+    """Map item ids to item types."""
+    f.seek(payload)
+    version = read_exact(f, FULL_BOX_HEADER_SIZE)[0]
+    count_size = 2 if version == 0 else 4
+    entries_start = payload + FULL_BOX_HEADER_SIZE + count_size
+    items = {}
+    for t, infe, _ in iter_boxes(f, entries_start, end):
+        if t != b'infe':
+            continue
+        f.seek(infe)
+        infe_version = read_exact(f, FULL_BOX_HEADER_SIZE)[0]
+        if infe_version < INFE_TYPED_VERSION:
+            continue
+        item_id = read_uint(f, 2 if infe_version == INFE_TYPED_VERSION else 4)
+        read_exact(f, 2)  # item_protection_index
+        items[item_id] = read_exact(f, 4)
+    return items
+
+
+def _parse_iloc(f: BinaryIO, payload: int) -> dict[int, tuple[int, list[tuple[int, int]]]]:
+    """Map item ids to their construction method and (offset, length) extents."""
+    f.seek(payload)
+    version = read_exact(f, FULL_BOX_HEADER_SIZE)[0]
+    sizes = read_exact(f, 2)
+    offset_size, length_size = sizes[0] >> 4, sizes[0] & 0xF
+    base_offset_size = sizes[1] >> 4
+    index_size = sizes[1] & 0xF if version in (1, 2) else 0
+    id_size = 2 if version < ILOC_LONG_ID_VERSION else 4
+    item_count = read_uint(f, id_size)
+    locations = {}
+    for _ in range(item_count):
+        item_id = read_uint(f, id_size)
+        construction_method = read_uint(f, 2) & 0xF if version in (1, 2) else 0
+        read_uint(f, 2)  # data_reference_index
+        base_offset = read_uint(f, base_offset_size)
+        extents = []
+        for _ in range(read_uint(f, 2)):
+            read_uint(f, index_size)
+            extent_offset = read_uint(f, offset_size)
+            extent_length = read_uint(f, length_size)
+            extents.append((base_offset + extent_offset, extent_length))
+        locations[item_id] = (construction_method, extents)
+    return locations
+
+
+def _read_item(f: BinaryIO, children: dict[bytes, tuple[int, int]], item_id: int) -> bytes | None:
+    """Read the data of an item of a HEIF `meta` box from its `iloc` extents."""
+    locations = _parse_iloc(f, children[b'iloc'][0])
+    if item_id not in locations:
+        return None
+    construction_method, extents = locations[item_id]
+    if construction_method == 1:  # in the `idat` box
+        if b'idat' not in children:
+            return None
+        base = children[b'idat'][0]
+    elif construction_method == 0:  # at file offsets
+        base = 0
+    else:
+        return None
+    data = b''
+    for offset, length in extents:
+        f.seek(base + offset)
+        data += read_exact(f, length)
+    return data
+
+
+def read_heif_exif(f: BinaryIO, meta: tuple[int, int]) -> bytes | None:
+    """
+    Read the Exif item of a HEIF `meta` box.
+
+    Returns:
+        bytes | None: The Exif block as b'Exif\\x00\\x00' followed by the TIFF header and IFDs
+    """
+    payload, end = meta
+    children = {}
+    for t, child, child_end in iter_boxes(f, payload + FULL_BOX_HEADER_SIZE, end):
+        children.setdefault(t, (child, child_end))
+    if b'iinf' not in children or b'iloc' not in children:
+        return None
+    items = _parse_iinf(f, *children[b'iinf'])
+    exif_ids = [item_id for item_id, item_type in items.items() if item_type == b'Exif']
+    if not exif_ids:
+        return None
+    data = _read_item(f, children, exif_ids[0])
+    if data is None or len(data) < EXIF_TIFF_OFFSET_SIZE:
+        return None
+    # the item starts with the offset of the TIFF header, which is usually preceded by b'Exif\x00\x00'
+    tiff_start = EXIF_TIFF_OFFSET_SIZE + struct.unpack('>I', data[:EXIF_TIFF_OFFSET_SIZE])[0]
+    return b'Exif\x00\x00' + data[tiff_start:]
+
+
+def _parse_mvhd(f: BinaryIO, payload: int) -> datetime.datetime | None:
+    f.seek(payload)
+    version = read_exact(f, FULL_BOX_HEADER_SIZE)[0]
+    creation = read_uint(f, 8 if version == 1 else 4)
+    if not creation:
+        return None
+    return MP4_EPOCH + datetime.timedelta(seconds=creation)
+
+
+def _parse_udta(f: BinaryIO, payload: int, end: int) -> dict[bytes, str]:
+    """Read the short text atoms (e.g. ©xyz, ©mak, ©mod) of a `udta` box."""
+    texts = {}
+    for t, child, child_end in iter_boxes(f, payload, end):
+        if not t.startswith(b'\xa9') or child_end - child < TEXT_ATOM_HEADER_SIZE:
+            continue
+        f.seek(child)
+        text_size = read_uint(f, 2)
+        read_exact(f, 2)  # language
+        text_size = min(text_size, child_end - child - TEXT_ATOM_HEADER_SIZE)
+        texts[t] = read_exact(f, text_size).decode('utf-8', errors='replace').strip('\x00')
+    return texts
+
+
+def _parse_keys_meta(f: BinaryIO, payload: int, end: int) -> dict[str, str]:
+    """Read the string values of a QuickTime `meta` box with `keys` and `ilst` children."""
+    start = _meta_children_start(f, payload)
+    keys_box = find_box(f, start, end, b'keys')
+    ilst_box = find_box(f, start, end, b'ilst')
+    if not keys_box or not ilst_box:
+        return {}
+    f.seek(keys_box[0] + 4)
+    keys = []
+    for _ in range(read_uint(f, 4)):
+        key_size = read_uint(f, 4)
+        read_exact(f, 4)  # namespace
+        keys.append(read_exact(f, key_size - 8).decode('utf-8', errors='replace'))
+    values = {}
+    for t, item, item_end in iter_boxes(f, *ilst_box):
+        index = int.from_bytes(t, 'big') - 1
+        if not 0 <= index < len(keys):
+            continue
+        data_box = find_box(f, item, item_end, b'data')
+        if not data_box:
+            continue
+        data, data_end = data_box
+        f.seek(data)
+        type_indicator = read_uint(f, 4)
+        read_exact(f, 4)  # locale
+        if type_indicator == 1:  # UTF-8
+            values[keys[index]] = read_exact(f, data_end - data - 8).decode('utf-8', errors='replace')
+    return values
+
+
+def parse_iso6709(s: str | None) -> tuple[float | None, float | None]:
+    # '+32.1234+034.1234+012.000/'
+    if not s:
+        return None, None
+    parts = []
+    current = ''
+    for c in s.rstrip('/'):
+        if c in '+-' and current:
+            parts.append(current)
+            current = ''
+        current += c
+    parts.append(current)
+    try:
+        return float(parts[0]), float(parts[1])
+    except (ValueError, IndexError):
+        return None, None
+
+
+def parse_iso_datetime(s: str | None) -> tuple[datetime.datetime | None, float | None]:
+    # '2023-05-01T12:30:15+0300' -> local datetime and offset in hours
+    if not s:
+        return None, None
+    try:
+        dt = datetime.datetime.fromisoformat(s)
+    except ValueError:
+        try:
+            dt = datetime.datetime.strptime(s, '%Y-%m-%dT%H:%M:%S%z')
+        except ValueError:
+            return None, None
+    goff = dt.utcoffset()
+    goff = goff.total_seconds() / 3600 if goff is not None else None
+    return dt.replace(tzinfo=None), goff
+
+
+def read_movie_meta(f: BinaryIO, moov: tuple[int, int], path: Path) -> ExifClass | None:
+    payload, end = moov
+    dt = None
+    texts: dict[bytes, str] = {}
+    keys: dict[str, str] = {}
+    for t, child, child_end in iter_boxes(f, payload, end):
+        if t == b'mvhd':
+            dt = _parse_mvhd(f, child)
+        elif t == b'udta':
+            texts = _parse_udta(f, child, child_end)
+        elif t == b'meta':
+            keys = _parse_keys_meta(f, child, child_end)
+    is_utc = True
+    goff = None
+    local_dt, local_goff = parse_iso_datetime(keys.get(APPLE_CREATION_DATE))
+    if local_dt:
+        dt, goff, is_utc = local_dt, local_goff, local_goff is None
+    if dt is None:
+        return None
+    lat, lon = parse_iso6709(keys.get(APPLE_LOCATION) or texts.get(b'\xa9xyz'))
+    make, model = clean_make_model(keys.get(APPLE_MAKE) or texts.get(b'\xa9mak'),
+                                   keys.get(APPLE_MODEL) or texts.get(b'\xa9mod'))
+    return ExifClass(backend='isobmff', ext=path.suffix, dt=dt, goff=goff, is_utc=is_utc,
+                     make=make, model=model, lat=lat, lon=lon)
+
+
+def isobmff_get(f: BinaryIO, path: Path, logger: logging.Logger) -> ExifClass | None:
+    """
+    Extract metadata from an ISO-BMFF (HEIC/HEIF/MP4/MOV) file object.
+
+    Args:
+        f: A seekable binary file object
+        path: The file path, used for its name and extension
+        logger: Logger
+
+    Returns:
+        ExifClass | None: The extracted metadata
+    """
+    top = {}
+    heif = False
+    for t, payload, end in iter_boxes(f, 0, None):
+        if not top and t not in FIRST_BOX_TYPES:
+            return None
+        top.setdefault(t, (payload, end))
+        if t == b'ftyp':
+            f.seek(payload)
+            heif = f.read(4) in HEIF_BRANDS
+        # a movie may have a top level `meta` (without an Exif item) before its `moov`
+        if t == b'moov' or (t == b'meta' and heif):
+            break
+    if b'meta' in top:
+        exif = read_heif_exif(f, top[b'meta'])
+        if exif:
+            exif_dict = piexif.load(exif)
+            ex, stat = piexif_dict_to_exif(exif_dict, path, logger, backend='isobmff')
+            if stat == ExifStat.ValidExif:
+                return ex
+    if b'moov' in top:
+        return read_movie_meta(f, top[b'moov'], path)
+    return None
+
+
+def extract_isobmff(path: Path | str, logger: logging.Logger) -> ExifClass | None:
+    path = Path(path)
+    with open(path, 'rb') as f:
+        return isobmff_get(f, path, logger)
@@ -1,4 +1,5 @@
 import logging
+import struct
 from pathlib import Path
 
 import piexif
@@ -11,9 +12,16 @@ from medren.exif_process import (
     clean_make_model,
     is_timestamp_valid,
     parse_datetime_colon,
+    parse_float,
     parse_gps,
-    parse_offset, parse_float,
+    parse_offset,
 )
+from medren.report import warn
+
+JPEG_MARKER = 0xFF  # The first byte of each segment marker
+JPEG_EOI = 0xD9  # End of image
+JPEG_SOS = 0xDA  # Start of scan, the compressed data follows
+JPEG_APP1 = 0xE1  # The segment of the Exif (and XMP)
 
 
 def exif_decode(s: str | bytes) -> str | None:
@@ -52,7 +60,7 @@ def piexif_get_raw(filename: Path | str, logger: logging.Logger) -> tuple[ExifRa
 
         return exif_dict, ExifStat.ValidExif
     except Exception as e:
-        logger.warning(f"{piexif}: Could not get raw exif data from {filename}: {e}")
+        warn(logger, 'piexif_error', f"{piexif}: Could not get raw exif data from {filename}: {e}")
         return None, ExifStat.UnknownErr
 
 def get_best_dt(dts: list[str | None]) -> tuple[str | None, ExifStat]:
@@ -69,6 +77,56 @@ def piexif_get(path: Path | str, logger: logging.Logger) -> tuple[ExifClass | No
     exif_dict, stat = piexif_get_raw(path, logger)
     if stat != ExifStat.ValidExif:
         return None, stat
+    return piexif_dict_to_exif(exif_dict, path, logger)
+
+
+def jpeg_exif_span(data: bytes) -> tuple[int, int] | None:
+    """
+    Find the Exif APP1 segment in the head of a JPEG file.
+
+    Returns:
+        tuple[int, int] | None: The start and end of the segment payload (Exif header + TIFF),
+            None if the head has no (complete) Exif segment
+    """
+    pos = 2
+    while pos + 4 <= len(data) and data[pos] == JPEG_MARKER:
+        marker = data[pos + 1]
+        if marker in (JPEG_EOI, JPEG_SOS):
+            break
+        length = struct.unpack('>H', data[pos + 2:pos + 4])[0]
+        if marker == JPEG_APP1 and data[pos + 4:pos + 10] == b'Exif\x00\x00':
+            end = pos + 2 + length
+            return (pos + 4, end) if end <= len(data) else None
+        pos += 2 + length
+    return None
+
+
+def jpeg_exif_segment(data: bytes) -> bytes | None:
+    """The Exif APP1 segment payload (Exif header + TIFF) in the head of a JPEG file (see jpeg_exif_span)."""
+    span = jpeg_exif_span(data)
+    return data[span[0]:span[1]] if span is not None else None
+
+
+def piexif_get_buffer(data: bytes, path: Path, logger: logging.Logger) -> tuple[ExifClass | None, ExifStat]:
+    """Parse the Exif of a file from its head (JPEG, or TIFF based files with the Exif near the start)."""
+    try:
+        if data[:2] == b'\xff\xd8':
+            data = jpeg_exif_segment(data)
+            if data is None:
+                return None, ExifStat.NoExif
+        elif data[:2] not in (b'II', b'MM'):
+            return None, ExifStat.Unsupported
+        exif_dict = piexif.load(data)
+        if not exif_dict or not any(d for d in exif_dict.values()):
+            return None, ExifStat.NoExif
+    except Exception as e:
+        logger.debug(f"piexif: Could not get raw exif data from the head of {path}: {e}")
+        return None, ExifStat.UnknownErr
+    return piexif_dict_to_exif(exif_dict, path, logger)
+
+
+def piexif_dict_to_exif(exif_dict: ExifRaw, path: Path, logger: logging.Logger,
+                        backend: str = 'piexif') -> tuple[ExifClass | None, ExifStat]:
     ext = path.suffix
     try:
         _0th = exif_dict.get('0th', {})
@@ -141,12 +199,12 @@ def piexif_get(path: Path | str, logger: logging.Logger) -> tuple[ExifClass | No
             lon=lon,
             alt=alt,
 
-            backend='piexif',
+            backend=backend,
             # all=exif_dict,
         )
         # ex.goff_form_loc(logger=logger)
         return ex, ExifStat.ValidExif
     except Exception as ex:
-        logger.warning(f"{piexif}: Could not get exif data from {exif_dict}: {ex}")
+        warn(logger, 'piexif_error', f"{piexif}: Could not get exif data from {exif_dict}: {ex}")
         return None, ExifStat.UnknownErr
 
@@ -0,0 +1,75 @@
+import datetime
+import json
+import logging
+import os
+import re
+from pathlib import Path, PurePath
+
+from medren.exif_process import ExifClass
+
+# Google Takeout exports keep the time a photo was taken (in UTC) and its location in a JSON file
+# next to the media file, named IMG_1234.jpg.json or IMG_1234.jpg.supplemental-metadata.json.
+# Takeout shortens long sidecar names to 51 characters, and names the sidecar of IMG_1234(1).jpg IMG_1234.jpg(1).json.
+
+TAKEOUT_NAME_LIMIT = 46  # Characters of the sidecar name before the .json extension
+TAKEOUT_SIDECAR_SIZE_LIMIT = 1024 * 1024
+
+
+def takeout_sidecar_names(name: str) -> list[str]:
+    """The possible names of the Takeout sidecar of a media file, in order of likelihood."""
+    stem, ext = os.path.splitext(name)
+    names = []
+    for base in (name, re.sub(r'-edited$', '', stem) + ext):
+        for sidecar in (f'{base}.supplemental-metadata', base):
+            names += [sidecar + '.json', sidecar[:TAKEOUT_NAME_LIMIT] + '.json']
+    match = re.fullmatch(r'(.*)\((\d+)\)', stem)
+    if match:
+        names.append(f'{match.group(1)}{ext}({match.group(2)}).json')
+    return list(dict.fromkeys(names))
+
+
+def find_takeout_sidecar(path: Path | str) -> Path | None:
+    path = Path(path)
+    for name in takeout_sidecar_names(path.name):
+        candidate = path.with_name(name)
+        if candidate.is_file():
+            return candidate
+    return None
+
+
+def parse_takeout_json(data: str | bytes, path: PurePath) -> ExifClass | None:
+    """
+    Parse a Takeout sidecar.
+
+    Args:
+        data: The JSON text
+        path: The media file path, used for its extension
+
+    Returns:
+        ExifClass | None: The time the photo was taken (UTC, moved to the local time of the location if there is one)
+            and its location
+    """
+    d = json.loads(data)
+    if not isinstance(d, dict):
+        return None
+    taken = d.get('photoTakenTime') or d.get('creationTime') or {}
+    try:
+        timestamp = int(taken['timestamp'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    dt = datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).replace(tzinfo=None)
+    lat = lon = alt = None
+    for key in ('geoDataExif', 'geoData'):
+        geo = d.get(key) or {}
+        if geo.get('latitude') or geo.get('longitude'):  # Takeout writes 0.0 for unknown locations
+            lat, lon, alt = geo.get('latitude'), geo.get('longitude'), geo.get('altitude')
+            break
+    return ExifClass(backend='takeout', ext=path.suffix, dt=dt, is_utc=True, lat=lat, lon=lon, alt=alt)
+
+
+def extract_takeout_sidecar(path: Path | str, logger: logging.Logger) -> ExifClass | None:
+    path = Path(path)
+    sidecar = find_takeout_sidecar(path)
+    if not sidecar or sidecar.stat().st_size > TAKEOUT_SIDECAR_SIZE_LIMIT:
+        return None
+    return parse_takeout_json(sidecar.read_bytes(), path)
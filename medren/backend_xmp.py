@@ -0,0 +1,70 @@
+import logging
+import re
+from pathlib import Path
+
+from medren.backend_isobmff import parse_iso_datetime
+from medren.datetime_from_filename import extract_datetime_from_filename
+from medren.exif_process import ExifClass, clean_make_model
+
+# XMP sidecars (e.g. from Lightroom or darktable) are small text files next to the media file,
+# named either IMG_1234.xmp or IMG_1234.CR2.xmp.
+
+XMP_DATE_TAGS = ['exif:DateTimeOriginal', 'photoshop:DateCreated', 'xmp:CreateDate', 'exif:DateTimeDigitized']
+
+
+def find_xmp_sidecar(path: Path | str) -> Path | None:
+    path = Path(path)
+    if path.suffix.lower() == '.xmp':
+        return path
+    for candidate in (path.with_suffix('.xmp'), path.with_suffix('.XMP'),
+                      path.with_name(path.name + '.xmp'), path.with_name(path.name + '.XMP')):
+        if candidate.is_file():
+            return candidate
+    return None
+
+
+def get_xmp_value(xmp: str, tag: str) -> str | None:
+    # the value may be stored as an attribute (tag="value") or as an element (<tag>value</tag>)
+    match = re.search(rf'{re.escape(tag)}="([^"]*)"', xmp) or \
+            re.search(rf'<{re.escape(tag)}>([^<]*)</{re.escape(tag)}>', xmp)
+    return match.group(1).strip() if match else None
+
+
+def parse_xmp_gps(s: str | None) -> float | None:
+    # '32,34.2203N' (degrees, decimal minutes) or '32,34,13.22N' (degrees, minutes, seconds)
+    if not s:
+        return None
+    try:
+        ref = s[-1].upper()
+        parts = [float(p) for p in s[:-1].split(',')]
+        dms = parts[0] + sum(p / 60 ** i for i, p in enumerate(parts[1:], start=1))
+        return -dms if ref in ['S', 'W'] else dms
+    except (ValueError, IndexError):
+        return None
+
+
+def extract_xmp_sidecar(path: Path | str, logger: logging.Logger) -> ExifClass | None:
+    path = Path(path)
+    sidecar = find_xmp_sidecar(path)
+    if not sidecar:
+        return None
+    xmp = sidecar.read_text(encoding='utf-8', errors='replace')
+    for tag in XMP_DATE_TAGS:
+        dt, goff = parse_iso_datetime(get_xmp_value(xmp, tag))
+        if dt:
+            break
+    else:
+        return None
+    make, model = clean_make_model(get_xmp_value(xmp, 'tiff:Make'), get_xmp_value(xmp, 'tiff:Model'))
+    return ExifClass(
+        backend='xmp',
+        ext=path.suffix,
+        dt=dt,
+        goff=goff,
+        is_utc=False,
+        t_fn=extract_datetime_from_filename(path.name),
+        make=make,
+        model=model,
+        lat=parse_xmp_gps(get_xmp_value(xmp, 'exif:GPSLatitude')),
+        lon=parse_xmp_gps(get_xmp_value(xmp, 'exif:GPSLongitude')),
+    )
@@ -1,15 +1,31 @@
+import atexit
+import contextvars
 import importlib
+import io
 import logging
+import os
 import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Callable
+from typing import Any, BinaryIO, Callable
 
+from medren.backend_isobmff import extract_isobmff, isobmff_get
 from medren.backend_piexif import get_best_dt
-from medren.consts import image_ext_with_exif
+from medren.backend_takeout import extract_takeout_sidecar
+from medren.backend_xmp import extract_xmp_sidecar
+from medren.consts import image_ext_with_exif, isobmff_extensions
 from medren.datetime_from_filename import extract_datetime_from_filename
-from medren.exif_process import ExifClass, ExifStat, parse_datetime_dash, extract_datetime_with_optional_goff, parse_offset, \
-    clean_make_model, parse_datetime_colon
+from medren.exif_process import (
+    ExifClass,
+    ExifStat,
+    clean_make_model,
+    extract_datetime_with_optional_goff,
+    parse_datetime_colon,
+    parse_datetime_dash,
+    parse_offset,
+)
 
 
 def extract_piexif(path: Path | str, logger: logging.Logger) -> ExifClass | None:
@@ -20,38 +36,82 @@ def extract_piexif(path: Path | str, logger: logging.Logger) -> ExifClass | None
     return None
 
 
-def extract_exiftool(path: Path | str, logger: logging.Logger) -> ExifClass | None:
+def extract_piexif_buffer(data: bytes, path: Path, logger: logging.Logger) -> ExifClass | None:
+    from medren.backend_piexif import piexif_get_buffer
+    ex, stat = piexif_get_buffer(data, path, logger=logger)
+    if stat == ExifStat.ValidExif:
+        return ex
+    return None
+
+
+exiftool_local = threading.local()  # The exiftool process of each thread (see exiftool_helper)
+
+
+def exiftool_helper():
+    """
+    The exiftool process of this thread, started on first use and kept running between files (-stay_open),
+    instead of starting exiftool (a Perl interpreter) for every file. A forked process starts its own.
+    """
     import exiftool
     from exiftool.exiftool import ENCODING_UTF8
+    pid, et = getattr(exiftool_local, 'helper', (None, None))
+    if et is None or pid != os.getpid() or not et.running:
+        et = exiftool.ExifToolHelper(encoding=ENCODING_UTF8)
+        et.run()
+        exiftool_local.helper = os.getpid(), et
+    return et
+
+
+def extract_exiftool(path: Path | str, logger: logging.Logger) -> ExifClass | None:
+    from exiftool.exceptions import ExifToolExecuteError
     path = Path(path)
-    with (exiftool.ExifToolHelper(encoding=ENCODING_UTF8) as et):
+    et = exiftool_helper()
+    try:
         metadata = et.get_metadata(str(path))
-        if metadata and len(metadata) > 0:
-            metadata = metadata[0]
-            exif_date = metadata.get('EXIF:DateTimeOriginal')
-            date_str = exif_date or \
-                        metadata.get('MakerNotes:TimeStamp') or \
-                        metadata.get('QuickTime:CreateDate')
-            if date_str:
-                dt, goff = extract_datetime_with_optional_goff(date_str, logger)
-                is_utc = goff is None and exif_date is None
-                lat = metadata.get('Composite:GPSLatitude')
-                lon = metadata.get('Composite:GPSLongitude')
-                make, model = clean_make_model(metadata.get('MakerNotes:Make'), metadata.get('MakerNotes:Model'))
-                if not lat or not lon:
-                    latlon = metadata.get('Composite:GPSPosition', metadata.get('QuickTime:GPSCoordinates'))
-                    if latlon:
-                        try:
-                            lat, lon = str(latlon).split(' ')
-                            lat = float(lat)
-                            lon = float(lon)
-                        except Exception:
-                            lat, lon = None, None
-                return ExifClass(backend='exiftool', ext=path.suffix, dt=dt, goff=goff, lat=lat, make=make, model=model, lon=lon, is_utc=is_utc)
+    except ExifToolExecuteError:
+        raise  # exiftool failed on the file and is ready for the next one
+    except Exception:
+        # the process may be out of sync with its output, the next file starts a new one
+        et.terminate()
+        exiftool_local.helper = None, None
+        raise
+    if metadata and len(metadata) > 0:
+        metadata = metadata[0]
+        exif_date = metadata.get('EXIF:DateTimeOriginal')
+        date_str = exif_date or \
+                    metadata.get('MakerNotes:TimeStamp') or \
+                    metadata.get('QuickTime:CreateDate')
+        if date_str:
+            dt, goff = extract_datetime_with_optional_goff(date_str, logger)
+            is_utc = goff is None and exif_date is None
+            lat = metadata.get('Composite:GPSLatitude')
+            lon = metadata.get('Composite:GPSLongitude')
+            make, model = clean_make_model(metadata.get('MakerNotes:Make'), metadata.get('MakerNotes:Model'))
+            if not lat or not lon:
+                latlon = metadata.get('Composite:GPSPosition', metadata.get('QuickTime:GPSCoordinates'))
+                if latlon:
+                    try:
+                        lat, lon = str(latlon).split(' ')
+                        lat = float(lat)
+                        lon = float(lon)
+                    except Exception:
+                        lat, lon = None, None
+            return ExifClass(backend='exiftool', ext=path.suffix, dt=dt, goff=goff, lat=lat, make=make, model=model,
+                             lon=lon, is_utc=is_utc)
     return None
 
 
 def extract_exifread(path: Path | str, logger: logging.Logger) -> ExifClass | None:
+    path = Path(path)
+    with open(path, 'rb') as f:
+        return exifread_get(f, path, logger)
+
+
+def extract_exifread_buffer(data: bytes, path: Path, logger: logging.Logger) -> ExifClass | None:
+    return exifread_get(io.BytesIO(data), path, logger)
+
+
+def exifread_get(f: BinaryIO, path: Path, logger: logging.Logger) -> ExifClass | None:
     import exifread
     from exifread.classes import IfdTag
 
@@ -92,141 +152,141 @@ def extract_exifread(path: Path | str, logger: logging.Logger) -> ExifClass | No
             return None
         return parse_offset(p.values, logger)
 
-    path = Path(path)
-    with open(path, 'rb') as f:
-        tags = exifread.process_file(f)
-        t_org = get_tag_str(tags.get('EXIF DateTimeOriginal'))
-        t_dig = get_tag_str(tags.get('EXIF DateTimeDigitized'))
-        dt, stat = get_best_dt([t_org, t_dig])
-        if dt is None:
-            return None
-        t_img = get_tag_str(tags.get('Image DateTime'))
-        t_fn = extract_datetime_from_filename(path.name)
-        dt = parse_datetime_colon(t_org)
-
-        goff_org = get_offset_tag(tags.get('EXIF OffsetTimeOriginal'))
-        goff_dig = get_offset_tag(tags.get('EXIF OffsetTimeDigitized'))
-        goff_img = get_offset_tag(tags.get('EXIF OffsetTime'))
-
-        make = get_tag_str(tags.get('Image Make'))
-        model = get_tag_str(tags.get('Image Model'))
-        make, model = clean_make_model(make, model)
-
-        w = get_tag_int(tags.get('EXIF ExifImageWidth'))
-        h = get_tag_int(tags.get('EXIF ExifImageLength'))
-
-        iw = get_tag_int(tags.get('Image ImageWidth'))
-        ih = get_tag_int(tags.get('Image ImageLength'))
-        # XResolution = get_tag_val(tags.get('Image XResolution'))
-        # YResolution = get_tag_val(tags.get('Image YResolution'))
-
-        lat = parse_gps_tag(tags.get('GPS GPSLatitude'), tags.get('GPS GPSLatitudeRef'))
-        lon = parse_gps_tag(tags.get('GPS GPSLongitude'), tags.get('GPS GPSLongitudeRef'))
-        alt = get_tag_float(tags.get('GPS GPSAltitude'), 1)
-        ex = ExifClass(
-            ext=path.suffix,
-
-            dt=dt,
-            is_utc=False,
-            t_org=t_org,
-            t_dig=t_dig,
-            t_img=t_img,
-            t_fn=t_fn,
-
-            goff=goff_org,
-            goff_dig=goff_dig,
-            goff_img=goff_img,
-
-            make=make,
-            model=model,
-
-            w=w,
-            h=h,
-            iw=iw,
-            ih=ih,
-
-            lat=lat,
-            lon=lon,
-            alt=alt,
-
-            backend='exifread',
-        )
-        # ex.goff_form_loc(logger=logger)
-        return ex
+    tags = exifread.process_file(f)
+    t_org = get_tag_str(tags.get('EXIF DateTimeOriginal'))
+    t_dig = get_tag_str(tags.get('EXIF DateTimeDigitized'))
+    dt, stat = get_best_dt([t_org, t_dig])
+    if dt is None:
+        return None
+    t_img = get_tag_str(tags.get('Image DateTime'))
+    t_fn = extract_datetime_from_filename(path.name)
+    dt = parse_datetime_colon(t_org)
+
+    goff_org = get_offset_tag(tags.get('EXIF OffsetTimeOriginal'))
+    goff_dig = get_offset_tag(tags.get('EXIF OffsetTimeDigitized'))
+    goff_img = get_offset_tag(tags.get('EXIF OffsetTime'))
+
+    make = get_tag_str(tags.get('Image Make'))
+    model = get_tag_str(tags.get('Image Model'))
+    make, model = clean_make_model(make, model)
+
+    w = get_tag_int(tags.get('EXIF ExifImageWidth'))
+    h = get_tag_int(tags.get('EXIF ExifImageLength'))
+
+    iw = get_tag_int(tags.get('Image ImageWidth'))
+    ih = get_tag_int(tags.get('Image ImageLength'))
+    # XResolution = get_tag_val(tags.get('Image XResolution'))
+    # YResolution = get_tag_val(tags.get('Image YResolution'))
+
+    lat = parse_gps_tag(tags.get('GPS GPSLatitude'), tags.get('GPS GPSLatitudeRef'))
+    lon = parse_gps_tag(tags.get('GPS GPSLongitude'), tags.get('GPS GPSLongitudeRef'))
+    alt = get_tag_float(tags.get('GPS GPSAltitude'), 1)
+    ex = ExifClass(
+        ext=path.suffix,
+
+        dt=dt,
+        is_utc=False,
+        t_org=t_org,
+        t_dig=t_dig,
+        t_img=t_img,
+        t_fn=t_fn,
+
+        goff=goff_org,
+        goff_dig=goff_dig,
+        goff_img=goff_img,
+
+        make=make,
+        model=model,
+
+        w=w,
+        h=h,
+        iw=iw,
+        ih=ih,
+
+        lat=lat,
+        lon=lon,
+        alt=alt,
+
+        backend='exifread',
+    )
+    # ex.goff_form_loc(logger=logger)
+    return ex
 
 
 def extract_hachoir(path: Path | str, logger: logging.Logger) -> ExifClass | None:
-    from hachoir.metadata import extractMetadata
     from hachoir.parser import createParser
     path = Path(path)
-    parser = createParser(str(path))
-    t_org = t_dig = t_img = dt = goff_org = goff_dig = goff_img = make = model = w = h = iw = ih = lat = lon = alt = None
+    return hachoir_get(createParser(str(path)), path, logger)
+
+
+def extract_hachoir_buffer(data: bytes, path: Path, logger: logging.Logger) -> ExifClass | None:
+    from hachoir.parser import createParser
+    return hachoir_get(createParser(io.BytesIO(data), real_filename=str(path)), path, logger)
+
+
+def hachoir_colon_datetime(value: str) -> str:
+    return value.replace('-', ':')
+
+
+def hachoir_unit_int(value: str) -> int:
+    return int(value[:-7])  # e.g. '4000 pixels'
+
+
+def hachoir_unit_float(value: str) -> float:
+    return round(float(value[:-7]), 1)  # e.g. '35.0 meters'
+
+
+# hachoir plaintext tag name -> (ExifClass field, parser)
+HACHOIR_TAGS: dict[str, tuple[str, Callable[[str], Any]]] = {
+    "Image width": ('iw', hachoir_unit_int),
+    "Image height": ('ih', hachoir_unit_int),
+    "Camera model": ('model', str),
+    "Camera manufacturer": ('make', str),
+    "Date-time original": ('t_org', hachoir_colon_datetime),
+    "Date-time digitized": ('t_dig', hachoir_colon_datetime),
+    "Creation date": ('t_img', hachoir_colon_datetime),
+    "Latitude": ('lat', float),
+    "Longitude": ('lon', float),
+    "Altitude": ('alt', hachoir_unit_float),
+}
+
+
+def hachoir_tags(metadata) -> dict[str, Any]:
+    """The ExifClass fields of the hachoir metadata."""
+    tags = {}
+    for item in metadata.exportPlaintext():
+        try:
+            tag_name, tag_val = item.split(": ")
+        except Exception:
+            continue
+        tag = HACHOIR_TAGS.get(tag_name[2:])
+        if tag is None:
+            continue
+        name, parse = tag
+        if name == 't_img' and tags.get(name):
+            continue  # sometimes this entry appears twice (why?), the first occurrence is the correct one
+        tags[name] = parse(tag_val)
+    return tags
+
+
+def hachoir_get(parser, path: Path, logger: logging.Logger) -> ExifClass | None:
+    from hachoir.metadata import extractMetadata
     try:
         metadata = extractMetadata(parser) if parser else None
         if metadata:
-            for item in metadata.exportPlaintext():
-                try:
-                    tag_name, tag_val = item.split(": ")
-                except Exception:
-                    continue
-                tag_name = tag_name[2:]
-                if tag_name == "Image width":
-                    iw = int(tag_val[:-7])  # pixels
-                elif tag_name == "Image height":
-                    ih = int(tag_val[:-7])
-                elif tag_name == "Camera model":
-                    model = tag_val
-                elif tag_name == "Camera manufacturer":
-                    make = tag_val
-                elif tag_name == "Date-time original":
-                    t_org = tag_val.replace('-', ':')
-                elif tag_name == "Date-time digitized":
-                    t_dig = tag_val.replace('-', ':')
-                elif tag_name == "Creation date":
-                    if not t_img:
-                        # sometimes this entry appears twice (why?), the first occurrence is the correct one
-                        t_img = tag_val.replace('-', ':')
-                elif tag_name == "Latitude":
-                    lat = float(tag_val)
-                elif tag_name == "Longitude":
-                    lon = float(tag_val)
-                elif tag_name == "Altitude":
-                    alt = round(float(tag_val[:-7]), 1)  # meters
-
+            tags = hachoir_tags(metadata)
+            t_org, t_dig = tags.get('t_org'), tags.get('t_dig')
             if not t_org and not t_dig:
                 return None
-            dt = parse_datetime_colon(t_org or t_dig)
-            make, model = clean_make_model(make, model)
-            t_fn = extract_datetime_from_filename(path.name)
+            tags['make'], tags['model'] = clean_make_model(tags.get('make'), tags.get('model'))
             return ExifClass(
                 ext=path.suffix,
-
-                dt=dt,
+                dt=parse_datetime_colon(t_org or t_dig),
                 is_utc=False,
-                t_org=t_org,
-                t_dig=t_dig,
-                t_img=t_img,
-                t_fn=t_fn,
-
-                goff=goff_org,
-                goff_dig=goff_dig,
-                goff_img=goff_img,
-
-                make=make,
-                model=model,
-
-                w=w,
-                h=h,
-                iw=iw,
-                ih=ih,
-
-                lat=lat,
-                lon=lon,
-                alt=alt,
-
+                t_fn=extract_datetime_from_filename(path.name),
                 backend='hachoir',
+                **tags,
             )
-
     finally:
         if parser:
             parser.stream._input.close()
@@ -237,6 +297,10 @@ def extract_pymediainfo(path: Path | str, logger: logging.Logger) -> ExifClass |
     from pymediainfo import MediaInfo
     path = Path(path)
     media_info = MediaInfo.parse(path)
+    return pymediainfo_to_exif(media_info, path, logger)
+
+
+def pymediainfo_to_exif(media_info, path: Path, logger: logging.Logger) -> ExifClass | None:
     for track in media_info.tracks:
         if track.track_type == 'General' and track.encoded_date:
             date_str = track.encoded_date.split('UTC')[0].strip()
@@ -283,6 +347,10 @@ def extract_ffmpeg(path: Path | str, logger: logging.Logger) -> ExifClass | None
         probe = ffmpeg.probe(str(path))
     except Exception:
         return None
+    return ffmpeg_probe_to_exif(probe, path, logger)
+
+
+def ffmpeg_probe_to_exif(probe: dict, path: Path, logger: logging.Logger) -> ExifClass | None:
     tags = probe['format'].get('tags')
     if not tags:
         return None
@@ -294,10 +362,157 @@ def extract_ffmpeg(path: Path | str, logger: logging.Logger) -> ExifClass | None
         lat, lon = parse_location_string(tags.get('location'))
         goff = parse_goff_string(tags.get('com.samsung.android.utc_offset'))
         make, model = clean_make_model(tags.get('maker'), tags.get('model'))
-        return ExifClass(backend='ffmpeg', ext=path.suffix, make=make, model=model, dt=dt, goff=goff, lat=lat, lon=lon, is_utc=is_utc)
+        return ExifClass(backend='ffmpeg', ext=path.suffix, make=make, model=model, dt=dt, goff=goff, lat=lat, lon=lon,
+                         is_utc=is_utc)
     return None
 
 
+# Batch extraction: video backends pay mostly for process startup and library loading,
+# so many files are handed to a few long-lived workers instead of one call per file.
+
+BatchResult = dict[Path, ExifClass | None]
+DEFAULT_BATCH_CHUNK = 16
+
+
+def _chunks(items: list, size: int) -> list[list]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _pymediainfo_worker_init():
+    # load libmediainfo once per worker process, later parse calls reuse the loaded library
+    from pymediainfo import MediaInfo
+    MediaInfo.can_parse()
+
+
+class WorkerPool:
+    """
+    Worker processes started on first use and reused by later batches (and Renamers),
+    so each batch does not pay for starting the processes (and their initializer) again.
+    A larger number of workers replaces the pool, the pool is shut down at exit.
+    """
+
+    def __init__(self, initializer: Callable[[], None] | None = None):
+        self.initializer = initializer
+        self.pool: ProcessPoolExecutor | None = None
+        self.workers = 0
+        self.lock = threading.Lock()
+
+    def get(self, workers: int) -> ProcessPoolExecutor:
+        with self.lock:
+            if self.pool is None or self.workers < workers:
+                if self.pool is None:
+                    atexit.register(self.shutdown)
+                else:
+                    self.pool.shutdown(wait=False)  # the batches already submitted to it still complete
+                self.pool = ProcessPoolExecutor(max_workers=workers, initializer=self.initializer)
+                self.workers = workers
+            return self.pool
+
+    def shutdown(self) -> None:
+        with self.lock:
+            pool, self.pool, self.workers = self.pool, None, 0
+        if pool is not None:
+            atexit.unregister(self.shutdown)
+            pool.shutdown()
+
+
+pymediainfo_workers = WorkerPool(_pymediainfo_worker_init)  # loads libmediainfo once per worker process
+
+
+def pymediainfo_pool(workers: int) -> ProcessPoolExecutor:
+    """The pymediainfo worker processes, reused by the batches (see WorkerPool)."""
+    return pymediainfo_workers.get(workers)
+
+
+def shutdown_pymediainfo_pool() -> None:
+    pymediainfo_workers.shutdown()
+
+
+def _pymediainfo_worker(paths: list[str]) -> list[ExifClass | None]:
+    worker_logger = logging.getLogger(__name__)
+    results = []
+    for path in paths:
+        try:
+            results.append(extract_pymediainfo(path, worker_logger))
+        except Exception as e:
+            worker_logger.debug(f"pymediainfo: Could not extract datetime from {path}: {e}")
+            results.append(None)
+    return results
+
+
+def extract_pymediainfo_batch(paths: list[Path | str], logger: logging.Logger,
+                              workers: int = 4, chunk_size: int = DEFAULT_BATCH_CHUNK) -> BatchResult:
+    """
+    Extract metadata for many files using persistent pymediainfo worker processes.
+
+    Args:
+        paths: Files to extract
+        logger: Logger
+        workers: Number of worker processes
+        chunk_size: Number of files handed to a worker at once
+
+    Returns:
+        BatchResult: Mapping of each path to its ExifClass (or None), as extract_pymediainfo would return
+    """
+    from concurrent.futures.process import BrokenProcessPool
+
+    paths = [Path(p) for p in paths]
+    results: BatchResult = {}
+    if not paths:
+        return results
+    chunks = _chunks([str(p) for p in paths], chunk_size)
+    try:
+        for chunk, chunk_results in zip(chunks, pymediainfo_pool(workers).map(_pymediainfo_worker, chunks)):
+            for path, ex in zip(chunk, chunk_results):
+                results[Path(path)] = ex
+    except BrokenProcessPool:
+        shutdown_pymediainfo_pool()  # a worker died (e.g. crashed in libmediainfo), the next batch starts a new pool
+        raise
+    return results
+
+
+def extract_ffmpeg_batch(paths: list[Path | str], logger: logging.Logger,
+                         workers: int = 4, chunk_size: int = DEFAULT_BATCH_CHUNK) -> BatchResult:
+    """
+    Extract metadata for many files, running chunks of ffprobe calls concurrently.
+
+    ffprobe accepts a single input per invocation, so each chunk is probed sequentially by one thread
+    while several chunks overlap their process startup.
+
+    Args:
+        paths: Files to extract
+        logger: Logger
+        workers: Number of concurrent ffprobe chunks
+        chunk_size: Number of files probed by a chunk
+
+    Returns:
+        BatchResult: Mapping of each path to its ExifClass (or None), as extract_ffmpeg would return
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    def probe_chunk(chunk: list[Path]) -> list[ExifClass | None]:
+        chunk_results = []
+        for path in chunk:
+            try:
+                chunk_results.append(extract_ffmpeg(path, logger))
+            except Exception as e:
+                logger.debug(f"ffmpeg: Could not extract datetime from {path}: {e}")
+                chunk_results.append(None)
+        return chunk_results
+
+    paths = [Path(p) for p in paths]
+    results: BatchResult = {}
+    if not paths:
+        return results
+    chunks = _chunks(paths, chunk_size)
+    with ThreadPoolExecutor(max_workers=min(workers, len(chunks))) as pool:
+        # each chunk runs in a copy of the caller context, so the warnings reach its active report
+        futures = [pool.submit(contextvars.copy_context().run, probe_chunk, chunk) for chunk in chunks]
+        for chunk, future in zip(chunks, futures):
+            results.update(zip(chunk, future.result()))
+    return results
+
+
 @dataclass
 class Backend:
     module: str
@@ -305,18 +520,36 @@ class Backend:
     ext: list[str] | None
     func: Callable[[Path | str, logging.Logger], ExifClass | None]
     dep: list[str]
+    batch_func: Callable[..., BatchResult] | None = None  # (paths, logger, workers=...) -> BatchResult
+    builtin: bool = False  # implemented by medren itself, always available
+    # (header bytes, path, logger) -> ExifClass, parses a header that was already read (see Renamer.fuse)
+    buffer_func: Callable[[bytes, Path, logging.Logger], ExifClass | None] | None = None
+    # (seekable file object, path, logger) -> ExifClass, parses a file that is not on disk (see remote.py)
+    stream_func: Callable[[BinaryIO, Path, logging.Logger], ExifClass | None] | None = None
 
 
 backend_support = {b.module: b for b in [
-    Backend(module='exifread', package='exifread', ext=None, func=extract_exifread, dep=[]),
-    Backend(module='piexif', package='piexif', ext=image_ext_with_exif, func=extract_piexif, dep=[]),
+    Backend(module='isobmff', package='medren', ext=isobmff_extensions, func=extract_isobmff, dep=[], builtin=True,
+            stream_func=isobmff_get),
+    Backend(module='exifread', package='exifread', ext=None, func=extract_exifread, dep=[],
+            buffer_func=extract_exifread_buffer, stream_func=exifread_get),
+    Backend(module='piexif', package='piexif', ext=image_ext_with_exif, func=extract_piexif, dep=[],
+            buffer_func=extract_piexif_buffer),
+    # after the Exif backends: a sidecar often only holds a date, and is probed for next to every file
+    Backend(module='xmp', package='medren', ext=None, func=extract_xmp_sidecar, dep=[], builtin=True),
     Backend(module='exiftool', package='pyexiftool', ext=None, func=extract_exiftool, dep=['exiftool.exe']),
-    Backend(module='hachoir', package='hachoir', ext=None, func=extract_hachoir, dep=['hachoir-metadata.exe']),
-    Backend(module='pymediainfo', package='pymediainfo', ext=None, func=extract_pymediainfo, dep=['MediaInfo.dll']),
-    Backend(module='ffmpeg', package='ffmpeg-python', ext=None, func=extract_ffmpeg, dep=['ffprobe.exe']),
+    Backend(module='hachoir', package='hachoir', ext=None, func=extract_hachoir, dep=['hachoir-metadata.exe'],
+            buffer_func=extract_hachoir_buffer),
+    Backend(module='pymediainfo', package='pymediainfo', ext=None, func=extract_pymediainfo, dep=['MediaInfo.dll'],
+            batch_func=extract_pymediainfo_batch),
+    Backend(module='ffmpeg', package='ffmpeg-python', ext=None, func=extract_ffmpeg, dep=['ffprobe.exe'],
+            batch_func=extract_ffmpeg_batch),
+    # the last resort: Takeout times are UTC, and the media files usually keep their own metadata
+    Backend(module='takeout', package='medren', ext=None, func=extract_takeout_sidecar, dep=[], builtin=True),
 ]
                    }
 
 backend_priority = list(backend_support.keys())
-available_backends = [backend for backend in backend_priority if importlib.util.find_spec(backend)]
+available_backends = [backend for backend in backend_priority
+                      if backend_support[backend].builtin or importlib.util.find_spec(backend)]
 print(available_backends)
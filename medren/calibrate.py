@@ -0,0 +1,139 @@
+import logging
+import random
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from medren.backends import available_backends, backend_support
+from medren.consts import extension_normalized
+from medren.exif_process import ExifClass
+from medren.profiles import load_profile, save_profile
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SAMPLES_PER_EXT = 10
+COMPLETENESS_FIELDS = ('dt', 'goff', 'make', 'model', 'lat', 'lon', 'w', 'h')
+
+BackendOrder = dict[str, list[str]]  # extension -> backends by priority
+
+
+def completeness(ex: ExifClass | None) -> float:
+    """The fraction of the main fields that a result has."""
+    if ex is None:
+        return 0.0
+    return sum(getattr(ex, f) is not None for f in COMPLETENESS_FIELDS) / len(COMPLETENESS_FIELDS)
+
+
+@dataclass
+class CalibrationStat:
+    calls: int = 0
+    ok: int = 0  # returned a datetime
+    seconds: float = 0.0
+    completeness: float = 0.0  # sum over the calls
+
+    @property
+    def success_rate(self) -> float:
+        return self.ok / self.calls if self.calls else 0.0
+
+    @property
+    def mean_seconds(self) -> float:
+        return self.seconds / self.calls if self.calls else 0.0
+
+    @property
+    def mean_completeness(self) -> float:
+        return self.completeness / self.calls if self.calls else 0.0
+
+    @property
+    def cost(self) -> float:
+        """
+        Expected seconds per datetime found.
+
+        Trying backends in increasing cost order minimizes the expected time until one of them succeeds.
+        """
+        return self.mean_seconds / self.success_rate if self.ok else float('inf')
+
+
+@dataclass
+class Calibration:
+    stats: dict[str, dict[str, CalibrationStat]] = \
+        field(default_factory=lambda: defaultdict(lambda: defaultdict(CalibrationStat)))  # ext -> backend -> stat
+
+    def order(self) -> BackendOrder:
+        """The backends of each extension by cost, ties broken by the completeness of their results."""
+        return {ext: sorted(backends, key=lambda b: (backends[b].cost, -backends[b].mean_completeness,
+                                                     backends[b].mean_seconds))
+                for ext, backends in self.stats.items()}
+
+    def summary(self) -> str:
+        lines = []
+        for ext, order in self.order().items():
+            lines.append(f'{ext}:')
+            for b in order:
+                stat = self.stats[ext][b]
+                lines.append(f'  {b}: {stat.ok}/{stat.calls} ok, {1000 * stat.mean_seconds:.1f}ms, '
+                             f'{100 * stat.mean_completeness:.0f}% complete')
+        return '\n'.join(lines)
+
+
+def normalized_ext(path: Path) -> str:
+    ext = path.suffix.lower()
+    return extension_normalized.get(ext, ext)
+
+
+def sample_files(paths: list[Path], per_ext: int = DEFAULT_SAMPLES_PER_EXT, seed: int = 0) -> dict[str, list[Path]]:
+    """Pick up to per_ext files of each extension."""
+    by_ext = defaultdict(list)
+    for path in paths:
+        by_ext[normalized_ext(path)].append(path)
+    rng = random.Random(seed)
+    return {ext: rng.sample(files, min(per_ext, len(files))) for ext, files in by_ext.items()}
+
+
+def calibrate(paths: list[Path | str], backends: list[str] | None = None,
+              per_ext: int = DEFAULT_SAMPLES_PER_EXT, seed: int = 0) -> Calibration:
+    """
+    Time every backend on a sample of the files of each extension.
+
+    Each backend first runs once on a file of the extension without being timed,
+    so library loading and other warm up costs are not counted.
+
+    Args:
+        paths: Files to sample from
+        backends: Backends to calibrate (default: all the available backends)
+        per_ext: Files sampled per extension
+        seed: Seed of the sampling
+
+    Returns:
+        Calibration: The stats per extension and backend
+    """
+    backends = backends or available_backends
+    result = Calibration()
+    samples = sample_files([Path(p) for p in paths if Path(p).is_file()], per_ext, seed)
+    for ext, files in samples.items():
+        for backend in backends:
+            b = backend_support[backend]
+            if b.ext is not None and ext not in b.ext:
+                continue
+            stat = result.stats[ext][backend]
+            for i, path in enumerate([files[0], *files]):
+                start = time.perf_counter()
+                try:
+                    ex = b.func(path, logger)
+                except Exception as e:
+                    logger.debug(f"{backend}: Could not extract datetime from {path}: {e}")
+                    ex = None
+                if i == 0:
+                    continue  # warm up
+                stat.seconds += time.perf_counter() - start
+                stat.calls += 1
+                stat.ok += ex is not None and ex.dt is not None
+                stat.completeness += completeness(ex)
+    return result
+
+
+def save_backend_order(profile_name: str | None, order: BackendOrder) -> None:
+    """Store a calibrated backend order in a profile, merged with the order of other extensions."""
+    values = load_profile(profile_name)
+    values['backend_order'] = {**(values.get('backend_order') or {}), **order}
+    save_profile(values, profile_name)
@@ -0,0 +1,245 @@
+import datetime
+import json
+import logging
+import math
+import sqlite3
+from collections.abc import Iterable
+from dataclasses import dataclass
+from pathlib import Path
+
+from medren.consts import MEDREN_DIR
+from medren.exif_process import ExifClass
+from medren.preview_cache import file_key
+
+logger = logging.getLogger(__name__)
+
+CATALOG_PATH = MEDREN_DIR / 'catalog.sqlite'
+GRID_DEG = 0.05  # Size of the lat/lon grid cells of the location index (about 5.5 km of latitude)
+EARTH_RADIUS_KM = 6371.0088
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS media (
+    path TEXT PRIMARY KEY,
+    dir TEXT NOT NULL,
+    name TEXT NOT NULL,
+    ext TEXT,
+    size INTEGER,
+    mtime_ns INTEGER,
+    dt TEXT,
+    goff REAL,
+    make TEXT COLLATE NOCASE,
+    model TEXT COLLATE NOCASE,
+    lat REAL,
+    lon REAL,
+    cell_lat INTEGER,
+    cell_lon INTEGER,
+    sha256 TEXT,
+    backend TEXT,
+    new_name TEXT,
+    exif TEXT NOT NULL,
+    scanned_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS media_dt ON media (dt);
+CREATE INDEX IF NOT EXISTS media_make_model ON media (make, model);
+CREATE INDEX IF NOT EXISTS media_cell ON media (cell_lat, cell_lon);
+CREATE INDEX IF NOT EXISTS media_sha256 ON media (sha256);
+"""
+
+COLUMNS = ['path', 'dir', 'name', 'ext', 'size', 'mtime_ns', 'dt', 'goff', 'make', 'model', 'lat', 'lon',
+           'cell_lat', 'cell_lon', 'sha256', 'backend', 'new_name', 'exif', 'scanned_at']
+
+
+def grid_cell(lat: float, lon: float) -> tuple[int, int]:
+    return math.floor(lat / GRID_DEG), math.floor(lon / GRID_DEG)
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Return the great circle distance between two points in km."""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def format_dt(dt: datetime.datetime | datetime.date | str | None) -> str | None:
+    """Format a datetime as stored in the catalog, so text comparison orders by time."""
+    if dt is None or isinstance(dt, str):
+        return dt
+    if not isinstance(dt, datetime.datetime):
+        dt = datetime.datetime.combine(dt, datetime.time())
+    return dt.strftime('%Y-%m-%d %H:%M:%S')
+
+
+@dataclass
+class CatalogRow:
+    path: Path
+    size: int | None
+    mtime_ns: int | None
+    sha256: str | None
+    new_name: str | None
+    exif: ExifClass
+    distance_km: float | None = None  # Distance from the `near` point of the query
+
+
+@dataclass
+class CatalogQuery:
+    """The filters of a catalog query (see Catalog.query)."""
+    make: str | None = None
+    model: str | None = None
+    start: datetime.datetime | datetime.date | str | None = None
+    end: datetime.datetime | datetime.date | str | None = None
+    near: tuple[float, float] | None = None
+    radius_km: float | None = None
+    sha256: str | None = None
+    directory: Path | str | None = None
+
+    def where(self) -> tuple[list[str], list]:
+        """The WHERE conditions and their parameters."""
+        where, params = [], []
+        # prefix LIKE on a NOCASE column can use the index
+        for column, value in (('make', self.make), ('model', self.model)):
+            if value:
+                where.append(f"{column} LIKE ? ESCAPE '\\'")
+                params.append(value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+        for condition, value in (("dt >= ?", format_dt(self.start)), ("dt < ?", format_dt(self.end)),
+                                 ("sha256 = ?", self.sha256 or None),
+                                 ("dir = ?", None if self.directory is None else str(self.directory))):
+            if value is not None:
+                where.append(condition)
+                params.append(value)
+        if self.near is not None:
+            if self.radius_km is None:
+                raise ValueError('radius_km is required with near')
+            # the index narrows the search to the grid cells of the bounding box, the distance filters the rest
+            lat, lon = self.near
+            dlat = self.radius_km / (math.pi * EARTH_RADIUS_KM / 180)
+            dlon = dlat / max(math.cos(math.radians(lat)), 1e-6)
+            (lat0, lon0), (lat1, lon1) = grid_cell(lat - dlat, lon - dlon), grid_cell(lat + dlat, lon + dlon)
+            where.append("cell_lat BETWEEN ? AND ? AND cell_lon BETWEEN ? AND ?")
+            params += [lat0, lat1, lon0, lon1]
+        return where, params
+
+
+class Catalog:
+    """
+    A local SQLite catalog of the extracted metadata, one row per file.
+
+    Rows are keyed by path and replaced when a file is scanned again.
+    The full ExifClass is kept as JSON, so renames can be generated from the catalog without reading the files.
+    """
+
+    def __init__(self, path: Path | str = CATALOG_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self) -> 'Catalog':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def add(self, entries: Iterable[tuple[Path, ExifClass, str | None, str | None]]) -> int:
+        """
+        Add or replace the rows of scanned files.
+
+        Args:
+            entries: The paths, their metadata, new names and content hashes (None when not computed)
+
+        Returns:
+            int: The number of rows written
+        """
+        scanned_at = format_dt(datetime.datetime.now())
+        rows = []
+        for entry_path, ex, new_name, sha256 in entries:
+            key = file_key(entry_path)
+            size, mtime_ns = (key[1], key[2]) if key else (None, None)
+            cell = grid_cell(ex.lat, ex.lon) if ex.lat is not None and ex.lon is not None else (None, None)
+            path = Path(entry_path)
+            rows.append((str(path), str(path.parent), path.name, ex.ext, size, mtime_ns, format_dt(ex.dt), ex.goff,
+                         ex.make, ex.model, ex.lat, ex.lon, *cell, sha256, ex.backend, new_name,
+                         json.dumps(ex.to_dict()), scanned_at))
+        with self.conn:
+            # a file scanned again without hashing keeps its known hash
+            self.conn.executemany(
+                f"INSERT INTO media ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))}) "
+                f"ON CONFLICT (path) DO UPDATE SET "
+                f"{', '.join(f'{c} = excluded.{c}' for c in COLUMNS if c not in ('path', 'sha256'))}, "
+                f"sha256 = CASE WHEN excluded.sha256 IS NOT NULL OR media.size != excluded.size "
+                f"OR media.mtime_ns != excluded.mtime_ns THEN excluded.sha256 ELSE media.sha256 END",
+                rows)
+        return len(rows)
+
+    def remove(self, paths: Iterable[Path | str]) -> None:
+        with self.conn:
+            self.conn.executemany("DELETE FROM media WHERE path = ?", [(str(p),) for p in paths])
+
+    def moved(self, moves: dict[str, str]) -> None:
+        """Update the paths of renamed files."""
+        if not moves:
+            return
+        # in a chain (B -> C, A -> B) the row of B moves before A takes its path
+        pending = dict(moves)
+        ordered = []
+        while pending:
+            ready = [org for org, new in pending.items() if new not in pending] or list(pending)
+            ordered += [(org, pending.pop(org)) for org in ready]
+        with self.conn:
+            # the rows of replaced files, the paths that are also moved away keep their rows
+            self.conn.executemany("DELETE FROM media WHERE path = ?",
+                                  [(new,) for new in moves.values() if new not in moves])
+            self.conn.executemany("UPDATE media SET path = ?, dir = ?, name = ? WHERE path = ?",
+                                  [(new, str(Path(new).parent), Path(new).name, org) for org, new in ordered])
+
+    def query(self, make: str | None = None, model: str | None = None,  # noqa: PLR0913 (see CatalogQuery)
+              start: datetime.datetime | datetime.date | str | None = None,
+              end: datetime.datetime | datetime.date | str | None = None,
+              near: tuple[float, float] | None = None, radius_km: float | None = None,
+              sha256: str | None = None, directory: Path | str | None = None,
+              limit: int | None = None) -> list[CatalogRow]:
+        """
+        Query the catalog, e.g. all the Pixel photos in March 2024 within 5 km of a point.
+
+        Args:
+            make: Camera make prefix (case insensitive)
+            model: Camera model prefix (case insensitive)
+            start: The earliest datetime (inclusive)
+            end: The latest datetime (exclusive)
+            near: A (lat, lon) point
+            radius_km: The maximum distance from `near` (required with it)
+            sha256: Content hash
+            directory: Only files in this directory
+            limit: The maximum number of rows
+
+        Returns:
+            list[CatalogRow]: The matching rows, by datetime (or by distance when `near` is given)
+        """
+        where, params = CatalogQuery(make=make, model=model, start=start, end=end, near=near, radius_km=radius_km,
+                                     sha256=sha256, directory=directory).where()
+        sql = "SELECT path, size, mtime_ns, sha256, new_name, exif FROM media"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY dt, path"
+        if limit is not None and near is None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        rows = []
+        for path, size, mtime_ns, sha, new_name, exif in self.conn.execute(sql, params):
+            row = CatalogRow(path=Path(path), size=size, mtime_ns=mtime_ns, sha256=sha, new_name=new_name,
+                             exif=ExifClass.from_dict(json.loads(exif)))
+            if near is not None:
+                row.distance_km = haversine_km(near[0], near[1], row.exif.lat, row.exif.lon)
+                if row.distance_km > radius_km:
+                    continue
+            rows.append(row)
+        if near is not None:
+            rows.sort(key=lambda r: r.distance_km)
+            rows = rows[:limit]
+        return rows
+
+    def count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM media").fetchone()[0]
@@ -0,0 +1,417 @@
+import argparse
+import datetime
+import logging
+import sys
+from collections.abc import Callable
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from medren.backends import available_backends
+from medren.calibrate import DEFAULT_SAMPLES_PER_EXT, calibrate, save_backend_order
+from medren.catalog import CATALOG_PATH, Catalog
+from medren.consts import DEFAULT_PROFILE_NAME, file_types
+from medren.daemon import DEFAULT_JOBS, SOCKET_PATH, Daemon
+from medren.mover import TRANSFER_MODES
+from medren.plan import read_plan, verify_plan, write_plan
+from medren.profiles import Modes, load_profile
+from medren.renamer import MEDREN_DIR, Renamer
+from medren.report import OutcomeReport
+from medren.stats import RenamerStats, profiled
+from medren.supervisor import DEFAULT_FILE_TIMEOUT, Quarantine, Supervisor
+from medren.template_match import SKIP_MODES
+from medren.writeback import DEFAULT_WORKERS, undo, write_back_many
+
+if TYPE_CHECKING:
+    from medren.exif_process import ExifClass
+    from medren.tracklog import Geotagger
+
+logger = logging.getLogger(__name__)
+
+
+def add_renamer_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--profile', '-P', help='Profile name')
+    parser.add_argument('--template', '-t', help='Template value')
+    parser.add_argument('--datetime-format', '-d', help='Datetime format value')
+    parser.add_argument('--prefix', '-p', help='Prefix value')
+    parser.add_argument('--suffix', '-s', help='Suffix value')
+    parser.add_argument('--separator', help='Separator value')
+    parser.add_argument('--recursive', '-r', action='store_true', help='Process sub directories')
+    parser.add_argument('--backends', nargs='+', choices=available_backends, help='Backends by priority')
+    parser.add_argument('--batch-workers', type=int, default=0,
+                        help='Workers for batch extraction of video backends (0 extracts file by file)')
+    parser.add_argument('--no-pair', dest='pair', action='store_false',
+                        help='Do not rename Live Photo, RAW+JPEG and sidecar files together')
+    parser.add_argument('--fuse', action='store_true',
+                        help='Merge the fields of all backends, reading the file head once')
+    parser.add_argument('--dest', type=Path,
+                        help='Root directory of the new paths '
+                             '(organize mode, e.g. with --template "{year}/{month}/...")')
+    parser.add_argument('--transfer', choices=TRANSFER_MODES, default='move',
+                        help='move (rename), copy (reflink where possible) or hardlink the files to their new paths')
+    parser.add_argument('--archives', action='store_true',
+                        help='Rename the media inside zip/tar inputs (with --dest), applying extracts them')
+    parser.add_argument('--skip-conforming', nargs='?', const='skip', choices=SKIP_MODES,
+                        help='Skip files the template already named, from their names alone (skip) '
+                             'or after comparing them to the extracted datetime (verify)')
+    parser.add_argument('--near-dups', action='store_true',
+                        help='Group near duplicates by their Exif thumbnails (also the {dup} template field)')
+    parser.add_argument('--dup-radius', type=int, default=8,
+                        help='Bits that may differ between the thumbnail hashes of near duplicates (of 64)')
+    parser.add_argument('--infer-tz', action='store_true',
+                        help='Infer the time offsets of files without a location from nearby geotagged files')
+    parser.add_argument('--tz-max-gap', type=float, default=12,
+                        help='Hours between a file and the geotagged files its offset is inferred from (--infer-tz)')
+    parser.add_argument('--track', nargs='+', type=Path,
+                        help='GPX, KML or CSV track logs (or directories of them) to locate the files without GPS')
+    parser.add_argument('--camera-tz', type=float,
+                        help='The UTC offset in hours the camera clock was set to, for files without one (--track)')
+    parser.add_argument('--clock-skew', type=float, default=0,
+                        help='Seconds the camera clock was ahead of the track log (--track)')
+    parser.add_argument('--track-max-gap', type=float, default=10,
+                        help='Minutes between a file and the track points it is located by (--track)')
+    parser.add_argument('--align-clocks', nargs='?', const='', metavar='REFERENCE',
+                        help='Correct the clock skews between the devices, relative to the reference device '
+                             '(make and model, by default the device with the most files)')
+    parser.add_argument('--timeout', type=float,
+                        help='Run the backends in a supervised worker, with this budget in seconds per backend')
+    parser.add_argument('--file-timeout', type=float, default=DEFAULT_FILE_TIMEOUT,
+                        help='Budget in seconds of all the backends for a file (with --timeout)')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='Extract and rename files concurrently, adapting the files in flight to each storage '
+                             'root (mount point) by its latency')
+    parser.add_argument('--ceiling', nargs='+', metavar='ROOT=N',
+                        help='The most files in flight under a root (--adaptive), over the ceilings of the profile')
+    parser.add_argument('--seek-order', action='store_true',
+                        help='Read the files in their order on the disk and read their headers ahead (spinning disks)')
+
+
+def make_renamer(args: argparse.Namespace) -> Renamer:
+    """Create a Renamer from a profile, overridden by the command line arguments."""
+    values = load_profile(args.profile)
+    kwargs = {k: values[k] for k in ['template', 'datetime_format', 'normalize', 'prefix', 'suffix', 'separator']
+              if values.get(k) is not None}
+    for k in ['template', 'datetime_format', 'prefix', 'suffix', 'separator']:
+        if getattr(args, k) is not None:
+            kwargs[k] = getattr(args, k)
+    recursive = args.recursive or values.get('mode') == Modes.recursive
+    root_ceilings = {**(values.get('root_ceilings') or {}),
+                     **{root: int(n) for root, n in (c.rsplit('=', 1) for c in args.ceiling or [])}}
+    supervisor = Supervisor(backend_timeout=args.timeout, file_timeout=args.file_timeout) if args.timeout else None
+    return Renamer(backends=args.backends, backend_order=values.get('backend_order'), recursive=recursive,
+                   batch_workers=args.batch_workers, pair=args.pair, fuse=args.fuse, supervisor=supervisor,
+                   dest_root=args.dest, transfer=args.transfer, archives=args.archives,
+                   skip_conforming=args.skip_conforming, near_dups=args.near_dups, dup_radius=args.dup_radius,
+                   geotagger=make_geotagger(args), infer_tz=args.infer_tz,
+                   tz_max_gap=datetime.timedelta(hours=args.tz_max_gap), align_clocks=args.align_clocks is not None,
+                   reference_device=args.align_clocks or None, adaptive=args.adaptive,
+                   root_ceilings=root_ceilings or None, seek_order=args.seek_order, **kwargs)
+
+
+def make_geotagger(args: argparse.Namespace) -> 'Geotagger | None':
+    if not args.track:
+        return None
+    from medren.tracklog import Geotagger, TrackLog
+
+    track = TrackLog.load(args.track)
+    logger.info(f'Loaded {len(track)} track points')
+    return Geotagger(track=track, camera_goff=args.camera_tz, clock_skew=datetime.timedelta(seconds=args.clock_skew),
+                     max_gap=datetime.timedelta(minutes=args.track_max_gap))
+
+
+def add_profiling_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--profile-stats', type=Path, help='Write per-stage and per-backend stats to this JSON file')
+    parser.add_argument('--profiler', choices=['cprofile', 'pyinstrument'], help='Run under a profiler')
+    parser.add_argument('--profiler-out', type=Path, help='Profiler output file (printed if not given)')
+    parser.add_argument('--report', type=Path,
+                        help='Write the outcome of every file to this .csv, .parquet or .sqlite file, '
+                             'and log only samples of the per file warnings')
+
+
+def add_write_back_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--write-exif', action='store_true',
+                        help='Write the corrected datetimes and offsets into the Exif of the files (before renaming)')
+    parser.add_argument('--set-mtime', action='store_true',
+                        help='Also set the modification times of the files to their datetimes (--write-exif)')
+    parser.add_argument('--exif-journal', type=Path,
+                        help='Journal of the Exif changes, for undo-exif (by default in the logs directory)')
+    parser.add_argument('--write-workers', type=int, default=DEFAULT_WORKERS,
+                        help='Files written at the same time (--write-exif)')
+
+
+def write_exif(args: argparse.Namespace, renamer: Renamer, renames: dict[str, tuple[str, 'ExifClass']]) -> None:
+    """Write back the files whose datetime or offset the preview corrected, the others are left untouched."""
+    journal = args.exif_journal or MEDREN_DIR / 'logs' / f'exif-{datetime.datetime.now():%Y%m%d-%H%M%S}.jsonl'
+    items = [(path, ex) for path, ex in renamer.corrected_files(renames) if path.is_file()]
+    counts = write_back_many(items, journal, workers=args.write_workers, set_mtime=args.set_mtime)
+    logger.info(f"Wrote the metadata of {len(items)} files ({', '.join(f'{s.value}: {n}' for s, n in counts.items())}),"
+                f" undo with: medren-cli undo-exif {journal}")
+
+
+def cmd_undo_exif(args: argparse.Namespace) -> None:
+    counts = undo(args.journal)
+    logger.info(f"Restored {counts['restored']} files ({counts['changed']} changed since, {counts['missing']} missing)")
+
+
+def cmd_preview(args: argparse.Namespace, emit: Callable[[str], None] = print, renamer: Renamer | None = None) -> None:
+    """Preview (and apply) the renames, emitting a line per file (the daemon passes its own emit and Renamer)."""
+    renamer = renamer or make_renamer(args)
+    if args.catalog:
+        renamer.catalog = Catalog(args.catalog)
+    if args.profile_stats:
+        renamer.stats = RenamerStats()
+    if args.report:
+        renamer.report = OutcomeReport()
+    with profiled(args.profiler, args.profiler_out):
+        renames = renamer.generate_renames(args.inputs, resolve_names=True)
+    for org_path, (new_name, _ex) in renames.items():
+        emit(f'{org_path} -> {new_name}')
+    for i, group in enumerate(renamer.dup_groups, 1):
+        emit(f'Near duplicates dup{i}: {", ".join(str(path) for path in group)}')
+    if args.write_exif:
+        write_exif(args, renamer, renames)
+    if args.apply:
+        moves = renamer.apply_rename(renames, logfile=args.logfile)
+        logger.info(f'Renamed {len(moves)} files')
+    if args.plan_out:
+        count = write_plan(args.plan_out, renames, template=renamer.template, datetime_format=renamer.datetime_format)
+        logger.info(f'Wrote {count} renames to {args.plan_out}')
+    if renamer.stats:
+        renamer.stats.write_json(args.profile_stats)
+        logger.info(renamer.stats.summary())
+    if renamer.report is not None:
+        renamer.report.write(args.report)
+        logger.info(renamer.report.summary())
+    if renamer.scheduler is not None:
+        logger.info(renamer.scheduler.summary())
+
+
+def cmd_apply(args: argparse.Namespace, emit: Callable[[str], None] = print) -> None:
+    root_map = dict(m.split('=', 1) for m in args.root_map or [])
+    if args.check or args.dry_run:
+        _header, entries = read_plan(args.plan, root_map)
+        problems = list(verify_plan(entries))
+        for entry, problem in problems:
+            emit(f'{entry.src}: {problem}')
+        if problems or args.dry_run:
+            sys.exit(1 if problems else 0)
+    header, entries = read_plan(args.plan, root_map)
+    logger.info(f"Applying the plan made on {header.get('host')} at {header.get('created')}")
+    moves = Renamer(transfer=args.transfer).apply_rename(entries, logfile=args.logfile)
+    logger.info(f'Renamed {len(moves)} files')
+
+
+def add_query_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--catalog', type=Path, default=CATALOG_PATH, help='Catalog database')
+    parser.add_argument('--make', help='Camera make prefix')
+    parser.add_argument('--model', help='Camera model prefix, e.g. Pixel')
+    parser.add_argument('--start', help='Earliest datetime (YYYY-MM-DD[ HH:MM:SS])')
+    parser.add_argument('--end', help='Latest datetime, exclusive (YYYY-MM-DD[ HH:MM:SS])')
+    parser.add_argument('--near', type=lambda s: tuple(float(v) for v in s.split(',')), metavar='LAT,LON',
+                        help='Only files taken near this point')
+    parser.add_argument('--radius-km', type=float, default=1.0, help='Radius around --near')
+    parser.add_argument('--sha256', help='Content hash')
+    parser.add_argument('--dir', dest='directory', help='Only files in this directory')
+    parser.add_argument('--limit', type=int, help='Maximum number of files')
+
+
+def query_catalog(catalog: Catalog, args: argparse.Namespace) -> list:
+    return catalog.query(make=args.make, model=args.model, start=args.start, end=args.end, near=args.near,
+                         radius_km=args.radius_km if args.near else None, sha256=args.sha256,
+                         directory=args.directory, limit=args.limit)
+
+
+def cmd_catalog_query(args: argparse.Namespace) -> None:
+    with Catalog(args.catalog) as catalog:
+        rows = query_catalog(catalog, args)
+    for row in rows:
+        ex = row.exif
+        fields = [str(row.path), ex.dt and ex.dt.isoformat(sep=' '), ex.make, ex.model, ex.lat, ex.lon, row.sha256]
+        if row.distance_km is not None:
+            fields.append(f'{row.distance_km:.3f}km')
+        print('\t'.join('' if v is None else str(v) for v in fields))
+
+
+def cmd_catalog_preview(args: argparse.Namespace) -> None:
+    renamer = make_renamer(args)
+    with Catalog(args.catalog) as catalog:
+        renames = renamer.generate_renames_from_catalog(query_catalog(catalog, args))
+    for org_path, (new_name, _ex) in renames.items():
+        print(f'{org_path} -> {new_name}')
+
+
+def cmd_quarantine(args: argparse.Namespace) -> None:
+    quarantine = Quarantine()
+    if args.clear:
+        quarantine.clear()
+        return
+    for entry in quarantine.entries.values():
+        reasons = [f"all backends: {entry['file']}"] if entry['file'] else []
+        reasons += [f'{backend}: {reason}' for backend, reason in entry['backends'].items()]
+        print(f"{entry['path']}\t{entry['time']}\t{'; '.join(reasons)}")
+
+
+def cmd_calibrate(args: argparse.Namespace) -> None:
+    renamer = Renamer(recursive=args.recursive)
+    paths = renamer.resolve_names(args.inputs)
+    calibration = calibrate(paths, backends=args.backends, per_ext=args.samples, seed=args.seed)
+    print(calibration.summary())
+    if not args.dry_run:
+        save_backend_order(args.profile, calibration.order())
+        print(f'Saved the backend order to profile {args.profile or DEFAULT_PROFILE_NAME}')
+
+
+def cmd_probe(args: argparse.Namespace) -> None:
+    from medren.remote import ConnectionPool, extract_remote_many
+
+    with ConnectionPool(connections=args.workers) as pool:
+        metas = extract_remote_many(args.urls, backends=args.backends, workers=args.workers, pool=pool)
+        for url, ex in metas.items():
+            if ex is not None:
+                print(f'{url}\t{ex.dt}\t{ex.goff}\t{ex.make}\t{ex.model}\t{ex.backend}')
+        logger.info(f'{pool.requests} range requests, {pool.bytes_fetched} bytes fetched')
+
+
+def cmd_watch(args: argparse.Namespace) -> None:
+    from medren.watch import Watcher
+
+    renamer = make_renamer(args)
+    patterns = file_types.get(args.pattern, [args.pattern])
+    logfile = args.logfile or MEDREN_DIR / 'logs' / 'watch.log'
+    watcher = Watcher(renamer=renamer, roots=[Path(p) for p in args.inputs], patterns=patterns,
+                      stable_secs=args.stable_secs, poll_interval=args.poll_interval,
+                      use_inotify=False if args.poll else None, logfile=logfile)
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+
+
+def make_parser(parser_class: type[argparse.ArgumentParser] = argparse.ArgumentParser) -> argparse.ArgumentParser:
+    """The parser of the command line (the sub command parsers are of the same class)."""
+    parser = parser_class(prog='medren-cli', description='MedRen - The Media Renamer (command line)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    add_rename_commands(subparsers)
+    add_catalog_commands(subparsers)
+    add_tool_commands(subparsers)
+    add_service_commands(subparsers)
+    return parser
+
+
+def add_rename_commands(subparsers: argparse._SubParsersAction) -> None:
+    """The preview, rename, apply and undo-exif commands."""
+    preview = subparsers.add_parser('preview', help='Print the new names of the files')
+    preview.add_argument(dest='inputs', nargs='+', help='Input paths (dirs, filenames or pattern)')
+    add_renamer_args(preview)
+    add_profiling_args(preview)
+    add_write_back_args(preview)
+    preview.add_argument('--catalog', type=Path, nargs='?', const=CATALOG_PATH,
+                         help=f'Add the metadata of the files to a catalog database (default {CATALOG_PATH})')
+    preview.add_argument('--plan-out', type=Path, help='Write the renames to a plan file (.jsonl or .jsonl.gz)')
+    preview.set_defaults(func=cmd_preview, apply=False, logfile=None)
+
+    rename = subparsers.add_parser('rename', help='Rename the files (preview and apply)')
+    rename.add_argument(dest='inputs', nargs='+', help='Input paths (dirs, filenames or pattern)')
+    add_renamer_args(rename)
+    add_profiling_args(rename)
+    add_write_back_args(rename)
+    rename.add_argument('--logfile', type=Path, help='CSV log of the renames')
+    rename.set_defaults(func=cmd_preview, apply=True, catalog=None, plan_out=None)
+
+    apply = subparsers.add_parser('apply', help='Apply the renames of a plan file')
+    apply.add_argument(dest='plan', type=Path, help='Plan file written by preview --plan-out')
+    apply.add_argument('--root-map', nargs='+', metavar='OLD=NEW',
+                       help='Replace path prefixes of the plan, when the files are mounted elsewhere')
+    apply.add_argument('--check', action='store_true',
+                       help='Check all the files before renaming any, and do not rename if some changed')
+    apply.add_argument('--dry-run', action='store_true', help='Only check the files')
+    apply.add_argument('--logfile', type=Path, help='CSV log of the renames')
+    apply.add_argument('--transfer', choices=TRANSFER_MODES, default='move',
+                       help='move (rename), copy (reflink where possible) or hardlink the files to their new paths')
+    apply.set_defaults(func=cmd_apply)
+
+    undo_exif = subparsers.add_parser('undo-exif', help='Restore the files changed by --write-exif')
+    undo_exif.add_argument(dest='journal', type=Path, help='Journal of the Exif changes')
+    undo_exif.set_defaults(func=cmd_undo_exif)
+
+
+def add_catalog_commands(subparsers: argparse._SubParsersAction) -> None:
+    """The catalog query and preview commands."""
+    catalog = subparsers.add_parser('catalog', help='Query the catalog database')
+    catalog_commands = catalog.add_subparsers(dest='catalog_command', required=True)
+    query = catalog_commands.add_parser('query', help='List the cataloged files')
+    add_query_args(query)
+    query.set_defaults(func=cmd_catalog_query)
+    catalog_preview = catalog_commands.add_parser(
+        'preview', help='Print the new names of the cataloged files, without reading the files')
+    add_query_args(catalog_preview)
+    add_renamer_args(catalog_preview)
+    catalog_preview.set_defaults(func=cmd_catalog_preview)
+
+
+def add_tool_commands(subparsers: argparse._SubParsersAction) -> None:
+    """The quarantine, calibrate and probe commands."""
+    quarantine = subparsers.add_parser('quarantine', help='List the files that made a backend hang or crash')
+    quarantine.add_argument('--clear', action='store_true', help='Clear the list, the files are tried again')
+    quarantine.set_defaults(func=cmd_quarantine)
+
+    calibrate = subparsers.add_parser(
+        'calibrate', help='Time the backends on sample files and save the fastest order per extension to a profile')
+    calibrate.add_argument(dest='inputs', nargs='+', help='Input paths (dirs, filenames or pattern)')
+    calibrate.add_argument('--profile', '-P', help='Profile to save the order to')
+    calibrate.add_argument('--recursive', '-r', action='store_true', help='Process sub directories')
+    calibrate.add_argument('--backends', nargs='+', choices=available_backends, help='Backends to time')
+    calibrate.add_argument('--samples', '-n', type=int, default=DEFAULT_SAMPLES_PER_EXT, help='Files per extension')
+    calibrate.add_argument('--seed', type=int, default=0, help='Seed of the sampling')
+    calibrate.add_argument('--dry-run', action='store_true', help='Only print the measurements')
+    calibrate.set_defaults(func=cmd_calibrate)
+
+    probe = subparsers.add_parser(
+        'probe', help='Print the metadata of remote files (http(s) or fsspec URLs), reading only the ranges needed')
+    probe.add_argument(dest='urls', nargs='+', help='File URLs')
+    probe.add_argument('--backends', nargs='+', choices=available_backends, help='Backends by priority')
+    probe.add_argument('--workers', type=int, default=8, help='Files (and connections per host) at the same time')
+    probe.set_defaults(func=cmd_probe)
+
+
+def add_service_commands(subparsers: argparse._SubParsersAction) -> None:
+    """The long running watch and daemon commands."""
+    watch = subparsers.add_parser('watch', help='Watch directories and rename new files as they arrive')
+    watch.add_argument(dest='inputs', nargs='+', help='Directories to watch')
+    add_renamer_args(watch)
+    watch.add_argument('--pattern', default='media', help=f'File type ({", ".join(file_types)}) or pattern')
+    watch.add_argument('--stable-secs', type=float, default=2.0,
+                       help='Time a new file size should stay unchanged before it is renamed')
+    watch.add_argument('--poll-interval', type=float, default=1.0, help='Time between checks')
+    watch.add_argument('--poll', action='store_true', help='Poll the directories instead of using inotify')
+    watch.add_argument('--logfile', type=Path, help='CSV log of the renames')
+    watch.set_defaults(func=cmd_watch)
+
+    daemon = subparsers.add_parser('daemon', help='Serve preview, rename and apply jobs of medren-client on a socket, '
+                                                  'keeping the backends and caches warm between jobs')
+    daemon.add_argument('--socket', type=Path, default=SOCKET_PATH, help='The Unix socket to listen on')
+    daemon.add_argument('--jobs', type=int, default=DEFAULT_JOBS, help='Jobs run at the same time, the others wait')
+    daemon.set_defaults(func=cmd_daemon)
+
+
+def cmd_daemon(args: argparse.Namespace) -> None:
+    try:
+        Daemon(socket_path=args.socket, jobs=args.jobs).serve()
+    except KeyboardInterrupt:
+        pass
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    return make_parser().parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args(argv)
+    try:
+        args.func(args)
+    except ImportError as e:  # a missing optional dependency (Pillow, fsspec)
+        sys.exit(f'medren-cli: {e}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+import dataclasses
+import datetime
+import logging
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+
+import numpy as np
+
+from medren.exif_process import ExifClass
+
+logger = logging.getLogger(__name__)
+
+# Clock skews between the cameras of a shared event, so their files interleave in the right order.
+# Shots of the same moments by two devices make a peak in the histogram of the time differences between their
+# events (the cross-correlation of their event trains) at the skew between their clocks. The differences are only
+# taken within MAX_SKEW of each event (two searchsorted over the sorted times), so the cost follows the number of
+# close pairs rather than the time span of the library. Near duplicate pairs across devices (the same scene),
+# when known, give the skew directly if enough of them agree; a single pair may well be a look-alike scene.
+
+DEFAULT_MAX_SKEW = datetime.timedelta(hours=2)  # Larger skews are not searched
+DEFAULT_BIN = datetime.timedelta(seconds=30)  # The resolution of the histogram, the estimate is refined within it
+SMOOTH_BINS = 3  # The lag histogram is smoothed over this many bins
+MIN_EVENTS = 5  # Devices with fewer files are not estimated
+MIN_SCORE = 0.3  # The minimal fraction of the events of a device aligned with the reference
+MIN_PAIRS = 3  # Fewer near duplicate pairs of a device do not set its skew
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+@dataclass
+class SkewEstimate:
+    device: str
+    offset: datetime.timedelta  # Added to the times of the device to align them with the reference
+    score: float  # The fraction of the events of the device aligned with reference events (0..1)
+    events: int
+    method: str  # histogram or pairs
+
+
+def device_label(ex: ExifClass) -> str | None:
+    label = ' '.join(v for v in (ex.make, ex.model) if v)
+    return label or None
+
+
+def reference_device(exifs: list[ExifClass]) -> str | None:
+    """The device with the most dated files."""
+    counts = Counter(device_label(ex) for ex in exifs if ex.dt is not None)
+    counts.pop(None, None)
+    return max(counts, key=counts.get, default=None)
+
+
+def epoch_seconds(dts: list[datetime.datetime | None]) -> np.ndarray:
+    return np.array([(dt - EPOCH).total_seconds() if dt is not None else np.nan for dt in dts], dtype=np.float64)
+
+
+def lag_differences(ref: np.ndarray, other: np.ndarray, max_skew: float) -> tuple[np.ndarray, np.ndarray]:
+    """
+    The differences between the events of two devices within max_skew of each other.
+
+    Args:
+        ref: The sorted event times of the reference device
+        other: The event times of another device
+        max_skew: The largest difference
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The differences ref - other of the pairs, and the index in other of each pair
+    """
+    lo = np.searchsorted(ref, other - max_skew, 'left')
+    hi = np.searchsorted(ref, other + max_skew, 'right')
+    counts = hi - lo
+    total = int(counts.sum())
+    starts = np.repeat(lo, counts)
+    within = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    events = np.repeat(np.arange(len(other)), counts)
+    return ref[starts + within] - other[events], events
+
+
+def align(ref: np.ndarray, other: np.ndarray, max_skew: float, bin_secs: float) -> tuple[float, float] | None:
+    """
+    Find the offset that aligns the most events of other with the events of ref.
+
+    Returns:
+        tuple[float, float] | None: The offset in seconds and the fraction of the events of other it aligns,
+            None if no events are within max_skew
+    """
+    diffs, events = lag_differences(ref, other, max_skew)
+    if not len(diffs):
+        return None
+    bins = int(np.ceil(2 * max_skew / bin_secs)) + 1
+    hist = np.bincount(((diffs + max_skew) // bin_secs).astype(np.int64), minlength=bins).astype(np.float64)
+    hist = np.convolve(hist, np.ones(SMOOTH_BINS), 'same')
+    peak = (np.argmax(hist) + 0.5) * bin_secs - max_skew
+    near = diffs[np.abs(diffs - peak) <= bin_secs * SMOOTH_BINS / 2]
+    offset = float(np.median(near))
+    aligned = np.unique(events[np.abs(diffs - offset) <= bin_secs / 2])
+    return offset, len(aligned) / len(other)
+
+
+def agree(offsets: list[float], bin_secs: float) -> tuple[float, float] | None:
+    """
+    The offset given by pairs of files of the same moments, if enough of them agree.
+
+    Returns:
+        tuple[float, float] | None: The median offset in seconds and the fraction of the pairs within half a bin of it,
+            None if there are fewer than MIN_PAIRS pairs or their median absolute deviation exceeds half a bin
+    """
+    if len(offsets) < MIN_PAIRS:
+        return None
+    values = np.array(offsets)
+    offset = float(np.median(values))
+    deviations = np.abs(values - offset)
+    if np.median(deviations) > bin_secs / 2:
+        return None
+    return offset, float(np.mean(deviations <= bin_secs / 2))
+
+
+def reference_pair_offsets(exifs: list[ExifClass], times: np.ndarray, reference: str,
+                           pairs: list[tuple[int, int]]) -> dict[str, list[float]]:
+    """The offsets to the reference clock given by the pairs of a reference file and a file of another device."""
+    pair_offsets: dict[str, list[float]] = defaultdict(list)
+    for a, b in pairs:
+        da, db = device_label(exifs[a]), device_label(exifs[b])
+        if da == reference and db not in (None, reference):
+            pair_offsets[db].append(times[a] - times[b])
+        elif db == reference and da not in (None, reference):
+            pair_offsets[da].append(times[b] - times[a])
+    return pair_offsets
+
+
+def estimate_skews(exifs: list[ExifClass], reference: str | None = None,
+                   max_skew: datetime.timedelta = DEFAULT_MAX_SKEW, bin_size: datetime.timedelta = DEFAULT_BIN,
+                   pairs: list[tuple[int, int]] | None = None) -> dict[str, SkewEstimate]:
+    """
+    Estimate the clock skew of each device relative to a reference device.
+
+    Args:
+        exifs: The metadata of the files
+        reference: The device (make and model) whose clock is kept, None for the device with the most files
+        max_skew: Larger skews are not searched
+        bin_size: The resolution of the histogram
+        pairs: Indices of files of different devices that show the same moment (e.g. near duplicates), only the
+            pairs of a reference file and a file of another device are used
+
+    Returns:
+        dict[str, SkewEstimate]: The estimates of the devices that could be aligned
+    """
+    devices: dict[str, list[int]] = defaultdict(list)
+    for i, ex in enumerate(exifs):
+        if ex.dt is not None and (label := device_label(ex)) is not None:
+            devices[label].append(i)
+    if reference is None:
+        reference = reference_device(exifs)
+    if reference not in devices:
+        return {}
+    times = epoch_seconds([ex.dt for ex in exifs])
+    ref = np.sort(times[devices[reference]])
+    pair_offsets = reference_pair_offsets(exifs, times, reference, pairs or [])
+    skews = {}
+    for device, indices in devices.items():
+        if device == reference:
+            continue
+        method = 'pairs'
+        result = agree(pair_offsets.get(device, []), bin_size.total_seconds())
+        if result is None:
+            if pair_offsets.get(device):
+                logger.debug(f"The {len(pair_offsets[device])} pairs of {device} do not agree, using the histogram")
+            if len(indices) < MIN_EVENTS:
+                continue
+            method = 'histogram'
+            result = align(ref, times[indices], max_skew.total_seconds(), bin_size.total_seconds())
+            if result is None or result[1] < MIN_SCORE:
+                logger.debug(f"Could not align the clock of {device} with {reference} ({result=})")
+                continue
+        offset, score = result
+        skews[device] = SkewEstimate(device=device, offset=datetime.timedelta(seconds=round(offset)), score=score,
+                                     events=len(indices), method=method)
+    return skews
+
+
+def apply_skews(exifs: list[ExifClass], skews: dict[str, SkewEstimate]) -> list[ExifClass]:
+    """Copies of the metadata with the datetimes of the skewed devices corrected (the given objects are kept)."""
+    result = []
+    for ex in exifs:
+        skew = skews.get(device_label(ex))
+        if skew is not None and skew.offset and ex.dt is not None:
+            result.append(dataclasses.replace(ex, dt=ex.dt + skew.offset))
+        else:
+            result.append(ex)
+    return result
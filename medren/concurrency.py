@@ -0,0 +1,166 @@
+import contextvars
+import functools
+import logging
+import os
+import time
+from collections import deque
+from collections.abc import Callable, Iterable
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+# Per file operations (metadata extraction, renames) run with an adaptive number in flight per storage root.
+# Each root (a mount point, or a root pinned in the profile) has an AIMD limit like TCP congestion control:
+# after each window of completions the limit grows by one while the mean latency stays near the best window seen,
+# and is cut by DECREASE_FACTOR when the latency climbs (the NAS or disk is saturated) or operations fail.
+# Local NVMe ends up with many files in flight, a busy SMB/NFS share with a few.
+
+DEFAULT_CEILING = 16  # The largest limit of a root that is not pinned
+INITIAL_LIMIT = 2
+DECREASE_FACTOR = 0.5
+CONGESTION_RATIO = 2.0  # A window latency this many times the best window latency is congestion
+MAX_THREADS = 64
+
+
+@functools.lru_cache(maxsize=4096)
+def mount_point(directory: str) -> str:
+    """The mount point of a directory (cached per directory)."""
+    path = os.path.abspath(directory)
+    while not os.path.ismount(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return path
+
+
+@dataclass
+class AimdLimit:
+    """The adaptive limit of operations in flight on one storage root."""
+    ceiling: int = DEFAULT_CEILING
+    limit: float = INITIAL_LIMIT
+    in_flight: int = 0
+    completed: int = 0
+    errors: int = 0
+    best_latency: float | None = None  # The lowest mean latency of a window
+    throughput: float | None = None  # Operations per second in the last window
+    window: list[float] = field(default_factory=list, repr=False)  # Latencies of the current window
+    window_errors: int = 0
+    window_start: float = field(default_factory=time.perf_counter, repr=False)
+
+    @property
+    def capacity(self) -> int:
+        return max(1, min(int(self.limit), self.ceiling))
+
+    def done(self, latency: float, ok: bool = True) -> None:
+        """Record a finished operation, adjusting the limit at the end of each window."""
+        self.in_flight -= 1
+        self.completed += 1
+        self.errors += not ok
+        self.window.append(latency)
+        self.window_errors += not ok
+        if len(self.window) < self.capacity:
+            return
+        now = time.perf_counter()
+        mean = sum(self.window) / len(self.window)
+        self.throughput = len(self.window) / max(now - self.window_start, 1e-9)
+        if self.best_latency is None or mean < self.best_latency:
+            self.best_latency = mean
+        if self.window_errors or mean > self.best_latency * CONGESTION_RATIO:
+            self.limit = max(1.0, self.limit * DECREASE_FACTOR)
+        else:
+            self.limit = min(float(self.ceiling), self.limit + 1)
+        self.window = []
+        self.window_errors = 0
+        self.window_start = now
+
+
+class AdaptiveScheduler:
+    """
+    Run per file operations concurrently, with an AIMD limit per storage root.
+
+    The limits are kept between runs, so a scheduler that outlives a preview starts the next one tuned.
+
+    Args:
+        ceilings: The largest limit of pinned roots (paths), files under them share the limit of the root
+        default_ceiling: The largest limit of the other roots (mount points)
+    """
+
+    def __init__(self, ceilings: dict[str, int] | None = None, default_ceiling: int = DEFAULT_CEILING):
+        # the longest roots first, so nested pinned roots win
+        self.ceilings = sorted(((str(Path(root).absolute()), int(c)) for root, c in (ceilings or {}).items()),
+                               key=lambda rc: -len(rc[0]))
+        self.default_ceiling = default_ceiling
+        self.limits: dict[str, AimdLimit] = {}
+
+    def root_of(self, path: Path | str) -> str:
+        path = str(Path(path).absolute())
+        for root, _ceiling in self.ceilings:
+            if path == root or path.startswith(root.rstrip(os.sep) + os.sep):
+                return root
+        return mount_point(os.path.dirname(path))
+
+    def limit_of(self, root: str) -> AimdLimit:
+        if root not in self.limits:
+            ceiling = next((c for r, c in self.ceilings if r == root), self.default_ceiling)
+            self.limits[root] = AimdLimit(ceiling=ceiling, limit=min(INITIAL_LIMIT, ceiling))
+        return self.limits[root]
+
+    def map(self, func: Callable[[Any], Any], items: Iterable[Any],
+            path_of: Callable[[Any], Path | str] = lambda item: item) -> list[Any]:
+        """
+        Call func on each item, keeping at most the limit of its root in flight.
+
+        The calls run in worker threads, in the context (context variables) of the caller.
+
+        Args:
+            func: The operation
+            items: The items
+            path_of: The path of an item, to find its root
+
+        Returns:
+            list[Any]: The results in the order of the items
+
+        Raises:
+            Exception: The first exception raised by func, after the calls in flight finish
+        """
+        items = list(items)
+        queues: dict[str, deque[int]] = {}
+        for i, item in enumerate(items):
+            queues.setdefault(self.root_of(path_of(item)), deque()).append(i)
+        if not queues:
+            return []
+        results: list[Any] = [None] * len(items)
+        threads = min(MAX_THREADS, len(items), sum(self.limit_of(root).ceiling for root in queues))
+        in_flight: dict[Future, tuple[str, int, float]] = {}
+        error = None
+        with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='medren-io') as pool:
+            while in_flight or (error is None and any(queues.values())):
+                if error is None:
+                    for root, queue in queues.items():
+                        limit = self.limit_of(root)
+                        while queue and limit.in_flight < limit.capacity:
+                            i = queue.popleft()
+                            limit.in_flight += 1
+                            future = pool.submit(contextvars.copy_context().run, func, items[i])
+                            in_flight[future] = (root, i, time.perf_counter())
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    root, i, start = in_flight.pop(future)
+                    exc = future.exception()
+                    self.limit_of(root).done(time.perf_counter() - start, ok=exc is None)
+                    if exc is not None:
+                        error = error or exc
+                    else:
+                        results[i] = future.result()
+        if error is not None:
+            raise error
+        return results
+
+    def summary(self) -> str:
+        return '\n'.join(f'{root}: limit {limit.capacity}/{limit.ceiling}, {limit.completed} done, '
+                         f'{limit.errors} errors, best latency {limit.best_latency or 0:.4f}s'
+                         for root, limit in self.limits.items())
@@ -1,7 +1,16 @@
+import os
+from pathlib import Path
+
+MEDREN_DIR = Path(os.path.join(os.path.expanduser('~'), 'medren'))
+MEDREN_DIR.mkdir(parents=True, exist_ok=True)
+PROFILES_DIR = MEDREN_DIR / 'profiles'
+PROFILES_DIR.mkdir(parents=True, exist_ok=True)
+
 DEFAULT_PROFILE_NAME = 'default'
 DEFAULT_SEPARATOR = '_'
 DEFAULT_TEMPLATE = '{datetime}{s}{make}{s}{model}{s}{cname}{s}{suffix}{ext}'
 DEFAULT_DATETIME_FORMAT = '%Y-%m-%d-%H-%M-%S'
+UNKNOWN_DIR = 'Unknown'  # Directory name of a template part whose values are all missing
 
 # Generic filename patterns
 DAY_PATTERN = r'0[1-9]|[12]\d|3[01]'
@@ -25,21 +34,26 @@ GENERIC_PATTERNS: list[str] = [
 
 
 image_ext_with_exif = ['.jpg', '.jpeg', '.tif', '.tiff']
-image_extensions = [*image_ext_with_exif, '.png', '.bmp', '.heic']
+image_extensions = [*image_ext_with_exif, '.png', '.bmp', '.heic', '.heif']
+raw_extensions = ['.dng', '.cr2', '.cr3', '.nef', '.arw', '.orf', '.rw2', '.raf']
+sidecar_extensions = ['.xmp', '.aae']
 extension_normalized = {
     ".jpeg": ".jpg",
     ".tiff": "tif",
 }
-video_extensions = ['.mp4', '.mp2', '.mpg', '.mpeg', '.m2v', '.m4v', '.mpv', '.mpv', '.avi']
+video_extensions = ['.mp4', '.mov', '.mp2', '.mpg', '.mpeg', '.m2v', '.m4v', '.mpv', '.mpv', '.avi', '.3gp']
+isobmff_extensions = ['.heic', '.heif', '.mp4', '.mov', '.m4v', '.3gp']
 
 images_pattern = [f"*{ext}" for ext in image_extensions]
 video_pattern = [f"*{ext}" for ext in video_extensions]
-media_pattern = images_pattern + video_pattern
+raw_pattern = [f"*{ext}" for ext in raw_extensions]
+media_pattern = images_pattern + video_pattern + raw_pattern
 file_types = {
     "jpeg": ["*.jpg", "*.jpeg"],
     "mp4": ["*.mp4"],
     "images":  images_pattern,
     "videos": video_pattern,
+    "raw": raw_pattern,
     "media": media_pattern,
     "*": ["*"],
-}
\ No newline at end of file
+}
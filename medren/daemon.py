@@ -0,0 +1,336 @@
+import argparse
+import contextvars
+import itertools
+import json
+import logging
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+from medren.consts import MEDREN_DIR
+
+logger = logging.getLogger(__name__)
+
+# A local service that runs medren-cli jobs (preview, rename, apply) for scripts that call medren per folder,
+# so each call does not pay the imports, the backend probing, the timezone index load and the exiftool startup.
+# The daemon keeps them warm, with a preview cache shared by all the jobs, and runs the jobs in a pool
+# (the others wait in its queue). It speaks JSON-RPC 2.0 over a Unix socket, a JSON message per line:
+#   -> {"jsonrpc": "2.0", "id": 1, "method": "run", "params": {"argv": ["preview", "photos", "-r"], "cwd": "/home"}}
+#   <- {"jsonrpc": "2.0", "method": "output", "params": {"job": 7, "line": "photos/a.jpg -> 2020-...jpg"}}
+#   <- {"jsonrpc": "2.0", "method": "log", "params": {"job": 7, "level": "INFO", "message": "Renamed 3 files"}}
+#   <- {"jsonrpc": "2.0", "id": 1, "result": {"job": 7, "exit_code": 0}}
+# The other methods are status (the queued and running jobs), ping and shutdown.
+# This module only imports the standard library at the top, so medren-client (client_main) starts fast.
+
+SOCKET_PATH = MEDREN_DIR / 'medren.sock'
+DEFAULT_JOBS = 2  # Jobs run at the same time
+JOB_COMMANDS = ('preview', 'rename', 'apply')
+
+# JSON-RPC error codes
+PARSE_ERROR = -32700
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+JOB_ERROR = -32000
+
+# The job of the current thread, so log records of the job (also from the worker threads it starts
+# with the context copied) are sent to its client
+current_job: contextvars.ContextVar['Job | None'] = contextvars.ContextVar('current_job', default=None)
+
+
+class DaemonError(Exception):
+    """The daemon could not be reached, or failed a request."""
+
+
+class JobArgumentParser(argparse.ArgumentParser):
+    """An argument parser that raises instead of printing to the daemon's output and exiting."""
+
+    def error(self, message: str):
+        raise ValueError(f'{self.prog}: error: {message}')
+
+    def exit(self, status: int = 0, message: str | None = None):
+        raise ValueError(message or f'{self.prog}: exit {status}')
+
+    def print_help(self, file=None) -> None:
+        raise ValueError(self.format_help())
+
+
+@dataclass
+class Job:
+    id: int
+    argv: list[str]
+    cwd: str
+    send: Callable[[dict], None] = field(repr=False)  # Sends a message to the client
+    state: str = 'queued'  # queued, running
+    submitted: float = field(default_factory=time.time)
+    detached: bool = False  # The client went away, the job still runs to its end
+
+    def notify(self, method: str, **params: Any) -> None:
+        if self.detached:
+            return
+        try:
+            self.send({'jsonrpc': '2.0', 'method': method, 'params': {'job': self.id, **params}})
+        except OSError:
+            self.detached = True
+
+    def emit(self, line: str) -> None:
+        self.notify('output', line=line)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {'job': self.id, 'argv': self.argv, 'cwd': self.cwd, 'state': self.state, 'submitted': self.submitted}
+
+
+class JobLogHandler(logging.Handler):
+    """Sends the log records of a job to its client."""
+
+    def emit(self, record: logging.LogRecord) -> None:
+        job = current_job.get()
+        if job is not None:
+            job.notify('log', level=record.levelname, message=self.format(record))
+
+
+def absolute_paths(args: argparse.Namespace, cwd: str) -> None:
+    """Make the relative paths of the arguments of a job relative to the directory of its client."""
+    def absolute(value: Any) -> Any:
+        return Path(cwd) / value if isinstance(value, Path) and not value.is_absolute() else value
+
+    for name, value in vars(args).items():
+        setattr(args, name, [absolute(v) for v in value] if isinstance(value, list) else absolute(value))
+    if getattr(args, 'inputs', None):
+        args.inputs = [os.path.join(cwd, p) for p in args.inputs]
+
+
+def rpc_error(request_id: Any, code: int, message: str) -> dict:
+    return {'jsonrpc': '2.0', 'id': request_id, 'error': {'code': code, 'message': message}}
+
+
+class Daemon:
+    """
+    Serve medren-cli jobs on a Unix socket, keeping the backends and caches warm between jobs.
+
+    Args:
+        socket_path: The Unix socket to listen on
+        jobs: Jobs run at the same time, the others wait in the queue
+    """
+
+    def __init__(self, socket_path: Path | str = SOCKET_PATH, jobs: int = DEFAULT_JOBS):
+        self.socket_path = Path(socket_path)
+        self.pool = ThreadPoolExecutor(max_workers=max(1, jobs), thread_name_prefix='medren-job')
+        self.jobs: dict[int, Job] = {}
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.cache = None  # The PreviewCache shared by the jobs, created by warm_up
+        self.server: socketserver.ThreadingUnixStreamServer | None = None
+        self.ready = threading.Event()  # Set once the socket accepts connections
+
+    def warm_up(self) -> None:
+        """Import the backends, load the timezone index and create the caches once for all the jobs."""
+        from medren import cli  # noqa: F401 (imports and probes the backends)
+        from medren.preview_cache import PreviewCache
+        from medren.timezone_offset import timezone_finder
+
+        start = time.perf_counter()
+        timezone_finder()
+        self.cache = PreviewCache()
+        logger.info(f'Warmed up in {time.perf_counter() - start:.2f}s')
+
+    def run_job(self, job: Job) -> int:
+        """Run a job in a pool thread, returning its exit code."""
+        from medren import cli
+
+        token = current_job.set(job)
+        job.state = 'running'
+        try:
+            args = cli.make_parser(JobArgumentParser).parse_args(job.argv)
+            if args.command not in JOB_COMMANDS:
+                raise ValueError(f"The daemon runs {', '.join(JOB_COMMANDS)} jobs, not {args.command}")
+            if getattr(args, 'profiler', None):
+                raise ValueError('The daemon does not run jobs under a profiler')
+            absolute_paths(args, job.cwd)
+            if args.command == 'apply':
+                cli.cmd_apply(args, emit=job.emit)
+            else:
+                renamer = cli.make_renamer(args)
+                renamer.cache = self.cache
+                cli.cmd_preview(args, emit=job.emit, renamer=renamer)
+            return 0
+        except SystemExit as e:
+            return e.code if isinstance(e.code, int) else 1
+        finally:
+            current_job.reset(token)
+            with self.lock:
+                self.jobs.pop(job.id, None)
+
+    def submit(self, argv: list[str], cwd: str, send: Callable[[dict], None]) -> tuple[Job, Any]:
+        job = Job(id=next(self.ids), argv=argv, cwd=cwd, send=send)
+        with self.lock:
+            self.jobs[job.id] = job
+        return job, self.pool.submit(self.run_job, job)
+
+    def dispatch(self, request: dict, send: Callable[[dict], None]) -> dict:
+        """Handle a request, returning its response (a run request streams notifications while it waits)."""
+        request_id = request.get('id')
+        method = request.get('method')
+        handler = {'run': self.handle_run, 'status': self.handle_status, 'ping': self.handle_ping,
+                   'shutdown': self.handle_shutdown}.get(method)
+        if handler is None:
+            return rpc_error(request_id, METHOD_NOT_FOUND, f'Unknown method {method}')
+        return handler(request_id, request.get('params') or {}, send)
+
+    def handle_run(self, request_id: Any, params: dict, send: Callable[[dict], None]) -> dict:
+        argv = params.get('argv')
+        if not isinstance(argv, list) or not all(isinstance(a, str) for a in argv):
+            return rpc_error(request_id, INVALID_PARAMS, 'argv should be a list of strings')
+        job, future = self.submit(argv, params.get('cwd') or os.getcwd(), send)
+        try:
+            exit_code = future.result()
+        except Exception as e:
+            logger.warning(f'Job {job.id} {argv} failed: {e}')
+            return rpc_error(request_id, JOB_ERROR, str(e))
+        return {'jsonrpc': '2.0', 'id': request_id, 'result': {'job': job.id, 'exit_code': exit_code}}
+
+    def handle_status(self, request_id: Any, params: dict, send: Callable[[dict], None]) -> dict:
+        with self.lock:
+            jobs = [job.to_dict() for job in self.jobs.values()]
+        return {'jsonrpc': '2.0', 'id': request_id, 'result': {'jobs': jobs}}
+
+    def handle_ping(self, request_id: Any, params: dict, send: Callable[[dict], None]) -> dict:
+        return {'jsonrpc': '2.0', 'id': request_id,
+                'result': {'pid': os.getpid(), 'uptime': time.time() - self.started}}
+
+    def handle_shutdown(self, request_id: Any, params: dict, send: Callable[[dict], None]) -> dict:
+        threading.Thread(target=self.server.shutdown, daemon=True).start()
+        return {'jsonrpc': '2.0', 'id': request_id, 'result': 'ok'}
+
+    def serve(self) -> None:
+        """Warm up and serve until a shutdown request, then wait for the running jobs."""
+        self.warm_up()
+        if self.socket_path.exists():
+            try:
+                request('ping', socket_path=self.socket_path)
+            except DaemonError:
+                self.socket_path.unlink()  # left by a daemon that did not stop cleanly
+            else:
+                raise DaemonError(f'A daemon is already serving on {self.socket_path}')
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        self.server = socketserver.ThreadingUnixStreamServer(str(self.socket_path), RequestHandler)
+        self.server.daemon_threads = True
+        self.server.medren = self
+        os.chmod(self.socket_path, 0o600)
+        log_handler = JobLogHandler(level=logging.INFO)
+        logging.getLogger().addHandler(log_handler)
+        logger.info(f'Serving on {self.socket_path}')
+        self.ready.set()
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            self.socket_path.unlink(missing_ok=True)
+            self.pool.shutdown(wait=True)
+            logging.getLogger().removeHandler(log_handler)
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        daemon: Daemon = self.server.medren
+        lock = threading.Lock()
+
+        def send(message: dict) -> None:
+            with lock:
+                self.wfile.write(json.dumps(message).encode() + b'\n')
+                self.wfile.flush()
+
+        for line in self.rfile:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                send(rpc_error(None, PARSE_ERROR, 'Parse error'))
+                continue
+            try:
+                send(daemon.dispatch(message, send))
+            except OSError:
+                break  # the client went away
+
+
+def request(method: str, params: dict | None = None, socket_path: Path | str = SOCKET_PATH,
+            on_notify: Callable[[dict], None] | None = None) -> Any:
+    """
+    Send a request to the daemon and wait for its result.
+
+    Args:
+        method: run, status, ping or shutdown
+        params: The parameters of the method
+        socket_path: The socket of the daemon
+        on_notify: Called with each notification (output and log lines of a job) until the result
+
+    Returns:
+        Any: The result
+
+    Raises:
+        DaemonError: The daemon is not running, or it failed the request
+    """
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(str(socket_path))
+            with sock.makefile('rwb') as f:
+                f.write(json.dumps({'jsonrpc': '2.0', 'id': 1, 'method': method, 'params': params or {}}).encode()
+                        + b'\n')
+                f.flush()
+                for line in f:
+                    message = json.loads(line)
+                    if 'id' not in message:
+                        if on_notify is not None:
+                            on_notify(message)
+                        continue
+                    if 'error' in message:
+                        raise DaemonError(message['error']['message'])
+                    return message['result']
+    except OSError as e:
+        raise DaemonError(f'Could not reach the daemon on {socket_path}: {e}') from e
+    raise DaemonError('The daemon closed the connection')
+
+
+def print_notification(message: dict) -> None:
+    params = message.get('params', {})
+    if message.get('method') == 'output':
+        print(params['line'], flush=True)
+    elif message.get('method') == 'log':
+        print(params['message'], file=sys.stderr, flush=True)
+
+
+def client_main(argv: list[str] | None = None) -> None:
+    """medren-client: run a medren-cli command in the daemon (medren-cli daemon), streaming its output."""
+    parser = argparse.ArgumentParser(prog='medren-client', description='Run medren-cli jobs in the medren daemon')
+    parser.add_argument('--socket', type=Path, default=SOCKET_PATH, help='The socket of the daemon')
+    parser.add_argument('argv', nargs=argparse.REMAINDER,
+                        help=f"status, ping, stop, or a medren-cli command ({', '.join(JOB_COMMANDS)}) and its args")
+    args = parser.parse_args(argv)
+    if not args.argv:
+        parser.error('a command is required')
+    try:
+        if args.argv == ['status']:
+            for job in request('status', socket_path=args.socket)['jobs']:
+                print(f"{job['job']}\t{job['state']}\t{job['cwd']}\t{' '.join(job['argv'])}")
+        elif args.argv == ['ping']:
+            print(request('ping', socket_path=args.socket))
+        elif args.argv == ['stop']:
+            request('shutdown', socket_path=args.socket)
+        else:
+            result = request('run', {'argv': args.argv, 'cwd': os.getcwd()}, socket_path=args.socket,
+                             on_notify=print_notification)
+            sys.exit(result['exit_code'])
+    except DaemonError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    client_main()
@@ -1,6 +1,7 @@
 import re
 from datetime import datetime
 
+
 def extract_datetime_from_filename(filename):
     patterns = [
         # IMG_20240501_203015.jpg or VID_20240501_203015.mp4 or PXL_20240501_203015.mp4
@@ -1,9 +1,10 @@
 import datetime
 import logging
-from dataclasses import dataclass
+from dataclasses import MISSING, dataclass, fields
 from enum import IntEnum
 from typing import Any
 
+from medren.report import warn
 from medren.timezone_offset import get_timezone_offset
 
 
@@ -46,6 +47,7 @@ class ExifClass:
     goff_dig: Goff = None
     goff_img: Goff = None
     goff_ll: Goff = None
+    goff_conf: float | None = None  # The confidence of an inferred goff (see tz_infer.py), None if not inferred
 
     make: str | None = None
     model: str | None = None
@@ -75,6 +77,23 @@ class ExifClass:
     def __post_init__(self):
         self.goff_form_loc(logger)
 
+    def to_dict(self) -> dict[str, Any]:
+        """Return the fields as JSON friendly values (the datetime as ISO text)."""
+        d = dict(vars(self))
+        if self.dt is not None:
+            d['dt'] = self.dt.isoformat()
+        return d
+
+    @classmethod
+    def from_dict(cls, d: dict[str, Any]) -> 'ExifClass':
+        """Restore an ExifClass saved by to_dict, without recomputing the offsets done on creation."""
+        ex = cls.__new__(cls)
+        ex.__dict__.update({f.name: f.default for f in fields(cls) if f.default is not MISSING})
+        ex.__dict__.update({k: v for k, v in d.items() if k in cls.__dataclass_fields__})
+        if isinstance(ex.dt, str):
+            ex.dt = datetime.datetime.fromisoformat(ex.dt)
+        return ex
+
     def goff_form_loc(self, logger: logging.Logger):
         try:
             if self.is_utc and self.goff is not None:
@@ -92,9 +111,9 @@ class ExifClass:
                     elif self.goff == self.goff_ll:
                         pass
                     else:
-                        logger.warning(f"time offset mismatch {self.goff} != {self.goff_ll} {self}")
+                        warn(logger, 'offset_mismatch', f"time offset mismatch {self.goff} != {self.goff_ll} {self}")
         except Exception as e:
-            logger.warning(f"Failed to fetch time offset {self} ({e})")
+            warn(logger, 'offset_error', f"Failed to fetch time offset {self} ({e})")
 
 
 makers = {
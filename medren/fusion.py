@@ -0,0 +1,94 @@
+from pathlib import Path
+
+from medren.exif_process import ExifClass
+
+# Fusion mode merges the results of several backends field by field (see Renamer.fuse).
+# The backends that can parse a buffer share one read of the file head,
+# the others are only called while fields are still missing.
+
+FUSE_HEADER_BYTES = 256 * 1024  # Bytes read from the head of a file, enough for the Exif segment of a JPEG
+
+# Fields that are only meaningful together are taken from the same backend, the first field tells if a group is set
+FIELD_GROUPS: dict[str, tuple[str, ...]] = {
+    'dt': ('dt', 'is_utc', 't_org', 't_dig'),
+    'goff': ('goff', 'goff_dig', 'goff_img'),
+    't_img': ('t_img',),
+    't_fn': ('t_fn',),
+    'camera': ('make', 'model'),
+    'size': ('w', 'h'),
+    'image_size': ('iw', 'ih'),
+    'location': ('lat', 'lon', 'alt'),
+}
+
+# Groups worth calling another (file reading) backend for
+WANTED_GROUPS = ('dt', 'goff', 'camera', 'location')
+
+FieldPriority = dict[str, list[str]]  # group -> backends by priority, the other backends follow in their usual order
+
+
+def read_header(path: Path | str, size: int = FUSE_HEADER_BYTES) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read(size)
+
+
+def ranked(results: list[ExifClass], order: list[str] | None) -> list[ExifClass]:
+    """Sort the results by a backend priority list, keeping the original order for the unlisted backends."""
+    if not order:
+        return results
+    return sorted(results, key=lambda ex: order.index(ex.backend) if ex.backend in order else len(order))
+
+
+def group_source(results: list[ExifClass], group: str, priority: FieldPriority) -> ExifClass | None:
+    key = FIELD_GROUPS[group][0]
+    return next((ex for ex in ranked(results, priority.get(group)) if getattr(ex, key) is not None), None)
+
+
+def backend_needed(backend: str, results: list[ExifClass], priority: FieldPriority) -> bool:
+    """
+    Check if a backend could improve the fused result.
+
+    Args:
+        backend: The backend name
+        results: The results of the backends called so far
+        priority: Backend priority per field group
+
+    Returns:
+        bool: True if a wanted group is missing, or is set by a backend of lower priority for it
+    """
+    for group in WANTED_GROUPS:
+        source = group_source(results, group, priority)
+        if source is None:
+            return True
+        order = priority.get(group) or []
+        if backend in order and (source.backend not in order or order.index(backend) < order.index(source.backend)):
+            return True
+    return False
+
+
+def merge_exif(results: list[ExifClass | None], priority: FieldPriority | None = None) -> ExifClass | None:
+    """
+    Merge the results of several backends.
+
+    Args:
+        results: The results of the backends, by backend priority
+        priority: Backend priority per field group, overriding the order of the results
+
+    Returns:
+        ExifClass | None: The merged metadata (its backend names the contributing backends),
+            None if no backend found a datetime
+    """
+    results = [ex for ex in results if ex is not None]
+    priority = priority or {}
+    values, sources = {}, []
+    for group, names in FIELD_GROUPS.items():
+        source = group_source(results, group, priority)
+        if source is not None:
+            values.update({name: getattr(source, name) for name in names})
+            if source.backend not in sources:
+                sources.append(source.backend)
+    if values.get('dt') is None:
+        return None
+    if len(sources) == 1:
+        return next(ex for ex in results if ex.backend == sources[0])
+    # the offsets that depend on the location are computed again for the merged fields
+    return ExifClass(ext=results[0].ext, backend='+'.join(sources), **values)
@@ -32,4 +32,4 @@ def test_pluscode():
 if __name__ == '__main__':
     # test_geocode()
     # test_reverse()
-    test_pluscode()
\ No newline at end of file
+    test_pluscode()
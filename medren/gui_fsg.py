@@ -1,8 +1,6 @@
 import argparse
 import datetime
-import json
 import logging
-import os
 from copy import copy
 from enum import Enum
 from pathlib import Path
@@ -13,76 +11,39 @@ import pyperclip
 
 from medren import __version__
 from medren.backends import available_backends
-from medren.renamer import (
-    MEDREN_DIR,
-    PROFILES_DIR,
-    Renamer,
-)
+from medren.calibrate import calibrate, save_backend_order
+from medren.catalog import CATALOG_PATH, Catalog
 from medren.consts import (
     DEFAULT_DATETIME_FORMAT,
     DEFAULT_PROFILE_NAME,
     DEFAULT_SEPARATOR,
-    DEFAULT_TEMPLATE, file_types,
+    DEFAULT_TEMPLATE,
+    file_types,
 )
-from medren.profiles import Modes, profile_keys, profiles
+from medren.mover import TRANSFER_MODES
+from medren.plan import write_plan
+from medren.preview_cache import PreviewCache
+from medren.profiles import (
+    Modes,
+    delete_profile,
+    get_profile_names,
+    load_profile,
+    load_settings,
+    save_profile,
+    save_settings,
+)
+from medren.renamer import (
+    MEDREN_DIR,
+    Renamer,
+)
+from medren.stats import RenamerStats
+from medren.supervisor import Supervisor
+from medren.table_model import TABLE_HEADINGS, PreviewTable
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-saved_keys = [
-    'inputs', 'profile', 'pattern', 'backends',
-    ]
-
-# Settings file path
-def load_settings(filename, is_profile=False) -> dict:
-    try:
-        if os.path.exists(filename):
-            with open(filename) as f:
-                values = json.load(f)
-                filter_list = profile_keys if is_profile else saved_keys
-                values = {key: values[key] for key in filter_list}
-                return values
-    except Exception:
-        pass
-    return {}
-
-def save_settings(values, filename, is_profile=False) -> None:
-    filter_list = profile_keys if is_profile else saved_keys
-    values = {key: values[key] for key in filter_list}
-    try:
-        with open(filename, 'w') as f:
-            json.dump(values, f)
-    except Exception:
-        pass
-
-def load_profile(profile_name: str) -> dict:
-    profile_name = (profile_name or DEFAULT_PROFILE_NAME)
-    profile_filename = get_profile_filename(profile_name)
-    if profile_filename.is_file():
-        return load_settings(profile_filename, is_profile=True)
-    else:
-        profile = profiles.get(profile_name)
-        if profile:
-            return profile.get_vars()
-    return {}
-
-def save_profile(values, profile_name: str) -> None:
-    profile_filename = get_profile_filename(profile_name)
-    save_settings(values=values, filename=profile_filename, is_profile=True)
-
-def delete_profile(profile_name: str):
-    profile_filename = get_profile_filename(profile_name)
-    if profile_filename.is_file():
-        os.remove(profile_filename)
-
-def get_profile_filename(profile_name: str):
-    profile_name = (profile_name or DEFAULT_PROFILE_NAME) + '.json'
-    profile_filename = PROFILES_DIR / profile_name
-    return profile_filename
-
-
-
 def parse_args():
     parser = argparse.ArgumentParser(description='Media Renaming GUI')
     parser.add_argument(dest='inputs', nargs='*', help='Input paths (dirs, filenames or pattern)')
@@ -91,6 +52,14 @@ def parse_args():
     parser.add_argument('--datetime-format', '-d', help='Initial datetime format value')
     parser.add_argument('--prefix', '-p', help='Initial prefix value')
     parser.add_argument('--suffix', '-s', help='Initial suffix value')
+    parser.add_argument('--batch-workers', type=int, default=0,
+                        help='Workers for batch extraction of video backends (0 extracts file by file)')
+    parser.add_argument('--profile-stats', type=Path,
+                        help='Write per-stage and per-backend stats of each preview to this JSON file')
+    parser.add_argument('--timeout', type=float,
+                        help='Run the backends in a supervised worker, with this budget in seconds per backend')
+    parser.add_argument('--catalog', type=Path, nargs='?', const=CATALOG_PATH,
+                        help=f'Add the metadata of previewed files to a catalog database (default {CATALOG_PATH})')
     return parser.parse_args()
 
 
@@ -98,13 +67,6 @@ def update_profile_list():
     pass
 
 
-def get_profile_names():
-    saved_profile_names = [p.stem for p in PROFILES_DIR.glob('*.json')]
-    built_in_profile_names = list(profiles.keys())
-    all_profile_names = sorted(set(saved_profile_names) | set(built_in_profile_names))
-    return saved_profile_names, built_in_profile_names, all_profile_names
-
-
 def override_settings(d: dict[str, Any], overrides: dict[str, Any]):
     for k, v in overrides.items():
         if v:
@@ -146,12 +108,14 @@ def main():  # noqa: PLR0915, PLR0912
          sg.Button('Load Profile'),
          sg.Button('Save Profile'),
          sg.Button('Delete Profile'),
+         sg.Button('Calibrate', tooltip='Time the backends on the inputs and save the fastest order to the profile'),
          ],
 
         [
         sg.Button('Add'),
         sg.Button('Preview'),
         sg.Button('Rename'),
+        sg.Button('Save Plan'),
         sg.Button('Clear'),
         sg.Button('Load Settings'),
         sg.Button('Save Settings'),
@@ -159,6 +123,11 @@ def main():  # noqa: PLR0915, PLR0912
 
         [sg.Text('Template:'), sg.Input(default_text=DEFAULT_TEMPLATE, expand_x=True, key='template', size=(30, 1))],
 
+        [sg.Text('Destination:'), sg.Input(expand_x=True, key='dest', size=(30, 1),
+                                           tooltip='Root directory of the new paths, empty keeps the directories'),
+         sg.FolderBrowse(button_text='Browse', target='dest'),
+         sg.Text('Transfer:'), sg.Combo(TRANSFER_MODES, default_value='move', key='transfer', readonly=True)],
+
         [sg.Text('Datetime Format:'),
          sg.Input(default_text=DEFAULT_DATETIME_FORMAT, expand_x=True, key='datetime_format', size=(20, 1))],
 
@@ -167,7 +136,10 @@ def main():  # noqa: PLR0915, PLR0912
 
         [*separators_layout,
         sg.Checkbox('Normalize', default=True, key='normalize', expand_x=True),
-        sg.Checkbox('show full paths in table', default= True, key='org_full_path', expand_x=True),
+        sg.Checkbox('show full paths in table', default= True, key='org_full_path', expand_x=True,
+                    enable_events=True),
+        sg.Checkbox('Pair', default=True, key='pair', tooltip='Rename Live Photo, RAW+JPEG and sidecars together'),
+        sg.Checkbox('Fuse', default=False, key='fuse', tooltip='Merge the fields of all backends'),
         sg.Text('Items found:'), sg.Text('', key='-ITEMS-FOUND-', size=(10, 1)),
         ]
     ]
@@ -206,20 +178,28 @@ def main():  # noqa: PLR0915, PLR0912
     table_right_click_items = [c.value for c in TableRightClickCommand]
     bottom_layout = [sg.Table(
         values=[],
-        headings=['Original Filename', 'New Filename', 'Datetime', 'goff', 'make', 'model', 'Backend'],
+        headings=TABLE_HEADINGS,
         auto_size_columns=False,
         col_widths=[40, 30, 8, 2, 5, 8, 5],
         justification='left',
         key='-TABLE-',
         expand_x=True,
         expand_y=True,
+        enable_click_events=True,  # a click on a heading sorts by the column
         right_click_menu=['', table_right_click_items]
     )]
+    pager_layout = [
+        sg.Button('<<', key='-FIRST-'), sg.Button('<', key='-PREV-'),
+        sg.Text('', key='-PAGE-', size=(24, 1), justification='center'),
+        sg.Button('>', key='-NEXT-'), sg.Button('>>', key='-LAST-'),
+        sg.Text('Filter:'), sg.Input(key='-FILTER-', enable_events=True, size=(30, 1)),
+    ]
 
     # Final layout
     layout = [
         [top_left_column, top_right_column2, top_right_column],
-        [bottom_layout]
+        [bottom_layout],
+        pager_layout,
     ]
 
     window = sg.Window('MedRen - The Media Renamer', layout,
@@ -229,13 +209,22 @@ def main():  # noqa: PLR0915, PLR0912
 
     window.read(timeout=0)
     for key in loaded_values:
-        window[key].update(loaded_values[key])
+        if key in window.key_dict:
+            window[key].update(loaded_values[key])
     # window['inputs'].Widget.select_set(0)
 
     renamer, preview = None, {}
-    table_data = []
+    preview_cache = PreviewCache()  # kept between previews, so only changed inputs and stages are recomputed
+    catalog = Catalog(args.catalog) if args.catalog else None
+    supervisor = Supervisor(backend_timeout=args.timeout, file_timeout=2 * args.timeout) if args.timeout else None
+    table = PreviewTable()  # the preview rows, the widget only shows the current page
     preview = []
 
+    def show_table():
+        window['-TABLE-'].update(values=table.page_values(full_paths=window['org_full_path'].get()))
+        window['-ITEMS-FOUND-'].update(len(table.rows))
+        window['-PAGE-'].update(table.status())
+
     while True:
         event, values = window.read()
         if event == sg.WIN_CLOSED:
@@ -260,7 +249,8 @@ def main():  # noqa: PLR0915, PLR0912
                 if sg.popup_yes_no('Would you like to load settings?', title='Load Settings'):
                     values = load_settings(settings_filename)
                     for key in values:
-                        window[key].update(values[key])
+                        if key in window.key_dict:
+                            window[key].update(values[key])
 
             except Exception as e:
                 logger.error(f"Error loading settings: {e}")
@@ -268,6 +258,8 @@ def main():  # noqa: PLR0915, PLR0912
         elif event == 'Save Profile':
             try:
                 if sg.popup_yes_no(f'Would you like to save profile {profile_name}?', title='Save Profile'):
+                    # the calibrated backend order is not a widget, keep the saved one
+                    values = {**values, 'backend_order': load_profile(profile_name).get('backend_order')}
                     save_profile(values=values, profile_name=profile_name)
                     saved_profile_names, built_in_profile_names, all_profile_names = get_profile_names()
                     window['profile'].update(value=profile_name, values=all_profile_names)
@@ -280,7 +272,8 @@ def main():  # noqa: PLR0915, PLR0912
                 if sg.popup_yes_no(f'Would you like to load profile {profile_name}?', title='Load Profile'):
                     values = load_profile(profile_name)
                     for key in values:
-                        window[key].update(values[key])
+                        if key in window.key_dict:
+                            window[key].update(values[key])
 
             except Exception as e:
                 logger.error(f"Error loading profile {profile_name}: {e}")
@@ -298,6 +291,19 @@ def main():  # noqa: PLR0915, PLR0912
             except Exception as e:
                 logger.error(f"Error loading profile {profile_name}: {e}")
 
+        elif event == 'Calibrate':
+            if input_paths:
+                try:
+                    paths = Renamer(recursive=values['mode'] == 'recursive').resolve_names(input_paths)
+                    calibration = calibrate(paths, backends=list(window['backends'].Values))
+                    save_backend_order(profile_name, calibration.order())
+                    saved_profile_names, built_in_profile_names, all_profile_names = get_profile_names()
+                    window['profile'].update(value=profile_name, values=all_profile_names)
+                    sg.popup_scrolled(calibration.summary() or 'No files to calibrate',
+                                      title=f'Backend order saved to profile {profile_name}')
+                except Exception as e:
+                    logger.error(f"Error calibrating the backends: {e}")
+
         # Handle file/directory selection
         elif event == '-PATH-':
             pass
@@ -331,12 +337,13 @@ def main():  # noqa: PLR0915, PLR0912
 
         elif event == 'Clear':
             # input_paths.clear()
-            table_data = []
+            table.clear()
             window['inputs'].update([])
             # window['inputs'].Widget.select_set(0)
-            window['-TABLE-'].update(table_data)
+            show_table()
             preview = {}
             renamer = None
+            preview_cache.clear()
 
         elif event == 'Preview':
             if input_paths:
@@ -349,39 +356,78 @@ def main():  # noqa: PLR0915, PLR0912
                     normalize=values['normalize'],
                     suffix=values['suffix'],
                     backends=list(window['backends'].Values),
+                    backend_order=load_profile(profile_name).get('backend_order'),
                     recursive=recursive,
+                    batch_workers=args.batch_workers,
+                    pair=values['pair'],
+                    fuse=values['fuse'],
+                    cache=preview_cache,
+                    stats=RenamerStats() if args.profile_stats else None,
+                    catalog=catalog,
+                    supervisor=supervisor,
+                    dest_root=values['dest'] or None,
+                    transfer=values['transfer'],
                 )
                 preview = renamer.generate_renames(input_paths, resolve_names=True)
-                table_data = [[orig, path, ex.dt, ex.goff, ex.make, ex.model, ex.backend]
-                              for orig, (path, ex) in preview.items()]
-                if not values['org_full_path']:
-                    for item in table_data:
-                        item[0] = Path(item[0]).name
-                window['-TABLE-'].update(values=table_data)
-                window['-ITEMS-FOUND-'].update(len(table_data))
+                if renamer.stats:
+                    renamer.stats.write_json(args.profile_stats)
+                table = PreviewTable.from_renames(preview, filter_text=values['-FILTER-'],
+                                                  sort_col=table.sort_col, descending=table.descending)
+                show_table()
 
         elif event == 'Rename':
             if preview and renamer:
                 log_filename = datetime.datetime.now().strftime(values['datetime_format']) + '.log'
                 renamer.apply_rename(preview, logfile=MEDREN_DIR / 'logs' / log_filename)
                 sg.popup('Renaming complete!')
-                window['-TABLE-'].update([])
+                table.clear()
+                show_table()
             else:
                 sg.popup('Nothing to rename. Please preview first.')
 
+        elif event == 'Save Plan':
+            if preview:
+                filename = sg.popup_get_file('Save the renames to a plan file', save_as=True,
+                                             default_extension='.jsonl.gz',
+                                             file_types=(('Plan files', '*.jsonl.gz *.jsonl'),))
+                if filename:
+                    write_plan(filename, preview, template=values['template'],
+                               datetime_format=values['datetime_format'])
+            else:
+                sg.popup('Nothing to save. Please preview first.')
+
+        elif isinstance(event, tuple) and event[:2] == ('-TABLE-', '+CLICKED+'):
+            row, col = event[2]
+            if row == -1 and col is not None and col >= 0:
+                table.sort_by(col)
+                show_table()
+
+        elif event in ('-FIRST-', '-PREV-', '-NEXT-', '-LAST-'):
+            table.go_to({'-FIRST-': 0, '-PREV-': table.page - 1, '-NEXT-': table.page + 1,
+                         '-LAST-': table.page_count - 1}[event])
+            show_table()
+
+        elif event == '-FILTER-':
+            table.set_filter(values['-FILTER-'])
+            show_table()
+
+        elif event == 'org_full_path':
+            show_table()
+
         elif event in table_right_click_items:
             if values['-TABLE-']:
                 if event == TableRightClickCommand.select_all.value:
                     # window['-TABLE-']
                     continue
+                selected = table.selected(values['-TABLE-'])
                 if event == TableRightClickCommand.org.value:
-                    text = '\n'.join(f"{table_data[i][0]}" for i in values['-TABLE-'])
+                    text = '\n'.join(f"{row[0]}" for row in selected)
                 elif event == TableRightClickCommand.new.value:
-                    text = '\n'.join(f"{table_data[i][1]}" for i in values['-TABLE-'])
+                    text = '\n'.join(f"{row[1]}" for row in selected)
                 elif event == TableRightClickCommand.both.value:
-                    text = '\n'.join(f"{table_data[i][0]} -> {table_data[i][1]}" for i in values['-TABLE-'])
+                    text = '\n'.join(f"{row[0]} -> {row[1]}" for row in selected)
                 elif event == TableRightClickCommand.csv.value:
-                    text = '\n'.join(f"{','.join([str(x) for x in table_data[i]])}" for i in values['-TABLE-'])
+                    text = '\n'.join(f"{','.join([str(x) for x in row])}" for row in selected)
                 else:
                     text = 'Unknown operation'
                 pyperclip.copy(text)
@@ -407,6 +453,10 @@ def main():  # noqa: PLR0915, PLR0912
 
 
     window.close()
+    if catalog:
+        catalog.close()
+    if supervisor:
+        supervisor.stop()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,126 @@
+import errno
+import logging
+import os
+import struct
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+
+from medren.fusion import FUSE_HEADER_BYTES
+
+logger = logging.getLogger(__name__)
+
+# Header reads in the order of the files on the disk, for spinning disks where a scan in glob order seeks across
+# the platter for every file. The files are sorted by the physical address of their first extent (the FIEMAP ioctl
+# on Linux), or by inode where FIEMAP is not supported (inodes are allocated roughly in the order of the data).
+# The kernel is asked to read the headers of the next files ahead (POSIX_FADV_WILLNEED on the header range only,
+# so it does not read ahead the whole file), and the pages of a file are dropped once it is parsed
+# (POSIX_FADV_DONTNEED), so a large scan does not evict the rest of the page cache.
+
+FS_IOC_FIEMAP = 0xC020660B  # ioctl to map the extents of a file, from linux/fs.h
+FIEMAP_HEADER = struct.Struct('=QQIIII')  # fm_start, fm_length, fm_flags, fm_mapped_extents, fm_extent_count, reserved
+FIEMAP_EXTENT = struct.Struct('=QQQQQIIII')  # fe_logical, fe_physical, fe_length, reserved, fe_flags, reserved
+HEADER_HINT_BYTES = FUSE_HEADER_BYTES  # The range of each file read ahead
+LOOKAHEAD = 8  # Files whose headers are read ahead of the parsers
+
+SUPPORTS_FADVISE = hasattr(os, 'posix_fadvise')
+FIEMAP_UNSUPPORTED_ERRNOS = (errno.EOPNOTSUPP, errno.ENOTTY)  # The file system (or platform) has no FIEMAP
+
+fiemap_unsupported: set[int] = set()  # Devices where FIEMAP failed, sorted by inode without trying again
+
+
+def physical_offset(path: Path | str) -> int | None:
+    """
+    The physical address of the first extent of a file (FIEMAP).
+
+    Returns:
+        int | None: The address, None if no extent is mapped (an empty file, inline or delayed allocation data)
+
+    Raises:
+        OSError: If the file cannot be opened, or FIEMAP is not supported (errno in FIEMAP_UNSUPPORTED_ERRNOS)
+    """
+    try:
+        import fcntl
+    except ImportError as e:
+        raise OSError(errno.ENOTTY, 'FIEMAP is not supported on this platform') from e
+    request = FIEMAP_HEADER.pack(0, 0xFFFFFFFFFFFFFFFF, 0, 0, 1, 0) + bytes(FIEMAP_EXTENT.size)
+    with open(path, 'rb') as f:
+        reply = fcntl.ioctl(f.fileno(), FS_IOC_FIEMAP, request)
+    if FIEMAP_HEADER.unpack_from(reply)[3] == 0:
+        return None
+    return FIEMAP_EXTENT.unpack_from(reply, FIEMAP_HEADER.size)[1]
+
+
+def seek_key(path: Path | str, use_fiemap: bool = True) -> tuple:
+    """The sort key of a file by its place on the disk: device, then physical address or inode."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return (1,)  # missing files last, they fail without a read
+    physical = None
+    if use_fiemap and st.st_dev not in fiemap_unsupported:
+        try:
+            physical = physical_offset(path)
+        except OSError as e:
+            # only a missing ioctl turns FIEMAP off for the device, a file without extents falls back to its inode
+            if e.errno in FIEMAP_UNSUPPORTED_ERRNOS:
+                fiemap_unsupported.add(st.st_dev)
+    return (0, st.st_dev, physical is None, physical if physical is not None else st.st_ino)
+
+
+def seek_order(paths: Iterable[Path], use_fiemap: bool = True) -> list[Path]:
+    """
+    Sort files by their place on the disk.
+
+    Args:
+        paths: The files
+        use_fiemap: Whether to sort by the physical address of the data (FIEMAP), else by inode
+
+    Returns:
+        list[Path]: The files in the order of their data on each device
+    """
+    return sorted(paths, key=lambda path: seek_key(path, use_fiemap))
+
+
+def advise(path: Path | str, offset: int, length: int, advice: int) -> None:
+    """Give the kernel a hint about the pages of a file (posix_fadvise), ignoring errors."""
+    if not SUPPORTS_FADVISE:
+        return
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.posix_fadvise(fd, offset, length, advice)
+    except OSError as e:
+        logger.debug(f"posix_fadvise of {path} failed: {e}")
+    finally:
+        os.close(fd)
+
+
+def scheduled(paths: list[Path], header_bytes: int = HEADER_HINT_BYTES, lookahead: int = LOOKAHEAD,
+              drop: bool = True, ordered: bool = False) -> Iterator[Path]:
+    """
+    Yield the files in their order on the disk, reading the headers of the next files ahead.
+
+    Args:
+        paths: The files
+        header_bytes: The range of each file read ahead
+        lookahead: Files whose headers are read ahead
+        drop: Whether to drop the pages of a file from the page cache after the consumer is done with it
+        ordered: Whether the files are already in their order on the disk (see seek_order)
+
+    Yields:
+        Path: The files, each one after the headers of the next ones were requested
+    """
+    order = list(paths) if ordered else seek_order(paths)
+    if not SUPPORTS_FADVISE:
+        yield from order
+        return
+    for path in order[:lookahead]:
+        advise(path, 0, header_bytes, os.POSIX_FADV_WILLNEED)
+    for i, path in enumerate(order):
+        if i + lookahead < len(order):
+            advise(order[i + lookahead], 0, header_bytes, os.POSIX_FADV_WILLNEED)
+        yield path
+        if drop:
+            advise(path, 0, 0, os.POSIX_FADV_DONTNEED)
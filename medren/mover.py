@@ -0,0 +1,289 @@
+import ctypes
+import errno
+import functools
+import hashlib
+import logging
+import os
+import shutil
+import sys
+from collections import OrderedDict
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# How apply_rename puts a file at its new path:
+#   move: rename within the filesystem, a verified stream copy and delete across filesystems
+#   copy: a reflink (copy on write clone), else copy_file_range, else a verified stream copy, the original is kept
+#   hardlink: a hard link, else a copy (across filesystems), the original is kept
+TRANSFER_MODES = ['move', 'copy', 'hardlink']
+
+FICLONE = 0x40049409  # ioctl to clone a file (btrfs, xfs, ...), from linux/fs.h
+RENAME_NOREPLACE = 1  # renameat2 flag to fail if the target exists, from linux/fs.h
+AT_FDCWD = -100
+COPY_CHUNK = 8 * 1024 * 1024
+DIR_FDS_LIMIT = 64  # Directories kept open by DirFds
+
+SUPPORTS_DIR_FD = hasattr(os, 'O_DIRECTORY') and {os.rename, os.link, os.unlink, os.stat} <= os.supports_dir_fd
+LINK_NOFOLLOW = {'follow_symlinks': False} if os.link in os.supports_follow_symlinks else {}  # link a symlink itself
+
+
+class VerifyError(OSError):
+    """The copy of a file differs from the original."""
+
+
+def reflink(src: Path | str, dst: Path | str) -> None:
+    """Clone a file sharing its data blocks (Linux filesystems that support FICLONE)."""
+    import fcntl
+    with open(src, 'rb') as fsrc, open(dst, 'xb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            fdst.close()
+            os.unlink(dst)
+            raise
+
+
+def copy_range(src: Path | str, dst: Path | str) -> None:
+    """Copy a file within the kernel with copy_file_range (which may reflink or copy on the server for NFS/SMB)."""
+    with open(src, 'rb') as fsrc, open(dst, 'xb') as fdst:
+        try:
+            remaining = os.fstat(fsrc.fileno()).st_size
+            while remaining > 0:
+                copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), min(remaining, 1 << 30))
+                if copied == 0:
+                    break
+                remaining -= copied
+        except OSError:
+            fdst.close()
+            os.unlink(dst)
+            raise
+
+
+def file_digest(path: Path | str) -> str:
+    with open(path, 'rb', buffering=0) as f:
+        return hashlib.file_digest(f, 'sha256').hexdigest()
+
+
+def stream_copy(src: Path | str, dst: Path | str, verify: bool = True) -> None:
+    """
+    Copy a file by reading and writing it, hashing the data on the way.
+
+    Args:
+        src: The original file
+        dst: The new file, it should not exist
+        verify: If true, the new file is read back and compared to the hash of the original
+    """
+    digest = hashlib.sha256()
+    with open(src, 'rb') as fsrc, open(dst, 'xb') as fdst:
+        try:
+            while chunk := fsrc.read(COPY_CHUNK):
+                digest.update(chunk)
+                fdst.write(chunk)
+            fdst.flush()
+            os.fsync(fdst.fileno())
+        except BaseException:
+            fdst.close()
+            unlink_quietly(dst)
+            raise
+    if verify and file_digest(dst) != digest.hexdigest():
+        unlink_quietly(dst)
+        raise VerifyError(errno.EIO, 'The copy differs from the original', str(dst))
+
+
+@functools.cache
+def libc_renameat2():
+    """The renameat2 function of the C library (Linux, glibc 2.28+), None where it is missing."""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        func = ctypes.CDLL(None, use_errno=True).renameat2
+    except (OSError, AttributeError):
+        return None
+    func.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_uint]
+    func.restype = ctypes.c_int
+    return func
+
+
+def rename_noreplace(src: Path | str, dst: Path | str, src_dir_fd: int | None = None,
+                     dst_dir_fd: int | None = None) -> None:
+    """
+    Rename a file without replacing an existing target, atomically where the system allows.
+
+    Uses renameat2(RENAME_NOREPLACE) on Linux, else a hard link and an unlink of the original
+    (both fail if the target exists), and on filesystems without hard links a check and a rename.
+
+    Args:
+        src: The original file, relative to src_dir_fd if given
+        dst: The new path, relative to dst_dir_fd if given
+        src_dir_fd: An open directory of the original
+        dst_dir_fd: An open directory of the new path
+
+    Raises:
+        FileExistsError: dst exists
+    """
+    renameat2 = libc_renameat2()
+    if renameat2 is not None:
+        if renameat2(AT_FDCWD if src_dir_fd is None else src_dir_fd, os.fsencode(src),
+                     AT_FDCWD if dst_dir_fd is None else dst_dir_fd, os.fsencode(dst), RENAME_NOREPLACE) == 0:
+            return
+        err = ctypes.get_errno()
+        # EINVAL: the filesystem does not support the flag (e.g. some network filesystems)
+        if err not in (errno.EINVAL, errno.ENOSYS, errno.ENOTSUP):
+            raise OSError(err, os.strerror(err), str(src), None, str(dst))
+    try:
+        os.link(src, dst, src_dir_fd=src_dir_fd, dst_dir_fd=dst_dir_fd, **LINK_NOFOLLOW)
+    except OSError as e:
+        if e.errno in (errno.EEXIST, errno.EXDEV, errno.ENOENT):
+            raise
+        # no hard links (e.g. FAT): not atomic
+        try:
+            os.stat(dst, dir_fd=dst_dir_fd, follow_symlinks=False)
+        except FileNotFoundError:
+            os.rename(src, dst, src_dir_fd=src_dir_fd, dst_dir_fd=dst_dir_fd)
+            return
+        raise FileExistsError(errno.EEXIST, 'The target exists', str(dst)) from None
+    os.unlink(src, dir_fd=src_dir_fd)
+
+
+class DirFds:
+    """
+    Open directories, so renames in them resolve only the file names (the least recently used are closed).
+
+    Where the system has no directory file descriptors, get returns None and the renames use the full paths.
+
+    Args:
+        limit: The most directories kept open (at least the two of a rename)
+    """
+
+    def __init__(self, limit: int = DIR_FDS_LIMIT):
+        self.limit = max(limit, 2)
+        self.fds: OrderedDict[str, int] = OrderedDict()
+
+    def get(self, directory: Path, create: bool = False) -> int | None:
+        """
+        The file descriptor of a directory, opening it once.
+
+        Args:
+            directory: The directory
+            create: If true, the directory and its missing parents are created
+        """
+        if not SUPPORTS_DIR_FD:
+            if create:
+                directory.mkdir(parents=True, exist_ok=True)
+            return None
+        key = str(directory)
+        fd = self.fds.get(key)
+        if fd is not None:
+            self.fds.move_to_end(key)
+            return fd
+        flags = os.O_RDONLY | os.O_DIRECTORY | getattr(os, 'O_CLOEXEC', 0)
+        try:
+            fd = os.open(directory, flags)
+        except FileNotFoundError:
+            if not create:
+                raise
+            directory.mkdir(parents=True, exist_ok=True)
+            fd = os.open(directory, flags)
+        self.fds[key] = fd
+        if len(self.fds) > self.limit:
+            os.close(self.fds.popitem(last=False)[1])
+        return fd
+
+    def close(self) -> None:
+        while self.fds:
+            os.close(self.fds.popitem()[1])
+
+    def __enter__(self) -> 'DirFds':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def unlink_quietly(path: Path | str) -> None:
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def copy_file(src: Path | str, dst: Path | str, verify: bool = True) -> str:
+    """
+    Copy a file, cloning it where the filesystem allows.
+
+    Returns:
+        str: The method used ('reflink', 'copy_file_range' or 'stream')
+    """
+    try:
+        reflink(src, dst)
+        method = 'reflink'
+    except FileExistsError:
+        raise
+    except (OSError, ImportError):
+        try:
+            copy_range(src, dst)
+            method = 'copy_file_range'
+        except FileExistsError:
+            raise
+        except (OSError, AttributeError):
+            stream_copy(src, dst, verify=verify)
+            method = 'stream'
+    shutil.copystat(src, dst)
+    return method
+
+
+def move_file(src: Path, dst: Path, src_dir_fd: int | None, dst_dir_fd: int | None, verify: bool = True) -> str:
+    """Rename a file without replacing dst, or copy and delete it across filesystems (the move mode of transfer)."""
+    try:
+        if src_dir_fd is None:
+            rename_noreplace(src, dst)
+        else:
+            rename_noreplace(src.name, dst.name, src_dir_fd=src_dir_fd, dst_dir_fd=dst_dir_fd)
+        return 'rename'
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    # another filesystem: copy, verify, and only then delete the original
+    stream_copy(src, dst, verify=verify)
+    shutil.copystat(src, dst)
+    os.unlink(src)
+    return 'stream'
+
+
+def transfer(src: Path | str, dst: Path | str, mode: str = 'move', verify: bool = True,
+             dir_fds: DirFds | None = None) -> str:
+    """
+    Put a file at a new path, creating the missing directories. An existing file is never replaced.
+
+    Args:
+        src: The original file
+        dst: The new path, it should not exist
+        mode: One of TRANSFER_MODES
+        verify: If true, byte copies are read back and verified
+        dir_fds: Open directories to rename relative to (see DirFds), for many files
+
+    Returns:
+        str: The method used ('rename', 'hardlink', 'reflink', 'copy_file_range' or 'stream')
+
+    Raises:
+        FileExistsError: dst exists
+    """
+    if mode not in TRANSFER_MODES:
+        raise ValueError(f'Unknown transfer mode {mode}')
+    src, dst = Path(src), Path(dst)
+    if dir_fds is None:
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        src_dir_fd = dst_dir_fd = None
+    else:
+        src_dir_fd, dst_dir_fd = dir_fds.get(src.parent), dir_fds.get(dst.parent, create=True)
+    if mode == 'move':
+        return move_file(src, dst, src_dir_fd, dst_dir_fd, verify=verify)
+    if mode == 'hardlink':
+        try:
+            os.link(src, dst)
+            return 'hardlink'
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+                raise
+            logger.debug(f"Could not hard link {src} to {dst}, copying: {e}")
+    return copy_file(src, dst, verify=verify)
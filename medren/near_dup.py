@@ -0,0 +1,179 @@
+import importlib.util
+import io
+import logging
+from collections.abc import Hashable, Iterator
+from pathlib import Path
+
+import numpy as np
+import piexif
+
+from medren.backend_piexif import jpeg_exif_segment
+from medren.fusion import read_header
+
+logger = logging.getLogger(__name__)
+
+# Near duplicates (bursts, re-saved or resized copies) found by a perceptual hash of the Exif thumbnail.
+# Only the head of each file is read, and the small thumbnail is decoded (with Pillow, an optional dependency)
+# instead of the full image. The hashes are indexed in a BK-tree, so finding the hashes within a hamming radius
+# of each file does not compare all the pairs.
+
+HASH_SIZE = 8  # The hash has HASH_SIZE**2 bits
+DCT_SIZE = 32  # The thumbnail is reduced to DCT_SIZE x DCT_SIZE gray pixels
+DEFAULT_DUP_RADIUS = 8  # Hamming distance between the hashes of near duplicates
+
+
+def dct_matrix(n: int) -> np.ndarray:
+    """The orthonormal DCT-II matrix."""
+    k = np.arange(n)[:, None]
+    m = np.cos(np.pi * (2 * np.arange(n)[None, :] + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    m[0] /= np.sqrt(2)
+    return m
+
+
+DCT = dct_matrix(DCT_SIZE)
+
+
+def phash_many(images: np.ndarray) -> list[int]:
+    """
+    Compute the perceptual hashes of gray images.
+
+    Each bit tells if a low frequency DCT coefficient of the image is above the median of these coefficients.
+
+    Args:
+        images: An array of shape (n, DCT_SIZE, DCT_SIZE)
+
+    Returns:
+        list[int]: The hashes, HASH_SIZE**2 bits each
+    """
+    images = np.asarray(images, dtype=np.float64)
+    coeffs = (DCT @ images @ DCT.T)[:, :HASH_SIZE, :HASH_SIZE].reshape(len(images), -1)
+    median = np.median(coeffs[:, 1:], axis=1, keepdims=True)  # the DC coefficient is only the mean brightness
+    bits = np.packbits(coeffs > median, axis=1)
+    return [int.from_bytes(row.tobytes(), 'big') for row in bits]
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def read_thumbnail(path: Path | str) -> bytes | None:
+    """Read the Exif thumbnail (a small JPEG) from the head of a JPEG or TIFF based file."""
+    data = read_header(path)
+    if data[:2] == b'\xff\xd8':
+        data = jpeg_exif_segment(data)
+    elif data[:2] not in (b'II', b'MM'):
+        return None
+    if not data:
+        return None
+    try:
+        return piexif.load(data).get('thumbnail') or None
+    except Exception as e:
+        logger.debug(f"Could not read the thumbnail of {path}: {e}")
+        return None
+
+
+def require_pillow() -> None:
+    """Fail before the preview if Pillow, needed to decode the thumbnails, is missing."""
+    if importlib.util.find_spec('PIL') is None:
+        raise ImportError('Grouping near duplicates needs Pillow (pip install medren[near-dups])')
+
+
+def decode_gray(jpeg: bytes) -> np.ndarray:
+    """Decode a thumbnail to DCT_SIZE x DCT_SIZE gray pixels."""
+    from PIL import Image
+
+    with Image.open(io.BytesIO(jpeg)) as image:
+        image.draft('L', (DCT_SIZE, DCT_SIZE))  # let the JPEG decoder scale down
+        return np.asarray(image.convert('L').resize((DCT_SIZE, DCT_SIZE), Image.Resampling.BILINEAR))
+
+
+def thumbnail_hashes(paths: list[Path]) -> dict[Path, int | None]:
+    """The perceptual hashes of the Exif thumbnails of files, None for the files without a thumbnail."""
+    images, hashed = [], []
+    for path in paths:
+        try:
+            thumb = read_thumbnail(path)
+            if thumb:
+                images.append(decode_gray(thumb))
+                hashed.append(path)
+        except ImportError:
+            raise
+        except Exception as e:
+            logger.debug(f"Could not hash the thumbnail of {path}: {e}")
+    hashes = dict.fromkeys(paths)
+    if images:
+        hashes.update(zip(hashed, phash_many(np.stack(images))))
+    return hashes
+
+
+class BKTree:
+    """A BK-tree of hashes under the hamming distance, for radius queries."""
+
+    def __init__(self):
+        self.root = None  # [hash, items, {distance: child}]
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def add(self, h: int, item: Hashable) -> None:
+        self.size += 1
+        if self.root is None:
+            self.root = [h, [item], {}]
+            return
+        node = self.root
+        while True:
+            d = hamming(h, node[0])
+            if d == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [h, [item], {}]
+                return
+            node = child
+
+    def query(self, h: int, radius: int) -> Iterator[tuple[int, Hashable]]:
+        """Yield the items whose hashes are within radius of h, with their distances."""
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            d = hamming(h, node[0])
+            if d <= radius:
+                for item in node[1]:
+                    yield d, item
+            # by the triangle inequality, only the children at distances d-radius..d+radius can be close
+            stack.extend(child for dist, child in node[2].items() if d - radius <= dist <= d + radius)
+
+
+def group_near_duplicates(hashes: dict[Path, int | None], radius: int = DEFAULT_DUP_RADIUS) -> list[list[Path]]:
+    """
+    Group the files whose hashes are within radius of each other (transitively).
+
+    Returns:
+        list[list[Path]]: The groups of two files or more, in the order of the files
+    """
+    order = {path: i for i, path in enumerate(hashes)}
+    tree = BKTree()
+    for path, h in hashes.items():
+        if h is not None:
+            tree.add(h, path)
+    parent = {path: path for path in order}
+
+    def find(path: Path) -> Path:
+        while parent[path] != path:
+            parent[path] = parent[parent[path]]
+            path = parent[path]
+        return path
+
+    for path, h in hashes.items():
+        if h is None:
+            continue
+        for _d, other in tree.query(h, radius):
+            a, b = find(path), find(other)
+            if a != b:
+                parent[max(a, b, key=order.get)] = min(a, b, key=order.get)
+    groups: dict[Path, list[Path]] = {}
+    for path in hashes:
+        groups.setdefault(find(path), []).append(path)
+    return [group for group in groups.values() if len(group) > 1]
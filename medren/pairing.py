@@ -0,0 +1,97 @@
+import os
+from collections import defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from medren.consts import image_ext_with_exif, image_extensions, raw_extensions, sidecar_extensions, video_extensions
+
+# Files sharing a directory and a base name belong together:
+# a Live Photo (IMG_1234.HEIC + IMG_1234.MOV), a RAW+JPEG pair (DSC_1234.NEF + DSC_1234.JPG),
+# and their sidecars (IMG_1234.xmp, IMG_1234.CR2.xmp, IMG_1234.AAE).
+# Metadata is extracted once from the primary file and all the members are renamed together.
+
+# The first extension found in a group becomes its primary (the one with the most reliable and cheapest metadata)
+primary_extensions = [*image_ext_with_exif, '.heic', '.heif', *raw_extensions,
+                      *[ext for ext in image_extensions if ext not in image_ext_with_exif],
+                      *video_extensions]
+
+
+@dataclass
+class PairGroup:
+    primary: Path
+    companions: list[Path] = field(default_factory=list)
+
+    @property
+    def members(self) -> list[Path]:
+        return [self.primary, *self.companions]
+
+
+def pair_key(path: Path) -> tuple[Path, str]:
+    """Return the directory and the lowercase base name shared by the members of a group."""
+    name = path.name
+    stem, ext = os.path.splitext(name)
+    if ext.lower() in sidecar_extensions:
+        # IMG_1234.CR2.xmp belongs to IMG_1234.CR2
+        inner_stem, inner_ext = os.path.splitext(stem)
+        if inner_ext.lower() in primary_extensions:
+            stem = inner_stem
+    return path.parent, stem.lower()
+
+
+def pair_tail(path: Path) -> str:
+    """Return the part of the name after the shared base name, e.g. '.cr2.xmp' for IMG_1234.CR2.xmp"""
+    stem = pair_key(path)[1]
+    return path.name[len(stem):].lower()
+
+
+def _primary_rank(path: Path) -> int:
+    ext = path.suffix.lower()
+    return primary_extensions.index(ext) if ext in primary_extensions else len(primary_extensions)
+
+
+def find_sidecars(paths: list[Path]) -> list[Path]:
+    """Find the sidecar files next to the given files, listing each directory once."""
+    keys = {pair_key(p) for p in paths}
+    known = set(paths)
+    sidecars = []
+    for directory in {d for d, _ in keys}:
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            continue
+        for name in names:
+            if os.path.splitext(name)[1].lower() not in sidecar_extensions:
+                continue
+            path = Path(directory) / name
+            if path not in known and pair_key(path) in keys:
+                sidecars.append(path)
+    return sidecars
+
+
+def pair_files(paths: list[Path], with_sidecars: bool = True) -> list[PairGroup]:
+    """
+    Group files that belong together.
+
+    Args:
+        paths: The files to group
+        with_sidecars: If true, sidecar files next to the given files are added to their groups
+
+    Returns:
+        list[PairGroup]: The groups, single files are returned as groups without companions
+    """
+    paths = [Path(p) for p in paths]
+    if with_sidecars:
+        paths = paths + find_sidecars(paths)
+    by_key: dict[tuple[Path, str], list[Path]] = defaultdict(list)
+    for path in paths:
+        by_key[pair_key(path)].append(path)
+    groups = []
+    for members in by_key.values():
+        members.sort(key=_primary_rank)
+        primary = members[0]
+        if primary.suffix.lower() in sidecar_extensions:
+            # sidecars without their media file are left alone
+            groups.extend(PairGroup(primary=p) for p in members)
+        else:
+            groups.append(PairGroup(primary=primary, companions=members[1:]))
+    return groups
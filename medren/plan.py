@@ -0,0 +1,188 @@
+import datetime
+import gzip
+import json
+import logging
+import os
+import socket
+from collections.abc import Iterator
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO, Any
+
+from medren import __version__
+from medren.archive import split_member_path
+from medren.exif_process import ExifClass
+from medren.preview_cache import FileKey, file_key
+
+logger = logging.getLogger(__name__)
+
+# A plan file holds the renames of a preview, so they can be applied later or on another host.
+# It is JSON lines (gzip compressed if the name ends with .gz): a header line, then one line per file:
+#   {"src": original path, "dst": new name (relative to the directory of src, or absolute),
+#    "size": .., "mtime_ns": .. (fingerprint of src when planned), "meta": the metadata used (ExifClass fields)}
+
+PLAN_FORMAT = 'medren-plan'
+PLAN_VERSION = 1
+
+RootMap = dict[str, str]  # path prefix on the planning host -> path prefix where the plan is applied
+
+
+class PlanError(Exception):
+    """The file is not a plan this version can read."""
+
+
+@dataclass
+class PlanEntry:
+    src: Path
+    dst: str
+    size: int | None = None
+    mtime_ns: int | None = None
+    meta: ExifClass | None = None
+
+    @property
+    def target(self) -> Path:
+        return self.src.parent / self.dst
+
+    def check(self) -> str | None:
+        """
+        Compare the file to its fingerprint.
+
+        Returns:
+            str | None: Why the entry can not be applied, None if the file is unchanged
+        """
+        key = source_key(self.src)
+        if key is None:
+            return 'missing'
+        if self.size is not None and (key[1], key[2]) != (self.size, self.mtime_ns):
+            return 'changed'
+        return None
+
+
+def source_key(path: Path | str) -> FileKey | None:
+    """The fingerprint of a file, or of its archive for a member of an archive."""
+    key = file_key(path)
+    if key is None and (member := split_member_path(path)):
+        key = file_key(member[0])
+    return key
+
+
+def open_plan(filename: Path | str, mode: str) -> IO[str]:
+    if str(filename).endswith('.gz'):
+        return gzip.open(filename, mode + 't', encoding='utf-8')
+    return open(filename, mode, encoding='utf-8')
+
+
+def map_root(path: str, root_map: RootMap | None) -> str:
+    for org, new in (root_map or {}).items():
+        prefix = org.rstrip('/\\')
+        if path.startswith(prefix) and path[len(prefix):len(prefix) + 1] in ('', '/', '\\'):
+            return new.rstrip('/\\') + path[len(prefix):]
+    return path
+
+
+class PlanWriter:
+    """Write a plan file entry by entry."""
+
+    def __init__(self, filename: Path | str, **header: Any):
+        self.filename = Path(filename)
+        self.filename.parent.mkdir(parents=True, exist_ok=True)
+        self.f = open_plan(self.filename, 'w')
+        self.count = 0
+        self.f.write(json.dumps({
+            'format': PLAN_FORMAT,
+            'version': PLAN_VERSION,
+            'medren': __version__,
+            'created': datetime.datetime.now().isoformat(timespec='seconds'),
+            'host': socket.gethostname(),
+            **header,
+        }) + '\n')
+
+    def write(self, src: Path | str, dst: str, meta: ExifClass | None = None) -> None:
+        key = source_key(src)
+        entry = {'src': str(src), 'dst': str(dst), 'size': key and key[1], 'mtime_ns': key and key[2],
+                 'meta': meta.to_dict() if meta is not None else None}
+        self.f.write(json.dumps(entry, separators=(',', ':')) + '\n')
+        self.count += 1
+
+    def close(self) -> None:
+        self.f.close()
+
+    def __enter__(self) -> 'PlanWriter':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def write_plan(filename: Path | str, renames: dict[str, tuple[str, ExifClass]], **header: Any) -> int:
+    """
+    Write the renames of a preview to a plan file.
+
+    Args:
+        filename: The plan file (.jsonl, or .jsonl.gz to compress it)
+        renames: The renames, as returned by Renamer.generate_renames
+        header: Extra header fields (e.g. the template)
+
+    Returns:
+        int: The number of entries written
+    """
+    with PlanWriter(filename, **header) as writer:
+        for org_path, (new_name, ex) in renames.items():
+            writer.write(org_path, new_name, ex)
+        return writer.count
+
+
+def read_plan_header(f: IO[str]) -> dict[str, Any]:
+    try:
+        header = json.loads(f.readline())
+    except ValueError as e:
+        raise PlanError(f'Not a plan file: {e}') from e
+    if not isinstance(header, dict) or header.get('format') != PLAN_FORMAT:
+        raise PlanError('Not a plan file')
+    if header.get('version', 0) > PLAN_VERSION:
+        raise PlanError(f"Plan version {header.get('version')} is newer than the supported version {PLAN_VERSION}")
+    return header
+
+
+def read_plan(filename: Path | str, root_map: RootMap | None = None) -> tuple[dict[str, Any], Iterator[PlanEntry]]:
+    """
+    Read a plan file lazily.
+
+    Args:
+        filename: The plan file
+        root_map: Path prefixes to replace, when the plan is applied where the files are mounted elsewhere
+
+    Returns:
+        tuple[dict[str, Any], Iterator[PlanEntry]]: The header, and the entries as they are read
+    """
+    f = open_plan(filename, 'r')
+    try:
+        header = read_plan_header(f)
+    except Exception:
+        f.close()
+        raise
+
+    def entries() -> Iterator[PlanEntry]:
+        with f:
+            for line in f:
+                if not line.strip():
+                    continue
+                d = json.loads(line)
+                dst = d['dst']
+                if os.path.isabs(dst):
+                    dst = map_root(dst, root_map)
+                yield PlanEntry(src=Path(map_root(d['src'], root_map)), dst=dst, size=d.get('size'),
+                                mtime_ns=d.get('mtime_ns'),
+                                meta=ExifClass.from_dict(d['meta']) if d.get('meta') else None)
+
+    return header, entries()
+
+
+def verify_plan(entries: Iterator[PlanEntry]) -> Iterator[tuple[PlanEntry, str]]:
+    """Check the entries of a plan before applying it, yielding the entries that can not be applied and why."""
+    for entry in entries:
+        problem = entry.check()
+        if problem is None and entry.target != entry.src and entry.target.exists():
+            problem = 'target exists'
+        if problem:
+            yield entry, problem
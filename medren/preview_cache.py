@@ -0,0 +1,105 @@
+import glob
+import os
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from medren.exif_process import ExifClass
+
+# Memoized results of the preview stages (discover -> extract -> enrich -> name -> plan).
+# A cache outlives the Renamer that filled it, so a new preview with another template or prefix
+# only re-runs the naming over the cached metadata, and adding an input only discovers and extracts the new files.
+# Entries are keyed by what they depend on: discovery by the mtimes of the scanned directories,
+# file results by the path, size and mtime of the file.
+# A cache may be shared by concurrent jobs (see daemon.py): the lock guards the lookups, inserts and counters.
+
+FileKey = tuple[str, int, int]  # path, size, mtime_ns
+
+
+def file_key(path: Path | str) -> FileKey | None:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return str(path), st.st_size, st.st_mtime_ns
+
+
+def dir_mtimes(directories: list[str]) -> dict[str, int]:
+    mtimes = {}
+    for d in directories:
+        try:
+            mtimes[d] = os.stat(d).st_mtime_ns
+        except OSError:
+            mtimes[d] = -1
+    return mtimes
+
+
+@dataclass
+class PreviewCache:
+    # glob pattern -> (mtimes of the directories it covers, resolved paths)
+    resolved: dict[str, tuple[dict[str, int], list[Path]]] = field(default_factory=dict)
+    # (file key, backends) -> extracted metadata, the cached objects are shared and should not be modified
+    meta: dict[tuple[FileKey, tuple[str, ...]], ExifClass | None] = field(default_factory=dict)
+    hashes: dict[FileKey, str] = field(default_factory=dict)  # file key -> sha256
+    phashes: dict[FileKey, int | None] = field(default_factory=dict)  # file key -> perceptual hash of the thumbnail
+    addresses: dict[tuple[float, float], str | None] = field(default_factory=dict)  # (lat, lon) -> address
+    hits: int = 0
+    misses: int = 0
+    lock: threading.RLock = field(default_factory=threading.RLock, repr=False, compare=False)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.resolved.clear()
+            self.meta.clear()
+            self.hashes.clear()
+            self.phashes.clear()
+            self.addresses.clear()
+            self.hits = self.misses = 0
+
+    def resolve(self, pattern: str) -> list[Path]:
+        """Glob a pattern, reusing the previous result while the directories it covers are unchanged."""
+        with self.lock:
+            cached = self.resolved.get(pattern)
+            if cached and dir_mtimes(list(cached[0])) == cached[0]:
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+        # the glob runs without the lock, a concurrent job resolving the same pattern just stores the same result
+        paths = [Path(p) for p in glob.glob(pattern, recursive=True)]
+        base = Path(pattern).parent
+        while glob.has_magic(str(base)):
+            base = base.parent
+        directories = [str(base)]
+        if '**' in pattern:
+            directories += [d for d, _, _ in os.walk(base) if d != str(base)]
+        with self.lock:
+            self.resolved[pattern] = (dir_mtimes(directories), paths)
+        return paths
+
+    def get_meta(self, key: FileKey | None, backends: list[str]) -> tuple[bool, ExifClass | None]:
+        if key is None:
+            return False, None
+        k = (key, tuple(backends))
+        with self.lock:
+            if k in self.meta:
+                self.hits += 1
+                return True, self.meta[k]
+            self.misses += 1
+        return False, None
+
+    def set_meta(self, key: FileKey | None, backends: list[str], ex: ExifClass | None) -> None:
+        if key is not None:
+            with self.lock:
+                self.meta[(key, tuple(backends))] = ex
+
+    def renamed(self, moves: dict[str, str]) -> None:
+        """Carry the results of renamed files over to their new paths (a rename keeps the size and mtime)."""
+        if not moves:
+            return
+        with self.lock:
+            for k in [k for k in self.meta if k[0][0] in moves]:
+                (org_path, size, mtime), backends = k
+                self.meta[((moves[org_path], size, mtime), backends)] = self.meta.pop(k)
+            for cache in (self.hashes, self.phashes):
+                for k in [k for k in cache if k[0] in moves]:
+                    cache[(moves[k[0]], k[1], k[2])] = cache.pop(k)
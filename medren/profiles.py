@@ -1,7 +1,9 @@
+import json
+import os
 from dataclasses import dataclass
 from enum import StrEnum
 
-from medren.consts import DEFAULT_TEMPLATE, DEFAULT_DATETIME_FORMAT, DEFAULT_PROFILE_NAME
+from medren.consts import DEFAULT_DATETIME_FORMAT, DEFAULT_PROFILE_NAME, DEFAULT_TEMPLATE, PROFILES_DIR
 
 
 class Modes(StrEnum):
@@ -20,6 +22,8 @@ class Profile:
     suffix: str = ''
     org_full_path: str = ''
     separator: str = None
+    backend_order: dict[str, list[str]] | None = None  # Calibrated backend order per extension
+    root_ceilings: dict[str, int] | None = None  # The most files in flight per storage root (adaptive concurrency)
 
     def get_vars(self):
         values = vars(self)
@@ -32,7 +36,8 @@ profiles: dict[str, Profile] = {
         template='{prefix}{s}#{idx:03d}{s}{datetime}{s}{cname}{s}{suffix}{ext}',
     ),
     "geo": Profile(
-        template='{prefix}{s}{datetime}{s}{pluscode}{s}{address}{s}{lat:.4f}{s}{lon:.4f}{ext}', # .4 digits ~ 11m accuracy
+        # .4 digits ~ 11m accuracy
+        template='{prefix}{s}{datetime}{s}{pluscode}{s}{address}{s}{lat:.4f}{s}{lon:.4f}{ext}',
     ),
     "compact": Profile(
         template='{prefix}{s}{datetime}{s}{suffix}{ext}',
@@ -49,3 +54,62 @@ profiles: dict[str, Profile] = {
 }
 
 profile_keys = [k for k in Profile.__annotations__]
+
+saved_keys = [
+    'inputs', 'profile', 'pattern', 'backends',
+    ]
+
+# Settings file path
+def load_settings(filename, is_profile=False) -> dict:
+    try:
+        if os.path.exists(filename):
+            with open(filename) as f:
+                values = json.load(f)
+                filter_list = profile_keys if is_profile else saved_keys
+                # keys added after the file was saved keep their defaults
+                values = {key: values[key] for key in filter_list if key in values}
+                return values
+    except Exception:
+        pass
+    return {}
+
+def save_settings(values, filename, is_profile=False) -> None:
+    filter_list = profile_keys if is_profile else saved_keys
+    values = {key: values[key] for key in filter_list if key in values}
+    try:
+        with open(filename, 'w') as f:
+            json.dump(values, f)
+    except Exception:
+        pass
+
+def load_profile(profile_name: str) -> dict:
+    profile_name = (profile_name or DEFAULT_PROFILE_NAME)
+    profile_filename = get_profile_filename(profile_name)
+    if profile_filename.is_file():
+        return load_settings(profile_filename, is_profile=True)
+    else:
+        profile = profiles.get(profile_name)
+        if profile:
+            return profile.get_vars()
+    return {}
+
+def save_profile(values, profile_name: str) -> None:
+    profile_filename = get_profile_filename(profile_name)
+    save_settings(values=values, filename=profile_filename, is_profile=True)
+
+def delete_profile(profile_name: str):
+    profile_filename = get_profile_filename(profile_name)
+    if profile_filename.is_file():
+        os.remove(profile_filename)
+
+def get_profile_filename(profile_name: str):
+    profile_name = (profile_name or DEFAULT_PROFILE_NAME) + '.json'
+    profile_filename = PROFILES_DIR / profile_name
+    return profile_filename
+
+
+def get_profile_names():
+    saved_profile_names = [p.stem for p in PROFILES_DIR.glob('*.json')]
+    built_in_profile_names = list(profiles.keys())
+    all_profile_names = sorted(set(saved_profile_names) | set(built_in_profile_names))
+    return saved_profile_names, built_in_profile_names, all_profile_names
@@ -0,0 +1,388 @@
+import bisect
+import http.client
+import io
+import logging
+import os
+import queue
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from pathlib import PurePosixPath
+from urllib.parse import unquote, urlsplit
+
+from medren.backends import available_backends, backend_support
+from medren.consts import extension_normalized, isobmff_extensions
+from medren.exif_process import ExifClass
+
+logger = logging.getLogger(__name__)
+
+# Metadata extraction from files that are not on a local filesystem.
+# HTTP(S) files are read with range requests through a pool of keep-alive connections,
+# other fsspec URLs (s3://, gs://, ...) through the block-caching file objects of fsspec (an optional dependency).
+# The backends with a stream_func parse a seekable file object, so only the header and the seek targets
+# of the parser are fetched, never the whole file.
+
+DEFAULT_BLOCK_SIZE = 64 * 1024  # The minimal request size, small reads are rounded up to it
+DEFAULT_TAIL_SIZE = 64 * 1024  # Fetched with the header of ISO-BMFF files, whose moov box is often at the end
+DEFAULT_CONNECTIONS = 8  # Per host
+HTTP_TIMEOUT = 30
+
+CONTENT_RANGE = re.compile(r'bytes (\d+)-(\d+)/(\d+|\*)')
+
+
+class RemoteError(OSError):
+    """A range request failed."""
+
+
+def is_remote(path: str) -> bool:
+    """Check if a path is a URL of a remote file system (anything but file://)."""
+    scheme = urlsplit(str(path)).scheme
+    return len(scheme) > 1 and scheme != 'file'  # a single letter is a Windows drive
+
+
+def url_path(url: str) -> PurePosixPath:
+    """The path part of a URL, for the name and extension of the file."""
+    return PurePosixPath(unquote(urlsplit(url).path))
+
+
+class ConnectionPool:
+    """
+    Keep-alive HTTP(S) connections per host, shared by threads.
+
+    Args:
+        connections: The maximal number of idle connections kept per host
+        timeout: Socket timeout in seconds
+    """
+
+    def __init__(self, connections: int = DEFAULT_CONNECTIONS, timeout: float = HTTP_TIMEOUT):
+        self.connections = connections
+        self.timeout = timeout
+        self.idle: dict[tuple[str, str], queue.LifoQueue] = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=connections, thread_name_prefix='medren-range')
+        self.requests = 0
+        self.bytes_fetched = 0
+
+    def __enter__(self) -> 'ConnectionPool':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True)
+        with self.lock:
+            for idle in self.idle.values():
+                while not idle.empty():
+                    idle.get_nowait().close()
+            self.idle.clear()
+
+    def _idle(self, key: tuple[str, str]) -> queue.LifoQueue:
+        with self.lock:
+            return self.idle.setdefault(key, queue.LifoQueue())
+
+    def _connect(self, scheme: str, netloc: str) -> http.client.HTTPConnection:
+        if scheme == 'https':
+            return http.client.HTTPSConnection(netloc, timeout=self.timeout)
+        return http.client.HTTPConnection(netloc, timeout=self.timeout)
+
+    def _release(self, key: tuple[str, str], conn: http.client.HTTPConnection) -> None:
+        idle = self._idle(key)
+        if idle.qsize() < self.connections:
+            idle.put(conn)
+        else:
+            conn.close()
+
+    def fetch(self, url: str, range_header: str, limit: int) -> tuple[int, bytes, int | None]:
+        """
+        Request a byte range.
+
+        Args:
+            url: An http or https URL
+            range_header: The value of the Range header (e.g. 'bytes=0-65535' or 'bytes=-65536')
+            limit: The maximal number of bytes to read, if the server ignores the range and sends the whole file
+
+        Returns:
+            tuple[int, bytes, int | None]: The offset of the data, the data and the size of the file (if known)
+        """
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise ValueError(f'Not an HTTP URL: {url}')
+        key = (parts.scheme, parts.netloc)
+        target = parts.path or '/'
+        if parts.query:
+            target += '?' + parts.query
+        idle = self._idle(key)
+        for attempt in range(2):
+            try:
+                conn = idle.get_nowait()
+                reused = True
+            except queue.Empty:
+                conn, reused = self._connect(*key), False
+            try:
+                conn.request('GET', target, headers={'Range': range_header})
+                return self._read_response(url, conn, conn.getresponse(), limit)
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                conn.close()
+                if reused and attempt == 0:
+                    continue  # a stale keep-alive connection, try a new one
+                raise
+            except BaseException:
+                conn.close()
+                raise
+        raise RemoteError(f'Could not fetch {url}')  # not reached
+
+    def _read_response(self, url: str, conn: http.client.HTTPConnection, resp: http.client.HTTPResponse,
+                       limit: int) -> tuple[int, bytes, int | None]:
+        """Read the response to a range request (see fetch), releasing or closing its connection."""
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        if resp.status == HTTPStatus.PARTIAL_CONTENT:
+            data = resp.read()
+            self._release(key, conn)
+            match = CONTENT_RANGE.match(resp.getheader('Content-Range', ''))
+            if not match:
+                raise RemoteError(f'Bad Content-Range from {url}')
+            start, _end, size = match.groups()
+            offset, size = int(start), None if size == '*' else int(size)
+        elif resp.status == HTTPStatus.OK:
+            # the server ignores ranges, read the start of the body only and drop the connection
+            data = resp.read(limit)
+            conn.close()
+            length = resp.getheader('Content-Length')
+            offset, size = 0, int(length) if length else None
+        elif resp.status == HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE:
+            resp.read()
+            self._release(key, conn)
+            match = re.match(r'bytes \*/(\d+)', resp.getheader('Content-Range', ''))
+            return 0, b'', int(match.group(1)) if match else None
+        else:
+            resp.read()
+            conn.close()
+            raise RemoteError(f'HTTP {resp.status} {resp.reason} for {url}')
+        with self.lock:
+            self.requests += 1
+            self.bytes_fetched += len(data)
+        return offset, data, size
+
+
+class RangeFile(io.RawIOBase):
+    """
+    A read-only, seekable file object over HTTP range requests.
+
+    The fetched ranges are kept, reads are rounded up to block_size and only the missing parts are requested.
+
+    Args:
+        url: An http or https URL
+        pool: The connection pool
+        block_size: The minimal request size
+    """
+
+    def __init__(self, url: str, pool: ConnectionPool, block_size: int = DEFAULT_BLOCK_SIZE):
+        super().__init__()
+        self.url = url
+        self.pool = pool
+        self.block_size = block_size
+        self.size: int | None = None
+        self.pos = 0
+        self.starts: list[int] = []  # The sorted start offsets of the fetched extents
+        self.extents: dict[int, bytes] = {}  # start -> data, extents do not overlap
+        self.bytes_fetched = 0
+        self.lock = threading.Lock()
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.pos
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_SET:
+            pos = offset
+        elif whence == os.SEEK_CUR:
+            pos = self.pos + offset
+        elif whence == os.SEEK_END:
+            pos = self.known_size() + offset
+        else:
+            raise ValueError(f'Invalid whence {whence}')
+        if pos < 0:
+            raise ValueError('Negative seek position')
+        self.pos = pos
+        return pos
+
+    def known_size(self) -> int:
+        """The file size, fetching the tail to learn it if needed."""
+        if self.size is None:
+            self.fetch_tail(self.block_size)
+        if self.size is None:  # the server sent no total size (e.g. 'Content-Range: bytes 0-99/*')
+            raise io.UnsupportedOperation(f'The size of {self.url} is unknown')
+        return self.size
+
+    def _add(self, offset: int, data: bytes, size: int | None) -> None:
+        with self.lock:
+            if size is not None:
+                self.size = size
+            self.bytes_fetched += len(data)
+            if not data:
+                return
+            # merge with the overlapping and adjacent extents
+            start, end = offset, offset + len(data)
+            i = bisect.bisect_left(self.starts, start)
+            if i > 0 and self.starts[i - 1] + len(self.extents[self.starts[i - 1]]) >= start:
+                i -= 1
+            merged = []
+            while i < len(self.starts) and self.starts[i] <= end:
+                s = self.starts.pop(i)
+                merged.append((s, self.extents.pop(s)))
+            lo = min([start] + [s for s, _ in merged])
+            hi = max([end] + [s + len(d) for s, d in merged])
+            buf = bytearray(hi - lo)
+            for s, d in merged:
+                buf[s - lo:s - lo + len(d)] = d
+            buf[start - lo:end - lo] = data
+            bisect.insort(self.starts, lo)
+            self.extents[lo] = bytes(buf)
+
+    def _cached(self, start: int, end: int) -> bytes | None:
+        with self.lock:
+            i = bisect.bisect_right(self.starts, start) - 1
+            if i >= 0:
+                s = self.starts[i]
+                data = self.extents[s]
+                if s + len(data) >= end:
+                    return data[start - s:end - s]
+        return None
+
+    def fetch(self, start: int, end: int) -> None:
+        """Fetch a byte range (end excluded) into the cache, rounded up to the block size."""
+        end = max(end, start + self.block_size)
+        if self.size is not None:
+            end = min(end, self.size)
+        if end <= start:
+            return
+        self._add(*self.pool.fetch(self.url, f'bytes={start}-{end - 1}', end))
+
+    def fetch_tail(self, length: int) -> None:
+        """Fetch the last bytes of the file (this also learns the file size)."""
+        self._add(*self.pool.fetch(self.url, f'bytes=-{length}', length))
+
+    def prefetch(self, head: int, tail: int = 0) -> None:
+        """Fetch the head and the tail of the file in parallel."""
+        futures = [self.pool.executor.submit(self.fetch, 0, head)]
+        if tail:
+            futures.append(self.pool.executor.submit(self.fetch_tail, tail))
+        for future in futures:
+            future.result()
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = max(0, self.known_size() - self.pos)
+        if self.size is not None:
+            size = max(0, min(size, self.size - self.pos))
+        if size == 0:
+            return b''
+        start, end = self.pos, self.pos + size
+        data = self._cached(start, end)
+        if data is None:
+            self.fetch(start, end)
+            if self.size is not None:
+                end = min(end, self.size)  # the size may be known only now
+            data = self._cached(start, end) if end > start else b''
+            if data is None:
+                raise RemoteError(f'Could not read {self.url} at {start}')
+        self.pos += len(data)
+        return data
+
+    def readinto(self, b) -> int:
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+
+def open_remote(url: str, pool: ConnectionPool | None = None, block_size: int = DEFAULT_BLOCK_SIZE):
+    """
+    Open a remote file for reading.
+
+    Args:
+        url: An http(s) URL, or any URL fsspec supports
+        pool: The connection pool of http(s) URLs
+        block_size: The minimal request size
+
+    Returns:
+        A seekable binary file object
+    """
+    if urlsplit(url).scheme in ('http', 'https'):
+        if pool is None:
+            raise ValueError('HTTP URLs need a connection pool')
+        return RangeFile(url, pool, block_size=block_size)
+    try:
+        import fsspec
+    except ImportError as e:
+        raise ImportError(f'Reading {url} needs fsspec (pip install fsspec)') from e
+    return fsspec.open(url, 'rb', block_size=block_size).open()
+
+
+def remote_backends(ext: str, backends: list[str] | None = None) -> list[str]:
+    """The backends that can parse a file object of this extension, in priority order."""
+    return [b for b in backends or available_backends
+            if backend_support[b].stream_func and (backend_support[b].ext is None or ext in backend_support[b].ext)]
+
+
+def extract_remote(url: str, pool: ConnectionPool | None = None, backends: list[str] | None = None,
+                   block_size: int = DEFAULT_BLOCK_SIZE) -> ExifClass | None:
+    """
+    Extract metadata from a remote file, fetching only the byte ranges its parser reads.
+
+    Args:
+        url: An http(s) URL, or any URL fsspec supports
+        pool: The connection pool of http(s) URLs
+        backends: Backends by priority (default: the available backends that can read a file object)
+        block_size: The minimal request size
+
+    Returns:
+        ExifClass | None: The extracted metadata or None if no datetime was found
+    """
+    path = url_path(url)
+    ext = path.suffix.lower()
+    ext = extension_normalized.get(ext, ext)
+    with open_remote(url, pool, block_size) as f:
+        if isinstance(f, RangeFile):
+            f.prefetch(block_size, DEFAULT_TAIL_SIZE if ext in isobmff_extensions else 0)
+        for backend in remote_backends(ext, backends):
+            try:
+                f.seek(0)
+                ex = backend_support[backend].stream_func(f, path, logger)
+                if ex:
+                    return ex
+            except Exception as e:
+                logger.debug(f"{backend}: Could not extract datetime from {url}: {e}")
+    logger.warning(f"No datetime found for {url}")
+    return None
+
+
+def extract_remote_many(urls: list[str], backends: list[str] | None = None, workers: int = DEFAULT_CONNECTIONS,
+                        pool: ConnectionPool | None = None) -> dict[str, ExifClass | None]:
+    """
+    Extract metadata from many remote files in parallel.
+
+    Args:
+        urls: The file URLs
+        backends: Backends by priority
+        workers: Files extracted at the same time
+        pool: The connection pool, a new one is used (and closed) if None
+
+    Returns:
+        dict[str, ExifClass | None]: The extracted metadata per URL
+    """
+    own_pool = pool is None
+    pool = pool or ConnectionPool(connections=workers)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return dict(zip(urls, executor.map(lambda url: extract_remote(url, pool, backends), urls)))
+    finally:
+        if own_pool:
+            pool.close()
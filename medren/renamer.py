@@ -1,29 +1,57 @@
+import contextlib
 import csv
-import glob
+import datetime
+import functools
 import hashlib
 import logging
 import math
 import os
 import re
+import threading
+import time
 from collections import defaultdict
+from collections.abc import Callable, Iterable, Iterator
 from dataclasses import dataclass, field
 from pathlib import Path
+from typing import TYPE_CHECKING
 
 from geopy import Nominatim
 from openlocationcode.openlocationcode import encode
 
+from medren.archive import extract_members, is_archive, scan_archive, split_member_path
 from medren.backends import ExifClass, available_backends, backend_support
-from medren.consts import DEFAULT_DATETIME_FORMAT, DEFAULT_TEMPLATE, DEFAULT_SEPARATOR, GENERIC_PATTERNS, \
-    extension_normalized
+from medren.concurrency import AdaptiveScheduler
+from medren.consts import (
+    DEFAULT_DATETIME_FORMAT,
+    DEFAULT_SEPARATOR,
+    DEFAULT_TEMPLATE,
+    GENERIC_PATTERNS,
+    MEDREN_DIR,  # noqa: F401 (re-exported for cli and gui_fsg)
+    PROFILES_DIR,  # noqa: F401 (re-exported, it was defined here)
+    UNKNOWN_DIR,
+    extension_normalized,
+    sidecar_extensions,
+)
+from medren.exif_process import ExifStat
+from medren.fusion import FieldPriority, backend_needed, merge_exif, read_header
+from medren.io_sched import scheduled, seek_order
+from medren.mover import DirFds, transfer
+from medren.pairing import PairGroup, pair_files, pair_tail
+from medren.preview_cache import PreviewCache, file_key
+from medren.report import Attempt, OutcomeReport
+from medren.stats import RenamerStats
+from medren.supervisor import FileTimeoutError, Supervisor
+from medren.template_match import TemplateMatch, TemplateMatcher, conforming_files
+from medren.tz_infer import DEFAULT_MAX_GAP, infer_timezones
 from medren.util import filename_safe
 
-logger = logging.getLogger(__name__)
-
-MEDREN_DIR = Path(os.path.join(os.path.expanduser('~'), 'medren'))
-MEDREN_DIR.mkdir(parents=True, exist_ok=True)
-PROFILES_DIR = MEDREN_DIR / 'profiles'
-PROFILES_DIR.mkdir(parents=True, exist_ok=True)
+if TYPE_CHECKING:
+    from medren.catalog import Catalog, CatalogRow
+    from medren.clock_skew import SkewEstimate
+    from medren.plan import PlanEntry
+    from medren.tracklog import Geotagger
 
+logger = logging.getLogger(__name__)
 
 def hash_file(filename: Path | str, digest='sha256'):
     with open(filename, 'rb', buffering=0) as f:
@@ -40,15 +68,46 @@ class Renamer:
     normalize: bool = field(default=True)  # Whether to normalize the filename
     separator: str = field(default=DEFAULT_SEPARATOR)  # The separator between parts of the name
     backends: list[str] | None = None  # The backends to use for metadata extraction
+    backend_order: dict[str, list[str]] | None = None  # Calibrated backend order per extension (see calibrate.py)
     recursive: bool = field(default=False)  # Whether to recursively search for files
     do_calc_hash: bool | None = None
     do_calc_loc: bool | None = None
     do_calc_pluscode: bool | None = None
     geolocator: Nominatim | None = None
+    batch_workers: int = field(default=0)  # Workers for batch-capable backends (0 extracts file by file)
+    pair: bool = field(default=True)  # Whether to rename Live Photo, RAW+JPEG and sidecar files together
+    cache: PreviewCache = field(default_factory=PreviewCache)  # Memoized preview stages, may be shared by Renamers
+    stats: RenamerStats | None = None  # Timers and counters of the stages and backends, None disables them
+    report: OutcomeReport | None = None  # The outcome of every file, None logs the per file warnings
+    adaptive: bool = field(default=False)  # Whether to extract and rename concurrently, adapting per storage root
+    root_ceilings: dict[str, int] | None = None  # The most files in flight under pinned roots (adaptive)
+    scheduler: AdaptiveScheduler | None = field(default=None, repr=False)  # Created when adaptive, may be shared
+    seek_order: bool = field(default=False)  # Whether to read the files in their order on the disk (spinning disks)
+    catalog: 'Catalog | None' = None  # A catalog to fill with the metadata of every preview
+    fuse: bool = field(default=False)  # Whether to merge the fields of all backends instead of taking the first result
+    field_priority: FieldPriority | None = None  # Backend priority per field group when fusing
+    supervisor: Supervisor | None = None  # Runs the backends in a worker process with time budgets
+    dest_root: Path | None = None  # Root directory of the new paths (organize mode), None keeps the directories
+    transfer: str = field(default='move')  # How files get to their new paths, one of mover.TRANSFER_MODES
+    archives: bool = field(default=False)  # Whether to scan the media inside zip/tar inputs (needs dest_root)
+    skip_conforming: str | None = None  # How to skip files the template already named, one of SKIP_MODES
+    near_dups: bool = field(default=False)  # Whether to group near duplicates by their Exif thumbnails ({dup})
+    dup_radius: int = field(default=8)  # Hamming distance between the thumbnail hashes of near duplicates
+    geotagger: 'Geotagger | None' = None  # Locates the files without GPS on a track log
+    infer_tz: bool = field(default=False)  # Whether to infer missing time offsets from nearby geotagged files
+    tz_max_gap: datetime.timedelta = field(default=DEFAULT_MAX_GAP)  # Geotagged files further in time are not used
+    align_clocks: bool = field(default=False)  # Whether to correct the clock skews between the devices
+    reference_device: str | None = None  # The device (make and model) whose clock is kept, None for the most files
+    clock_skews: dict[str, 'SkewEstimate'] = field(default_factory=dict, init=False, repr=False)  # Of the last preview
+    dup_groups: list[list[Path]] = field(default_factory=list, init=False, repr=False)  # Of the last preview
+    # The metadata of the primary files as extracted (before geotag, tz_infer and clock_skew), of the last preview
+    extracted: dict[Path, ExifClass] = field(default_factory=dict, init=False, repr=False)
 
     def __post_init__(self):
         """Initialize backends after instance creation."""
         self.prefix = self.prefix or ''
+        if self.dest_root is not None:
+            self.dest_root = Path(self.dest_root)
         if not self.backends:
             self.backends = available_backends
         else:
@@ -56,6 +115,13 @@ class Renamer:
         self.do_calc_hash = '{sha256}' in self.template
         self.do_calc_loc = '{address}' in self.template
         self.do_calc_pluscode = '{pluscode}' in self.template
+        self.near_dups = self.near_dups or '{dup}' in self.template
+        if self.near_dups:
+            from medren.near_dup import require_pillow
+
+            require_pillow()
+        if self.adaptive and self.scheduler is None:
+            self.scheduler = AdaptiveScheduler(ceilings=self.root_ceilings)
         if self.do_calc_loc:
             self.geolocator = Nominatim(user_agent="medren")
 
@@ -87,6 +153,72 @@ class Renamer:
             name = re.sub(r'\\s+', '_', name)
         return name
 
+    def call_backend(self, backend: str, path: Path | str, ext: str, header: bytes | None = None) -> ExifClass | None:
+        b = backend_support[backend]
+        func, args = (b.buffer_func, (header, Path(path))) if header is not None else (b.func, (path,))
+        if self.supervisor is not None:
+            func = functools.partial(self.supervisor.call, backend, path, func)
+        else:
+            args = (*args, logger)
+        if self.stats is None:
+            return func(*args)
+        return self.stats.call_backend(backend, ext, func, *args)
+
+    def backends_for(self, ext: str) -> list[str]:
+        """
+        The backends to try for an extension, in order.
+
+        A calibrated order of the extension goes first, the other selected backends keep their order after it.
+
+        Args:
+            ext: The normalized extension
+
+        Returns:
+            list[str]: The backends that support the extension
+        """
+        order = [b for b in (self.backend_order or {}).get(ext, []) if b in self.backends]
+        order += [b for b in self.backends if b not in order]
+        return [b for b in order if backend_support[b].ext is None or ext in backend_support[b].ext]
+
+    def stage(self, name: str) -> contextlib.AbstractContextManager:
+        """Time a stage in the stats, if enabled, with the report (if any) collecting the warnings."""
+        stack = contextlib.ExitStack()
+        if self.stats:
+            stack.enter_context(self.stats.stage(name))
+        if self.report is not None:
+            stack.enter_context(self.report.activate())
+        return stack
+
+    def try_backend(self, backend: str, path: Path | str, ext: str, attempts: list[Attempt],  # noqa: PLR0913 (header is keyword only)
+                    *, header: bytes | None = None) -> ExifClass | None:
+        """Call a backend for one file, adding the attempt to attempts. Errors are logged (debug) and give None."""
+        start = time.perf_counter()
+        try:
+            ex = self.call_backend(backend, path, ext, header)
+        except FileTimeoutError:
+            raise
+        except Exception as e:
+            logger.debug(f"{backend}: Could not extract datetime from {path}: {e}")
+            attempts.append((backend, type(e).__name__, time.perf_counter() - start))
+            return None
+        attempts.append((backend, 'ok' if ex else 'none', time.perf_counter() - start))
+        return ex
+
+    def record_outcome(self, path: Path | str, ex: ExifClass | None,  # noqa: PLR0913 (the fields of a report row)
+                       attempts: list[Attempt] | None = None, *,
+                       status: ExifStat | None = None, message: str | None = None) -> None:
+        """Record the outcome of a file in the report, and warn (rate limited with a report) if it has no datetime."""
+        if ex is None:
+            warning = message or f"No datetime found for {path}"
+            if self.report is not None:
+                self.report.warn('no_datetime', warning)
+            else:
+                logger.warning(warning)
+        if self.report is not None:
+            if status is None:
+                status = ExifStat.ValidExif if ex else ExifStat.NoDateTime if attempts else ExifStat.Unsupported
+            self.report.record(path, status, ex.backend if ex else None, attempts=attempts, message=message)
+
     def fetch_meta(self, path: Path | str) -> ExifClass | None:
         """
         Extract datetime from file metadata.
@@ -97,20 +229,165 @@ class Renamer:
         Returns:
             datetime.datetime | None: The extracted datetime or None if not found
         """
+        if self.supervisor is not None:
+            if self.supervisor.quarantine.is_quarantined(path):
+                logger.info(f"Skipping quarantined {path}")
+                if self.report is not None:
+                    self.report.record(path, ExifStat.UnknownErr, message='quarantined')
+                return None
+            try:
+                with self.supervisor.file_budget(path):
+                    return self.fetch_meta_unsupervised(path)
+            except FileTimeoutError as e:
+                self.record_outcome(path, None, status=ExifStat.UnknownErr, message=f"Gave up on {path}: {e}")
+                return None
+        return self.fetch_meta_unsupervised(path)
+
+    def fetch_meta_unsupervised(self, path: Path | str) -> ExifClass | None:
+        if self.fuse:
+            return self.fetch_meta_fused(path)
         ext = os.path.splitext(path)[1].lower()
         ext = extension_normalized.get(ext, ext)
         path = str(path)
-        for backend in self.backends:
-            supported_exts = backend_support[backend].ext
-            if supported_exts is None or ext in supported_exts:
+        attempts = []
+        for backend in self.backends_for(ext):
+            if self.skip_backend(backend, path):
+                continue
+            ex = self.try_backend(backend, path, ext, attempts)
+            if ex:
+                self.record_outcome(path, ex, attempts)
+                return ex
+        self.record_outcome(path, None, attempts)
+        return None
+
+    def skip_backend(self, backend: str, path: Path | str) -> bool:
+        """Check if a backend is quarantined for a file."""
+        return self.supervisor is not None and self.supervisor.quarantine.is_quarantined(path, backend)
+
+    def fetch_meta_fused(self, path: Path | str) -> ExifClass | None:
+        """
+        Extract metadata by merging the fields of several backends.
+
+        The head of the file is read once and parsed by every backend that accepts a buffer,
+        the other backends are called only while they could add or improve a field.
+
+        Args:
+            path: Path to the file
+
+        Returns:
+            ExifClass | None: The merged metadata or None if no datetime was found
+        """
+        ext = os.path.splitext(path)[1].lower()
+        ext = extension_normalized.get(ext, ext)
+        priority = self.field_priority or {}
+        supported = self.backends_for(ext)
+        header = None
+        if any(backend_support[b].buffer_func for b in supported):
+            try:
+                with self.stage('read_header'):
+                    header = read_header(path)
+            except OSError as e:
+                status = ExifStat.FileNotFound if isinstance(e, FileNotFoundError) else ExifStat.UnknownErr
+                self.record_outcome(path, None, status=status, message=f"Could not read {path}: {e}")
+                return None
+        results = []
+        attempts = []
+        for backend in supported:
+            buffered = backend_support[backend].buffer_func is not None
+            if not buffered and not backend_needed(backend, results, priority) or self.skip_backend(backend, path):
+                continue
+            ex = self.try_backend(backend, path, ext, attempts, header=header if buffered else None)
+            if ex:
+                results.append(ex)
+        ex = merge_exif(results, priority)
+        self.record_outcome(path, ex, attempts)
+        return ex
+
+    def fetch_meta_batch(self, paths: list[Path]) -> dict[Path, ExifClass | None]:
+        """
+        Extract metadata for many files, handing batch-capable backends all their files at once.
+
+        Backends are tried in the same priority order as fetch_meta, each one only receiving
+        the files that no earlier backend could handle. Extensions with different calibrated
+        orders are batched separately.
+
+        Args:
+            paths: Paths to the files
+
+        Returns:
+            dict[Path, ExifClass | None]: The extracted metadata per path
+        """
+        results: dict[Path, ExifClass | None] = {}
+        groups: dict[tuple[str, ...], list[Path]] = defaultdict(list)
+        for path in map(Path, paths):
+            ext = path.suffix.lower()
+            groups[tuple(self.backends_for(extension_normalized.get(ext, ext)))].append(path)
+        for order, group in groups.items():
+            self.fetch_meta_batch_group(order, group, results)
+        return results
+
+    def fetch_meta_batch_group(self, order: tuple[str, ...], paths: list[Path],
+                               results: dict[Path, ExifClass | None]) -> None:
+        pending = paths
+        attempts: dict[Path, list[Attempt]] = defaultdict(list)
+        for backend in order:
+            if not pending:
+                break
+            b = backend_support[backend]
+            supported = pending
+            if b.batch_func and len(supported) > 1:
+                start = time.perf_counter()
                 try:
-                    ex = backend_support[backend].func(path, logger)
-                    if ex:
-                        return ex
+                    batch = b.batch_func(supported, logger, workers=self.batch_workers)
                 except Exception as e:
-                    logger.debug(f"{backend}: Could not extract datetime from {path}: {e}")
-        logger.warning(f"No datetime found for {path}")
-        return None
+                    logger.debug(f"{backend}: Batch extraction failed: {e}")
+                    batch = {}
+                seconds = (time.perf_counter() - start) / len(supported)
+                for path in supported:
+                    ok = batch.get(path) is not None
+                    attempts[path].append((backend, 'ok' if ok else 'none' if path in batch else 'error', seconds))
+                    if self.stats:
+                        self.stats.record_backend(backend, path.suffix.lower(), ok, seconds, error=path not in batch)
+            else:
+                batch = {path: self.try_backend(backend, str(path), path.suffix.lower(), attempts[path])
+                         for path in supported}
+            for path, ex in batch.items():
+                if ex:
+                    results[path] = ex
+                    self.record_outcome(path, ex, attempts[path])
+            pending = [p for p in pending if p not in results]
+        for path in pending:
+            self.record_outcome(path, None, attempts[path])
+            results[path] = None
+
+    def fetch_meta_many(self, paths: list[Path]) -> dict[Path, ExifClass | None]:
+        """
+        Extract metadata for many files, in batches if batch_workers is set, else concurrently if adaptive.
+
+        With seek_order, the files are read in their order on the disk, and when they are read one by one
+        the headers of the next files are read ahead (see io_sched.scheduled).
+
+        Args:
+            paths: Paths to the files
+
+        Returns:
+            dict[Path, ExifClass | None]: The extracted metadata per path
+        """
+        if self.seek_order:
+            with self.stage('seek_order'):
+                ordered = seek_order(paths)
+        else:
+            ordered = paths
+        if self.batch_workers and not self.fuse and self.supervisor is None:
+            results = self.fetch_meta_batch(ordered)
+        elif self.scheduler is not None and self.supervisor is None:
+            # the supervisor has a single worker process, so supervised extraction stays sequential
+            results = dict(zip(ordered, self.scheduler.map(self.fetch_meta, ordered)))
+        elif self.seek_order:
+            results = {path: self.fetch_meta(path) for path in scheduled(ordered, ordered=True)}
+        else:
+            return {path: self.fetch_meta(path) for path in paths}
+        return {path: results[path] for path in paths}
 
     def resolve_names(self, inputs: list[Path | str]) -> list[Path]:
         """
@@ -129,44 +406,275 @@ class Renamer:
                     path = path / '*'
             elif path.is_file():
                 path = path.parent / path.name
-            paths = list(glob.glob(str(path), recursive=True))
-            resolved_inputs.extend(paths)
-        resolved_inputs = [Path(p) for p in resolved_inputs]
+            resolved_inputs.extend(self.cache.resolve(str(path)))
         return resolved_inputs
 
-    def generate_renames(self, inputs: list[Path | str],
-                         resolve_names: bool = False) -> dict[str, tuple[Path, ExifClass]]:
+    def fetch_meta_cached(self, paths: list[Path]) -> dict[Path, ExifClass | None]:
         """
-        Generate a preview of file renames.
+        Extract metadata for many files, reusing the results cached for unchanged files.
 
         Args:
-            inputs: Input files or dirs to process
-            resolve_names: If true, the inputs would be resolved (wildcards, dirs)
+            paths: Paths to the files
 
         Returns:
-            dict[str, tuple[Path, ExifClass]]: Dictionary mapping original
-                filenames to new filenames and details
+            dict[Path, ExifClass | None]: The extracted metadata per path
         """
-        if resolve_names:
-            inputs = self.resolve_names(inputs)
-        renames, counter = {}, defaultdict(int)
-        idx = 0
-        dt_and_paths = []
-        for path in inputs:
-            if not path.is_file():
-                continue
-            ex = self.fetch_meta(path)
+        keys = {path: file_key(path) for path in paths}
+        metas, missing = {}, []
+        for path, key in keys.items():
+            found, ex = self.cache.get_meta(key, self.meta_cache_backends(path))
+            if found:
+                self.record_outcome(path, ex, [('cache', 'ok' if ex else 'none', 0.0)])
+                metas[path] = ex
+            else:
+                missing.append(path)
+        for path, ex in self.fetch_meta_many(missing).items():
+            self.cache.set_meta(keys[path], self.meta_cache_backends(path), ex)
+            metas[path] = ex
+        return metas
+
+    def meta_cache_backends(self, path: Path) -> list[str]:
+        """The backend part of the cache key of a file, results of another order or mode are not reused."""
+        ext = path.suffix.lower()
+        backends = self.backends_for(extension_normalized.get(ext, ext))
+        return [*backends, '+fuse'] if self.fuse else backends
+
+    def extract(self, paths: list[Path | str]) -> list[tuple[PairGroup, ExifClass]]:
+        """
+        Extract the metadata of the files (the extract stage of the preview).
+
+        Args:
+            paths: The files to process
+
+        Returns:
+            list[tuple[PairGroup, ExifClass]]: The file groups and their metadata, sorted by datetime.
+                The ExifClass objects may be shared with the cache and should not be modified.
+        """
+        paths = [Path(path) for path in paths if Path(path).is_file()]
+        archives = [path for path in paths if self.archives and is_archive(path)]
+        if archives:
+            paths = [path for path in paths if path not in archives]
+        if self.stats:
+            self.stats.files += len(paths)
+        if self.pair:
+            groups = pair_files(paths)
+        else:
+            groups = [PairGroup(primary=path) for path in paths]
+        metas = self.fetch_meta_cached([g.primary for g in groups])
+        items = []
+        for group in groups:
+            ex = metas.get(group.primary)
+            if ex is None:
+                # a group whose primary has no datetime may still get one from another media member
+                for path in group.companions:
+                    if path.suffix.lower() not in sidecar_extensions:
+                        ex = self.fetch_meta_cached([path])[path]
+                        if ex is not None:
+                            break
             if ex is not None:
-                dt_and_paths.append((Path(path), ex))
-                logger.debug(f"{ex.backend}: Fetched datetime {ex.dt} ({ex.goff=}) for {path}")
-        dt_and_paths.sort(key=lambda x: x[1].dt)
+                items.append((group, ex))
+                logger.debug(f"{ex.backend}: Fetched datetime {ex.dt} ({ex.goff=}) for {group.primary}")
+        for archive in archives:
+            items += self.extract_archive(archive)
+        items.sort(key=lambda x: x[1].dt)
+        return items
+
+    def geotag(self, items: list[tuple[PairGroup, ExifClass]]) -> list[tuple[PairGroup, ExifClass]]:
+        """
+        Add locations from the track log to the files without GPS.
+
+        Args:
+            items: The extracted file groups and their metadata
+
+        Returns:
+            list[tuple[PairGroup, ExifClass]]: The file groups and their metadata (copies where a location was
+                added), sorted by datetime
+        """
+        exifs = self.geotagger.geotag([ex for _group, ex in items])
+        items = [(group, ex) for (group, _ex), ex in zip(items, exifs)]
+        items.sort(key=lambda x: x[1].dt)
+        return items
+
+    def infer_timezones(self, items: list[tuple[PairGroup, ExifClass]]) -> list[tuple[PairGroup, ExifClass]]:
+        """
+        Infer the time offsets of files without a location from the geotagged files near them in time.
+
+        Args:
+            items: The extracted file groups and their metadata
+
+        Returns:
+            list[tuple[PairGroup, ExifClass]]: The file groups and their metadata (copies where an offset was
+                inferred), sorted by datetime
+        """
+        exifs = infer_timezones([ex for _group, ex in items], max_gap=self.tz_max_gap)
+        items = [(group, ex) for (group, _ex), ex in zip(items, exifs)]
+        items.sort(key=lambda x: x[1].dt)
+        return items
+
+    def correct_clock_skews(self, items: list[tuple[PairGroup, ExifClass]]) -> list[tuple[PairGroup, ExifClass]]:
+        """
+        Align the clocks of the devices with the reference device, so their files interleave in order.
+
+        Near duplicates across devices (when grouping them) are used as pairs of files of the same moment.
+
+        Args:
+            items: The extracted file groups and their metadata
+
+        Returns:
+            list[tuple[PairGroup, ExifClass]]: The file groups and their metadata (copies where the datetime was
+                corrected), sorted by datetime
+        """
+        from medren.clock_skew import apply_skews, device_label, estimate_skews, reference_device
+
+        exifs = [ex for _group, ex in items]
+        reference = self.reference_device or reference_device(exifs)
+        pairs = []
+        if self.near_dups and reference is not None:
+            index = {group.primary: i for i, (group, _ex) in enumerate(items)}
+            labels = self.near_duplicate_labels(list(index))
+            members = defaultdict(list)
+            for path, label in labels.items():
+                members[label].append(index[path])
+            # only the pairs of a reference file and a file of another device give a skew
+            for group in members.values():
+                devices = {i: device_label(exifs[i]) for i in group}
+                pairs += [(a, b) for a in group if devices[a] == reference
+                          for b in group if devices[b] not in (None, reference)]
+        self.clock_skews = estimate_skews(exifs, reference=reference, pairs=pairs)
+        for skew in self.clock_skews.values():
+            logger.info(f"The clock of {skew.device} is off by {-skew.offset} ({skew.method}, {skew.score=:.2f})")
+        exifs = apply_skews(exifs, self.clock_skews)
+        items = [(group, ex) for (group, _ex), ex in zip(items, exifs)]
+        items.sort(key=lambda x: x[1].dt)
+        return items
+
+    def extract_archive(self, archive: Path) -> list[tuple[PairGroup, ExifClass]]:
+        """
+        Extract the metadata of the media inside an archive, without extracting them.
+
+        The members are named by the archive path followed by their path inside it (see archive.py).
+
+        Args:
+            archive: A zip or tar file
+
+        Returns:
+            list[tuple[PairGroup, ExifClass]]: The members and their metadata
+        """
+        if self.dest_root is None:
+            raise ValueError(f'The media of {archive} can only be renamed into a destination root')
+        with self.stage('archive'):
+            metas = scan_archive(archive, self.backends_for)
+        if self.stats:
+            self.stats.files += len(metas)
+        return [(PairGroup(primary=archive / name), ex) for name, ex in metas.items()]
+
+    def file_hash(self, path: Path) -> str:
+        key = file_key(path)
+        with self.cache.lock:
+            h = self.cache.hashes.get(key)
+        if h is None:
+            with self.stage('hash'):
+                h = hash_file(path)
+            with self.cache.lock:
+                self.cache.hashes[key] = h
+        return h
+
+    def near_duplicate_labels(self, paths: list[Path]) -> dict[Path, str]:
+        """
+        Group near duplicates (bursts, re-saved or resized copies) by the perceptual hashes of their Exif thumbnails.
 
+        Args:
+            paths: The files to group
+
+        Returns:
+            dict[Path, str]: The group label (dup1, dup2, ...) of each file that has near duplicates
+        """
+        from medren.near_dup import group_near_duplicates, thumbnail_hashes
+
+        keys = {path: file_key(path) for path in paths}
+        with self.cache.lock:
+            missing = [path for path in paths if keys[path] is None or keys[path] not in self.cache.phashes]
+        with self.stage('near_dup'):
+            computed = thumbnail_hashes(missing)
+            with self.cache.lock:
+                for path, h in computed.items():
+                    if keys[path] is not None:
+                        self.cache.phashes[keys[path]] = h
+                hashes = {path: self.cache.phashes.get(keys[path]) for path in paths}
+            self.dup_groups = group_near_duplicates(hashes, self.dup_radius)
+        return {path: f'dup{i}' for i, group in enumerate(self.dup_groups, 1) for path in group}
+
+    def reverse_geocode(self, lat: float, lon: float) -> str | None:
+        with self.cache.lock:
+            if (lat, lon) in self.cache.addresses:
+                return self.cache.addresses[(lat, lon)]
+        address = None
+        try:
+            with self.stage('geocode'):
+                location = self.geolocator.reverse(f"{lat}, {lon}")
+            if location and location.address:
+                address = location.address
+        except Exception as e:
+            logger.error(f"Could not get location info for: {lat}, {lon}: {e}")
+            return None
+        with self.cache.lock:
+            self.cache.addresses[(lat, lon)] = address
+        return address
+
+    def enrich(self, items: list[tuple[PairGroup, ExifClass]],
+               hashes: dict[Path, str] | None = None) -> dict[Path, dict[str, str | None]]:
+        """
+        Compute the template values that need more than the metadata (the enrich stage of the preview).
+
+        Args:
+            items: The extracted file groups and their metadata
+            hashes: Known content hashes per path, these files are not read again
+
+        Returns:
+            dict[Path, dict[str, str | None]]: The extra template values per primary path
+        """
+        extras = {}
+        dups = self.near_duplicate_labels([group.primary for group, _ex in items]) if self.near_dups else {}
+        for group, ex in items:
+            path = group.primary
+            values = {'dup': dups.get(path)}
+            try:
+                if self.do_calc_hash:
+                    values['sha256'] = (hashes or {}).get(path) or self.file_hash(path)
+                if (self.do_calc_loc or self.do_calc_pluscode) and ex.lat and ex.lon:
+                    values['pluscode'] = encode(ex.lat, ex.lon)
+                    if self.do_calc_loc:
+                        values['address'] = self.reverse_geocode(ex.lat, ex.lon)
+            except Exception as e:
+                logger.error(f"Error enriching {path}: {e}")
+            extras[path] = values
+        return extras
+
+    def name(self, items: list[tuple[PairGroup, ExifClass]],
+             extras: dict[Path, dict[str, str | None]]) -> list[tuple[PairGroup, ExifClass, str, str]]:
+        """
+        Format the new names by the template (the name stage of the preview).
+
+        Args:
+            items: The extracted file groups and their metadata, sorted by datetime
+            extras: The extra template values per primary path
+
+        Returns:
+            list[tuple[PairGroup, ExifClass, str, str]]: The file groups, their metadata, new stems and extensions.
+                A stem may start with directories, when the template has them.
+        """
+        named = []
         s = self.separator
 
         none_value = math.nan
         none_value_s = str(none_value)
 
-        for path, ex in dt_and_paths:
+        def clean(part: str) -> str:
+            part = part.replace(none_value_s+s,'').replace(s+none_value_s,'').replace(none_value_s,'')
+            return filename_safe(part)
+
+        for idx, (group, ex) in enumerate(items):
+            path = group.primary
             try:
                 name = path.stem
                 clean_name = self.get_clean_name(name)
@@ -174,85 +682,364 @@ class Renamer:
                 ext = path.suffix.lower()
                 datetime_str = ex.dt.strftime(self.datetime_format)
                 exif_kwargs = ex.get_exif_kwargs(none_value=none_value)
-                sha256 = hash_file(path) if self.do_calc_hash else ''
-                address = None
-                pluscode = None
-                if self.do_calc_loc and ex.lat and ex.lon:
-                    try:
-                        location = self.geolocator.reverse(f"{ex.lat}, {ex.lon}")
-                    except Exception as e:
-                        logger.error(f"Could not get location info for: {ex.lat}, {ex.lon}: {e}")
-                        location = None
-                    if location and location.address:
-                        address = location.address
-                    pluscode = encode(ex.lat, ex.lon)
-                # Format the new filename using the template
-                new_name = self.template.format(
+                values = extras.get(path, {})
+                # Format the new filename using the template, the parts before a '/' name directories
+                *dir_parts, new_name = (part.format(
                     prefix=self.prefix or none_value,
                     datetime=datetime_str or none_value,
                     name=name or none_value,
                     cname=clean_name or none_value,
                     suffix=suffix or none_value,
                     idx=idx,
-                    sha256=sha256,
-                    pluscode=pluscode or none_value,
-                    address=address or none_value,
+                    sha256=values.get('sha256', ''),
+                    pluscode=values.get('pluscode') or none_value,
+                    address=values.get('address') or none_value,
+                    dup=values.get('dup') or none_value,
                     s=s,
                     ext=ext,
+                    year=ex.dt.strftime('%Y'),
+                    month=ex.dt.strftime('%m'),
+                    day=ex.dt.strftime('%d'),
                     **exif_kwargs,
-                )
+                ) for part in self.template.split('/'))
                 new_name = Path(new_name)
 
                 # Remove trailing separators from the new filename
                 new_stem, ext = os.path.splitext(new_name)
-                new_stem = new_stem.replace(none_value_s+s,'').replace(s+none_value_s,'').replace(none_value_s,'')
-                new_stem = filename_safe(new_stem)
+                new_stem = clean(new_stem)
                 # if s and new_stem.endswith(s):
                 #     new_stem = new_stem[:-len(s)]
                 # if s and new_stem.startswith(s):
                 #     new_stem = new_stem[len(s):]
-
-                cnt = counter[new_name]
-                if cnt > 0:
-                    # Insert counter before the extension
-                    new_stem = f"{clean_name}-{cnt}"
-                new_name = new_stem + new_name.suffix
-
-                counter[new_name] += 1
-                renames[path] = (new_name, ex)
-                idx += 1
+                dirs = [clean(d) or UNKNOWN_DIR for d in dir_parts]
+                named.append((group, ex, os.path.join(*dirs, new_stem), new_name.suffix))
             except Exception as e:
                 logger.error(f"Error generating preview for {path}: {e}")
+        return named
+
+    def plan(self, named: list[tuple[PairGroup, ExifClass, str, str]],
+             taken: dict[Path, set[str]] | None = None) -> dict[str, tuple[Path, ExifClass]]:
+        """
+        Resolve name collisions (the plan stage of the preview).
+
+        Args:
+            named: The file groups, their metadata, new stems and extensions
+            taken: Names already in use per directory, new names would not collide with them
+
+        Returns:
+            dict[str, tuple[Path, ExifClass]]: Dictionary mapping original
+                filenames to new filenames and details
+        """
+        renames = {}
+        used: dict[Path, set[str]] = defaultdict(set)
+        for directory, names in (taken or {}).items():
+            used[Path(directory)].update(names)
+        listed = set(used)
+        for group, ex, new_rel_stem, ext in named:
+            path = group.primary
+            rel_dir, new_stem = os.path.split(new_rel_stem)
+            directory = (self.dest_root or path.parent) / rel_dir
+            if directory != path.parent and directory not in listed:
+                # the files already in a target directory are not renamed, the new names should not collide with them
+                listed.add(directory)
+                with contextlib.suppress(OSError):
+                    used[directory].update(os.listdir(directory))
+            # Add a counter if the new name (or the name of a companion) is already in use
+            tails = [ext] + [pair_tail(c) for c in group.companions]
+            members = {m.name for m in group.members} if directory == path.parent else set()
+            stem, cnt = new_stem, 0
+            while any(stem + tail in used[directory] and stem + tail not in members for tail in tails):
+                cnt += 1
+                stem = f"{new_stem}-{cnt}"
+            for member, tail in zip(group.members, tails):
+                used[directory].add(stem + tail)
+                if self.dest_root:
+                    new_name = str(directory / (stem + tail))
+                else:
+                    new_name = os.path.join(rel_dir, stem + tail)
+                renames[member] = (new_name, ex)
         return renames
 
-    def apply_rename(self, renames: dict[str, tuple[Path, ExifClass]], logfile: Path | str | None = None) -> None:
+    def generate_renames(self, inputs: list[Path | str],
+                         resolve_names: bool = False,
+                         taken: dict[Path, set[str]] | None = None) -> dict[str, tuple[Path, ExifClass]]:
         """
-        Apply the renaming operations.
+        Generate a preview of file renames.
+
+        The preview runs in stages (discover -> extract -> enrich -> name -> plan),
+        the discover, extract and enrich results are memoized in the cache.
 
         Args:
-            renames: Dictionary mapping original filenames to new filenames
+            inputs: Input files or dirs to process
+            resolve_names: If true, the inputs would be resolved (wildcards, dirs)
+            taken: Names already in use per directory, new names would not collide with them
+
+        Returns:
+            dict[str, tuple[Path, ExifClass]]: Dictionary mapping original
+                filenames to new filenames and details
         """
+        if resolve_names:
+            with self.stage('discover'):
+                inputs = self.resolve_names(inputs)
+        if self.skip_conforming:
+            with self.stage('match'):
+                inputs, taken = self.skip_conforming_files(inputs, taken)
+        with self.stage('extract'):
+            items = self.extract(inputs)
+        self.extracted = {group.primary: ex for group, ex in items}
+        if self.geotagger is not None:
+            with self.stage('geotag'):
+                items = self.geotag(items)
+        if self.infer_tz:
+            with self.stage('tz_infer'):
+                items = self.infer_timezones(items)
+        if self.align_clocks:
+            with self.stage('clock_skew'):
+                items = self.correct_clock_skews(items)
+        with self.stage('enrich'):
+            extras = self.enrich(items)
+        with self.stage('name'):
+            named = self.name(items, extras)
+        with self.stage('plan'):
+            renames = self.plan(named, taken)
+        if self.catalog is not None:
+            with self.stage('catalog'):
+                self.add_to_catalog(renames, extras)
+        return renames
+
+    def corrected_files(self, renames: dict[str, tuple[Path, ExifClass]]) -> list[tuple[Path, ExifClass]]:
+        """
+        The primary files of a preview whose datetime or offset were corrected (by geotag, tz_infer or clock_skew).
+
+        Args:
+            renames: The renames of the last preview
+
+        Returns:
+            list[tuple[Path, ExifClass]]: The files and their corrected metadata
+        """
+        corrected = []
+        for path, (_new_name, ex) in renames.items():
+            org = self.extracted.get(path)
+            if org is not None and (ex.dt, ex.goff, ex.is_utc) != (org.dt, org.goff, org.is_utc):
+                corrected.append((Path(path), ex))
+        return corrected
+
+    def skip_conforming_files(self, paths: list[Path | str], taken: dict[Path, set[str]] | None = None
+                              ) -> tuple[list[Path], dict[Path, set[str]]]:
+        """
+        Leave out the files whose names the template would produce, before any backend runs.
+
+        Args:
+            paths: The files to process
+            taken: Names already in use per directory
+
+        Returns:
+            tuple[list[Path], dict[Path, set[str]]]: The other files, and the names in use including the skipped files
+        """
+        matcher = TemplateMatcher(self.template, self.datetime_format, self.separator,
+                                  prefix=self.prefix, suffix=self.suffix)
+        others, matches = conforming_files([Path(p) for p in paths if Path(p).is_file()], matcher, self.dest_root)
+        if self.skip_conforming == 'verify':
+            # the metadata is extracted (and cached), but the other stages are skipped
+            metas = self.fetch_meta_cached(list(matches))
+            for path in [path for path, m in matches.items() if not self.verify_name(m, metas[path])]:
+                logger.info(f"The name of {path} does not match its metadata")
+                del matches[path]
+                others.append(path)
+        if self.stats:
+            self.stats.conforming += len(matches)
+        taken = {Path(d): set(names) for d, names in (taken or {}).items()}
+        for path in matches:
+            taken.setdefault(path.parent, set()).add(path.name)
+        return others, taken
+
+    def verify_name(self, m: TemplateMatch, ex: ExifClass | None) -> bool:
+        """Compare the datetime in a name to the one in the metadata of the file."""
+        if m.dt is None:
+            return True
+        return ex is not None and filename_safe(ex.dt.strftime(self.datetime_format)) == m.values['datetime']
+
+    def add_to_catalog(self, renames: dict[str, tuple[Path, ExifClass]],
+                       extras: dict[Path, dict[str, str | None]]) -> None:
+        """
+        Add a row per primary file with its extracted metadata, so a preview from the catalog applies
+        the corrections (geotag, tz_infer, clock_skew) once. Companions and sidecars get no rows,
+        their metadata is not extracted.
+        """
+        self.catalog.add((path, ex, renames[path][0] if path in renames else None,
+                          extras.get(path, {}).get('sha256'))
+                         for path, ex in self.extracted.items())
+
+    def generate_renames_from_catalog(self, rows: list['CatalogRow'],
+                                      taken: dict[Path, set[str]] | None = None) -> dict[str, tuple[Path, ExifClass]]:
+        """
+        Generate a preview of file renames from catalog rows, without reading the files.
+
+        Args:
+            rows: Catalog rows (see Catalog.query)
+            taken: Names already in use per directory, new names would not collide with them
+
+        Returns:
+            dict[str, tuple[Path, ExifClass]]: Dictionary mapping original
+                filenames to new filenames and details
+        """
+        exifs = {row.path: row.exif for row in rows}
+        hashes = {row.path: row.sha256 for row in rows if row.sha256}
+        if self.pair:
+            groups = pair_files(list(exifs), with_sidecars=False)
+        else:
+            groups = [PairGroup(primary=path) for path in exifs]
+        items = [(group, exifs[group.primary]) for group in groups if exifs[group.primary].dt is not None]
+        items.sort(key=lambda x: x[1].dt)
+        self.extracted = {group.primary: ex for group, ex in items}
+        if self.geotagger is not None:
+            with self.stage('geotag'):
+                items = self.geotag(items)
+        if self.infer_tz:
+            with self.stage('tz_infer'):
+                items = self.infer_timezones(items)
+        if self.align_clocks:
+            with self.stage('clock_skew'):
+                items = self.correct_clock_skews(items)
+        with self.stage('enrich'):
+            extras = self.enrich(items, hashes)
+        with self.stage('name'):
+            named = self.name(items, extras)
+        with self.stage('plan'):
+            return self.plan(named, taken)
+
+    def transfer_file(self, org_path: Path, new_path: Path, dir_fds: DirFds | None = None) -> bool:
+        """Put a file at its new path, returning False if it does not exist or the new path exists."""
+        try:
+            transfer(org_path, new_path, self.transfer, dir_fds=dir_fds)
+        except FileExistsError:
+            logger.warning(f"Skipping {org_path} because {new_path} exists")
+            return False
+        except FileNotFoundError:
+            logger.warning(f"Skipping {org_path} because it does not exist")
+            return False
+        return True
+
+    def transfer_many(self, tasks: list[tuple[Path, Path]]) -> list[bool | OSError]:
+        """
+        Transfer files concurrently with the adaptive scheduler, each worker thread opening its own directories.
+
+        Returns:
+            list[bool | OSError]: Per task, whether the file was transferred, or the error of a failed transfer
+                (the other transfers go on, so the caller can record them before raising)
+        """
+        local = threading.local()
+        opened = []
+
+        def run(task: tuple[Path, Path]) -> bool | OSError:
+            dir_fds = getattr(local, 'dir_fds', None)
+            if dir_fds is None:
+                dir_fds = local.dir_fds = DirFds()
+                opened.append(dir_fds)
+            try:
+                return self.transfer_file(*task, dir_fds)
+            except OSError as e:
+                return e
+
         try:
-            f = writer = None
-            if logfile:
-                logfile = Path(logfile)
-                logfile.parent.mkdir(parents=True, exist_ok=True)
-                f = open(logfile, 'w', newline='', encoding='utf-8')
-                writer = csv.writer(f)
+            return self.scheduler.map(run, tasks, path_of=lambda task: task[0])
+        finally:
+            for dir_fds in opened:
+                dir_fds.close()
+
+    @staticmethod
+    @contextlib.contextmanager
+    def rename_log(logfile: Path | str | None, append: bool = False) -> Iterator[Callable[[str, str], None]]:
+        """Open the CSV log of the renames, yielding the function that logs a rename (a no-op without a log)."""
+        if not logfile:
+            yield lambda org_path, new_name: None
+            return
+        logfile = Path(logfile)
+        logfile.parent.mkdir(parents=True, exist_ok=True)
+        write_header = not (append and logfile.is_file())
+        with open(logfile, 'a' if append else 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            if write_header:
                 writer.writerow(['Original', 'New'])  # Write header
-            for _org_path, (new_filename, _ex) in renames.items():
-                org_path = Path(_org_path)
-                if not org_path.exists():
-                    logger.warning(f"Skipping {org_path} because it does not exist")
-                    continue
-                dir_path = Path(org_path).parent
-                new_path = dir_path / new_filename
-                if new_path != org_path and not os.path.exists(new_path):
-                    os.rename(org_path, new_path)
-                    if writer:
-                        writer.writerow([str(org_path), str(new_filename)])
-            if f:
-                f.close()
+            yield lambda org_path, new_name: writer.writerow([org_path, new_name])
+
+    def apply_rename(self, renames: 'dict[str, tuple[Path, ExifClass]] | Iterable[PlanEntry]',
+                     logfile: Path | str | None = None, append: bool = False) -> dict[str, str]:
+        """
+        Apply the renaming operations.
+
+        The renames done before an error are logged, and carried over to the cache and catalog, before it is raised.
+
+        Args:
+            renames: Dictionary mapping original filenames to new filenames, or the entries of a plan file
+                (see plan.read_plan), which are applied as they are read and skipped if the file changed
+            logfile: CSV file to log the renames to
+            append: If true, the renames are appended to an existing logfile
+
+        Returns:
+            dict[str, str]: The original and new paths of the renamed (or copied, see transfer) files
+        """
+        if isinstance(renames, dict):
+            items = ((Path(org_path), new_filename, None) for org_path, (new_filename, _ex) in renames.items())
+        else:
+            items = ((entry.src, entry.dst, entry) for entry in renames)
+        moves = {}
+        try:
+            with self.rename_log(logfile, append) as log:
+
+                def record(org_path: Path, new_path: Path, new_name: Path | str) -> None:
+                    moves[str(org_path)] = str(new_path)
+                    log(str(org_path), str(new_name))
+
+                extractions, queued = self.rename_each(items, record)
+                if queued:
+                    done = self.transfer_many([(org_path, new_path) for org_path, new_path, _ in queued])
+                    error = next((result for result in done if isinstance(result, OSError)), None)
+                    for (org_path, new_path, new_filename), result in zip(queued, done):
+                        if result is True:
+                            record(org_path, new_path, new_filename)
+                    if error is not None:
+                        raise error
+                for archive, targets in extractions.items():
+                    # the members are extracted in one pass over the archive, which is kept
+                    for name, new_path in extract_members(archive, targets).items():
+                        record(archive / name, new_path, new_path)
+            return moves
         except Exception as e:
             logger.error(f"Error applying renames: {e}")
             raise
+        finally:
+            if self.transfer == 'move':
+                self.cache.renamed(moves)
+                if self.catalog is not None:
+                    self.catalog.moved(moves)
+
+    def rename_each(self, items: Iterable[tuple[Path, Path | str, 'PlanEntry | None']],
+                    record: Callable[[Path, Path, Path | str], None]) \
+            -> tuple[dict[Path, dict[str, Path]], list[tuple[Path, Path, Path | str]]]:
+        """
+        Check the renames and transfer the files one by one, recording each (the first stage of apply_rename).
+
+        Returns:
+            The members to extract per archive, and the transfers queued for the adaptive scheduler
+        """
+        extractions: dict[Path, dict[str, Path]] = defaultdict(dict)  # archive -> member -> new path
+        queued: list[tuple[Path, Path, Path | str]] = []  # transfers run concurrently after the checks (adaptive)
+        # each directory is opened once, and the renames within it are atomic and never replace a file
+        with DirFds() as dir_fds:
+            for org_path, new_filename, entry in items:
+                # only the parents named like archives are checked, a missing file fails its transfer
+                member = split_member_path(org_path)
+                if entry is not None and (problem := entry.check()):
+                    logger.warning(f"Skipping {org_path} because it {problem} since it was planned")
+                    continue
+                new_path = Path(org_path).parent / new_filename
+                if member is not None:
+                    extractions[member[0]][member[1]] = new_path
+                elif new_path == org_path:
+                    continue
+                elif self.scheduler is not None:
+                    queued.append((org_path, new_path, new_filename))
+                elif self.transfer_file(org_path, new_path, dir_fds):
+                    record(org_path, new_path, new_filename)
+        return extractions, queued
@@ -0,0 +1,124 @@
+import contextlib
+import contextvars
+import csv
+import logging
+import sqlite3
+import threading
+from collections import Counter
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from medren.exif_process import ExifStat
+
+logger = logging.getLogger(__name__)
+
+# The outcome of every file of a run in one columnar table (CSV, Parquet or SQLite) instead of a log line per file.
+# Per file warnings (no datetime, offset mismatches, ...) are counted by code, and only the first few of each code
+# are logged as samples, the summary has the totals.
+
+SAMPLE_WARNINGS = 3  # Warnings logged per code, the others are only counted
+REPORT_COLUMNS = ['path', 'ext', 'status', 'backend', 'attempts', 'seconds', 'message']
+
+# The report of the Renamer that is currently running, so helpers deep in the call stack
+# (e.g. the offset checks of ExifClass) can report to it without being handed the Renamer.
+active_report: contextvars.ContextVar['OutcomeReport | None'] = contextvars.ContextVar('active_report', default=None)
+
+Attempt = tuple[str, str, float]  # backend, result (ok, none or the exception name), seconds
+
+
+def format_attempts(attempts: list[Attempt]) -> str:
+    return ';'.join(f'{backend}:{result}:{seconds:.4f}' for backend, result, seconds in attempts)
+
+
+@dataclass
+class OutcomeReport:
+    """
+    The outcomes of the files of a run, stored by column.
+
+    Args:
+        samples: Warnings logged per code, the others are only counted
+    """
+    samples: int = SAMPLE_WARNINGS
+    columns: dict[str, list] = field(default_factory=lambda: {c: [] for c in REPORT_COLUMNS})
+    warnings: Counter = field(default_factory=Counter)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)  # Files may finish in worker threads
+
+    def __len__(self) -> int:
+        return len(self.columns['path'])
+
+    def record(self, path: Path | str, status: 'ExifStat', backend: str | None = None,  # noqa: PLR0913 (the columns of a row)
+               *, attempts: list[Attempt] | None = None, message: str | None = None) -> None:
+        """Record the outcome of a file."""
+        attempts = attempts or []
+        path = str(path)
+        row = (path, Path(path).suffix.lower(), status.name, backend, format_attempts(attempts),
+               round(sum(a[2] for a in attempts), 6), message)
+        with self.lock:
+            for column, value in zip(REPORT_COLUMNS, row):
+                self.columns[column].append(value)
+
+    def warn(self, code: str, message: str) -> None:
+        """Count a warning, logging it only if it is one of the first samples of its code."""
+        with self.lock:
+            self.warnings[code] += 1
+            count = self.warnings[code]
+        if count <= self.samples:
+            logger.warning(message)
+            if count == self.samples:
+                logger.warning(f"Not logging more '{code}' warnings, see the summary")
+
+    @contextlib.contextmanager
+    def activate(self) -> Iterator['OutcomeReport']:
+        token = active_report.set(self)
+        try:
+            yield self
+        finally:
+            active_report.reset(token)
+
+    def status_counts(self) -> Counter:
+        return Counter(self.columns['status'])
+
+    def summary(self) -> str:
+        lines = [f'{len(self)} files']
+        lines += [f'{status}: {count}' for status, count in self.status_counts().most_common()]
+        lines += [f'{backend}: {count} files' for backend, count in Counter(
+            b for b in self.columns['backend'] if b).most_common()]
+        lines += [f'warning {code}: {count}' + (f' ({count - self.samples} not logged)' if count > self.samples else '')
+                  for code, count in self.warnings.most_common()]
+        return '\n'.join(lines)
+
+    def rows(self) -> Iterator[tuple]:
+        return zip(*(self.columns[c] for c in REPORT_COLUMNS))
+
+    def write(self, filename: Path | str) -> None:
+        """Write the report as CSV, Parquet (.parquet, needs pyarrow) or SQLite (.sqlite or .db)."""
+        filename = Path(filename)
+        filename.parent.mkdir(parents=True, exist_ok=True)
+        suffix = filename.suffix.lower()
+        if suffix == '.parquet':
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            pq.write_table(pa.table(self.columns), filename)
+        elif suffix in ('.sqlite', '.db'):
+            with contextlib.closing(sqlite3.connect(filename)) as db, db:
+                db.execute('DROP TABLE IF EXISTS outcomes')
+                db.execute('CREATE TABLE outcomes (path TEXT, ext TEXT, status TEXT, backend TEXT, attempts TEXT, '
+                           'seconds REAL, message TEXT)')
+                db.executemany(f"INSERT INTO outcomes VALUES ({', '.join('?' * len(REPORT_COLUMNS))})", self.rows())
+        else:
+            with open(filename, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(REPORT_COLUMNS)
+                writer.writerows(self.rows())
+
+
+def warn(log: logging.Logger, code: str, message: str) -> None:
+    """Log a per file warning, or count it in the active report (see OutcomeReport.warn)."""
+    report = active_report.get()
+    if report is None:
+        log.warning(message)
+    else:
+        report.warn(code, message)
@@ -0,0 +1,209 @@
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from collections.abc import Iterator
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# The stats of the Renamer that is currently running, so helpers deep in the call stack
+# (e.g. the timezone lookup of ExifClass) can report to it without being handed the Renamer.
+active_stats: contextvars.ContextVar['RenamerStats | None'] = contextvars.ContextVar('active_stats', default=None)
+
+
+def read_proc_io() -> int | None:
+    """Return the number of bytes this process has read so far (Linux only)."""
+    try:
+        with open('/proc/self/io', 'rb') as f:
+            for line in f:
+                if line.startswith(b'rchar:'):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+@dataclass
+class TimerStat:
+    calls: int = 0
+    seconds: float = 0.0
+    bytes_read: int = 0  # of the calls that did not overlap a stage of another thread
+
+
+@dataclass
+class BackendStat:
+    calls: int = 0
+    ok: int = 0  # returned metadata
+    failed: int = 0  # returned nothing
+    errors: int = 0  # raised an exception
+    seconds: float = 0.0
+    bytes_read: int = 0
+
+    @property
+    def success_rate(self) -> float | None:
+        return self.ok / self.calls if self.calls else None
+
+
+@dataclass
+class RenamerStats:
+    """
+    Timers and counters of a Renamer run.
+
+    Bytes read are taken from /proc/self/io where available, so they include the reads of this process only
+    (not of the exiftool/ffprobe subprocesses). As the counter is process wide, a stage call that overlaps a stage
+    of another thread (e.g. the headers read by the extract workers) does not add to bytes_read.
+    """
+    stages: dict[str, TimerStat] = field(default_factory=lambda: defaultdict(TimerStat))
+    backends: dict[str, BackendStat] = field(default_factory=lambda: defaultdict(BackendStat))
+    backend_ext: dict[str, dict[str, BackendStat]] = \
+        field(default_factory=lambda: defaultdict(lambda: defaultdict(BackendStat)))
+    files: int = 0
+    conforming: int = 0  # files skipped because the template already named them
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)  # Backends may run in worker threads
+    # thread id -> number of its open stages, and the number of times a thread entered a stage while another was in one
+    running: dict[int, int] = field(default_factory=lambda: defaultdict(int), init=False, repr=False)
+    overlaps: int = field(default=0, init=False, repr=False)
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[TimerStat]:
+        """Time a stage (or any named step) of the run."""
+        thread = threading.get_ident()
+        with self.lock:
+            stat = self.stages[name]
+            concurrent = any(n for t, n in self.running.items() if t != thread)
+            self.overlaps += concurrent
+            self.running[thread] += 1
+            overlaps = self.overlaps
+        token = active_stats.set(self)
+        start_bytes = read_proc_io()
+        start = time.perf_counter()
+        try:
+            yield stat
+        finally:
+            seconds = time.perf_counter() - start
+            end_bytes = read_proc_io()
+            with self.lock:
+                stat.seconds += seconds
+                stat.calls += 1
+                # the reads of the other threads are in the same counter
+                if start_bytes is not None and end_bytes is not None and not concurrent and overlaps == self.overlaps:
+                    stat.bytes_read += end_bytes - start_bytes
+                self.running[thread] -= 1
+                if not self.running[thread]:
+                    del self.running[thread]
+            active_stats.reset(token)
+
+    def record_backend(self, backend: str, ext: str, ok: bool, seconds: float,  # noqa: PLR0913 (the counters are keyword only)
+                       *, bytes_read: int = 0, error: bool = False) -> None:
+        """Record a backend call for one file."""
+        with self.lock:
+            for stat in (self.backends[backend], self.backend_ext[backend][ext]):
+                stat.calls += 1
+                stat.ok += ok
+                stat.failed += not ok and not error
+                stat.errors += error
+                stat.seconds += seconds
+                stat.bytes_read += bytes_read
+
+    def call_backend(self, backend: str, ext: str, func, *args):
+        """Call a backend function for one file and record it."""
+        start_bytes = read_proc_io()
+        start = time.perf_counter()
+        ex, error = None, False
+        try:
+            ex = func(*args)
+            return ex
+        except Exception:
+            error = True
+            raise
+        finally:
+            end_bytes = read_proc_io()
+            read = end_bytes - start_bytes if start_bytes is not None and end_bytes is not None else 0
+            self.record_backend(backend, ext, ex is not None, time.perf_counter() - start,
+                                bytes_read=read, error=error)
+
+    def to_dict(self) -> dict:
+        def backend_dict(stat: BackendStat) -> dict:
+            return {**asdict(stat), 'success_rate': stat.success_rate}
+        return {
+            'files': self.files,
+            'conforming': self.conforming,
+            'stages': {k: asdict(v) for k, v in self.stages.items()},
+            'backends': {k: backend_dict(v) for k, v in self.backends.items()},
+            'backend_ext': {b: {ext: backend_dict(v) for ext, v in exts.items()}
+                            for b, exts in self.backend_ext.items()},
+        }
+
+    def write_json(self, filename: Path | str) -> None:
+        filename = Path(filename)
+        filename.parent.mkdir(parents=True, exist_ok=True)
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def summary(self) -> str:
+        lines = [f'{self.files} files, {self.conforming} already named']
+        for name, stat in self.stages.items():
+            lines.append(f'{name}: {stat.seconds:.3f}s in {stat.calls} calls, {stat.bytes_read} bytes read')
+        for name, stat in self.backends.items():
+            lines.append(f'{name}: {stat.ok}/{stat.calls} ok, {stat.errors} errors, {stat.seconds:.3f}s')
+        return '\n'.join(lines)
+
+
+def timed(name: str):
+    """Decorate a function to be timed as the step `name` of the active Renamer stats, if any."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            stats = active_stats.get()
+            if stats is None:
+                return func(*args, **kwargs)
+            with stats.stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextlib.contextmanager
+def profiled(profiler: str | None, output: Path | str | None = None) -> Iterator[None]:
+    """
+    Run a block under cProfile or pyinstrument.
+
+    Args:
+        profiler: 'cprofile', 'pyinstrument' or None (no profiling)
+        output: Where to write the profile (.prof for cProfile, .html for pyinstrument), None prints it
+    """
+    if not profiler:
+        yield
+    elif profiler == 'cprofile':
+        import cProfile
+        import pstats
+        prof = cProfile.Profile()
+        prof.enable()
+        try:
+            yield
+        finally:
+            prof.disable()
+            if output:
+                prof.dump_stats(str(output))
+            else:
+                pstats.Stats(prof).sort_stats('cumulative').print_stats(30)
+    elif profiler == 'pyinstrument':
+        from pyinstrument import Profiler
+        prof = Profiler()
+        prof.start()
+        try:
+            yield
+        finally:
+            prof.stop()
+            if output:
+                Path(output).write_text(prof.output_html(), encoding='utf-8')
+            else:
+                print(prof.output_text())
+    else:
+        raise ValueError(f'Unknown profiler {profiler}')
@@ -0,0 +1,211 @@
+import contextlib
+import datetime
+import json
+import logging
+import multiprocessing
+import time
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable
+
+from medren.consts import MEDREN_DIR
+from medren.exif_process import ExifClass
+from medren.preview_cache import file_key
+
+logger = logging.getLogger(__name__)
+
+QUARANTINE_PATH = MEDREN_DIR / 'quarantine.json'
+DEFAULT_BACKEND_TIMEOUT = 30.0
+DEFAULT_FILE_TIMEOUT = 60.0
+
+
+class BackendTimeoutError(Exception):
+    """A backend did not finish within its time budget."""
+
+
+class BackendCrashedError(Exception):
+    """The worker process died while running a backend."""
+
+
+class FileTimeoutError(BackendTimeoutError):
+    """The time budget of a file ran out."""
+
+
+def _worker_main(conn) -> None:
+    worker_logger = logging.getLogger(__name__)
+    while True:
+        try:
+            func, args = conn.recv()
+        except EOFError:
+            return
+        try:
+            conn.send(('ok', func(*args, worker_logger)))
+        except Exception as e:
+            conn.send(('error', f'{type(e).__name__}: {e}'))
+
+
+def quarantine_key(path: Path | str) -> str:
+    key = file_key(path)
+    return f'{key[0]}|{key[1]}|{key[2]}' if key else str(path)
+
+
+@dataclass
+class Quarantine:
+    """
+    Files (or file and backend pairs) that made a backend hang or crash, kept between runs.
+
+    Entries are keyed by the path, size and mtime of the file, so a file that changed is tried again.
+    """
+    path: Path = QUARANTINE_PATH
+    entries: dict[str, dict[str, Any]] = field(default_factory=dict)
+
+    def __post_init__(self):
+        self.path = Path(self.path)
+        if self.path.is_file():
+            try:
+                with open(self.path, encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not load the quarantine list {self.path}: {e}")
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix('.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, indent=2)
+        tmp.replace(self.path)
+
+    def add(self, path: Path | str, reason: str, backend: str | None = None) -> None:
+        """
+        Quarantine a file for one backend, or for all of them if backend is None.
+        """
+        entry = self.entries.setdefault(quarantine_key(path), {'path': str(path), 'file': None, 'backends': {}})
+        if backend is None:
+            entry['file'] = reason
+        else:
+            entry['backends'][backend] = reason
+        entry['time'] = datetime.datetime.now().isoformat(timespec='seconds')
+        self.save()
+        logger.warning(f"Quarantined {path}{f' for {backend}' if backend else ''}: {reason}")
+
+    def is_quarantined(self, path: Path | str, backend: str | None = None) -> bool:
+        entry = self.entries.get(quarantine_key(path))
+        if not entry:
+            return False
+        return entry['file'] is not None or (backend is not None and backend in entry['backends'])
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.save()
+
+
+@dataclass
+class Supervisor:
+    """
+    Run backends in a worker process with time budgets.
+
+    A worker that does not answer within the budget is killed, as is one that crashed, and a new one is started.
+    The offending file is quarantined for the backend, or for all backends when the budget of the file ran out,
+    so later runs skip it without waiting.
+    """
+    backend_timeout: float = DEFAULT_BACKEND_TIMEOUT  # Seconds a backend may spend on a file
+    file_timeout: float = DEFAULT_FILE_TIMEOUT  # Seconds all the backends together may spend on a file
+    timeouts: dict[str, float] = field(default_factory=dict)  # Per backend overrides of backend_timeout
+    quarantine: Quarantine = field(default_factory=Quarantine)
+    start_method: str = 'spawn'  # multiprocessing start method of the workers
+    deadline: float | None = None  # End of the budget of the current file
+    recycled: int = 0  # Number of workers killed
+    _proc: Any = field(default=None, repr=False)
+    _conn: Any = field(default=None, repr=False)
+
+    def start(self) -> None:
+        ctx = multiprocessing.get_context(self.start_method)
+        self._conn, child_conn = ctx.Pipe()
+        self._proc = ctx.Process(target=_worker_main, args=(child_conn,), daemon=True, name='medren-backend')
+        self._proc.start()
+        child_conn.close()
+
+    def stop(self) -> None:
+        if self._proc is None:
+            return
+        self._conn.close()
+        self._proc.join(timeout=1)
+        if self._proc.is_alive():
+            self._proc.kill()
+            self._proc.join()
+        self._proc = self._conn = None
+
+    def recycle(self) -> None:
+        """Kill the worker, a new one is started by the next call."""
+        if self._proc is not None:
+            self._proc.kill()
+            self._proc.join()
+            self._conn.close()
+            self._proc = self._conn = None
+        self.recycled += 1
+
+    def __enter__(self) -> 'Supervisor':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    @contextlib.contextmanager
+    def file_budget(self, path: Path | str) -> Iterator[None]:
+        """Limit the total time of the backend calls for a file."""
+        self.deadline = time.monotonic() + self.file_timeout
+        try:
+            yield
+        except FileTimeoutError:
+            self.quarantine.add(path, f'exceeded the file budget of {self.file_timeout}s')
+            raise
+        finally:
+            self.deadline = None
+
+    def call(self, backend: str, path: Path | str, func: Callable[..., ExifClass | None], *args) -> ExifClass | None:
+        """
+        Call a backend function in the worker: func(*args, logger).
+
+        Args:
+            backend: The backend name, for its budget and the quarantine
+            path: The file the backend works on
+            func: A module level backend function (it is pickled by name)
+            args: The arguments of func, before the logger
+
+        Raises:
+            BackendTimeoutError: The backend did not answer in its budget (the file is quarantined for it)
+            FileTimeoutError: The budget of the file ran out
+            BackendCrashedError: The worker died (the file is quarantined for the backend)
+        """
+        timeout = self.timeouts.get(backend, self.backend_timeout)
+        file_limited = False
+        if self.deadline is not None:
+            remaining = self.deadline - time.monotonic()
+            if remaining <= 0:
+                raise FileTimeoutError(f'no time left for {path}')
+            file_limited = remaining < timeout
+            timeout = min(timeout, remaining)
+        if self._proc is None or not self._proc.is_alive():
+            if self._proc is not None:
+                self.recycle()
+            self.start()
+        try:
+            self._conn.send((func, args))
+            answered = self._conn.poll(timeout)
+            if answered:
+                status, value = self._conn.recv()
+        except (EOFError, OSError) as e:
+            exitcode = self._proc.exitcode
+            self.recycle()
+            self.quarantine.add(path, f'worker crashed (exit code {exitcode})', backend)
+            raise BackendCrashedError(f'{backend} crashed on {path}') from e
+        if not answered:
+            self.recycle()
+            if file_limited:
+                raise FileTimeoutError(f'{backend} ran out of the budget of {path}')
+            self.quarantine.add(path, f'timed out after {timeout}s', backend)
+            raise BackendTimeoutError(f'{backend} timed out after {timeout}s on {path}')
+        if status == 'error':
+            raise RuntimeError(value)
+        return value
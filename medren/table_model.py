@@ -0,0 +1,107 @@
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+from medren.exif_process import ExifClass
+
+# The preview results behind the GUI table. Sorting, filtering and paging work on these rows,
+# and the widget only receives the rows of the current page, so large previews stay responsive.
+
+TABLE_HEADINGS = ['Original Filename', 'New Filename', 'Datetime', 'goff', 'make', 'model', 'Backend']
+DEFAULT_PAGE_SIZE = 500
+
+Row = tuple[str, str, Any, Any, str | None, str | None, str]
+
+
+def row_from_rename(org_path: Path | str, new_name: str, ex: ExifClass) -> Row:
+    return str(org_path), str(new_name), ex.dt, ex.goff, ex.make, ex.model, ex.backend
+
+
+def sort_key(value: Any) -> tuple:
+    # missing values go last, whatever the type of the column
+    return (value is None, value if value is not None else 0)
+
+
+@dataclass
+class PreviewTable:
+    rows: list[Row] = field(default_factory=list)
+    page_size: int = DEFAULT_PAGE_SIZE
+    page: int = 0
+    sort_col: int | None = None
+    descending: bool = False
+    filter_text: str = ''
+    view: list[int] = field(default_factory=list)  # Indices of the filtered rows, in sorted order
+    _search: list[str] | None = field(default=None, repr=False)  # Lower case text of each row, for filtering
+
+    def __post_init__(self):
+        self.refresh()
+
+    @classmethod
+    def from_renames(cls, renames: dict[str, tuple[str, ExifClass]], **kwargs) -> 'PreviewTable':
+        return cls(rows=[row_from_rename(org, new, ex) for org, (new, ex) in renames.items()], **kwargs)
+
+    def clear(self) -> None:
+        self.rows = []
+        self._search = None
+        self.page = 0
+        self.refresh()
+
+    def refresh(self) -> None:
+        """Filter and sort the rows again."""
+        if self.filter_text:
+            if self._search is None:
+                self._search = [' '.join(str(v) for v in row if v is not None).lower() for row in self.rows]
+            text = self.filter_text.lower()
+            view = [i for i, s in enumerate(self._search) if text in s]
+        else:
+            view = list(range(len(self.rows)))
+        if self.sort_col is not None:
+            col = self.sort_col
+            view.sort(key=lambda i: sort_key(self.rows[i][col]), reverse=self.descending)
+        self.view = view
+        self.page = min(self.page, self.page_count - 1)
+
+    def set_filter(self, text: str) -> None:
+        """Show the rows that contain the text (case insensitive, in any column)."""
+        if text != self.filter_text:
+            self.filter_text = text
+            self.page = 0
+            self.refresh()
+
+    def sort_by(self, col: int) -> None:
+        """Sort by a column, a second click on the same column reverses the order."""
+        if self.sort_col == col:
+            self.descending = not self.descending
+        else:
+            self.sort_col, self.descending = col, False
+        self.refresh()
+
+    @property
+    def page_count(self) -> int:
+        return max(1, -(-len(self.view) // self.page_size))
+
+    def go_to(self, page: int) -> None:
+        self.page = max(0, min(page, self.page_count - 1))
+
+    def page_rows(self) -> list[Row]:
+        start = self.page * self.page_size
+        return [self.rows[i] for i in self.view[start:start + self.page_size]]
+
+    def page_values(self, full_paths: bool = True) -> list[list]:
+        """The rows of the current page, formatted for the widget."""
+        values = []
+        for row in self.page_rows():
+            value = list(row)
+            if not full_paths:
+                value[0] = Path(value[0]).name
+            values.append(value)
+        return values
+
+    def selected(self, widget_rows: list[int]) -> list[Row]:
+        """The rows selected in the widget (indices within the current page)."""
+        page = self.page_rows()
+        return [page[i] for i in widget_rows if i < len(page)]
+
+    def status(self) -> str:
+        shown = f'{len(self.view)} of {len(self.rows)}' if self.filter_text else f'{len(self.rows)}'
+        return f'{shown} (page {self.page + 1}/{self.page_count})'
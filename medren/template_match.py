@@ -0,0 +1,218 @@
+import datetime
+import itertools
+import math
+import re
+import string
+from dataclasses import dataclass, field
+from pathlib import Path, PurePath
+
+from medren.consts import UNKNOWN_DIR
+from medren.util import filename_safe
+
+# The naming template compiled backwards into a matcher, so files that already have the name the template would
+# give them can be recognized from their path alone (e.g. when medren runs again over an organized library).
+# Renamer.name formats missing values as 'nan' and removes them with one adjacent separator, so the matcher has
+# one pattern per combination of missing values (up to MAX_OPTIONAL_FIELDS optional fields).
+
+MAX_OPTIONAL_FIELDS = 8
+SKIP_MODES = ['skip', 'verify']  # skip: trust the names, verify: compare them to the extracted datetime
+
+FIELD_PATTERNS = {
+    'year': r'\d{4}',
+    'month': r'\d{2}',
+    'day': r'\d{2}',
+    'idx': r'\d+',
+    'sha256': r'[0-9a-f]{64}',
+    'w': r'\d+',
+    'h': r'\d+',
+    'lat': r'-?\d+(?:\.\d+)?',
+    'lon': r'-?\d+(?:\.\d+)?',
+    'ext': r'\.[a-z0-9]+',
+    'dup': r'dup\d+',
+}
+TEXT_PATTERN = r'[^/]+?'
+REQUIRED_FIELDS = {'datetime', 'ext', 'year', 'month', 'day', 'idx', 'sha256', 'name'}  # never missing
+CONSTANT_FIELDS = {'prefix', 'suffix', 's'}  # the same for all the files
+
+STRFTIME_PATTERNS = {
+    'Y': r'\d{4}', 'y': r'\d{2}', 'm': r'\d{2}', 'd': r'\d{2}', 'H': r'\d{2}', 'I': r'\d{2}', 'M': r'\d{2}',
+    'S': r'\d{2}', 'f': r'\d{6}', 'j': r'\d{3}', 'p': r'[AaPp][Mm]', 'z': r'[+-]\d{4}', 'Z': r'[A-Za-z]*',
+    'a': r'[A-Za-z]+', 'A': r'[A-Za-z]+', 'b': r'[A-Za-z]+', 'B': r'[A-Za-z]+',
+}
+
+# placeholders of the field values and of the collision counter, private use characters that filename_safe keeps
+OPEN, CLOSE, COUNTER = '\ue000', '\ue001', '\ue002'
+PLACEHOLDER = re.compile(f'{OPEN}(\\d+){CLOSE}')
+
+
+def datetime_pattern(datetime_format: str) -> tuple[str, str]:
+    """
+    Convert a strftime format to a regex.
+
+    Returns:
+        tuple[str, str]: The regex, and the format as it appears in file names (to parse the matched text with)
+    """
+    pattern, fmt = '', ''
+    for literal, directive in re.findall(r'([^%]*)(%.|$)', datetime_format):
+        safe = filename_safe(literal)
+        pattern += re.escape(safe)
+        fmt += safe
+        if directive == '%%':
+            pattern += '-'  # filename_safe replaces %
+            fmt += '-'
+        elif directive:
+            pattern += STRFTIME_PATTERNS.get(directive[1], r'.+?')
+            fmt += directive
+    return pattern, fmt
+
+
+@dataclass
+class TemplateMatch:
+    dt: datetime.datetime | None
+    values: dict[str, str] = field(default_factory=dict)
+
+
+class TemplateMatcher:
+    """
+    Recognize the paths that a template produces.
+
+    Args:
+        template: The naming template (may have directories)
+        datetime_format: The format of {datetime}
+        separator: The value of {s}
+        prefix: The value of {prefix}
+        suffix: The value of {suffix}
+    """
+
+    def __init__(self, template: str, datetime_format: str, separator: str,  # noqa: PLR0913 (the constants are keyword only)
+                 *, prefix: str = '', suffix: str = ''):
+        self.template = template
+        self.datetime_format = datetime_format
+        self.dt_pattern, self.dt_format = datetime_pattern(datetime_format)
+        self.constants = {'prefix': prefix, 'suffix': suffix, 's': separator}
+        self.separator = separator
+        self.parts = [list(string.Formatter().parse(part)) for part in template.split('/')]
+        self.depth = len(self.parts)
+        # in template order, so ambiguous names are matched with the earlier fields present
+        names = dict.fromkeys(name for part in self.parts for _, name, _, _ in part if name is not None)
+        self.optional = [name for name in names if name not in REQUIRED_FIELDS | CONSTANT_FIELDS]
+        self.patterns = self.compile() if len(self.optional) <= MAX_OPTIONAL_FIELDS else []
+
+    def compile(self) -> list[re.Pattern]:
+        patterns = []
+        for present in itertools.product([True, False], repeat=len(self.optional)):
+            regex = self.combination_regex(dict(zip(self.optional, present)))
+            if regex not in patterns:
+                patterns.append(regex)
+        return [re.compile(p) for p in patterns]
+
+    def combination_regex(self, present: dict[str, bool]) -> str:
+        """The regex of the paths where only the present optional fields have values."""
+        s = self.separator
+        none_value_s = str(math.nan)
+        fields = []  # (name, format spec) of each placeholder
+
+        def render(tokens: list) -> str:
+            text = ''
+            for literal, name, spec, _conversion in tokens:
+                text += literal
+                if name is None:
+                    continue
+                if name in CONSTANT_FIELDS:
+                    value = self.constants[name]
+                    text += value if value or name == 's' else none_value_s
+                elif present.get(name, True):
+                    text += f'{OPEN}{len(fields)}{CLOSE}'
+                    fields.append((name, spec))
+                else:
+                    text += none_value_s
+            return text
+
+        def clean(part: str) -> str:
+            # the same as Renamer.name
+            part = part.replace(none_value_s + s, '').replace(s + none_value_s, '').replace(none_value_s, '')
+            return filename_safe(part)
+
+        *dir_parts, last = self.parts
+        dirs = [clean(render(part)) or UNKNOWN_DIR for part in dir_parts]
+        ext = ''
+        if last and last[-1][1] == 'ext' and not last[-1][2]:
+            ext = render([('', 'ext', '', None)])
+            last = last[:-1] + [(last[-1][0], None, None, None)]
+        stem = clean(render(last)) + COUNTER + ext  # the collision counter of Renamer.plan goes before the ext
+        regex = ''
+        groups = set()
+        for i, text in enumerate([*dirs, stem]):
+            if i:
+                regex += '/'
+            for j, piece in enumerate(PLACEHOLDER.split(text)):
+                if j % 2 == 0:
+                    regex += re.escape(piece).replace(COUNTER, r'(?:-\d+)?')
+                    continue
+                name, _spec = fields[int(piece)]
+                if name in groups:
+                    regex += f'(?P={name})'
+                    continue
+                groups.add(name)
+                pattern = self.dt_pattern if name == 'datetime' else FIELD_PATTERNS.get(name, TEXT_PATTERN)
+                regex += f'(?P<{name}>{pattern})'
+        return regex
+
+    def match(self, path: PurePath | str, root: PurePath | str | None = None) -> TemplateMatch | None:
+        """
+        Check if a path is a name the template produces.
+
+        Args:
+            path: The path of a file
+            root: The root directory of the template directories (the destination root), None for the
+                directory of the file before it was renamed
+
+        Returns:
+            TemplateMatch | None: The datetime and the other values in the path, None if it does not match
+        """
+        path = PurePath(path)
+        if root is not None:
+            try:
+                rel = path.relative_to(root)
+            except ValueError:
+                return None
+            if len(rel.parts) != self.depth:
+                return None
+        elif len(path.parts) < self.depth:
+            return None
+        tail = '/'.join(path.parts[-self.depth:])
+        for pattern in self.patterns:
+            m = pattern.fullmatch(tail)
+            if m and (result := self.validate(m.groupdict())):
+                return result
+        return None
+
+    def validate(self, values: dict[str, str]) -> TemplateMatch | None:
+        dt = None
+        if 'datetime' in values:
+            try:
+                dt = datetime.datetime.strptime(values['datetime'], self.dt_format)
+            except ValueError:
+                return None
+            for name, fmt in (('year', '%Y'), ('month', '%m'), ('day', '%d')):
+                if name in values and values[name] != dt.strftime(fmt):
+                    return None
+        return TemplateMatch(dt=dt, values=values)
+
+
+def conforming_files(paths: list[Path], matcher: TemplateMatcher,
+                     root: Path | None = None) -> tuple[list[Path], dict[Path, TemplateMatch]]:
+    """
+    Split files into the ones the template would rename and the ones it already named.
+
+    Returns:
+        tuple[list[Path], dict[Path, TemplateMatch]]: The other files, and the matches of the conforming files
+    """
+    others, matches = [], {}
+    for path in paths:
+        m = matcher.match(path, root)
+        if m is None:
+            others.append(path)
+        else:
+            matches[path] = m
+    return others, matches
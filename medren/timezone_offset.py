@@ -1,8 +1,22 @@
-from timezonefinder import TimezoneFinder
+import functools
+import threading
 from datetime import datetime
 from zoneinfo import ZoneInfo
 
+from timezonefinder import TimezoneFinder
+
+from medren.stats import timed
+
+timezone_lock = threading.Lock()  # TimezoneFinder reads its shared index files, a lookup at a time
+
 
+@functools.cache
+def timezone_finder() -> TimezoneFinder:
+    """The TimezoneFinder, loaded once for the process (loading its index is slow)."""
+    return TimezoneFinder()
+
+
+@timed('timezone')
 def get_timezone_offset(lat: float, lon: float, date: datetime, factor: float = 3600) -> float:
     """
     Get timezone offset (in hours, factor=3600) for given latitude, longitude and date.
@@ -16,8 +30,8 @@ def get_timezone_offset(lat: float, lon: float, date: datetime, factor: float =
     Returns:
         float: Offset from UTC in hours (including DST if applicable)
     """
-    tf = TimezoneFinder()
-    timezone_name = tf.timezone_at(lng=lon, lat=lat)
+    with timezone_lock:
+        timezone_name = timezone_finder().timezone_at(lng=lon, lat=lat)
     if timezone_name is None:
         raise ValueError("Could not determine timezone for given coordinates.")
 
@@ -32,15 +46,19 @@ def get_timezone_offset(lat: float, lon: float, date: datetime, factor: float =
     return offset
 
 
+TLV_WINTER_OFFSET, TLV_SUMMER_OFFSET = 2, 3  # Israel Standard and Daylight Time
+NYC_SUMMER_OFFSET = -4  # Eastern Daylight Time
+
+
 def test_timezone_offset():
     tlv_lat_lng = 32.08, 34.78
     winter_date = datetime(2025, 1, 1)
     offset = get_timezone_offset(*tlv_lat_lng, date=winter_date)
-    assert offset == 2
+    assert offset == TLV_WINTER_OFFSET
 
     summer_date = datetime(2025, 8, 1)
     offset = get_timezone_offset(*tlv_lat_lng, date=summer_date)
-    assert offset == 3
+    assert offset == TLV_SUMMER_OFFSET
 
 def test_timezone_offset2():
     lat = 40.7128
@@ -48,4 +66,4 @@ def test_timezone_offset2():
     date = datetime(2025, 6, 15)
     offset = get_timezone_offset(lat, lon, date)
     print(f"Timezone offset: {offset} hours")
-    assert offset == -4
+    assert offset == NYC_SUMMER_OFFSET
@@ -0,0 +1,232 @@
+import csv
+import dataclasses
+import datetime
+import logging
+from collections.abc import Iterator
+from dataclasses import dataclass
+from pathlib import Path
+from xml.etree import ElementTree
+
+import numpy as np
+
+from medren.exif_process import ExifClass
+
+logger = logging.getLogger(__name__)
+
+# Locations for files without GPS (e.g. DSLR shots) from the track log of a GPS logger or a phone (GPX, KML, CSV).
+# The track points of all the logs are loaded once into time sorted NumPy arrays, and the files are located
+# together: one searchsorted over the track for all of them, and a linear interpolation between the two track
+# points around each file. Track times are UTC, so a file on a camera local clock needs its offset (the file's
+# own, or the offset the camera clock was set to) and the camera clock skew to be converted first.
+
+DEFAULT_MAX_GAP = datetime.timedelta(minutes=10)  # Files further in time from the track are not located
+TRACK_SUFFIXES = ('.gpx', '.kml', '.csv')
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+TrackPoint = tuple[float, float, float, float | None]  # UTC epoch seconds, lat, lon, alt
+
+
+def parse_time(text: str) -> float:
+    """Convert an ISO 8601 time (UTC if it has no offset) or epoch seconds to epoch seconds."""
+    text = text.strip()
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    dt = datetime.datetime.fromisoformat(text.replace('Z', '+00:00'))
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return (dt - EPOCH).total_seconds()
+
+
+def local_name(tag: str) -> str:
+    return tag.rsplit('}', 1)[-1]
+
+
+def child_text(elem: ElementTree.Element, name: str) -> str | None:
+    for child in elem:
+        if local_name(child.tag) == name:
+            return child.text
+    return None
+
+
+def parse_gpx(path: Path | str) -> Iterator[TrackPoint]:
+    for _event, elem in ElementTree.iterparse(path):
+        if local_name(elem.tag) in ('trkpt', 'rtept', 'wpt'):
+            t = child_text(elem, 'time')
+            if t:
+                ele = child_text(elem, 'ele')
+                yield parse_time(t), float(elem.get('lat')), float(elem.get('lon')), float(ele) if ele else None
+            elem.clear()
+
+
+def parse_kml_coord(text: str, sep: str) -> tuple[float, float, float | None]:
+    lon, lat, *alt = (float(v) for v in text.strip().split(sep))
+    return lat, lon, alt[0] if alt else None
+
+
+def parse_kml(path: Path | str) -> Iterator[TrackPoint]:
+    """The points of gx:Track elements and of time stamped Placemarks."""
+    for _event, elem in ElementTree.iterparse(path):
+        name = local_name(elem.tag)
+        if name == 'Track':
+            whens = [c.text for c in elem if local_name(c.tag) == 'when']
+            coords = [c.text for c in elem if local_name(c.tag) == 'coord']
+            for when, coord in zip(whens, coords):
+                if when and coord:
+                    yield parse_time(when), *parse_kml_coord(coord, ' ')
+            elem.clear()
+        elif name == 'Placemark':
+            when = next((e.text for e in elem.iter() if local_name(e.tag) == 'when'), None)
+            coord = next((e.text for e in elem.iter() if local_name(e.tag) == 'coordinates'), None)
+            if when and coord:
+                yield parse_time(when), *parse_kml_coord(coord.split()[0], ',')
+            elem.clear()
+
+
+CSV_COLUMNS = {
+    'time': ('time', 'timestamp', 'datetime', 'date_time', 'utc'),
+    'lat': ('lat', 'latitude'),
+    'lon': ('lon', 'lng', 'long', 'longitude'),
+    'alt': ('alt', 'altitude', 'ele', 'elevation'),
+}
+
+
+def parse_csv(path: Path | str) -> Iterator[TrackPoint]:
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        header = {name.strip().lower(): name for name in reader.fieldnames or []}
+        columns = {key: next((header[n] for n in names if n in header), None) for key, names in CSV_COLUMNS.items()}
+        if not all(columns[key] for key in ('time', 'lat', 'lon')):
+            raise ValueError(f'{path} has no time, lat and lon columns')
+        for row in reader:
+            try:
+                alt = row.get(columns['alt']) if columns['alt'] else None
+                yield (parse_time(row[columns['time']]), float(row[columns['lat']]), float(row[columns['lon']]),
+                       float(alt) if alt else None)
+            except (TypeError, ValueError) as e:
+                logger.debug(f"Skipping a row of {path}: {e}")
+
+
+track_parsers = {'.gpx': parse_gpx, '.kml': parse_kml, '.csv': parse_csv}
+
+
+@dataclass
+class TrackLog:
+    """Track points sorted by time (UTC epoch seconds)."""
+    times: np.ndarray
+    lat: np.ndarray
+    lon: np.ndarray
+    alt: np.ndarray  # NaN where unknown
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    @classmethod
+    def from_points(cls, points: list[TrackPoint]) -> 'TrackLog':
+        data = np.array([(t, lat, lon, np.nan if alt is None else alt) for t, lat, lon, alt in points],
+                        dtype=np.float64).reshape(-1, 4)
+        data = data[np.argsort(data[:, 0], kind='stable')]
+        return cls(times=data[:, 0], lat=data[:, 1], lon=data[:, 2], alt=data[:, 3])
+
+    @classmethod
+    def load(cls, paths: list[Path | str]) -> 'TrackLog':
+        """Load GPX, KML and CSV track logs (or directories of them) into one track."""
+        points = []
+        for track_path in map(Path, paths):
+            files = sorted(p for p in track_path.rglob('*') if p.suffix.lower() in TRACK_SUFFIXES) \
+                if track_path.is_dir() else [track_path]
+            for file in files:
+                parser = track_parsers.get(file.suffix.lower())
+                if parser is None:
+                    raise ValueError(f'Unsupported track log {file}, expected one of {", ".join(TRACK_SUFFIXES)}')
+                count = len(points)
+                points.extend(parser(file))
+                logger.info(f'Loaded {len(points) - count} track points from {file}')
+        return cls.from_points(points)
+
+    def locate(self, times: np.ndarray, max_gap: datetime.timedelta = DEFAULT_MAX_GAP
+               ) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Interpolate the track at UTC times.
+
+        Args:
+            times: UTC epoch seconds
+            max_gap: Times further than this from both track points around them are not located
+
+        Returns:
+            tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]: The lat, lon and alt at the times,
+                and a mask of the located times
+        """
+        times = np.asarray(times, dtype=np.float64)
+        n = len(self.times)
+        if n == 0:
+            nan = np.full(times.shape, np.nan)
+            return nan, nan, nan, np.zeros(times.shape, dtype=bool)
+        hi = np.clip(np.searchsorted(self.times, times), 1, n - 1) if n > 1 else np.zeros(times.shape, dtype=int)
+        lo = np.maximum(hi - 1, 0)
+        t0, t1 = self.times[lo], self.times[hi]
+        span = t1 - t0
+        w = np.clip(np.divide(times - t0, span, out=np.zeros_like(times), where=span > 0), 0, 1)
+        gap = np.minimum(np.abs(times - t0), np.abs(times - t1))
+        found = gap <= max_gap.total_seconds()
+        lat = self.lat[lo] + (self.lat[hi] - self.lat[lo]) * w
+        lon = self.lon[lo] + (self.lon[hi] - self.lon[lo]) * w
+        alt = self.alt[lo] + (self.alt[hi] - self.alt[lo]) * w
+        return lat, lon, alt, found
+
+
+@dataclass
+class Geotagger:
+    """
+    Locate the files without GPS on a track log.
+
+    Args:
+        track: The track log
+        camera_goff: The UTC offset (hours) the camera clocks are set to, for files without an offset of their own
+            (None skips these files)
+        clock_skew: How far ahead of the true time the camera clocks are
+        max_gap: Files further in time from the track are not located
+    """
+    track: TrackLog
+    camera_goff: float | None = None
+    clock_skew: datetime.timedelta = datetime.timedelta(0)
+    max_gap: datetime.timedelta = DEFAULT_MAX_GAP
+
+    def utc_time(self, ex: ExifClass) -> float | None:
+        """The UTC epoch seconds of a file by the true time, None if its offset is unknown."""
+        if ex.dt is None:
+            return None
+        if ex.is_utc:
+            dt = ex.dt
+        elif ex.goff is not None:
+            dt = ex.dt - datetime.timedelta(hours=ex.goff)
+        elif self.camera_goff is not None:
+            dt = ex.dt - datetime.timedelta(hours=self.camera_goff)
+        else:
+            return None
+        return (dt - self.clock_skew - EPOCH).total_seconds()
+
+    def geotag(self, exifs: list[ExifClass]) -> list[ExifClass]:
+        """
+        Add locations from the track to the files without one.
+
+        Returns:
+            list[ExifClass]: The metadata of the files, copies with a location where one was found
+                (the given objects are not modified)
+        """
+        todo = [(i, t) for i, ex in enumerate(exifs) if ex.lat is None and (t := self.utc_time(ex)) is not None]
+        result = list(exifs)
+        if not todo:
+            return result
+        lat, lon, alt, found = self.track.locate(np.array([t for _i, t in todo]), self.max_gap)
+        for j in np.flatnonzero(found):
+            i = todo[j][0]
+            ex = exifs[i]
+            # a new ExifClass looks up the zone of the location (see ExifClass.goff_form_loc)
+            result[i] = dataclasses.replace(ex, lat=round(float(lat[j]), 7), lon=round(float(lon[j]), 7),
+                                            alt=None if np.isnan(alt[j]) else round(float(alt[j]), 2),
+                                            backend=f'{ex.backend}+track')
+        logger.info(f'Located {len(np.flatnonzero(found))} of {len(todo)} files on the track')
+        return result
@@ -0,0 +1,158 @@
+import bisect
+import dataclasses
+import datetime
+import logging
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from medren.exif_process import ExifClass, Goff
+
+logger = logging.getLogger(__name__)
+
+# Time offsets for files without a location, taken from geotagged files of the same time.
+# Photos of a trip without GPS (a camera next to a phone) keep their camera local time without an offset,
+# and videos whose backends give UTC without a location stay in UTC. The geotagged files (anchors) are indexed
+# by time, per device and for all devices, and each file without an offset takes the zone of its nearest anchors,
+# with a confidence that drops with the time gap, when the zone changes between the anchors before and after it,
+# and when the anchors are of another device. Sorting and the bisect lookups keep it O(n log n) for a library.
+
+DEFAULT_MAX_GAP = datetime.timedelta(hours=12)  # Anchors further away in time are not used
+DEFAULT_MIN_CONFIDENCE = 0.5  # Inferred offsets with a lower confidence are not applied
+OTHER_DEVICE_FACTOR = 0.7  # Confidence factor of an offset taken from the anchors of another device
+ZONE_CHANGE_FACTOR = 0.5  # Confidence factor when the anchors before and after a file disagree
+
+Device = tuple[str, str] | None  # (make, model), None for all the devices
+
+
+@dataclass
+class TzInference:
+    goff: Goff  # The inferred offset in hours
+    confidence: float  # 0..1
+    gap: datetime.timedelta  # The time to the nearest anchor
+    same_device: bool
+
+
+def is_anchor(ex: ExifClass) -> bool:
+    return ex.goff_ll is not None and ex.dt is not None
+
+
+def needs_offset(ex: ExifClass) -> bool:
+    return ex.goff is None and ex.goff_ll is None and ex.dt is not None
+
+
+def device_of(ex: ExifClass) -> Device:
+    if not ex.make and not ex.model:
+        return None
+    return (ex.make or '').lower(), (ex.model or '').lower()
+
+
+@dataclass
+class AnchorIndex:
+    """The anchors of a device sorted by time, on the local clock and in UTC."""
+    local: list[tuple[datetime.datetime, Goff]] = field(default_factory=list)
+    utc: list[tuple[datetime.datetime, Goff]] = field(default_factory=list)
+
+    def add(self, ex: ExifClass) -> None:
+        self.local.append((ex.dt, ex.goff_ll))
+        # the datetime of an anchor is local, by its embedded offset if it has one
+        self.utc.append((ex.dt - datetime.timedelta(hours=ex.goff if ex.goff is not None else ex.goff_ll),
+                         ex.goff_ll))
+
+    def sort(self) -> None:
+        self.local.sort(key=lambda a: a[0])
+        self.utc.sort(key=lambda a: a[0])
+
+    def neighbors(self, dt: datetime.datetime, is_utc: bool,
+                  max_gap: datetime.timedelta) -> list[tuple[datetime.timedelta, Goff]]:
+        """The anchors just before and just after a time (within max_gap), with their gaps."""
+        anchors = self.utc if is_utc else self.local
+        i = bisect.bisect_left(anchors, dt, key=lambda a: a[0])
+        result = []
+        for t, goff in anchors[max(i - 1, 0):i + 1]:
+            gap = abs(dt - t)
+            if gap <= max_gap:
+                result.append((gap, goff))
+        return result
+
+
+def estimate(neighbors: list[tuple[datetime.timedelta, Goff]], max_gap: datetime.timedelta) -> TzInference | None:
+    if not neighbors:
+        return None
+    gap, goff = min(neighbors, key=lambda n: n[0])
+    confidence = 1 - gap / max_gap
+    if len(neighbors) > 1:  # anchors before and after
+        (_, before), (_, after) = neighbors
+        if before == after:
+            confidence = (1 + confidence) / 2  # between two anchors of the same zone
+        else:
+            confidence *= ZONE_CHANGE_FACTOR
+    return TzInference(goff=goff, confidence=confidence, gap=gap, same_device=True)
+
+
+def build_index(exifs: list[ExifClass]) -> dict[Device, AnchorIndex]:
+    index: dict[Device, AnchorIndex] = defaultdict(AnchorIndex)
+    for ex in exifs:
+        if is_anchor(ex):
+            index[None].add(ex)
+            if (device := device_of(ex)) is not None:
+                index[device].add(ex)
+    for anchors in index.values():
+        anchors.sort()
+    return index
+
+
+def infer_offsets(exifs: list[ExifClass], max_gap: datetime.timedelta = DEFAULT_MAX_GAP) -> list[TzInference | None]:
+    """
+    Infer the time offsets of files without one from the geotagged files near them in time.
+
+    Args:
+        exifs: The metadata of all the files
+        max_gap: Anchors further away in time are not used
+
+    Returns:
+        list[TzInference | None]: The inferred offset of each file, None for the files that have an offset
+            or have no anchors near them
+    """
+    index = build_index(exifs)
+    result: list[TzInference | None] = [None] * len(exifs)
+    if not index:
+        return result
+    for i, ex in enumerate(exifs):
+        if not needs_offset(ex):
+            continue
+        device = device_of(ex)
+        inference = None
+        if device is not None and device in index:
+            inference = estimate(index[device].neighbors(ex.dt, bool(ex.is_utc), max_gap), max_gap)
+        if inference is None:
+            inference = estimate(index[None].neighbors(ex.dt, bool(ex.is_utc), max_gap), max_gap)
+            if inference is not None and device is not None:
+                inference.same_device = False
+                inference.confidence *= OTHER_DEVICE_FACTOR
+        result[i] = inference
+    return result
+
+
+def apply_offset(ex: ExifClass, inference: TzInference) -> ExifClass:
+    """A copy of the metadata with the inferred offset (a UTC datetime is converted to local time)."""
+    # on creation, a UTC datetime with an offset is shifted to local time (see ExifClass.goff_form_loc)
+    return dataclasses.replace(ex, goff=inference.goff, goff_conf=round(inference.confidence, 3))
+
+
+def infer_timezones(exifs: list[ExifClass], max_gap: datetime.timedelta = DEFAULT_MAX_GAP,
+                    min_confidence: float = DEFAULT_MIN_CONFIDENCE) -> list[ExifClass]:
+    """
+    Fill in the time offsets of files without one (see infer_offsets).
+
+    Returns:
+        list[ExifClass]: The metadata of the files, copies with an offset where it was inferred
+            with at least min_confidence (the given objects are not modified)
+    """
+    result = []
+    for ex, inference in zip(exifs, infer_offsets(exifs, max_gap)):
+        if inference is not None and inference.confidence >= min_confidence:
+            logger.debug(f"Inferred the offset {inference.goff} of {ex} ({inference.confidence=:.2f})")
+            result.append(apply_offset(ex, inference))
+        else:
+            result.append(ex)
+    return result
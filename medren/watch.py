@@ -0,0 +1,266 @@
+import ctypes
+import ctypes.util
+import fnmatch
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from medren.consts import media_pattern
+from medren.pairing import pair_key
+from medren.renamer import Renamer
+
+logger = logging.getLogger(__name__)
+
+# inotify(7) event masks
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_ISDIR = 0x40000000
+IN_Q_OVERFLOW = 0x00004000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+_EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, len
+
+
+class Inotify:
+    """A minimal inotify binding (Linux only), reporting the paths of created, written and moved-in files."""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.dirs: dict[int, Path] = {}
+        self.overflow = False
+
+    def add_watch(self, directory: Path) -> None:
+        wd = self._add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f'inotify_add_watch failed for {directory}')
+        self.dirs[wd] = Path(directory)
+
+    def read(self, timeout: float) -> list[tuple[Path, bool]]:
+        """
+        Wait for events.
+
+        Returns:
+            list[tuple[Path, bool]]: The paths of the events and whether each one is a directory
+        """
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        pos = 0
+        while pos + _EVENT_HEADER.size <= len(data):
+            wd, mask, _cookie, name_len = _EVENT_HEADER.unpack_from(data, pos)
+            pos += _EVENT_HEADER.size
+            name = data[pos:pos + name_len].rstrip(b'\x00')
+            pos += name_len
+            if mask & IN_Q_OVERFLOW:
+                self.overflow = True
+            elif wd in self.dirs and name:
+                events.append((self.dirs[wd] / os.fsdecode(name), bool(mask & IN_ISDIR)))
+        return events
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+@dataclass
+class Watcher:
+    """
+    Watch directories and rename new files as they arrive.
+
+    New files are debounced until their size stays unchanged for `stable_secs`,
+    then only the new arrivals are extracted and renamed.
+    The names in use are kept per directory, so new names would not collide with existing files.
+    """
+    renamer: Renamer
+    roots: list[Path]
+    patterns: list[str] = field(default_factory=lambda: list(media_pattern))  # File patterns to watch
+    stable_secs: float = 2.0  # Time a file size should stay unchanged before it is processed
+    poll_interval: float = 1.0  # Time between checks of pending files (and directory scans when polling)
+    use_inotify: bool | None = None  # None picks inotify when available
+    logfile: Path | None = None  # CSV log of the renames
+    pending: dict[Path, tuple[int, float]] = field(default_factory=dict)  # path -> (size, time of last change)
+    taken: dict[Path, set[str]] = field(default_factory=dict)  # Names in use per directory
+    produced_secs: float = 60.0  # Time the events of a file created by our own renames are ignored
+    # Files created by our own renames (in the watched roots) -> the time their events are no longer ignored
+    produced: dict[Path, float] = field(default_factory=dict)
+    known: dict[Path, tuple[int, int]] = field(default_factory=dict)  # path -> (size, mtime), when polling
+
+    def __post_init__(self):
+        self.roots = [Path(r) for r in self.roots]
+        self.patterns = [p.lower() for p in self.patterns]
+        if self.use_inotify is None:
+            self.use_inotify = sys.platform.startswith('linux')
+
+    def is_watched(self, path: Path) -> bool:
+        name = path.name.lower()
+        return any(fnmatch.fnmatch(name, p) for p in self.patterns)
+
+    def iter_dirs(self) -> list[Path]:
+        dirs = []
+        for root in self.roots:
+            dirs.append(root)
+            if self.renamer.recursive:
+                dirs.extend(Path(d) for d, _, _ in os.walk(root) if Path(d) != root)
+        return dirs
+
+    def snapshot(self) -> None:
+        """Record the files that are already present, they are not treated as new arrivals."""
+        for directory in self.iter_dirs():
+            self.scan_dir(directory, initial=True)
+
+    def scan_dir(self, directory: Path, initial: bool = False) -> None:
+        names = self.taken.setdefault(directory, set())
+        try:
+            entries = list(os.scandir(directory))
+        except OSError as e:
+            logger.warning(f"Could not scan {directory}: {e}")
+            return
+        for entry in entries:
+            if not entry.is_file():
+                continue
+            path = Path(entry.path)
+            if initial:
+                names.add(entry.name)
+            st = entry.stat()
+            state = (st.st_size, st.st_mtime_ns)
+            if self.known.get(path) != state:
+                self.known[path] = state
+                if not initial:
+                    self.on_event(path)
+
+    def is_under_roots(self, path: Path) -> bool:
+        return any(path.is_relative_to(root) for root in self.roots)
+
+    def on_event(self, path: Path) -> None:
+        # a copy or move makes several events (create, modify, close), all of them are ignored
+        if self.produced.get(path, 0) > time.monotonic():
+            return
+        if not self.is_watched(path):
+            return
+        try:
+            size = path.stat().st_size
+        except OSError:
+            self.pending.pop(path, None)
+            return
+        self.pending[path] = (size, time.monotonic())
+
+    def collect_ready(self) -> list[Path]:
+        """Return the pending files whose size did not change for stable_secs."""
+        now = time.monotonic()
+        self.produced = {path: until for path, until in self.produced.items() if until > now}
+        ready, waiting_keys = [], set()
+        for path, (size, changed) in list(self.pending.items()):
+            try:
+                current = path.stat().st_size
+            except OSError:
+                del self.pending[path]
+                continue
+            if current != size:
+                self.pending[path] = (current, now)
+                waiting_keys.add(pair_key(path))
+            elif now - changed >= self.stable_secs:
+                ready.append(path)
+            else:
+                waiting_keys.add(pair_key(path))
+        # a Live Photo or RAW+JPEG member waits for the rest of its group
+        ready = [p for p in ready if pair_key(p) not in waiting_keys]
+        for path in ready:
+            del self.pending[path]
+        return ready
+
+    def process(self, paths: list[Path]) -> dict:
+        renames = self.renamer.generate_renames(paths, taken=self.taken)
+        for path in paths:
+            self.taken.setdefault(path.parent, set()).add(path.name)
+        moves = self.renamer.apply_rename(renames, logfile=self.logfile, append=True)
+        for org, new in moves.items():
+            org_path, new_path = Path(org), Path(new)
+            if self.renamer.transfer == 'move':
+                self.taken.setdefault(org_path.parent, set()).discard(org_path.name)
+                self.known.pop(org_path, None)
+            self.taken.setdefault(new_path.parent, set()).add(new_path.name)
+            if self.is_under_roots(new_path):
+                self.produced[new_path] = time.monotonic() + self.produced_secs
+            logger.info(f"Renamed {org_path} -> {new_path}")
+        # every arrival is processed once, the preview cache would only grow
+        self.renamer.cache.clear()
+        return renames
+
+    def open_inotify(self) -> Inotify | None:
+        """Watch the directories with inotify, None where it is not available (polling)."""
+        if not self.use_inotify:
+            return None
+        inotify = None
+        try:
+            inotify = Inotify()
+            for directory in self.iter_dirs():
+                inotify.add_watch(directory)
+        except (OSError, AttributeError) as e:
+            logger.warning(f"inotify is not available, falling back to polling: {e}")
+            if inotify:
+                inotify.close()
+            return None
+        return inotify
+
+    def read_events(self, inotify: Inotify) -> None:
+        """Handle the inotify events until the poll interval passes."""
+        for path, is_dir in inotify.read(timeout=self.poll_interval):
+            if not is_dir:
+                self.on_event(path)
+            elif self.renamer.recursive:
+                inotify.add_watch(path)
+                self.scan_dir(path)
+        if inotify.overflow:
+            # events were lost, find the new files by scanning
+            inotify.overflow = False
+            for directory in self.iter_dirs():
+                self.scan_dir(directory)
+
+    def poll(self, stop: threading.Event) -> None:
+        """Wait for the poll interval, then scan the directories."""
+        stop.wait(self.poll_interval)
+        for directory in self.iter_dirs():
+            self.scan_dir(directory)
+
+    def run(self, stop: threading.Event | None = None) -> None:
+        """
+        Watch until `stop` is set (or forever).
+
+        Args:
+            stop: An event to stop watching
+        """
+        stop = stop or threading.Event()
+        self.snapshot()
+        inotify = self.open_inotify()
+        logger.info(f"Watching {', '.join(str(r) for r in self.roots)} ({'inotify' if inotify else 'polling'})")
+        try:
+            while not stop.is_set():
+                if inotify:
+                    self.read_events(inotify)
+                else:
+                    self.poll(stop)
+                ready = self.collect_ready()
+                if ready:
+                    try:
+                        self.process(ready)
+                    except Exception as e:
+                        logger.error(f"Error processing {len(ready)} new files: {e}")
+        finally:
+            if inotify:
+                inotify.close()
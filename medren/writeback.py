@@ -0,0 +1,365 @@
+import base64
+import datetime
+import hashlib
+import json
+import logging
+import os
+import shutil
+import struct
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from enum import Enum
+from pathlib import Path
+from typing import BinaryIO
+
+import piexif
+
+from medren.backend_piexif import jpeg_exif_span
+from medren.exif_process import ExifClass, Goff
+from medren.fusion import FUSE_HEADER_BYTES
+
+logger = logging.getLogger(__name__)
+
+# Write the corrected datetime and offset of a file back into its Exif (DateTimeOriginal, OffsetTimeOriginal).
+# When the tags are already there with room for the new values, only their bytes are patched in place (also in TIFF
+# based raw files), so a library of 100k files is updated without re-encoding or copying any image data. Otherwise
+# the Exif segment of a JPEG is rebuilt (piexif) and the file is streamed to a temporary file next to it, which
+# replaces it atomically. Every change is first written to a journal (JSON lines): the old bytes of the patches or
+# the old segment, and the old times, then the fingerprint of the file after the change, so `undo` can restore
+# the files that did not change since.
+
+DATETIME_ORIGINAL = piexif.ExifIFD.DateTimeOriginal
+OFFSET_TIME_ORIGINAL = piexif.ExifIFD.OffsetTimeOriginal
+EXIF_IFD_POINTER = piexif.ImageIFD.ExifTag
+ASCII = 2  # The TIFF type of text values
+TIFF_MAGIC = 42
+TIFF_HEADER_SIZE = 8  # Byte order, magic and the offset of IFD0
+IFD_COUNT_SIZE = 2  # The entry count before the entries of an IFD
+IFD_ENTRY_SIZE = 12  # Tag, type, count and the value field
+IFD_VALUE_OFFSET = 8  # The value field within an entry
+IFD_VALUE_SIZE = 4  # Values up to this size are inline in the value field, the others are pointed to
+EXIF_DATETIME_FORMAT = '%Y:%m:%d %H:%M:%S'
+MAX_SEGMENT_PAYLOAD = 0xFFFF - 2  # The largest JPEG segment, without its length
+COPY_CHUNK = 8 * 1024 * 1024
+DEFAULT_WORKERS = 8
+
+TagSpan = tuple[int, int]  # The position of a tag value in the file, and its size in bytes
+
+
+class WriteStatus(Enum):
+    patched = 'patched'  # The tags were patched in place
+    rewritten = 'rewritten'  # The Exif segment was rebuilt, the file rewritten
+    retimed = 'retimed'  # Only the modification time was set
+    unchanged = 'unchanged'  # The file already has the values
+    unsupported = 'unsupported'  # Not a JPEG or TIFF based file, or a TIFF without room for the values
+    failed = 'failed'
+
+
+def format_offset(goff: Goff) -> str:
+    minutes = round(goff * 60)
+    sign = '-' if minutes < 0 else '+'
+    return f'{sign}{abs(minutes) // 60:02d}:{abs(minutes) % 60:02d}'
+
+
+def target_values(ex: ExifClass) -> dict[int, bytes]:
+    """The Exif values of the corrected metadata of a file (nothing for a UTC datetime without an offset)."""
+    if ex.dt is None or ex.is_utc:
+        return {}
+    values = {DATETIME_ORIGINAL: ex.dt.strftime(EXIF_DATETIME_FORMAT).encode()}
+    if ex.goff is not None:
+        values[OFFSET_TIME_ORIGINAL] = format_offset(ex.goff).encode()
+    return values
+
+
+def target_mtime_ns(ex: ExifClass) -> int | None:
+    """The modification time of the datetime of a file (the local time of this host if its offset is unknown)."""
+    if ex.dt is None:
+        return None
+    dt = ex.dt
+    if ex.is_utc:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+    elif ex.goff is not None:
+        dt = dt.replace(tzinfo=datetime.timezone(datetime.timedelta(hours=ex.goff)))
+    return round(dt.timestamp() * 1e9)
+
+
+def read_ifd(f: BinaryIO, tiff_start: int, offset: int, order: str) -> list[tuple[int, int, int, bytes, int]]:
+    """The entries of a TIFF IFD: tag, type, count, the raw value field, and the position of the field."""
+    f.seek(tiff_start + offset)
+    raw_count = f.read(IFD_COUNT_SIZE)
+    if len(raw_count) < IFD_COUNT_SIZE:
+        raise ValueError('Truncated IFD')
+    count = struct.unpack(order + 'H', raw_count)[0]
+    data = f.read(IFD_ENTRY_SIZE * count)
+    if len(data) < IFD_ENTRY_SIZE * count:
+        raise ValueError('Truncated IFD')
+    entries = []
+    for i in range(count):
+        entry = IFD_ENTRY_SIZE * i
+        tag, typ, n = struct.unpack_from(order + 'HHI', data, entry)
+        value = entry + IFD_VALUE_OFFSET
+        entries.append((tag, typ, n, data[value:value + IFD_VALUE_SIZE],
+                        tiff_start + offset + IFD_COUNT_SIZE + value))
+    return entries
+
+
+def exif_tags(f: BinaryIO, tiff_start: int) -> dict[int, TagSpan]:
+    """
+    Find the text tags of the Exif IFD of a TIFF structure.
+
+    Args:
+        f: The file
+        tiff_start: The position of the TIFF header in the file (after 'Exif\\0\\0' in a JPEG)
+
+    Returns:
+        dict[int, TagSpan]: The position and size of the value of each text tag
+    """
+    f.seek(tiff_start)
+    header = f.read(TIFF_HEADER_SIZE)
+    order = {b'II': '<', b'MM': '>'}.get(header[:2])
+    if order is None or len(header) < TIFF_HEADER_SIZE or struct.unpack(order + 'H', header[2:4])[0] != TIFF_MAGIC:
+        raise ValueError('Not a TIFF structure')
+    ifd0 = struct.unpack(order + 'I', header[4:8])[0]
+    pointer = next((raw for tag, _typ, _n, raw, _pos in read_ifd(f, tiff_start, ifd0, order)
+                    if tag == EXIF_IFD_POINTER), None)
+    if pointer is None:
+        return {}
+    tags = {}
+    for tag, typ, n, raw, pos in read_ifd(f, tiff_start, struct.unpack(order + 'I', pointer)[0], order):
+        if typ == ASCII:
+            tags[tag] = (pos if n <= IFD_VALUE_SIZE else tiff_start + struct.unpack(order + 'I', raw)[0], n)
+    return tags
+
+
+def exif_payload(payload: bytes, values: dict[int, bytes]) -> bytes:
+    """An Exif segment payload with the values set, built from the current payload (empty if there is none)."""
+    exif_dict = piexif.load(payload) if payload else {'0th': {}, 'Exif': {}, 'GPS': {}, '1st': {}, 'thumbnail': None}
+    exif_dict['Exif'].update(values)
+    return piexif.dump(exif_dict)
+
+
+def app1_segment(payload: bytes) -> bytes:
+    if len(payload) > MAX_SEGMENT_PAYLOAD:
+        raise ValueError(f'The Exif segment is too large ({len(payload)} bytes)')
+    return b'\xff\xe1' + struct.pack('>H', len(payload) + 2) + payload
+
+
+def splice(path: Path, start: int, end: int, data: bytes) -> None:
+    """Replace the bytes start:end of a file by streaming it to a temporary file that then replaces it."""
+    tmp = path.with_name(f'.{path.name}.medren-tmp')
+    try:
+        with open(path, 'rb') as src, open(tmp, 'xb') as dst:
+            dst.write(src.read(start))
+            dst.write(data)
+            src.seek(end)
+            shutil.copyfileobj(src, dst, COPY_CHUNK)
+            dst.flush()
+            os.fsync(dst.fileno())
+        shutil.copymode(path, tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+class Journal:
+    """
+    The journal of a write-back, for undo (JSON lines, appended).
+
+    The entry of a file is written and synced before the file is changed: its old times, and the old bytes of
+    the patches ('patch') or the old Exif segment and the span of the new one ('rewrite'). A 'done' entry with
+    the fingerprint of the file follows the change.
+    """
+
+    def __init__(self, filename: Path | str):
+        self.filename = Path(filename)
+        self.filename.parent.mkdir(parents=True, exist_ok=True)
+        self.f = open(self.filename, 'a', encoding='utf-8')
+        self.lock = threading.Lock()
+
+    def write(self, entry: dict) -> None:
+        with self.lock:
+            self.f.write(json.dumps(entry) + '\n')
+            self.f.flush()
+            os.fsync(self.f.fileno())
+
+    def done(self, path: Path) -> None:
+        st = os.stat(path)
+        self.write({'path': str(path), 'done': True, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns})
+
+    def close(self) -> None:
+        self.f.close()
+
+    def __enter__(self) -> 'Journal':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def write_back(path: Path | str, ex: ExifClass, journal: Journal, set_mtime: bool = False) -> WriteStatus:
+    """
+    Write the datetime and offset of a file into its Exif, patching the tags in place when they have room.
+
+    Args:
+        path: The file
+        ex: Its corrected metadata
+        journal: The journal of the changes
+        set_mtime: Whether to also set the modification time of the file to its datetime
+
+    Returns:
+        WriteStatus: What was done
+    """
+    path = Path(path)
+    values = target_values(ex)
+    st = os.stat(path)
+    mtime_ns = target_mtime_ns(ex) if set_mtime else None
+    retime = mtime_ns is not None and mtime_ns != st.st_mtime_ns
+    times = {'atime_ns': st.st_atime_ns, 'mtime_ns': st.st_mtime_ns}
+    if not values and not retime:
+        return WriteStatus.unchanged
+    with open(path, 'r+b') as f:
+        head = f.read(FUSE_HEADER_BYTES)
+        if head[:2] == b'\xff\xd8':
+            span = jpeg_exif_span(head)
+            tags = exif_tags(f, span[0] + 6) if span is not None else {}
+        elif head[:4] in (b'II*\x00', b'MM\x00*'):
+            span = None
+            tags = exif_tags(f, 0)
+        else:
+            return WriteStatus.unsupported
+        patches = []
+        fits = True
+        for tag, value in values.items():
+            pos, size = tags.get(tag, (None, 0))
+            if size < len(value) + 1:
+                fits = False  # the tag is missing or too short
+                break
+            f.seek(pos)
+            old = f.read(size)
+            if old != value.ljust(size, b'\0'):
+                patches.append((pos, old, value.ljust(size, b'\0')))
+        if fits:
+            if not patches and not retime:
+                return WriteStatus.unchanged
+            journal.write({'path': str(path), 'op': 'patch', **times,
+                           'patches': [[pos, old.hex()] for pos, old, _new in patches]})
+            for pos, _old, new in patches:
+                f.seek(pos)
+                f.write(new)
+            f.flush()
+            os.fsync(f.fileno())
+    if fits:
+        status = WriteStatus.patched if patches else WriteStatus.retimed
+    elif head[:2] != b'\xff\xd8':
+        return WriteStatus.unsupported  # TIFF structures are only patched
+    else:
+        start, end = (span[0] - 4, span[1]) if span is not None else (2, 2)  # a new segment goes after SOI
+        segment = app1_segment(exif_payload(head[span[0]:span[1]] if span is not None else b'', values))
+        journal.write({'path': str(path), 'op': 'rewrite', **times, 'start': start, 'length': len(segment),
+                       'sha256': hashlib.sha256(segment).hexdigest(),
+                       'segment': base64.b64encode(head[start:end]).decode()})
+        splice(path, start, end, segment)
+        status = WriteStatus.rewritten
+    # keep the modification time, unless it is set to the datetime
+    os.utime(path, ns=(st.st_atime_ns, mtime_ns if mtime_ns is not None else st.st_mtime_ns))
+    journal.done(path)
+    return status
+
+
+def write_back_many(items: list[tuple[Path, ExifClass]], journal_path: Path | str, workers: int = DEFAULT_WORKERS,
+                    set_mtime: bool = False) -> Counter:
+    """
+    Write back the metadata of many files in parallel (see write_back).
+
+    Args:
+        items: The files and their corrected metadata
+        journal_path: The journal of the changes, for undo
+        workers: Files written at the same time
+        set_mtime: Whether to also set the modification times of the files to their datetimes
+
+    Returns:
+        Counter: The number of files per WriteStatus
+    """
+    counts = Counter()
+    with Journal(journal_path) as journal, ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(write_back, path, ex, journal, set_mtime): path for path, ex in items}
+        for future in as_completed(futures):
+            try:
+                status = future.result()
+            except Exception as e:
+                logger.warning(f"Could not write the metadata of {futures[future]}: {e}")
+                status = WriteStatus.failed
+            counts[status] += 1
+    return counts
+
+
+def read_journal(journal_path: Path | str) -> list[tuple[dict, dict | None]]:
+    """The entries of a journal paired with their 'done' entries (None if the change may not have completed)."""
+    entries: list[tuple[dict, dict | None]] = []
+    pending: dict[str, int] = {}
+    with open(journal_path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if entry.get('done'):
+                if (i := pending.pop(entry['path'], None)) is not None:
+                    entries[i] = (entries[i][0], entry)
+            else:
+                pending[entry['path']] = len(entries)
+                entries.append((entry, None))
+    return entries
+
+
+def holds_segment(path: Path, entry: dict) -> bool:
+    """Check if a file holds the new segment of a 'rewrite' entry at its span."""
+    if 'sha256' not in entry:
+        return False
+    with open(path, 'rb') as f:
+        f.seek(entry['start'])
+        data = f.read(entry['length'])
+    return len(data) == entry['length'] and hashlib.sha256(data).hexdigest() == entry['sha256']
+
+
+def undo(journal_path: Path | str) -> Counter:
+    """
+    Restore the files changed by a write-back, the last changes first.
+
+    Files that changed since (by their size and modification time) are skipped, and so are rewrites
+    that may not have happened (no 'done' entry) unless the file holds the new segment.
+
+    Returns:
+        Counter: The number of files restored ('restored'), and skipped ('changed', 'missing', 'incomplete')
+    """
+    counts = Counter()
+    for entry, done in reversed(read_journal(journal_path)):
+        path = Path(entry['path'])
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            counts['missing'] += 1
+            continue
+        if done is not None and (st.st_size, st.st_mtime_ns) != (done['size'], done['mtime_ns']):
+            logger.warning(f"Not restoring {path}, it changed since it was written")
+            counts['changed'] += 1
+            continue
+        if entry['op'] == 'patch':
+            with open(path, 'r+b') as f:
+                for pos, old in entry['patches']:
+                    f.seek(pos)
+                    f.write(bytes.fromhex(old))
+        else:
+            if not holds_segment(path, entry):
+                if done is None:
+                    logger.info(f"Not restoring {path}, it was not rewritten")
+                    counts['incomplete'] += 1
+                else:
+                    logger.warning(f"Not restoring {path}, it changed since it was written")
+                    counts['changed'] += 1
+                continue
+            splice(path, entry['start'], entry['start'] + entry['length'], base64.b64decode(entry['segment']))
+        os.utime(path, ns=(entry['atime_ns'], entry['mtime_ns']))
+        counts['restored'] += 1
+    return counts
@@ -0,0 +1,26 @@
+import struct
+
+import piexif
+
+# Minimal synthetic media files for the tests
+
+
+def make_exif(dt: str = '2020:04:24 12:07:46', offset: str | None = None,
+              make: str | None = None, model: str | None = None, thumbnail: bytes | None = None) -> bytes:
+    exif_ifd = {piexif.ExifIFD.DateTimeOriginal: dt.encode()}
+    if offset:
+        exif_ifd[piexif.ExifIFD.OffsetTimeOriginal] = offset.encode()
+    zeroth = {}
+    if make:
+        zeroth[piexif.ImageIFD.Make] = make.encode()
+    if model:
+        zeroth[piexif.ImageIFD.Model] = model.encode()
+    if thumbnail:
+        return piexif.dump({'0th': zeroth, 'Exif': exif_ifd, '1st': {}, 'thumbnail': thumbnail})
+    return piexif.dump({'0th': zeroth, 'Exif': exif_ifd})  # b'Exif\x00\x00' + TIFF
+
+
+def make_jpeg(dt: str = '2020:04:24 12:07:46', **kwargs) -> bytes:
+    exif = make_exif(dt, **kwargs)
+    app1 = b'\xff\xe1' + struct.pack('>H', len(exif) + 2) + exif
+    return b'\xff\xd8' + app1 + b'\xff\xda\x00\x02' + b'\x00' * 16 + b'\xff\xd9'
@@ -0,0 +1,86 @@
+import datetime
+import io
+import json
+import tarfile
+import zipfile
+from pathlib import Path
+
+from media_samples import make_jpeg
+from test_isobmff import box, make_mov
+
+from medren.archive import SequentialReader, split_member_path
+from medren.backend_takeout import takeout_sidecar_names
+from medren.plan import read_plan, write_plan
+from medren.renamer import Renamer
+
+TAKEOUT = {'title': 'IMG_0002.png', 'photoTakenTime': {'timestamp': '1588320000'},
+           'geoData': {'latitude': 0.0, 'longitude': 0.0}}
+
+
+def make_zip(path: Path) -> None:
+    with zipfile.ZipFile(path, 'w') as zf:
+        zf.writestr('Takeout/Google Photos/IMG_0001.jpg', make_jpeg('2020:01:01 10:00:00', make='Canon'))
+        zf.writestr('Takeout/Google Photos/IMG_0002.png', b'\x89PNG no metadata')
+        zf.writestr('Takeout/Google Photos/IMG_0002.png.supplemental-metadata.json', json.dumps(TAKEOUT))
+        zf.writestr('Takeout/Google Photos/notes.txt', b'nothing')
+
+
+def make_tgz(path: Path) -> None:
+    mov = make_mov(datetime.datetime(2020, 4, 24, 9, 7, 46), '+32.5703+034.9415/')
+    mov = mov[:20] + box(b'mdat', b'\x00' * 3_000_000) + mov[20:]  # the moov box after a large mdat
+    with tarfile.open(path, 'w:gz') as tf:
+        for name, data in [('DCIM/VID_0001.mov', mov), ('DCIM/IMG_0003.jpg', make_jpeg('2021:06:01 08:00:00'))]:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+
+
+def test_archive_preview_and_extract(tmp_path: Path):
+    make_zip(tmp_path / 'takeout.zip')
+    make_tgz(tmp_path / 'backup.tgz')
+    dest = tmp_path / 'library'
+    renamer = Renamer(template='{year}/{datetime}{ext}', dest_root=dest, archives=True)
+    renames = renamer.generate_renames([tmp_path], resolve_names=True)
+    names = {str(Path(org).relative_to(tmp_path)): Path(new).relative_to(dest).as_posix()
+             for org, (new, _ex) in renames.items()}
+    assert names == {
+        'takeout.zip/Takeout/Google Photos/IMG_0001.jpg': '2020/2020-01-01-10-00-00.jpg',
+        'takeout.zip/Takeout/Google Photos/IMG_0002.png': '2020/2020-05-01-08-00-00.png',  # Takeout time, UTC
+        'backup.tgz/DCIM/VID_0001.mov': '2020/2020-04-24-12-07-46.mov',
+        'backup.tgz/DCIM/IMG_0003.jpg': '2021/2021-06-01-08-00-00.jpg',
+    }
+
+    write_plan(tmp_path / 'plan.jsonl', renames)
+    _header, entries = read_plan(tmp_path / 'plan.jsonl')
+    moves = renamer.apply_rename(entries)
+    assert len(moves) == 4
+    assert (dest / '2021' / '2021-06-01-08-00-00.jpg').read_bytes() == make_jpeg('2021:06:01 08:00:00')
+    assert (dest / '2020' / '2020-04-24-12-07-46.mov').stat().st_size > 3_000_000
+    assert (tmp_path / 'takeout.zip').is_file()
+
+
+def test_split_member_path(tmp_path: Path):
+    make_zip(tmp_path / 'takeout.zip')
+    assert split_member_path(tmp_path / 'takeout.zip' / 'a' / 'b.jpg') == (tmp_path / 'takeout.zip', 'a/b.jpg')
+    assert split_member_path(tmp_path / 'photos' / 'b.jpg') is None
+
+
+def test_sequential_reader():
+    data = bytes(range(256)) * 100
+    f = SequentialReader(io.BytesIO(data), size=len(data), head=1000, window=2000)
+    f.seek(10_000)
+    assert f.read(10) == data[10_000:10_010]
+    f.seek(9_000)
+    assert f.read(10) == data[9_000:9_010]  # within the window
+    f.seek(0)
+    assert f.read(100) == data[:100]  # within the head
+    f.seek(-5, 2)
+    assert f.read() == data[-5:]
+
+
+def test_takeout_sidecar_names():
+    assert 'IMG_0001.jpg.json' in takeout_sidecar_names('IMG_0001.jpg')
+    assert 'IMG_0001.jpg(1).json' in takeout_sidecar_names('IMG_0001(1).jpg')
+    assert 'IMG_0001.jpg.supplemental-metadata.json' in takeout_sidecar_names('IMG_0001-edited.jpg')
+    long = 'a' * 60 + '.jpg'
+    assert 'a' * 46 + '.json' in takeout_sidecar_names(long)
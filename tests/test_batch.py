@@ -0,0 +1,71 @@
+import logging
+from pathlib import Path
+
+from medren import backends, renamer, report
+from medren.backends import Backend, extract_ffmpeg_batch, extract_pymediainfo_batch
+from medren.exif_process import ExifClass
+from medren.renamer import Renamer
+from medren.report import OutcomeReport
+
+logger = logging.getLogger(__name__)
+
+
+def test_pymediainfo_batch_maps_every_path(tmp_path: Path):
+    paths = [tmp_path / f'{i}.mp4' for i in range(5)]
+    for path in paths:
+        path.write_bytes(b'not a video')
+    results = extract_pymediainfo_batch(paths, logger, workers=2, chunk_size=2)
+    assert set(results) == set(paths)
+    assert all(ex is None for ex in results.values())
+
+
+def test_ffmpeg_batch_warnings_reach_the_report(tmp_path: Path, monkeypatch):
+    paths = [tmp_path / f'{i}.mp4' for i in range(6)]
+
+    def probe(path, logger):
+        report.warn(logger, 'offset_mismatch', f'Offset mismatch in {path}')
+
+    monkeypatch.setattr(backends, 'extract_ffmpeg', probe)
+    outcomes = OutcomeReport()
+    with outcomes.activate():
+        extract_ffmpeg_batch(paths, logger, workers=3, chunk_size=2)
+    assert outcomes.warnings['offset_mismatch'] == len(paths)
+
+
+def test_fetch_meta_batch_keeps_backend_priority(tmp_path: Path, monkeypatch):
+    paths = [tmp_path / f'{i}.mp4' for i in range(4)]
+    for path in paths:
+        path.write_bytes(b'')
+    calls = []
+
+    def first(path, logger):
+        calls.append(('first', Path(path).name))
+        return ExifClass(ext='.mp4', backend='first') if Path(path).stem == '0' else None
+
+    def second_batch(paths, logger, workers):
+        calls.append(('second', len(paths)))
+        return {p: ExifClass(ext='.mp4', backend='second') for p in paths}
+
+    monkeypatch.setitem(backends.backend_support, 'first', Backend('first', 'first', None, first, []))
+    monkeypatch.setitem(backends.backend_support, 'second',
+                        Backend('second', 'second', None, lambda p, logger: None, [], batch_func=second_batch))
+    monkeypatch.setattr(renamer, 'available_backends', ['first', 'second'])
+    results = Renamer(backends=['first', 'second'], batch_workers=2).fetch_meta_batch(paths)
+    assert results[paths[0]].backend == 'first'
+    assert all(results[p].backend == 'second' for p in paths[1:])
+    assert ('second', 3) in calls
+
+
+def test_pymediainfo_pool_is_reused(tmp_path: Path):
+    paths = [tmp_path / f'{i}.mp4' for i in range(3)]
+    for path in paths:
+        path.write_bytes(b'not a video')
+    try:
+        extract_pymediainfo_batch(paths, logger, workers=2)
+        pool = backends.pymediainfo_pool(2)
+        assert extract_pymediainfo_batch(paths, logger, workers=1) == dict.fromkeys(paths)
+        assert backends.pymediainfo_pool(1) is pool
+        assert backends.pymediainfo_pool(3) is not pool  # more workers replace it
+    finally:
+        backends.shutdown_pymediainfo_pool()
+    assert backends.pymediainfo_workers.pool is None
@@ -0,0 +1,48 @@
+import json
+from pathlib import Path
+
+from media_samples import make_jpeg
+
+from medren import profiles
+from medren.backends import available_backends
+from medren.calibrate import Calibration, CalibrationStat, calibrate, sample_files, save_backend_order
+from medren.renamer import Renamer
+
+
+def test_order():
+    calibration = Calibration()
+    calibration.stats['.jpg']['slow'] = CalibrationStat(calls=10, ok=10, seconds=1.0, completeness=5)
+    calibration.stats['.jpg']['fast'] = CalibrationStat(calls=10, ok=10, seconds=0.1, completeness=3)
+    calibration.stats['.jpg']['flaky'] = CalibrationStat(calls=10, ok=1, seconds=0.05, completeness=1)
+    calibration.stats['.jpg']['broken'] = CalibrationStat(calls=10, ok=0, seconds=0.01)
+    assert calibration.order() == {'.jpg': ['fast', 'flaky', 'slow', 'broken']}
+    assert 'fast: 10/10 ok, 10.0ms, 30% complete' in calibration.summary()
+
+
+def test_calibrate(tmp_path: Path, monkeypatch):
+    for i in range(5):
+        (tmp_path / f'IMG_{i}.jpg').write_bytes(make_jpeg(f'2020:01:0{i + 1} 10:00:00', make='Canon'))
+    (tmp_path / 'notes.txt').write_text('no metadata')
+    paths = list(tmp_path.iterdir())
+    assert {ext: len(files) for ext, files in sample_files(paths, per_ext=3).items()} == {'.jpg': 3, '.txt': 1}
+
+    calibration = calibrate(paths, per_ext=3)
+    order = calibration.order()
+    assert set(order['.jpg']) <= set(available_backends)
+    best = calibration.stats['.jpg'][order['.jpg'][0]]
+    assert best.calls == 3 and best.success_rate == 1
+
+    # the order is merged into the profile, older profile files without it still load
+    monkeypatch.setattr(profiles, 'PROFILES_DIR', tmp_path)
+    (tmp_path / 'old.json').write_text(json.dumps({'template': '{datetime}{ext}'}))
+    assert profiles.load_profile('old') == {'template': '{datetime}{ext}'}
+    save_backend_order('old', {'.png': ['pillow']})
+    save_backend_order('old', order)
+    assert profiles.load_profile('old')['backend_order'] == {'.png': ['pillow'], **order}
+
+
+def test_backends_for():
+    backends = available_backends[:2]
+    renamer = Renamer(backends=backends, backend_order={'.jpg': [*reversed(backends), 'unknown']})
+    jpg = renamer.backends_for('.jpg')
+    assert jpg == [b for b in reversed(backends) if b in Renamer(backends=backends).backends_for('.jpg')]
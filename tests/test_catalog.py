@@ -0,0 +1,75 @@
+import datetime
+from pathlib import Path
+
+from media_samples import make_jpeg
+
+from medren.catalog import Catalog, haversine_km
+from medren.exif_process import ExifClass
+from medren.renamer import Renamer
+
+
+def make_ex(dt: str, make: str, model: str, lat: float | None = None, lon: float | None = None) -> ExifClass:
+    return ExifClass(ext='.jpg', backend='test', dt=datetime.datetime.fromisoformat(dt), make=make, model=model,
+                     lat=lat, lon=lon)
+
+
+def test_query(tmp_path: Path):
+    with Catalog(tmp_path / 'catalog.sqlite') as catalog:
+        catalog.add([
+            (tmp_path / 'a.jpg', make_ex('2024-03-02 10:00:00', 'Google', 'Pixel 7', 32.08, 34.78), None, None),
+            (tmp_path / 'b.jpg', make_ex('2024-03-20 10:00:00', 'Google', 'Pixel 8', 32.10, 34.80), None, 'abc'),
+            (tmp_path / 'c.jpg', make_ex('2024-03-21 10:00:00', 'Google', 'Pixel 8', 31.77, 35.21), None, None),
+            (tmp_path / 'd.jpg', make_ex('2024-04-01 10:00:00', 'Google', 'Pixel 8', 32.08, 34.78), None, None),
+            (tmp_path / 'e.jpg', make_ex('2024-03-05 10:00:00', 'Apple', 'iPhone 15'), None, None),
+        ])
+        assert catalog.count() == 5
+        rows = catalog.query(model='pixel', start=datetime.date(2024, 3, 1), end='2024-04-01',
+                             near=(32.08, 34.78), radius_km=5)
+        assert [r.path.name for r in rows] == ['a.jpg', 'b.jpg']
+        assert rows[0].distance_km == 0
+        assert rows[1].distance_km == haversine_km(32.08, 34.78, 32.10, 34.80)
+        assert [r.path.name for r in catalog.query(make='apple')] == ['e.jpg']
+        assert [r.path.name for r in catalog.query(sha256='abc')] == ['b.jpg']
+        assert catalog.query(make='apple')[0].exif.dt == datetime.datetime(2024, 3, 5, 10)
+
+
+def test_preview_fills_catalog(tmp_path: Path):
+    (tmp_path / 'IMG_1.jpg').write_bytes(make_jpeg('2020:01:01 10:00:00', make='Canon', model='EOS R5'))
+    (tmp_path / 'IMG_2.jpg').write_bytes(make_jpeg('2020:01:02 10:00:00', make='Canon', model='EOS R5'))
+    (tmp_path / 'IMG_2.xmp').write_text('<x:xmpmeta/>')
+    catalog = Catalog(tmp_path / 'catalog.sqlite')
+    renamer = Renamer(template='{datetime}{ext}', catalog=catalog)
+    renames = renamer.generate_renames([tmp_path], resolve_names=True)
+    assert len(renames) == 3
+    rows = catalog.query(model='eos')
+    assert {r.path for r in rows} == set(renamer.extracted)  # a row per primary file, the sidecar has none
+    assert all(r.exif.ext == '.jpg' for r in rows)
+    del renames[tmp_path / 'IMG_2.xmp']
+    assert {r.new_name for r in rows} == {'2020-01-01-10-00-00.jpg', '2020-01-02-10-00-00.jpg'}
+
+    # renames from the catalog match the renames from the files
+    assert Renamer(template='{datetime}{ext}').generate_renames_from_catalog(rows) == renames
+
+    renamer.apply_rename(renames)
+    assert {r.path.name for r in catalog.query()} == {'2020-01-01-10-00-00.jpg', '2020-01-02-10-00-00.jpg'}
+    catalog.close()
+
+
+def test_moved_many(tmp_path: Path):
+    # more renames than SQLite host parameters
+    count = 40000
+    with Catalog(tmp_path / 'catalog.sqlite') as catalog:
+        ex = make_ex('2024-03-02 10:00:00', 'Google', 'Pixel 7')
+        catalog.add((tmp_path / f'{i}.jpg', ex, None, None) for i in range(count))
+        catalog.moved({str(tmp_path / f'{i}.jpg'): str(tmp_path / f'new_{i}.jpg') for i in range(count)})
+        assert catalog.count() == count
+        assert {r.path.name for r in catalog.query(limit=2)} <= {f'new_{i}.jpg' for i in range(count)}
+
+
+def test_moved_chain(tmp_path: Path):
+    with Catalog(tmp_path / 'catalog.sqlite') as catalog:
+        catalog.add([(tmp_path / 'a.jpg', make_ex('2024-03-02 10:00:00', 'Google', 'Pixel 7'), None, None),
+                     (tmp_path / 'b.jpg', make_ex('2024-03-03 10:00:00', 'Apple', 'iPhone 15'), None, None)])
+        catalog.moved({str(tmp_path / 'b.jpg'): str(tmp_path / 'c.jpg'),
+                       str(tmp_path / 'a.jpg'): str(tmp_path / 'b.jpg')})
+        assert {r.path.name: r.exif.make for r in catalog.query()} == {'b.jpg': 'Google', 'c.jpg': 'Apple'}
@@ -0,0 +1,73 @@
+import datetime
+
+import numpy as np
+
+from medren.clock_skew import apply_skews, estimate_skews
+from medren.exif_process import ExifClass
+from medren.pairing import PairGroup
+from medren.renamer import Renamer
+
+START = datetime.datetime(2024, 6, 1, 14, 0)
+
+
+def shots(seconds: list[float], make: str, model: str) -> list[ExifClass]:
+    return [ExifClass(ext='.jpg', backend='exifread', dt=START + datetime.timedelta(seconds=s), make=make,
+                      model=model) for s in seconds]
+
+
+def event(seed: int = 0) -> tuple[list[ExifClass], list[ExifClass]]:
+    # two cameras shooting the same moments of an event, the second clock 7 minutes and 13 seconds behind
+    rng = np.random.default_rng(seed)
+    moments = np.sort(rng.uniform(0, 4 * 3600, 60))
+    phone = shots(list(moments) + list(rng.uniform(0, 4 * 3600, 20)), 'Google', 'Pixel 8')
+    camera = shots(list(moments[::2] - 433 + rng.normal(0, 2, 30)), 'Canon', 'EOS R5')
+    return phone, camera
+
+
+def test_estimate_histogram_skew():
+    phone, camera = event()
+    skews = estimate_skews(phone + camera)
+    assert list(skews) == ['Canon EOS R5']
+    skew = skews['Canon EOS R5']
+    assert abs(skew.offset.total_seconds() - 433) <= 3
+    assert skew.method == 'histogram' and skew.score > 0.8
+
+    corrected = apply_skews(camera, skews)
+    assert corrected[0].dt == camera[0].dt + skew.offset
+    assert camera[0].dt == corrected[0].dt - skew.offset  # the given objects are kept
+
+
+def test_unrelated_devices_are_not_aligned():
+    rng = np.random.default_rng(1)
+    phone = shots(list(rng.uniform(0, 4 * 3600, 80)), 'Google', 'Pixel 8')
+    camera = shots(list(rng.uniform(0, 4 * 3600, 30)), 'Canon', 'EOS R5')
+    assert estimate_skews(phone + camera) == {}
+
+
+def test_pairs_and_reference():
+    phone, camera = event()
+    # the phone shot 2k and the camera shot k are of the same moment
+    pairs = [(2 * k, len(phone) + k) for k in range(4)]
+    skews = estimate_skews(phone + camera, reference='Canon EOS R5', pairs=pairs)
+    assert skews['Google Pixel 8'].method == 'pairs'
+    assert abs(skews['Google Pixel 8'].offset.total_seconds() + 433) <= 8
+
+
+def test_few_or_disagreeing_pairs_use_the_histogram():
+    phone, camera = event()
+    look_alike = [(1, len(phone))]  # a single pair of different moments
+    scattered = [(2 * k + 1, len(phone) + k) for k in range(4)]
+    for pairs in (look_alike, scattered):
+        skew = estimate_skews(phone + camera, pairs=pairs)['Canon EOS R5']
+        assert skew.method == 'histogram'
+        assert abs(skew.offset.total_seconds() - 433) <= 3
+
+
+def test_renamer_orders_corrected_times(tmp_path):
+    phone, camera = event()
+    items = [(PairGroup(primary=tmp_path / f'{i}.jpg'), ex) for i, ex in enumerate(phone + camera)]
+    renamer = Renamer(align_clocks=True)
+    items = renamer.correct_clock_skews(sorted(items, key=lambda x: x[1].dt))
+    assert list(renamer.clock_skews) == ['Canon EOS R5']
+    dts = [ex.dt for _group, ex in items]
+    assert dts == sorted(dts)
@@ -0,0 +1,93 @@
+import csv
+import threading
+import time
+from pathlib import Path
+
+import pytest
+from media_samples import make_jpeg
+
+from medren import renamer as renamer_module
+from medren.concurrency import AdaptiveScheduler, AimdLimit
+from medren.renamer import Renamer
+
+
+def test_aimd_limit():
+    limit = AimdLimit(ceiling=4, limit=1)
+    for _ in range(10):
+        limit.in_flight += 1
+        limit.done(0.01)
+    assert limit.capacity == 4  # grows by one per steady window, up to the ceiling
+    for _ in range(4):
+        limit.in_flight += 1
+        limit.done(0.1)  # congested
+    assert limit.capacity == 2
+    for _ in range(2):
+        limit.in_flight += 1
+        limit.done(0.01, ok=False)
+    assert limit.capacity == 1 and limit.errors == 2
+
+
+def test_scheduler_ceiling(tmp_path: Path):
+    (tmp_path / 'nas').mkdir()
+    scheduler = AdaptiveScheduler(ceilings={str(tmp_path / 'nas'): 3})
+    lock = threading.Lock()
+    running, most = 0, 0
+
+    def work(path: Path) -> str:
+        nonlocal running, most
+        with lock:
+            running += 1
+            most = max(most, running)
+        time.sleep(0.002)
+        with lock:
+            running -= 1
+        return path.name
+
+    paths = [tmp_path / 'nas' / f'{i}.jpg' for i in range(60)]
+    assert scheduler.map(work, paths) == [p.name for p in paths]  # in the order of the items
+    assert 1 < most <= 3
+    assert scheduler.root_of(paths[0]) == str(tmp_path / 'nas')
+    assert scheduler.limits[str(tmp_path / 'nas')].completed == 60
+
+
+def test_scheduler_error(tmp_path: Path):
+    def work(i: int) -> int:
+        if i == 5:
+            raise ValueError(i)
+        return i
+
+    with pytest.raises(ValueError):
+        AdaptiveScheduler().map(work, range(10), path_of=lambda i: tmp_path / f'{i}.jpg')
+
+
+def test_adaptive_renamer(tmp_path: Path):
+    for i in range(8):
+        (tmp_path / f'IMG_{i}.jpg').write_bytes(make_jpeg(f'2020:01:01 10:00:0{i}'))
+    renamer = Renamer(adaptive=True, template='{datetime}{ext}')
+    renames = renamer.generate_renames([tmp_path], resolve_names=True)
+    assert len(renames) == 8
+    moves = renamer.apply_rename(renames)
+    assert len(moves) == 8
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(new_name for new_name, _ex in renames.values())
+
+
+def test_adaptive_rename_error_keeps_the_log(tmp_path: Path, monkeypatch):
+    for i in range(8):
+        (tmp_path / f'IMG_{i}.jpg').write_bytes(make_jpeg(f'2020:01:01 10:00:0{i}'))
+    renamer = Renamer(adaptive=True, template='{datetime}{ext}')
+    renames = renamer.generate_renames([tmp_path], resolve_names=True)
+    transfer = renamer_module.transfer
+
+    def failing_transfer(src, dst, *args, **kwargs):
+        if src.name == 'IMG_3.jpg':
+            raise PermissionError(src)
+        return transfer(src, dst, *args, **kwargs)
+
+    monkeypatch.setattr(renamer_module, 'transfer', failing_transfer)
+    with pytest.raises(PermissionError):
+        renamer.apply_rename(renames, logfile=tmp_path / 'log' / 'renames.csv')
+    with open(tmp_path / 'log' / 'renames.csv', newline='') as f:
+        logged = {row['Original'] for row in csv.DictReader(f)}
+    # every file moved by the other workers is logged
+    assert logged == {str(tmp_path / f'IMG_{i}.jpg') for i in range(8) if i != 3}
+    assert not any((tmp_path / f'IMG_{i}.jpg').exists() for i in range(8) if i != 3)
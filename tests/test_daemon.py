@@ -0,0 +1,62 @@
+import threading
+from pathlib import Path
+
+import pytest
+from media_samples import make_jpeg
+
+from medren.daemon import Daemon, DaemonError, request
+
+
+@pytest.fixture
+def daemon(tmp_path: Path):
+    daemon = Daemon(socket_path=tmp_path / 'medren.sock', jobs=2)
+    thread = threading.Thread(target=daemon.serve, daemon=True)
+    thread.start()
+    assert daemon.ready.wait(30)
+    yield daemon
+    request('shutdown', socket_path=daemon.socket_path)
+    thread.join(10)
+    assert not thread.is_alive() and not daemon.socket_path.exists()
+
+
+def run(daemon: Daemon, argv: list[str], cwd: Path) -> tuple[int, list[str]]:
+    lines = []
+    result = request('run', {'argv': argv, 'cwd': str(cwd)}, socket_path=daemon.socket_path,
+                     on_notify=lambda m: lines.append(m['params'].get('line')) if m['method'] == 'output' else None)
+    return result['exit_code'], lines
+
+
+def test_daemon_jobs(daemon: Daemon, tmp_path: Path):
+    folders = [tmp_path / f'folder{i}' for i in range(3)]
+    for i, folder in enumerate(folders):
+        folder.mkdir()
+        (folder / 'IMG_1.jpg').write_bytes(make_jpeg(f'2020:01:0{i + 1} 10:00:00'))
+
+    results = {}
+
+    def preview(folder: Path) -> None:
+        results[folder.name] = run(daemon, ['preview', folder.name, '-t', '{datetime}{ext}'], tmp_path)
+
+    threads = [threading.Thread(target=preview, args=(folder,)) for folder in folders]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results['folder1'] == (0, [f'{folders[1] / "IMG_1.jpg"} -> 2020-01-02-10-00-00.jpg'])
+    assert len(daemon.cache.meta) == 3  # the cache is shared by the jobs
+
+    assert run(daemon, ['rename', 'IMG_1.jpg', '-t', '{datetime}{ext}'], folders[0]) == (
+        0, [f'{folders[0] / "IMG_1.jpg"} -> 2020-01-01-10-00-00.jpg'])
+    assert [p.name for p in folders[0].iterdir()] == ['2020-01-01-10-00-00.jpg']
+    assert request('status', socket_path=daemon.socket_path) == {'jobs': []}
+
+
+def test_daemon_errors(daemon: Daemon, tmp_path: Path):
+    with pytest.raises(DaemonError, match='invalid choice'):
+        run(daemon, ['preview', str(tmp_path), '--transfer', 'teleport'], tmp_path)
+    with pytest.raises(DaemonError, match='not quarantine'):
+        run(daemon, ['quarantine'], tmp_path)
+    with pytest.raises(DaemonError, match='Unknown method'):
+        request('format', socket_path=daemon.socket_path)
+    with pytest.raises(DaemonError, match='Could not reach'):
+        request('ping', socket_path=tmp_path / 'other.sock')
@@ -1,6 +1,7 @@
-import pytest
 from datetime import datetime
 
+import pytest
+
 from medren.datetime_from_filename import extract_datetime_from_filename
 
 
@@ -6,14 +6,13 @@ from pathlib import Path
 import numpy as np
 import pytest
 
-from medren.backends import backend_support, available_backends
-from medren.exif_process import ExifClass
+from medren.backends import available_backends, backend_support
 
 logger = get_logger()
 root = Path(r'c:\dev\medren-test')
 
 @pytest.mark.parametrize("filename", list(Path.glob(root, '*.jpg')))
-def test_compare_exif_backends(filename: list[Path], backends=['exifread', 'piexif']):
+def test_compare_exif_backends(filename: list[Path], backends=('exifread', 'piexif')):
     e0 = backend_support[backends[0]].func(filename, logger)
     if e0:
         e0.backend = None
@@ -56,7 +55,8 @@ def test_filename_datetime_consistency(filename: list[Path], backends=available_
     for backend in backends:
         ex = backend_support[backend].func(filename, logger)
         if ex and ex.t_fn and ex.t_img == ex.t_org:
-            # ex.dt_img != ex.dt_org indicates that the photo might have been edited, so the filename datetime is not reliable
+            # ex.dt_img != ex.dt_org indicates that the photo might have been edited,
+            # so the filename datetime is not reliable
             dt = ex.t_fn
             filename_time_is_utc = ex.make and "google" in ex.make.lower()
             # Google Pixel 6 datetime in filename is UTC, as appose to Samsung
@@ -0,0 +1,45 @@
+import datetime
+from pathlib import Path
+
+import pytest
+from media_samples import make_jpeg
+
+from medren import fusion
+from medren.backends import backend_support
+from medren.exif_process import ExifClass
+from medren.fusion import merge_exif
+from medren.renamer import Renamer
+
+
+def test_merge_exif():
+    a = ExifClass(ext='.jpg', backend='piexif', dt=datetime.datetime(2020, 1, 1, 10), make='Canon', model='R5')
+    b = ExifClass(ext='.jpg', backend='exiftool', dt=datetime.datetime(2020, 1, 1, 11), lat=32.5, lon=34.9, alt=10.0)
+    ex = merge_exif([a, None, b])
+    assert ex.backend == 'piexif+exiftool'
+    assert (ex.dt, ex.make, ex.lat, ex.lon, ex.alt) == (datetime.datetime(2020, 1, 1, 10), 'Canon', 32.5, 34.9, 10.0)
+    assert ex.goff_ll == 2  # computed for the merged location
+    assert merge_exif([a, b], {'dt': ['exiftool']}).dt == datetime.datetime(2020, 1, 1, 11)
+    assert merge_exif([a]) is a
+    assert merge_exif([None]) is None
+
+
+@pytest.mark.parametrize('priority, hour', [(None, 12), ({'dt': ['piexif']}, 10)])
+def test_fuse_reads_once(tmp_path: Path, monkeypatch, priority, hour):
+    path = tmp_path / 'IMG_1.jpg'
+    path.write_bytes(make_jpeg('2020:01:01 10:00:00', make='Canon', model='EOS R5'))
+    (tmp_path / 'IMG_1.xmp').write_text(
+        '<x:xmpmeta><rdf:Description exif:DateTimeOriginal="2020-01-01T12:00:00"'
+        ' exif:GPSLatitude="32,34.2203N" exif:GPSLongitude="34,56.4930E"/></x:xmpmeta>')
+    reads = []
+    read_header = fusion.read_header
+    monkeypatch.setattr('medren.renamer.read_header', lambda p: reads.append(p) or read_header(p))
+    for backend in ('piexif', 'exifread'):
+        # the file based functions are not called, the backends parse the shared header
+        monkeypatch.setattr(backend_support[backend], 'func', None)
+
+    renamer = Renamer(backends=['xmp', 'piexif', 'exifread'], fuse=True, field_priority=priority)
+    ex = renamer.fetch_meta(path)
+    assert reads == [path]
+    assert ex.dt.hour == hour
+    assert (ex.make, ex.model) == ('Canon', 'EOS-R5')
+    assert round(ex.lat, 4) == 32.5703
@@ -0,0 +1,69 @@
+import errno
+import os
+from pathlib import Path
+
+from media_samples import make_jpeg
+
+from medren import io_sched
+from medren.io_sched import scheduled, seek_key, seek_order
+from medren.renamer import Renamer
+
+
+def make_files(directory: Path, count: int) -> list[Path]:
+    paths = []
+    for i in range(count):
+        path = directory / f'IMG_{i:02d}.jpg'
+        path.write_bytes(make_jpeg(f'2020:01:01 10:00:{i:02d}'))
+        paths.append(path)
+    return paths
+
+
+def test_seek_order(tmp_path: Path):
+    paths = make_files(tmp_path, 10)
+    order = seek_order(reversed([*paths, tmp_path / 'missing.jpg']))
+    assert order[-1].name == 'missing.jpg'
+    keys = [seek_key(p) for p in order[:-1]]
+    assert keys == sorted(keys)
+    by_inode = seek_order(paths, use_fiemap=False)
+    assert [os.stat(p).st_ino for p in by_inode] == sorted(os.stat(p).st_ino for p in paths)
+
+
+def test_scheduled_hints(tmp_path: Path, monkeypatch):
+    paths = make_files(tmp_path, 5)
+    hints = []
+    monkeypatch.setattr(io_sched, 'SUPPORTS_FADVISE', True)
+    monkeypatch.setattr(io_sched, 'advise', lambda path, offset, length, advice: hints.append((Path(path), advice)))
+    monkeypatch.setattr(io_sched.os, 'POSIX_FADV_WILLNEED', 3, raising=False)
+    monkeypatch.setattr(io_sched.os, 'POSIX_FADV_DONTNEED', 4, raising=False)
+    seen = []
+    for path in scheduled(paths, lookahead=2):
+        seen.append(path)
+        # the headers of the next two files were requested before this one is parsed
+        requested = [p for p, advice in hints if advice == 3]
+        assert requested[:len(seen) + 1] == seek_order(paths)[:len(seen) + 1]
+    assert sorted(seen) == paths
+    assert [p for p, advice in hints if advice == 4] == seen  # dropped after parsing
+
+
+def test_renamer_seek_order(tmp_path: Path):
+    paths = make_files(tmp_path, 6)
+    metas = Renamer(seek_order=True).fetch_meta_many(paths)
+    assert list(metas) == paths  # in the order of the given paths
+    assert all(ex is not None and ex.dt.second == i for i, ex in enumerate(metas.values()))
+
+
+def test_fiemap_unsupported_per_device(tmp_path: Path, monkeypatch):
+    path = make_files(tmp_path, 1)[0]
+    dev = os.stat(path).st_dev
+    monkeypatch.setattr(io_sched, 'fiemap_unsupported', set())
+    # a file without mapped extents (inline or delayed allocation data) keeps FIEMAP on for the device
+    monkeypatch.setattr(io_sched, 'physical_offset', lambda p: None)
+    assert seek_key(path) == (0, dev, True, os.stat(path).st_ino)
+    assert io_sched.fiemap_unsupported == set()
+
+    def unsupported(p):
+        raise OSError(errno.EOPNOTSUPP, 'not supported')
+
+    monkeypatch.setattr(io_sched, 'physical_offset', unsupported)
+    seek_key(path)
+    assert io_sched.fiemap_unsupported == {dev}
@@ -0,0 +1,118 @@
+import datetime
+import logging
+import struct
+from pathlib import Path
+
+from media_samples import make_exif
+
+from medren.backend_isobmff import MP4_EPOCH, extract_isobmff
+from medren.backend_xmp import extract_xmp_sidecar
+from medren.pairing import pair_files, pair_tail
+from medren.renamer import Renamer
+
+logger = logging.getLogger(__name__)
+
+
+def box(box_type: bytes, payload: bytes) -> bytes:
+    return struct.pack('>I4s', 8 + len(payload), box_type) + payload
+
+
+def full_box(box_type: bytes, payload: bytes, version: int = 0) -> bytes:
+    return box(box_type, bytes([version, 0, 0, 0]) + payload)
+
+
+def make_heic(exif: bytes) -> bytes:
+    ftyp = box(b'ftyp', b'heic' + b'\x00\x00\x00\x00' + b'mif1heic')
+    item = struct.pack('>I', 6) + exif  # offset of the TIFF header, after b'Exif\x00\x00'
+    infe = full_box(b'infe', struct.pack('>HH4s', 1, 0, b'Exif') + b'\x00', version=2)
+    iinf = full_box(b'iinf', struct.pack('>H', 1) + infe)
+
+    def build(item_offset: int) -> bytes:
+        iloc = full_box(b'iloc', bytes([0x44, 0x00]) + struct.pack('>HHHHII', 1, 1, 0, 1, item_offset, len(item)))
+        meta = full_box(b'meta', full_box(b'hdlr', b'\x00' * 4 + b'pict' + b'\x00' * 13) + iinf + iloc)
+        return ftyp + meta
+
+    head = build(0)
+    mdat_payload_offset = len(head) + 8
+    return build(mdat_payload_offset) + box(b'mdat', item)
+
+
+def make_mov(created: datetime.datetime, location: str, head: bytes = b'') -> bytes:
+    seconds = int((created - MP4_EPOCH).total_seconds())
+    mvhd = full_box(b'mvhd', struct.pack('>IIII', seconds, seconds, 600, 0) + b'\x00' * 80)
+    text = location.encode()
+    udta = box(b'udta', box(b'\xa9xyz', struct.pack('>HH', len(text), 0x15c7) + text))
+    moov = box(b'moov', mvhd + udta)
+    return box(b'ftyp', b'qt  ' + b'\x00' * 4 + b'qt  ') + head + box(b'mdat', b'\x00' * 1000) + moov
+
+
+def test_heic_exif_item(tmp_path: Path):
+    path = tmp_path / 'IMG_0001.HEIC'
+    path.write_bytes(make_heic(make_exif(offset='+03:00', make='samsung', model='SM-G975F')))
+    ex = extract_isobmff(path, logger)
+    assert ex.backend == 'isobmff'
+    assert ex.dt == datetime.datetime(2020, 4, 24, 12, 7, 46)
+    assert ex.goff == 3
+    assert (ex.make, ex.model) == ('Samsung', 'SM-G975F')
+
+
+def test_mov_creation_time_after_mdat(tmp_path: Path):
+    path = tmp_path / 'IMG_0001.MOV'
+    path.write_bytes(make_mov(datetime.datetime(2020, 4, 24, 9, 7, 46), '+32.5703+034.9415/'))
+    ex = extract_isobmff(path, logger)
+    assert ex.lat == 32.5703
+    assert ex.lon == 34.9415
+    # the UTC creation time is moved to the local time of the location
+    assert ex.dt == datetime.datetime(2020, 4, 24, 12, 7, 46)
+    assert ex.goff == 3
+
+
+def test_movie_top_level_meta_before_moov(tmp_path: Path):
+    # a meta box without an Exif item, as written by some encoders
+    meta = full_box(b'meta', full_box(b'hdlr', b'\x00' * 4 + b'mdir' + b'\x00' * 13))
+    path = tmp_path / 'VID_0001.MOV'
+    path.write_bytes(make_mov(datetime.datetime(2020, 4, 24, 9, 7, 46), '+32.5703+034.9415/', head=meta))
+    ex = extract_isobmff(path, logger)
+    assert ex.dt == datetime.datetime(2020, 4, 24, 12, 7, 46)
+
+
+def test_not_isobmff(tmp_path: Path):
+    path = tmp_path / 'a.mp4'
+    path.write_bytes(b'\xff\xd8\xff\xe0 not a box')
+    assert extract_isobmff(path, logger) is None
+
+
+def test_xmp_sidecar(tmp_path: Path):
+    path = tmp_path / 'DSC_0001.NEF'
+    path.write_bytes(b'')
+    (tmp_path / 'DSC_0001.xmp').write_text(
+        '<x:xmpmeta><rdf:Description exif:DateTimeOriginal="2021-06-01T10:20:30.00+02:00"'
+        ' tiff:Make="NIKON CORPORATION" tiff:Model="NIKON D750"'
+        ' exif:GPSLatitude="32,34.2203N" exif:GPSLongitude="34,56.4930E"/></x:xmpmeta>')
+    ex = extract_xmp_sidecar(path, logger)
+    assert ex.dt == datetime.datetime(2021, 6, 1, 10, 20, 30)
+    assert ex.goff == 2
+    assert (ex.make, ex.model) == ('Nikon', 'D750')
+    assert round(ex.lat, 4) == 32.5703
+
+
+def test_pair_files(tmp_path: Path):
+    names = ['IMG_0001.HEIC', 'IMG_0001.MOV', 'IMG_0001.AAE', 'DSC_0002.NEF', 'DSC_0002.JPG', 'DSC_0002.NEF.xmp',
+             'IMG_0003.jpg']
+    for name in names:
+        (tmp_path / name).write_bytes(b'')
+    media = [tmp_path / n for n in names if not n.lower().endswith(('.aae', '.xmp'))]
+    groups = {g.primary.name: sorted(c.name for c in g.companions) for g in pair_files(media)}
+    assert groups == {
+        'IMG_0001.HEIC': ['IMG_0001.AAE', 'IMG_0001.MOV'],
+        'DSC_0002.JPG': ['DSC_0002.NEF', 'DSC_0002.NEF.xmp'],
+        'IMG_0003.jpg': [],
+    }
+    assert pair_tail(tmp_path / 'DSC_0002.NEF.xmp') == '.nef.xmp'
+
+
+def test_live_photo_renamed_together(tmp_path: Path):
+    (tmp_path / 'IMG_0001.HEIC').write_bytes(make_heic(make_exif(offset='+03:00', make='samsung', model='SM-G975F')))
+    (tmp_path / 'IMG_0001.MOV').write_bytes(make_mov(datetime.datetime(2020, 4, 24, 9, 7, 47), ''))
+    renames = Renamer(template='{datetime}{ext}').generate_renames([tmp_path], resolve_names=True)
+    assert sorted(name for name, _ in renames.values()) == ['2020-04-24-12-07-46.heic', '2020-04-24-12-07-46.mov']
@@ -0,0 +1,85 @@
+import io
+from pathlib import Path
+
+import numpy as np
+import pytest
+from media_samples import make_jpeg
+
+from medren.near_dup import DCT, DCT_SIZE, HASH_SIZE, BKTree, group_near_duplicates, hamming, phash_many, read_thumbnail
+from medren.renamer import Renamer
+
+
+def smooth_images(n: int, seed: int = 0) -> np.ndarray:
+    # random low frequencies around a mid gray
+    rng = np.random.default_rng(seed)
+    coeffs = np.zeros((n, DCT_SIZE, DCT_SIZE))
+    coeffs[:, :HASH_SIZE, :HASH_SIZE] = rng.normal(0, 40, (n, HASH_SIZE, HASH_SIZE))
+    coeffs[:, 0, 0] = 128 * DCT_SIZE
+    return DCT.T @ coeffs @ DCT
+
+
+def test_phash_near_and_far():
+    images = smooth_images(2)
+    noisy = images[0] + np.random.default_rng(1).normal(0, 4, images[0].shape)
+    a, b, brighter, other = phash_many(np.stack([images[0], noisy, images[0] * 0.8 + 30, images[1]]))
+    assert hamming(a, brighter) == 0
+    assert hamming(a, b) <= 8
+    assert hamming(a, other) > 8
+
+
+def test_bktree_matches_brute_force():
+    rng = np.random.default_rng(2)
+    hashes = [int(h) for h in rng.integers(0, 1 << 62, 500)]
+    tree = BKTree()
+    for i, h in enumerate(hashes):
+        tree.add(h, i)
+    assert len(tree) == len(hashes)
+    for h in hashes[:20]:
+        for radius in (0, 20, 30):
+            expected = sorted(i for i, other in enumerate(hashes) if hamming(h, other) <= radius)
+            assert sorted(i for _d, i in tree.query(h, radius)) == expected
+
+
+def test_group_near_duplicates():
+    paths = [Path(f'{i}.jpg') for i in range(5)]
+    hashes = dict(zip(paths, [0b0, 0xFF << 40, 0b111, None, 0b111111111]))
+    # 0 and 2 differ by 3 bits, 2 and 4 by 6 bits (0 and 4 by 9, grouped through 2)
+    assert group_near_duplicates(hashes, radius=6) == [[paths[0], paths[2], paths[4]]]
+    assert group_near_duplicates(hashes, radius=2) == []
+
+
+def thumbnail(image: np.ndarray) -> bytes:
+    from PIL import Image
+
+    out = io.BytesIO()
+    Image.fromarray(image.clip(0, 255).astype(np.uint8)).resize((160, 120)).save(out, 'JPEG', quality=80)
+    return out.getvalue()
+
+
+def test_near_duplicate_preview(tmp_path: Path):
+    pytest.importorskip('PIL')
+    burst, other = smooth_images(2, seed=3)
+    (tmp_path / 'IMG_1.jpg').write_bytes(make_jpeg('2020:01:01 10:00:00', thumbnail=thumbnail(burst)))
+    (tmp_path / 'IMG_2.jpg').write_bytes(make_jpeg('2020:01:01 10:00:01', thumbnail=thumbnail(burst + 3)))
+    (tmp_path / 'IMG_3.jpg').write_bytes(make_jpeg('2020:01:01 10:00:02', thumbnail=thumbnail(other)))
+    (tmp_path / 'IMG_4.jpg').write_bytes(make_jpeg('2020:01:01 10:00:03'))
+    assert read_thumbnail(tmp_path / 'IMG_4.jpg') is None
+
+    renamer = Renamer(template='{datetime}{s}{dup}{ext}')
+    renames = renamer.generate_renames([tmp_path], resolve_names=True)
+    assert sorted(n for n, _ex in renames.values()) == [
+        '2020-01-01-10-00-00_dup1.jpg', '2020-01-01-10-00-01_dup1.jpg',
+        '2020-01-01-10-00-02.jpg', '2020-01-01-10-00-03.jpg']
+    assert renamer.dup_groups == [[tmp_path / 'IMG_1.jpg', tmp_path / 'IMG_2.jpg']]
+
+
+def test_read_thumbnail(tmp_path: Path):
+    thumb = b'\xff\xd8\xff\xda\x00\x02' + b'\x00' * 100 + b'\xff\xd9'
+    (tmp_path / 'a.jpg').write_bytes(make_jpeg(thumbnail=thumb))
+    assert read_thumbnail(tmp_path / 'a.jpg') == thumb
+
+
+def test_near_dups_need_pillow(monkeypatch):
+    monkeypatch.setattr('importlib.util.find_spec', lambda name: None)
+    with pytest.raises(ImportError, match='Pillow'):
+        Renamer(template='{datetime}{s}{dup}{ext}')
@@ -0,0 +1,101 @@
+import errno
+import os
+from pathlib import Path
+
+import pytest
+from media_samples import make_jpeg
+
+from medren import mover
+from medren.mover import VerifyError, transfer
+from medren.renamer import Renamer
+
+
+def make_files(directory: Path) -> None:
+    directory.mkdir(parents=True, exist_ok=True)
+    (directory / 'IMG_1.jpg').write_bytes(make_jpeg('2020:01:01 10:00:00', make='Canon', model='EOS R5'))
+    (directory / 'IMG_2.jpg').write_bytes(make_jpeg('2020:02:01 10:00:00'))
+    (directory / 'IMG_2.xmp').write_text('<x:xmpmeta/>')
+
+
+def test_organize(tmp_path: Path):
+    src, dest = tmp_path / 'inbox', tmp_path / 'library'
+    make_files(src)
+    (dest / '2020' / '01' / 'Canon').mkdir(parents=True)
+    (dest / '2020' / '01' / 'Canon' / '2020-01-01-10-00-00.jpg').write_bytes(b'already there')
+
+    renamer = Renamer(template='{year}/{month}/{make}/{datetime}{ext}', dest_root=dest)
+    renames = renamer.generate_renames([src], resolve_names=True)
+    assert {p.name: Path(n).relative_to(dest).as_posix() for p, (n, _ex) in renames.items()} == {
+        'IMG_1.jpg': '2020/01/Canon/2020-01-01-10-00-00-1.jpg',
+        'IMG_2.jpg': '2020/02/Unknown/2020-02-01-10-00-00.jpg',
+        'IMG_2.xmp': '2020/02/Unknown/2020-02-01-10-00-00.xmp',
+    }
+    renamer.apply_rename(renames)
+    assert list(src.iterdir()) == []
+    assert (dest / '2020' / '02' / 'Unknown' / '2020-02-01-10-00-00.xmp').is_file()
+
+
+def test_organize_in_place_hardlink(tmp_path: Path):
+    make_files(tmp_path)
+    renamer = Renamer(template='{year}/{datetime}{ext}', transfer='hardlink')
+    moves = renamer.apply_rename(renamer.generate_renames([tmp_path], resolve_names=True))
+    assert len(moves) == 3
+    new = tmp_path / '2020' / '2020-01-01-10-00-00.jpg'
+    assert new.stat().st_ino == (tmp_path / 'IMG_1.jpg').stat().st_ino
+
+
+def test_transfer_cross_device(tmp_path: Path, monkeypatch):
+    src = tmp_path / 'a.bin'
+    src.write_bytes(os.urandom(1000))
+    data = src.read_bytes()
+
+    def no_rename(a, b, src_dir_fd=None, dst_dir_fd=None):
+        raise OSError(errno.EXDEV, 'Invalid cross-device link')
+    monkeypatch.setattr(mover, 'rename_noreplace', no_rename)
+    assert transfer(src, tmp_path / 'x' / 'b.bin') == 'stream'
+    assert not src.exists() and (tmp_path / 'x' / 'b.bin').read_bytes() == data
+
+    # a corrupted copy is removed and the original is kept
+    src.write_bytes(data)
+    monkeypatch.setattr(mover, 'file_digest', lambda path: 'bad')
+    with pytest.raises(VerifyError):
+        transfer(src, tmp_path / 'c.bin')
+    assert src.exists() and not (tmp_path / 'c.bin').exists()
+    with pytest.raises(FileExistsError):
+        transfer(src, tmp_path / 'x' / 'b.bin')
+
+
+def test_copy(tmp_path: Path):
+    src = tmp_path / 'a.bin'
+    src.write_bytes(b'data' * 1000)
+    assert transfer(src, tmp_path / 'b.bin', mode='copy') in ('reflink', 'copy_file_range', 'stream')
+    assert (tmp_path / 'b.bin').read_bytes() == src.read_bytes()
+    assert (tmp_path / 'b.bin').stat().st_mtime_ns == src.stat().st_mtime_ns
+
+
+@pytest.mark.parametrize('atomic', [True, False])
+def test_rename_noreplace(tmp_path: Path, monkeypatch, atomic: bool):
+    if not atomic:
+        monkeypatch.setattr(mover, 'libc_renameat2', lambda: None)  # the hard link fallback
+    (tmp_path / 'a.jpg').write_bytes(b'a')
+    (tmp_path / 'b.jpg').write_bytes(b'b')
+    with pytest.raises(FileExistsError):
+        mover.rename_noreplace(tmp_path / 'a.jpg', tmp_path / 'b.jpg')
+    assert (tmp_path / 'b.jpg').read_bytes() == b'b'
+    with mover.DirFds(limit=2) as dir_fds:
+        assert transfer(tmp_path / 'a.jpg', tmp_path / 'x' / 'c.jpg', dir_fds=dir_fds) == 'rename'
+        with pytest.raises(FileExistsError):
+            transfer(tmp_path / 'b.jpg', tmp_path / 'x' / 'c.jpg', dir_fds=dir_fds)
+        assert transfer(tmp_path / 'b.jpg', tmp_path / 'y' / 'c.jpg', dir_fds=dir_fds) == 'rename'
+        assert len(dir_fds.fds) == 2
+    assert not (tmp_path / 'a.jpg').exists() and (tmp_path / 'x' / 'c.jpg').read_bytes() == b'a'
+
+
+def test_apply_rename_skips_missing(tmp_path: Path, monkeypatch):
+    (tmp_path / 'a.jpg').write_bytes(b'a')
+    stats = []
+    monkeypatch.setattr(Path, 'exists', lambda self: stats.append(self) or os.path.exists(self))
+    moves = Renamer().apply_rename({str(tmp_path / 'a.jpg'): ('b.jpg', None),
+                                    str(tmp_path / 'missing.jpg'): ('c.jpg', None)})
+    assert moves == {str(tmp_path / 'a.jpg'): str(tmp_path / 'b.jpg')}
+    assert stats == []  # the renames are not preceded by a stat of each path
@@ -0,0 +1,48 @@
+import os
+import shutil
+from pathlib import Path
+
+import pytest
+from media_samples import make_jpeg
+
+from medren.plan import PlanError, read_plan, verify_plan, write_plan
+from medren.renamer import Renamer
+
+
+@pytest.mark.parametrize('plan_name', ['plan.jsonl', 'plan.jsonl.gz'])
+def test_plan_roundtrip(tmp_path: Path, plan_name: str):
+    src = tmp_path / 'host1'
+    src.mkdir()
+    for i in range(3):
+        (src / f'IMG_{i}.jpg').write_bytes(make_jpeg(f'2020:01:0{i + 1} 10:00:00', make='Canon', model='EOS R5'))
+    renames = Renamer(template='{datetime}{ext}').generate_renames([src], resolve_names=True)
+    plan = tmp_path / plan_name
+    assert write_plan(plan, renames, template='{datetime}{ext}') == 3
+
+    header, entries = read_plan(plan)
+    assert header['template'] == '{datetime}{ext}'
+    entries = list(entries)
+    assert {e.src: (e.dst, e.meta) for e in entries} == renames
+
+    # apply on another host, where the files are mounted elsewhere
+    dst = tmp_path / 'host2'
+    shutil.copytree(src, dst)
+    for path in src.iterdir():
+        os.utime(dst / path.name, ns=(path.stat().st_atime_ns, path.stat().st_mtime_ns))
+    (dst / 'IMG_2.jpg').write_bytes(b'changed')
+    root_map = {str(src): str(dst)}
+    _, entries = read_plan(plan, root_map)
+    assert [(e.src.name, problem) for e, problem in verify_plan(entries)] == [('IMG_2.jpg', 'changed')]
+
+    _, entries = read_plan(plan, root_map)
+    moves = Renamer().apply_rename(entries)
+    assert sorted(Path(p).name for p in moves.values()) == ['2020-01-01-10-00-00.jpg', '2020-01-02-10-00-00.jpg']
+    assert sorted(p.name for p in dst.iterdir()) == ['2020-01-01-10-00-00.jpg', '2020-01-02-10-00-00.jpg',
+                                                     'IMG_2.jpg']
+
+
+def test_not_a_plan(tmp_path: Path):
+    path = tmp_path / 'renames.log'
+    path.write_text('Original,New\n')
+    with pytest.raises(PlanError):
+        read_plan(path)
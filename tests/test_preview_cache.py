@@ -0,0 +1,60 @@
+import threading
+from pathlib import Path
+
+from media_samples import make_jpeg
+
+from medren.preview_cache import PreviewCache
+from medren.renamer import Renamer
+
+
+def test_template_change_reuses_metadata(tmp_path: Path, monkeypatch):
+    for i in range(3):
+        (tmp_path / f'{i}.jpg').write_bytes(make_jpeg(f'2020:01:0{i + 1} 10:00:00'))
+    fetched = []
+    fetch_meta = Renamer.fetch_meta
+    monkeypatch.setattr(Renamer, 'fetch_meta', lambda self, path: fetched.append(path) or fetch_meta(self, path))
+    cache = PreviewCache()
+
+    renames = Renamer(template='{datetime}{ext}', cache=cache).generate_renames([tmp_path], resolve_names=True)
+    assert len(fetched) == 3
+    renames2 = Renamer(template='x{datetime}{ext}', cache=cache).generate_renames([tmp_path], resolve_names=True)
+    assert len(fetched) == 3
+    assert sorted('x' + name for name, _ in renames.values()) == sorted(name for name, _ in renames2.values())
+
+    # a new file is discovered and only it is extracted
+    (tmp_path / 'new.jpg').write_bytes(make_jpeg('2020:01:05 10:00:00'))
+    renames3 = Renamer(template='{datetime}{ext}', cache=cache).generate_renames([tmp_path], resolve_names=True)
+    assert len(renames3) == 4
+    assert fetched[3:] == [tmp_path / 'new.jpg']
+
+
+def test_rename_keeps_cached_metadata(tmp_path: Path):
+    (tmp_path / 'a.jpg').write_bytes(make_jpeg('2020:01:01 10:00:00'))
+    cache = PreviewCache()
+    renamer = Renamer(template='{datetime}{ext}', cache=cache)
+    renamer.apply_rename(renamer.generate_renames([tmp_path], resolve_names=True))
+    misses = cache.misses
+    renamer.generate_renames([tmp_path / '2020-01-01-10-00-00.jpg'])
+    assert cache.misses == misses
+
+
+def test_shared_by_threads():
+    cache = PreviewCache()
+    backends = ['piexif']
+    for i in range(200):
+        cache.set_meta((f'old/{i}.jpg', 1, 1), backends, None)
+
+    def fill(job: int) -> None:
+        for i in range(2000):
+            cache.set_meta((f'{job}/{i}.jpg', 1, 1), backends, None)
+            cache.get_meta((f'{job}/{i}.jpg', 1, 1), backends)
+
+    threads = [threading.Thread(target=fill, args=(job,)) for job in range(4)]
+    for t in threads:
+        t.start()
+    for i in range(200):  # iterates the entries while the other jobs insert
+        cache.renamed({f'old/{i}.jpg': f'new/{i}.jpg'})
+    for t in threads:
+        t.join()
+    assert (cache.hits, cache.misses) == (8000, 0)
+    assert len(cache.meta) == 8200 and cache.get_meta(('new/0.jpg', 1, 1), backends)[0]
@@ -0,0 +1,138 @@
+import datetime
+import io
+import re
+import threading
+from collections.abc import Iterator
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from media_samples import make_jpeg
+from test_isobmff import box, make_mov
+
+from medren.remote import ConnectionPool, RangeFile, extract_remote, extract_remote_many, is_remote
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """Serves the files of the server from memory, with Range support."""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):  # noqa: N802
+        data = self.server.files.get(self.path)
+        if data is None:
+            self.send_error(404)
+            return
+        match = re.match(r'bytes=(\d*)-(\d*)', self.headers.get('Range', ''))
+        if match and self.server.ranges:
+            first, last = match.groups()
+            if first:
+                start, end = int(first), min(int(last) + 1 if last else len(data), len(data))
+            else:
+                start, end = max(0, len(data) - int(last)), len(data)
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end - 1}/{len(data) if self.server.sizes else "*"}')
+        else:
+            start, end = 0, len(data)
+            self.send_response(200)
+        self.send_header('Content-Length', str(end - start))
+        self.end_headers()
+        try:
+            self.wfile.write(data[start:end])
+            self.server.sent += end - start
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+class RangeServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        pass  # clients drop connections in the middle of bodies they do not need
+
+
+@pytest.fixture
+def server() -> Iterator[ThreadingHTTPServer]:
+    httpd = RangeServer(('127.0.0.1', 0), RangeHandler)
+    httpd.files, httpd.sent, httpd.ranges, httpd.sizes = {}, 0, True, True
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def url(server: ThreadingHTTPServer, path: str) -> str:
+    return f'http://127.0.0.1:{server.server_address[1]}{path}'
+
+
+def make_big_mov(size: int) -> bytes:
+    # a movie whose moov box is after a large mdat, as written by most cameras
+    mov = make_mov(datetime.datetime(2020, 4, 24, 9, 7, 46), '+32.5703+034.9415/')
+    ftyp, rest = mov[:20], mov[20:]
+    return ftyp + box(b'mdat', b'\x00' * size) + rest
+
+
+def test_mov_without_full_download(server):
+    server.files['/videos/big.mov'] = make_big_mov(20_000_000)
+    with ConnectionPool() as pool:
+        ex = extract_remote(url(server, '/videos/big.mov'), pool)
+        assert ex.dt == datetime.datetime(2020, 4, 24, 12, 7, 46)
+        assert ex.lat == 32.5703
+        assert server.sent < 300_000
+        assert pool.requests <= 4
+
+
+def test_jpeg_and_many(server):
+    for i in range(5):
+        server.files[f'/photos/IMG_{i}.jpg'] = make_jpeg(f'2020:01:0{i + 1} 10:00:00', make='Canon')
+    server.files['/photos/notes.txt'] = b'no metadata'
+    urls = [url(server, f'/photos/IMG_{i}.jpg') for i in range(5)] + [url(server, '/photos/notes.txt')]
+    metas = extract_remote_many(urls, workers=3)
+    assert [ex.dt.day for ex in list(metas.values())[:5]] == [1, 2, 3, 4, 5]
+    assert metas[urls[-1]] is None
+
+
+def test_range_file(server):
+    data = bytes(range(256)) * 1000
+    server.files['/data.bin'] = data
+    with ConnectionPool() as pool:
+        f = RangeFile(url(server, '/data.bin'), pool, block_size=1000)
+        f.seek(-10, 2)
+        assert f.read() == data[-10:]
+        f.seek(5000)
+        assert f.read(100) == data[5000:5100]
+        f.seek(500)
+        assert f.read(5000) == data[500:5500]  # spans the fetched blocks
+        requests = pool.requests
+        f.seek(900)
+        assert f.read(4000) == data[900:4900]
+        assert pool.requests == requests  # served from the fetched extents
+        f.seek(len(data) - 5)
+        assert f.read(100) == data[-5:]
+
+    server.ranges = False  # the whole body is sent, only the needed start is read
+    with ConnectionPool() as pool:
+        f = RangeFile(url(server, '/data.bin'), pool, block_size=1000)
+        f.seek(100)
+        assert f.read(10) == data[100:110]
+
+
+def test_is_remote():
+    assert is_remote('https://example.com/a.jpg')
+    assert is_remote('s3://bucket/a.jpg')
+    assert not is_remote('/photos/a.jpg')
+    assert not is_remote('C:/photos/a.jpg')
+    assert not is_remote('file:///photos/a.jpg')
+
+
+def test_unknown_size(server):
+    server.files['/a.bin'] = bytes(range(256)) * 100
+    server.sizes = False
+    with ConnectionPool() as pool:
+        f = RangeFile(url(server, '/a.bin'), pool, block_size=1000)
+        assert f.read(10) == bytes(range(10))
+        with pytest.raises(io.UnsupportedOperation, match='unknown'):
+            f.seek(-10, io.SEEK_END)
+        with pytest.raises(io.UnsupportedOperation):
+            f.read()
+        assert f.tell() == 10
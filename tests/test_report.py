@@ -0,0 +1,62 @@
+import csv
+import logging
+import sqlite3
+from pathlib import Path
+
+from media_samples import make_jpeg
+
+from medren.backend_piexif import piexif_get_raw
+from medren.preview_cache import PreviewCache
+from medren.renamer import Renamer
+from medren.report import OutcomeReport
+
+
+def make_files(directory: Path, missing: int) -> None:
+    (directory / 'IMG_1.jpg').write_bytes(make_jpeg('2020:01:01 10:00:00'))
+    for i in range(missing):
+        (directory / f'broken_{i}.jpg').write_bytes(b'\xff\xd8 not a jpeg')
+    (directory / 'notes.xyz').write_bytes(b'')
+
+
+def test_report_outcomes(tmp_path: Path, caplog):
+    make_files(tmp_path, missing=10)
+    report = OutcomeReport(samples=2)
+    renamer = Renamer(report=report)
+    with caplog.at_level(logging.WARNING):
+        renamer.fetch_meta_many(sorted(tmp_path.iterdir()))
+    assert report.status_counts() == {'ValidExif': 1, 'NoDateTime': 11}
+    assert report.warnings['no_datetime'] == 11
+    assert sum('No datetime found' in r.message for r in caplog.records) == 2  # only samples are logged
+    assert 'warning no_datetime: 11 (9 not logged)' in report.summary()
+    row = report.columns['path'].index(str(tmp_path / 'IMG_1.jpg'))
+    assert report.columns['backend'][row] and 'ok' in report.columns['attempts'][row]
+
+    report.write(tmp_path / 'report.csv')
+    with open(tmp_path / 'report.csv', newline='') as f:
+        assert len(list(csv.DictReader(f))) == 12
+    report.write(tmp_path / 'report.sqlite')
+    with sqlite3.connect(tmp_path / 'report.sqlite') as db:
+        assert db.execute("SELECT count(*) FROM outcomes WHERE status = 'NoDateTime'").fetchone() == (11,)
+
+
+def test_warnings_without_report(tmp_path: Path, caplog):
+    make_files(tmp_path, missing=4)
+    with caplog.at_level(logging.WARNING):
+        Renamer().fetch_meta_many(sorted(tmp_path.iterdir()))
+    assert sum('No datetime found' in r.message for r in caplog.records) == 5
+
+
+def test_cached_outcomes_and_backend_warnings(tmp_path: Path, caplog):
+    make_files(tmp_path, missing=5)
+    cache = PreviewCache()
+    Renamer(cache=cache).fetch_meta_cached(sorted(tmp_path.iterdir()))
+    report = OutcomeReport(samples=2)
+    with caplog.at_level(logging.WARNING), report.activate():
+        Renamer(report=report, cache=cache).fetch_meta_cached(sorted(tmp_path.iterdir()))
+        for i in range(5):
+            (tmp_path / f'garbage_{i}.jpg').write_bytes(b'neither JPEG nor TIFF')
+            piexif_get_raw(tmp_path / f'garbage_{i}.jpg', logging.getLogger('piexif'))
+    assert report.status_counts() == {'ValidExif': 1, 'NoDateTime': 6}  # the cached results are recorded too
+    assert report.columns['attempts'][0].startswith('cache:')
+    assert report.warnings['piexif_error'] == 5
+    assert sum('Could not get raw exif data' in r.message for r in caplog.records) == 2
@@ -0,0 +1,52 @@
+import json
+import threading
+from pathlib import Path
+
+from media_samples import make_jpeg
+
+from medren.renamer import Renamer
+from medren.stats import RenamerStats, read_proc_io
+
+
+def test_stats_per_stage_and_backend(tmp_path: Path):
+    (tmp_path / 'a.jpg').write_bytes(make_jpeg())
+    (tmp_path / 'b.jpg').write_bytes(b'not a jpeg')
+    renamer = Renamer(backends=['piexif', 'exifread'], stats=RenamerStats())
+    renamer.generate_renames([tmp_path], resolve_names=True)
+    stats = renamer.stats
+    assert stats.files == 2
+    assert set(stats.stages) == {'discover', 'extract', 'enrich', 'name', 'plan'}
+    assert stats.backends['piexif'].calls == 2
+    assert stats.backends['piexif'].ok == 1
+    assert stats.backends['exifread'].calls == 1
+    assert stats.backend_ext['piexif']['.jpg'].success_rate == 0.5
+
+    stats.write_json(tmp_path / 'stats.json')
+    loaded = json.loads((tmp_path / 'stats.json').read_text())
+    assert loaded['backends']['piexif']['ok'] == 1
+
+
+def test_concurrent_stages_do_not_count_bytes(tmp_path: Path):
+    (tmp_path / 'a.bin').write_bytes(bytes(10000))
+    stats = RenamerStats()
+    entered, leave = threading.Event(), threading.Event()
+
+    def worker() -> None:
+        with stats.stage('worker'):
+            entered.set()
+            leave.wait(10)
+
+    with stats.stage('alone'):
+        (tmp_path / 'a.bin').read_bytes()
+    thread = threading.Thread(target=worker)
+    thread.start()
+    entered.wait(10)
+    with stats.stage('main'):
+        (tmp_path / 'a.bin').read_bytes()
+    leave.set()
+    thread.join()
+    assert {name: stat.calls for name, stat in stats.stages.items()} == {'alone': 1, 'worker': 1, 'main': 1}
+    if read_proc_io() is not None:
+        assert stats.stages['alone'].bytes_read >= 10000
+    assert stats.stages['worker'].bytes_read == stats.stages['main'].bytes_read == 0
+    assert not stats.running
@@ -0,0 +1,69 @@
+import os
+import time
+from pathlib import Path
+
+import pytest
+from media_samples import make_jpeg
+
+from medren.backends import Backend, backend_support
+from medren.renamer import Renamer
+from medren.supervisor import BackendCrashedError, BackendTimeoutError, Quarantine, Supervisor
+
+
+def hang(path, logger):
+    time.sleep(60)
+
+
+def crash(path, logger):
+    os._exit(139)
+
+
+def echo(path, logger):
+    return str(path)
+
+
+@pytest.fixture
+def supervisor(tmp_path: Path):
+    with Supervisor(backend_timeout=1, file_timeout=5, quarantine=Quarantine(tmp_path / 'quarantine.json'),
+                    start_method='fork') as supervisor:
+        yield supervisor
+
+
+def test_call(supervisor: Supervisor, tmp_path: Path):
+    path = tmp_path / 'a.mp4'
+    path.write_bytes(b'x')
+    assert supervisor.call('echo', path, echo, path) == str(path)
+
+    start = time.monotonic()
+    with pytest.raises(BackendTimeoutError):
+        supervisor.call('hang', path, hang, path)
+    assert time.monotonic() - start < 5
+    with pytest.raises(BackendCrashedError):
+        supervisor.call('crash', path, crash, path)
+    assert supervisor.recycled == 2
+    assert supervisor.call('echo', path, echo, path) == str(path)
+
+    # the quarantine is kept between runs, and a changed file is tried again
+    quarantine = Quarantine(tmp_path / 'quarantine.json')
+    assert quarantine.is_quarantined(path, 'hang') and quarantine.is_quarantined(path, 'crash')
+    assert not quarantine.is_quarantined(path, 'echo') and not quarantine.is_quarantined(path)
+    path.write_bytes(b'xy')
+    assert not quarantine.is_quarantined(path, 'hang')
+
+
+def test_renamer_skips_hanging_backend(supervisor: Supervisor, tmp_path: Path, monkeypatch):
+    monkeypatch.setitem(backend_support, 'hang', Backend(module='hang', package='', ext=None, func=hang, dep=[]))
+    monkeypatch.setattr('medren.renamer.available_backends', ['hang', 'piexif'])
+    path = tmp_path / 'IMG_1.jpg'
+    path.write_bytes(make_jpeg('2020:01:01 10:00:00'))
+    renamer = Renamer(backends=['hang', 'piexif'], supervisor=supervisor)
+    assert renamer.fetch_meta(path).backend == 'piexif'
+    start = time.monotonic()
+    assert renamer.fetch_meta(path).backend == 'piexif'
+    assert time.monotonic() - start < 1  # the hanging backend is skipped for this file
+
+    supervisor.file_timeout = 0.5
+    path2 = tmp_path / 'IMG_2.jpg'
+    path2.write_bytes(make_jpeg('2020:01:02 10:00:00'))
+    assert renamer.fetch_meta(path2) is None
+    assert supervisor.quarantine.is_quarantined(path2)
@@ -0,0 +1,44 @@
+import datetime
+
+from medren.exif_process import ExifClass
+from medren.table_model import PreviewTable
+
+
+def make_renames(n: int) -> dict:
+    renames = {}
+    for i in range(n):
+        ex = ExifClass(ext='.jpg', backend='piexif', dt=datetime.datetime(2020, 1, 1) + datetime.timedelta(hours=i),
+                       make='Canon' if i % 2 else None)
+        renames[f'/photos/IMG_{i:05}.jpg'] = (f'{i:05}.jpg', ex)
+    return renames
+
+
+def test_paging():
+    table = PreviewTable.from_renames(make_renames(1001), page_size=500)
+    assert table.page_count == 3
+    assert len(table.page_rows()) == 500
+    table.go_to(5)
+    assert table.page == 2
+    assert [row[1] for row in table.page_rows()] == ['01000.jpg']
+    assert table.page_values(full_paths=False)[0][0] == 'IMG_01000.jpg'
+    assert table.selected([0, 3]) == [table.rows[1000]]
+    assert table.status() == '1001 (page 3/3)'
+
+
+def test_sort_and_filter():
+    table = PreviewTable.from_renames(make_renames(10), page_size=4)
+    table.sort_by(2)
+    table.sort_by(2)
+    assert table.page_rows()[0][1] == '00009.jpg'
+    table.sort_by(4)  # missing values last
+    assert [table.rows[i][4] for i in table.view] == ['Canon'] * 5 + [None] * 5
+
+    table.go_to(2)
+    table.set_filter('canon')
+    assert table.page == 0
+    assert len(table.view) == 5
+    assert table.status() == '5 of 10 (page 1/2)'
+    table.set_filter('img_0000')
+    assert len(table.view) == 10
+    table.set_filter('00003')
+    assert [row[1] for row in table.page_rows()] == ['00003.jpg']
@@ -0,0 +1,51 @@
+import datetime
+from pathlib import Path
+
+from media_samples import make_jpeg
+
+from medren.consts import DEFAULT_DATETIME_FORMAT, DEFAULT_TEMPLATE
+from medren.renamer import Renamer
+from medren.stats import RenamerStats
+from medren.template_match import TemplateMatcher
+
+
+def test_match_default_template():
+    matcher = TemplateMatcher(DEFAULT_TEMPLATE, DEFAULT_DATETIME_FORMAT, '_')
+    m = matcher.match('/photos/2020-04-24-12-07-46_Samsung_SM-G975F.jpg')
+    assert m.dt == datetime.datetime(2020, 4, 24, 12, 7, 46)
+    assert (m.values['make'], m.values['model']) == ('Samsung', 'SM-G975F')
+    assert matcher.match('/photos/2020-04-24-12-07-46-1.jpg').dt.year == 2020  # a collision counter
+    assert matcher.match('/photos/IMG_0001.jpg') is None
+    assert matcher.match('/photos/2020-13-24-12-07-46.jpg') is None  # not a date
+    assert matcher.match('/photos/2020-04-24-12-07-46_Canon.JPG') is None  # the template lowers the extension
+
+
+def test_match_directories():
+    matcher = TemplateMatcher('{year}/{month}/{make}/{datetime}{s}{suffix}{ext}', '%Y%m%d_%H%M%S', '_',
+                              suffix='trip')
+    root = Path('/library')
+    assert matcher.match(root / '2020/04/Canon/20200424_120746_trip.jpg', root).dt.day == 24
+    assert matcher.match(root / '2020/04/Unknown/20200424_120746_trip.jpg', root) is not None
+    assert matcher.match(root / '2020/05/Canon/20200424_120746_trip.jpg', root) is None  # the month differs
+    assert matcher.match(root / '2020/04/20200424_120746_trip.jpg', root) is None
+    assert matcher.match(Path('/elsewhere/2020/04/Canon/20200424_120746_trip.jpg'), root) is None
+
+
+def test_rerun_skips_named_files(tmp_path: Path):
+    (tmp_path / 'IMG_1.jpg').write_bytes(make_jpeg('2020:01:01 10:00:00', make='Canon', model='EOS R5'))
+    (tmp_path / 'IMG_2.jpg').write_bytes(make_jpeg('2020:02:01 10:00:00'))
+    renamer = Renamer()
+    renamer.apply_rename(renamer.generate_renames([tmp_path], resolve_names=True))
+    (tmp_path / 'IMG_3.jpg').write_bytes(make_jpeg('2020:02:01 10:00:00'))
+
+    stats = RenamerStats()
+    renamer = Renamer(skip_conforming='skip', stats=stats)
+    renames = renamer.generate_renames([tmp_path], resolve_names=True)
+    assert {Path(p).name: n for p, (n, _ex) in renames.items()} == {'IMG_3.jpg': '2020-02-01-10-00-00-1.jpg'}
+    assert stats.conforming == 2
+
+    # a name that does not match the metadata is renamed again when verifying
+    (tmp_path / '2020-01-01-10-00-00_Canon_EOS-R5.jpg').rename(tmp_path / '2021-01-01-10-00-00_Canon_EOS-R5.jpg')
+    renames = Renamer(skip_conforming='verify').generate_renames([tmp_path], resolve_names=True)
+    assert sorted(n for n, _ex in renames.values()) == ['2020-01-01-10-00-00_Canon_EOS-R5.jpg',
+                                                         '2020-02-01-10-00-00-1.jpg']
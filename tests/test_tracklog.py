@@ -0,0 +1,70 @@
+import datetime
+from pathlib import Path
+
+import numpy as np
+
+from medren.exif_process import ExifClass
+from medren.tracklog import EPOCH, Geotagger, TrackLog
+
+GPX = """<?xml version="1.0" encoding="UTF-8"?>
+<gpx version="1.1" xmlns="http://www.topografix.com/GPX/1/1">
+  <trk><trkseg>
+    <trkpt lat="32.0800" lon="34.7800"><ele>10</ele><time>2024-07-01T09:00:00Z</time></trkpt>
+    <trkpt lat="32.1000" lon="34.8000"><ele>30</ele><time>2024-07-01T09:10:00Z</time></trkpt>
+  </trkseg></trk>
+</gpx>
+"""
+
+KML = """<?xml version="1.0" encoding="UTF-8"?>
+<kml xmlns="http://www.opengis.net/kml/2.2" xmlns:gx="http://www.google.com/kml/ext/2.2">
+  <Document><Placemark><gx:Track>
+    <when>2024-07-01T14:00:00+03:00</when><when>2024-07-01T14:20:00+03:00</when>
+    <gx:coord>34.80 32.10 30</gx:coord><gx:coord>34.90 32.20 50</gx:coord>
+  </gx:Track></Placemark></Document>
+</kml>
+"""
+
+
+def epoch(*args) -> float:
+    return (datetime.datetime(*args) - EPOCH).total_seconds()
+
+
+def write_tracks(tmp_path: Path) -> list[Path]:
+    (tmp_path / 'a.gpx').write_text(GPX)
+    (tmp_path / 'b.kml').write_text(KML)
+    (tmp_path / 'c.csv').write_text('Time,Latitude,Longitude\n2024-07-01T10:00:00Z,32.3,35.0\nbad,row,\n')
+    return [tmp_path / 'a.gpx', tmp_path / 'b.kml', tmp_path / 'c.csv']
+
+
+def test_load_and_locate(tmp_path: Path):
+    write_tracks(tmp_path)
+    track = TrackLog.load([tmp_path])  # a directory of track logs
+    assert len(track) == 5
+    assert np.all(np.diff(track.times) >= 0)
+    lat, lon, alt, found = track.locate(np.array([epoch(2024, 7, 1, 9, 5), epoch(2024, 7, 1, 9, 30),
+                                                  epoch(2024, 7, 1, 9, 0), epoch(2024, 7, 2)]))
+    assert found.tolist() == [True, False, True, False]
+    assert np.allclose([lat[0], lon[0], alt[0]], [32.09, 34.79, 20])
+    assert np.allclose([lat[2], lon[2]], [32.08, 34.78])
+
+
+def test_geotag_with_camera_offset_and_skew(tmp_path: Path):
+    write_tracks(tmp_path)
+    geotagger = Geotagger(track=TrackLog.load([tmp_path / 'a.gpx']), camera_goff=3,
+                          clock_skew=datetime.timedelta(minutes=2))
+    exifs = [
+        ExifClass(ext='.cr3', backend='exifread', dt=datetime.datetime(2024, 7, 1, 12, 7)),  # camera local time
+        ExifClass(ext='.mp4', backend='ffmpeg', dt=datetime.datetime(2024, 7, 1, 9, 7), is_utc=True),
+        ExifClass(ext='.jpg', backend='exifread', dt=datetime.datetime(2024, 7, 1, 20, 0)),  # off the track
+    ]
+    result = geotagger.geotag(exifs)
+    assert (result[0].lat, result[0].lon, result[0].backend) == (32.09, 34.79, 'exifread+track')
+    assert result[0].goff == 3  # the zone of the location
+    assert result[1].lat is not None and result[1].dt == datetime.datetime(2024, 7, 1, 12, 7)  # now local time
+    assert result[2] is exifs[2] and exifs[0].lat is None
+
+
+def test_geotag_skips_unknown_offsets(tmp_path: Path):
+    geotagger = Geotagger(track=TrackLog.load(write_tracks(tmp_path)))
+    ex = ExifClass(ext='.cr3', backend='exifread', dt=datetime.datetime(2024, 7, 1, 12, 5))
+    assert geotagger.geotag([ex]) == [ex]
@@ -0,0 +1,54 @@
+import datetime
+from pathlib import Path
+
+from medren.exif_process import ExifClass
+from medren.pairing import PairGroup
+from medren.renamer import Renamer
+from medren.tz_infer import infer_offsets, infer_timezones
+
+
+def dt(hour: int, day: int = 1) -> datetime.datetime:
+    return datetime.datetime(2024, 7, day, hour)
+
+
+def anchor(t: datetime.datetime, goff: float, model: str = 'Pixel 8') -> ExifClass:
+    # a geotagged file, its offset from the location is given to avoid looking up the zone
+    return ExifClass(ext='.jpg', backend='exifread', dt=t, goff_ll=goff, make='Google', model=model)
+
+
+def test_camera_local_time_between_anchors():
+    exifs = [anchor(dt(9), 3), anchor(dt(15), 3),
+             ExifClass(ext='.jpg', backend='exifread', dt=dt(12), make='Canon', model='EOS R5')]
+    inference = infer_offsets(exifs)[2]
+    assert inference.goff == 3
+    assert not inference.same_device
+    result = infer_timezones(exifs)
+    assert result[2].goff == 3 and result[2].dt == dt(12)  # camera local time keeps its datetime
+    assert 0.5 < result[2].goff_conf < 1
+    assert exifs[2].goff is None  # the given objects are not modified
+
+
+def test_utc_video_takes_the_zone_of_the_same_device():
+    exifs = [anchor(dt(10), 2, model='Pixel 8'), anchor(dt(11), -4, model='Other'),
+             ExifClass(ext='.mp4', backend='pymediainfo', dt=dt(8, 1), is_utc=True, make='Google', model='Pixel 8')]
+    result = infer_timezones(exifs)
+    assert result[2].goff == 2
+    assert result[2].dt == dt(10) and not result[2].is_utc  # converted to local time
+
+
+def test_far_and_disagreeing_anchors():
+    exifs = [anchor(dt(0), 1), anchor(dt(20), 8),
+             ExifClass(ext='.jpg', backend='exifread', dt=dt(11), make='Google', model='Pixel 8'),
+             ExifClass(ext='.jpg', backend='exifread', dt=dt(12, day=5), make='Google', model='Pixel 8')]
+    inferences = infer_offsets(exifs)
+    assert inferences[2].goff == 8 and inferences[2].confidence < 0.5  # the zone changed in between
+    assert inferences[3] is None  # no anchors within the maximal gap
+    assert infer_timezones(exifs)[2].goff is None
+
+
+def test_renamer_infers_offsets(tmp_path: Path):
+    exifs = [anchor(dt(9), 3), ExifClass(ext='.mp4', backend='ffmpeg', dt=dt(7), is_utc=True)]
+    items = [(PairGroup(primary=tmp_path / f'{i}.jpg'), ex) for i, ex in enumerate(exifs)]
+    renamer = Renamer(infer_tz=True)
+    items = renamer.infer_timezones(items)
+    assert [(group.primary.name, ex.dt) for group, ex in items] == [('0.jpg', dt(9)), ('1.jpg', dt(10))]
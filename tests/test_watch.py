@@ -0,0 +1,57 @@
+import threading
+import time
+from pathlib import Path
+
+import pytest
+from media_samples import make_jpeg
+
+from medren.renamer import Renamer
+from medren.watch import Watcher
+
+
+def wait_for(predicate, timeout: float = 5.0) -> bool:
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+@pytest.mark.parametrize("use_inotify", [True, False])
+def test_watch_renames_new_files_only(tmp_path: Path, use_inotify: bool):
+    (tmp_path / 'old.jpg').write_bytes(make_jpeg('2020:01:01 10:00:00'))
+    (tmp_path / '2020-01-01-10-00-00.jpg').write_bytes(b'')
+    watcher = Watcher(renamer=Renamer(template='{datetime}{ext}'), roots=[tmp_path],
+                      stable_secs=0.2, poll_interval=0.05, use_inotify=use_inotify)
+    stop = threading.Event()
+    thread = threading.Thread(target=watcher.run, args=(stop,))
+    thread.start()
+    try:
+        time.sleep(0.2)
+        (tmp_path / 'new.jpg').write_bytes(make_jpeg('2020:01:01 10:00:00'))
+        assert wait_for(lambda: (tmp_path / '2020-01-01-10-00-00-1.jpg').exists())
+    finally:
+        stop.set()
+        thread.join()
+    assert (tmp_path / 'old.jpg').exists()
+    assert not (tmp_path / 'new.jpg').exists()
+
+
+@pytest.mark.parametrize("inside", [True, False])
+def test_copies_are_not_requeued(tmp_path: Path, inside: bool):
+    root = tmp_path / 'incoming'
+    root.mkdir()
+    dest = root / 'sorted' if inside else tmp_path / 'sorted'
+    (root / 'new.jpg').write_bytes(make_jpeg('2020:01:01 10:00:00'))
+    watcher = Watcher(renamer=Renamer(template='{datetime}{ext}', dest_root=dest, transfer='copy'), roots=[root])
+    watcher.process([root / 'new.jpg'])
+    copy = dest / '2020-01-01-10-00-00.jpg'
+    assert copy.is_file()
+    assert list(watcher.produced) == ([copy] if inside else [])  # the files outside the roots make no events
+    for _ in range(3 if inside else 0):  # create, modify and close
+        watcher.on_event(copy)
+    assert not watcher.pending
+
+    watcher.produced = dict.fromkeys(watcher.produced, time.monotonic())  # expired
+    assert watcher.collect_ready() == [] and not watcher.produced
@@ -0,0 +1,90 @@
+import dataclasses
+import datetime
+import os
+from pathlib import Path
+
+import piexif
+import pytest
+from media_samples import make_jpeg
+
+from medren.backend_piexif import jpeg_exif_segment
+from medren.exif_process import ExifClass
+from medren.renamer import Renamer
+from medren.writeback import Journal, WriteStatus, read_journal, undo, write_back, write_back_many
+
+
+def exif_values(path: Path) -> tuple[bytes | None, bytes | None]:
+    exif = piexif.load(jpeg_exif_segment(path.read_bytes()))['Exif']
+    return exif.get(piexif.ExifIFD.DateTimeOriginal), exif.get(piexif.ExifIFD.OffsetTimeOriginal)
+
+
+def corrected(dt: datetime.datetime, goff: float | None = None) -> ExifClass:
+    return ExifClass(ext='.jpg', backend='piexif', dt=dt, goff=goff)
+
+
+@pytest.mark.parametrize('offset, status', [('+00:00', WriteStatus.patched), (None, WriteStatus.rewritten)])
+def test_write_back_and_undo(tmp_path: Path, offset: str | None, status: WriteStatus):
+    path = tmp_path / 'IMG_1.jpg'
+    path.write_bytes(make_jpeg('2020:01:01 10:00:00', offset=offset))
+    original = path.read_bytes()
+    os.utime(path, ns=(1_000_000_000, 2_000_000_000))
+    ex = corrected(datetime.datetime(2020, 1, 1, 12, 30), goff=2.5)
+
+    with Journal(tmp_path / 'journal.jsonl') as journal:
+        assert write_back(path, ex, journal) == status
+        assert write_back(path, ex, journal) == WriteStatus.unchanged
+    assert exif_values(path) == (b'2020:01:01 12:30:00', b'+02:30')
+    assert (len(path.read_bytes()) == len(original)) == (status == WriteStatus.patched)  # patched in place
+    assert os.stat(path).st_mtime_ns == 2_000_000_000  # kept
+    assert [done is not None for _entry, done in read_journal(tmp_path / 'journal.jsonl')] == [True]
+
+    assert undo(tmp_path / 'journal.jsonl') == {'restored': 1}
+    assert path.read_bytes() == original
+    assert os.stat(path).st_mtime_ns == 2_000_000_000
+
+
+def test_write_back_many(tmp_path: Path):
+    items = []
+    for i in range(5):
+        path = tmp_path / f'IMG_{i}.jpg'
+        path.write_bytes(make_jpeg(f'2020:01:01 10:00:0{i}', offset='-05:00'))
+        items.append((path, corrected(datetime.datetime(2020, 1, 1, 11, 0, i), goff=-5)))
+    (tmp_path / 'notes.txt').write_text('not media')
+    items.append((tmp_path / 'notes.txt', corrected(datetime.datetime(2020, 1, 1))))
+    journal = tmp_path / 'journal.jsonl'
+
+    counts = write_back_many(items, journal, workers=3, set_mtime=True)
+    assert counts == {WriteStatus.patched: 5, WriteStatus.unsupported: 1}
+    assert exif_values(tmp_path / 'IMG_3.jpg') == (b'2020:01:01 11:00:03', b'-05:00')
+    expected = datetime.datetime(2020, 1, 1, 16, 0, 3, tzinfo=datetime.timezone.utc).timestamp()
+    assert os.stat(tmp_path / 'IMG_3.jpg').st_mtime == expected
+
+    (tmp_path / 'IMG_0.jpg').write_bytes(make_jpeg('2021:01:01 00:00:00'))  # changed since
+    assert undo(journal) == {'restored': 4, 'changed': 1}
+    assert exif_values(tmp_path / 'IMG_3.jpg') == (b'2020:01:01 10:00:03', b'-05:00')
+
+
+def test_undo_incomplete_rewrite(tmp_path: Path, monkeypatch):
+    path = tmp_path / 'IMG_1.jpg'
+    path.write_bytes(make_jpeg('2020:01:01 10:00:00'))
+    original = path.read_bytes()
+
+    def interrupted(*args):
+        raise OSError('interrupted')
+
+    monkeypatch.setattr('medren.writeback.splice', interrupted)
+    with Journal(tmp_path / 'journal.jsonl') as journal, pytest.raises(OSError):
+        write_back(path, corrected(datetime.datetime(2020, 1, 1, 12), goff=1), journal)
+    monkeypatch.undo()
+    assert undo(tmp_path / 'journal.jsonl') == {'incomplete': 1}
+    assert path.read_bytes() == original
+
+
+def test_corrected_files():
+    unchanged = corrected(datetime.datetime(2020, 1, 1, 10), goff=1)
+    inferred = corrected(datetime.datetime(2020, 1, 1, 11))
+    renamer = Renamer()
+    renamer.extracted = {Path('a.jpg'): unchanged, Path('b.jpg'): inferred}
+    renames = {Path('a.jpg'): ('A.jpg', unchanged), Path('b.jpg'): ('B.jpg', dataclasses.replace(inferred, goff=2)),
+               Path('b.xmp'): ('B.xmp', dataclasses.replace(inferred, goff=2))}  # a sidecar of b
+    assert [path for path, _ex in renamer.corrected_files(renames)] == [Path('b.jpg')]